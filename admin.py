@@ -0,0 +1,35 @@
+# admin.py
+import os
+import hmac
+import logging
+from functools import wraps
+
+from flask import request, jsonify
+
+logger = logging.getLogger(__name__)
+
+
+def admin_required(view):
+    """Protect an ops/admin endpoint with the ADMIN_TOKEN shared secret.
+
+    The token is accepted from the ``X-Admin-Token`` header or an
+    ``Authorization: Bearer <token>`` header. When ADMIN_TOKEN is not set the
+    endpoints are disabled entirely.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = os.getenv("ADMIN_TOKEN", "")
+        if not expected:
+            return jsonify({"error": "Admin endpoints are disabled"}), 404
+
+        supplied = request.headers.get("X-Admin-Token", "")
+        auth_header = request.headers.get("Authorization", "")
+        if not supplied and auth_header.startswith("Bearer "):
+            supplied = auth_header[len("Bearer "):]
+
+        if not hmac.compare_digest(supplied.encode(), expected.encode()):
+            logger.warning(f"Rejected admin request to {request.path} from IP {request.remote_addr}")
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,165 @@
+# admission.py
+"""Admission control for chat turns (per process).
+
+A chat turn holds its worker thread for as long as the graph runs, which is
+mostly waiting on Azure OpenAI. When the LLM slows down, turns pile up until
+they occupy every worker thread and logins and static pages queue behind
+them. ``AdmissionPool`` caps how many turns run at once and how many may
+wait for a slot, and for how long; anything beyond that is refused at once
+with ``Overloaded`` so the caller can answer 503 / "busy, retry" instead of
+tying up another thread.
+
+Only chat turns (HTTP and WebSocket) go through the pool. Auth and static
+routes are not admitted here, so as long as CHAT_MAX_IN_FLIGHT +
+CHAT_MAX_WAITING stays below the worker's HTTP thread count the remaining
+threads are theirs; gunicorn.conf.py refuses to start otherwise.
+
+Waiters are served first come, first served. Retry-After is the recent
+average turn duration, the soonest a slot is likely to open.
+
+``drain`` (called on shutdown, see lifecycle.py) refuses new and waiting
+turns and waits for the running ones to finish.
+
+Environment variables:
+  - CHAT_MAX_IN_FLIGHT: turns running at once per process, 0 for no limit (default 8)
+  - CHAT_MAX_WAITING: turns waiting for a slot (default 8)
+  - CHAT_QUEUE_TIMEOUT: seconds a turn waits before it is refused (default 5)
+"""
+import os
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# Weight of the latest turn in the running average of turn durations
+DURATION_SMOOTHING = 0.2
+MAX_RETRY_AFTER = 30
+
+
+class Overloaded(Exception):
+    """No slot for this turn; retry after ``retry_after`` seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"{reason}, retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionPool:
+    def __init__(self, name: str, max_in_flight: int, max_waiting: int, queue_timeout: float):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # One event per waiting turn; a released slot is handed to the oldest
+        self._waiters: deque = deque()
+        # Waiters woken by drain() rather than handed a slot
+        self._refused = set()
+        self._idle = threading.Condition(self._lock)
+        self.draining = False
+        self._avg_duration = 1.0
+        self.counters = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_timeout": 0,
+                         "rejected_draining": 0}
+        self._peak_in_flight = 0
+        self._wait_max = 0.0
+
+    def retry_after(self) -> int:
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(self._avg_duration)))
+
+    def acquire(self) -> None:
+        """Take a slot, waiting up to queue_timeout; raises Overloaded when refused."""
+        with self._lock:
+            if self.draining:
+                self.counters["rejected_draining"] += 1
+                raise Overloaded("shutting down", self.retry_after())
+            if self.max_in_flight <= 0 or (self._in_flight < self.max_in_flight and not self._waiters):
+                self._admit()
+                return
+            if len(self._waiters) >= self.max_waiting:
+                self.counters["rejected_full"] += 1
+                raise Overloaded("queue full", self.retry_after())
+            granted = threading.Event()
+            self._waiters.append(granted)
+            self.counters["queued"] += 1
+        started = time.monotonic()
+        granted.wait(self.queue_timeout)
+        with self._lock:
+            self._wait_max = max(self._wait_max, time.monotonic() - started)
+            if granted in self._refused:
+                self._refused.discard(granted)
+                self.counters["rejected_draining"] += 1
+                raise Overloaded("shutting down", self.retry_after())
+            if granted.is_set():
+                # release() already counted us in flight
+                self.counters["admitted"] += 1
+                return
+            self._waiters.remove(granted)
+            self.counters["rejected_timeout"] += 1
+            raise Overloaded("queue timeout", self.retry_after())
+
+    def _admit(self) -> None:
+        self._in_flight += 1
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        self.counters["admitted"] += 1
+
+    def release(self, duration: float) -> None:
+        with self._lock:
+            self._avg_duration += DURATION_SMOOTHING * (duration - self._avg_duration)
+            if self._waiters and (self.max_in_flight <= 0 or self._in_flight <= self.max_in_flight):
+                # Hand the slot over; in-flight stays the same
+                self._waiters.popleft().set()
+            else:
+                self._in_flight -= 1
+                if not self._in_flight:
+                    self._idle.notify_all()
+
+    def drain(self, timeout: float) -> int:
+        """Refuse new and waiting turns, then wait up to ``timeout`` for running ones; returns those left."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self.draining = True
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                self._refused.add(waiter)
+                waiter.set()
+            while self._in_flight and time.monotonic() < deadline:
+                self._idle.wait(deadline - time.monotonic())
+            return self._in_flight
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters = dict.fromkeys(self.counters, 0)
+            self._peak_in_flight = self._in_flight
+            self._wait_max = 0.0
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {"pool": self.name, "pid": os.getpid(), "in_flight": self._in_flight,
+                    "peak_in_flight": self._peak_in_flight, "waiting": len(self._waiters),
+                    "draining": self.draining, "max_in_flight": self.max_in_flight, "max_waiting": self.max_waiting,
+                    "queue_timeout_s": self.queue_timeout, "wait_max_s": round(self._wait_max, 3),
+                    "avg_turn_s": round(self._avg_duration, 3), "retry_after_s": self.retry_after(),
+                    **self.counters,
+                    "rejected": (self.counters["rejected_full"] + self.counters["rejected_timeout"]
+                                 + self.counters["rejected_draining"])}
+
+
+chat_admission = AdmissionPool(
+    "chat",
+    max_in_flight=int(os.getenv("CHAT_MAX_IN_FLIGHT", "8")),
+    max_waiting=int(os.getenv("CHAT_MAX_WAITING", "8")),
+    queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "5")),
+)
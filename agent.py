@@ -1,32 +1,129 @@
 # agent.py
-from typing import Dict
+from typing import Dict, Optional
 from patient_bot_conversational import *
-from db_utils import get_user_contact_info
-from datetime import datetime
+from db_utils import get_last_booking, get_user_contact_info
+from appointment_time import APP_TIMEZONE, local_now
+import os
+import time
 import uuid
-import logging
+import weakref
+import threading
 from logger import setup_logging
+from structured_log import get_logger
 
 # Initialize logging for Azure (stdout/stderr capture)
 setup_logging()
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
+
+# Put the stored location and last booking into patient_data so the assistant confirms them instead of asking
+PROFILE_PREFILL = os.getenv("PROFILE_PREFILL", "1") == "1"
+# Sessions without a turn for this long are dropped with their graph thread; a later turn
+# starts a new thread seeded from the stored conversation (chat_routes.rehydrate_graph_state)
+AGENT_IDLE_SECONDS = float(os.getenv("AGENT_IDLE_SECONDS", "3600"))
+AGENT_SWEEP_SECONDS = 60
+
+# Patient profiles shared by all sessions of a user; an entry lives as long as one of them
+_profiles: "weakref.WeakValueDictionary[str, PatientProfile]" = weakref.WeakValueDictionary()
+_profiles_lock = threading.Lock()
+
+
+class PatientProfile:
+    """Contact details and known booking slots, rendered once into the prompt's patient_data line."""
+
+    __slots__ = ("email", "firstname", "phone", "city", "state", "location", "last_booking", "patient_data",
+                 "__weakref__")
+
+    def __init__(self, email: str, contact_info: Dict, last_booking: Optional[Dict] = None):
+        self.email = email
+        self.firstname = contact_info.get("firstname") or None
+        self.phone = contact_info.get("phone") or None
+        # Routes doctor directory searches to the user's region shard (region_shards.py)
+        self.city = contact_info.get("city") or None
+        self.state = contact_info.get("state") or None
+        self.location = contact_info.get("location") or None
+        self.last_booking = last_booking
+        self.patient_data = self._render()
+
+    def _render(self) -> str:
+        patient_data = (
+            f"Name: {self.firstname or 'Unknown'}, "
+            f"Phone Number: {self.phone or 'N/A'}, "
+            f"Email Id: {self.email}"
+        )
+        slots = self.known_slots()
+        if slots:
+            patient_data += "\nKnown details (from the user's profile; confirm, don't ask again): " + "; ".join(
+                f"{name}: {value}" for name, value in slots.items())
+        return patient_data
+
+    def known_slots(self) -> Dict[str, str]:
+        """Booking slots the assistant can propose instead of asking for them (PROFILE_PREFILL)."""
+        if not PROFILE_PREFILL:
+            return {}
+        slots = {}
+        if self.city:
+            area = ", ".join(part for part in (self.location, self.state) if part and part != self.city)
+            slots["Location"] = f"{self.city} ({area})" if area else self.city
+        booking = self.last_booking or {}
+        if booking.get("hospital_name") and booking.get("specialization"):
+            last = f"{booking['specialization']} at {booking['hospital_name']}"
+            if booking.get("location"):
+                last += f", {booking['location']}"
+            slots["Last booking"] = last
+        return slots
+
+    def remember_booking(self, booking: Dict) -> None:
+        """Make a just-made booking the preference offered next time, in every session of the user."""
+        self.last_booking = {key: booking.get(key) for key in ("hospital_name", "specialization", "location")}
+        self.patient_data = self._render()
+
+
+class SessionState:
+    """Per-session agent state: the shared profile plus the graph thread id."""
+
+    __slots__ = ("profile", "thread_id", "session_id", "last_used")
+
+    def __init__(self, profile: PatientProfile, thread_id: str, session_id: str):
+        self.profile = profile
+        self.thread_id = thread_id
+        self.session_id = session_id
+        self.last_used = time.monotonic()
+
+    def config(self) -> Dict:
+        """The graph config for one turn; the date is today's, not the session's start date."""
+        return {
+            "configurable": {
+                "patient_data": self.profile.patient_data,
+                "current_date": get_formatted_date(),
+                "thread_id": self.thread_id,
+                # Token accounting (token_usage.py) is per chat session
+                "session_id": self.session_id,
+                "patient_city": self.profile.city,
+                "patient_state": self.profile.state,
+                # Whose appointments check_appointment/cancel_appointment may see
+                "patient_email": self.profile.email,
+                "patient_phone": self.profile.phone,
+            }
+        }
+
 
 # In-memory storage for user agents (per session)
-user_agents: Dict[str, Dict] = {}
+user_agents: Dict[str, SessionState] = {}
+# Graph thread ids of sessions from before a restart (lifecycle.py warm start), claimed on first use
+_restored_threads: Dict[str, str] = {}
+_sweep = {"next": time.monotonic() + AGENT_SWEEP_SECONDS}
+_sweep_lock = threading.Lock()
 
 def get_formatted_date() -> str:
-    """Return current date in a formatted string."""
-    return datetime.now().strftime("%B %d, %Y")
+    """Return the clinics' current date and time, with the weekday, as a string."""
+    formatted = local_now().strftime("%A, %B %d, %Y, %H:%M")
+    return f"{formatted} ({APP_TIMEZONE})" if APP_TIMEZONE else formatted
 
-def get_default_config(email: str) -> Dict:
+def _normalize_contact_info(email: str, raw_contact) -> Dict:
     """
-    Generate a config dictionary with patient data and a unique thread ID.
-    This version defensively normalizes contact_info to a dict no matter what
-    the data source returns (None, dict, list, nested list, etc).
+    Defensively normalize contact_info to a dict no matter what the data
+    source returns (None, dict, list, nested list, etc).
     """
-    raw_contact = get_user_contact_info(email)
-
-    # Defensive normalization ------------------------------------------------
     contact_info = None
 
     # If caller returned a dict directly, use it.
@@ -49,67 +146,100 @@ def get_default_config(email: str) -> Dict:
             contact_info = found
         else:
             # no dict found — log and fall through to defaults
-            logger.warning(
-                "[Azure] get_user_contact_info returned a list, but no dict found "
-                f"for {email}. Raw preview: {str(raw_contact)[:300]}"
-            )
+            logger.warning("contact_info_no_dict", email=email, preview=lambda: str(raw_contact)[:300])
 
     # Anything else (None, str, etc) — log and fallback
     else:
         if raw_contact is not None:
-            logger.warning(
-                "[Azure] get_user_contact_info returned unexpected type "
-                f"{type(raw_contact).__name__} for {email}. Preview: {str(raw_contact)[:300]}"
-            )
+            logger.warning("contact_info_unexpected_type", email=email, type=type(raw_contact).__name__,
+                           preview=lambda: str(raw_contact)[:300])
 
     # If still no usable contact_info, use default values
     if not isinstance(contact_info, dict):
-        logger.info(f"[Azure] No usable contact info for {email}; using default values.")
+        logger.info("contact_info_default", email=email)
         contact_info = {"firstname": "Unknown", "phone": "N/A"}
 
-    # Now safe to use contact_info as a dict
+    logger.debug("contact_info_normalized", email=email, contact=lambda: contact_info)
+    return contact_info
+
+def get_patient_profile(email: str) -> PatientProfile:
+    """Return the user's shared profile, loading it from the database only if no session holds it."""
+    with _profiles_lock:
+        profile = _profiles.get(email)
+    if profile is not None:
+        return profile
+    last_booking = None
+    if PROFILE_PREFILL:
+        try:
+            last_booking = get_last_booking(email)
+        except Exception:
+            logger.exception("last_booking_lookup_failed", email=email)
+    profile = PatientProfile(email, _normalize_contact_info(email, get_user_contact_info(email)), last_booking)
+    with _profiles_lock:
+        # Another request may have loaded it meanwhile; keep a single shared instance
+        return _profiles.setdefault(email, profile)
+
+def remember_booking(email: str, booking: Dict) -> None:
+    """Record a booking as the user's latest preference if a session holds their profile."""
+    with _profiles_lock:
+        profile = _profiles.get(email)
+    if profile is not None:
+        profile.remember_booking(booking)
+
+def evict_idle_agents(idle_seconds: float = AGENT_IDLE_SECONDS) -> int:
+    """Drop sessions idle for ``idle_seconds`` and their graph threads; returns how many."""
+    cutoff = time.monotonic() - idle_seconds
+    evicted = 0
+    for session_id, state in list(user_agents.items()):
+        if state.last_used < cutoff and user_agents.get(session_id) is state:
+            del user_agents[session_id]
+            memory.delete_thread(state.thread_id)
+            evicted += 1
+    if evicted:
+        logger.info("agents_evicted", count=evicted, remaining=len(user_agents))
+    return evicted
+
+def _maybe_evict() -> None:
+    now = time.monotonic()
+    if now < _sweep["next"] or not _sweep_lock.acquire(blocking=False):
+        return
     try:
-        current_date = get_formatted_date()
-        contact_info['current_date'] = current_date
-    except Exception as e:
-        logger.exception(f"[Azure] Error setting current_date for contact_info of {email}: {e}")
-        # ensure contact_info has the key even if exception occurred
-        contact_info.setdefault('current_date', get_formatted_date())
-
-    logger.info(f"[Azure] Normalized contact info for {email}: {contact_info}")
-
-    patient_data = (
-        f"Name: {contact_info.get('firstname', 'Unknown')}, "
-        f"Phone Number: {contact_info.get('phone', 'N/A')}, "
-        f"Email Id: {email}"
-    )
-    thread_id = str(uuid.uuid4())
-
-    config = {
-        "configurable": {
-            "patient_data": patient_data,
-            "current_date": current_date,
-            "thread_id": thread_id,
-        }
-    }
-
-    logger.info(f"[Azure] Generated config for {email}: {config}")
-    return config
+        _sweep["next"] = now + AGENT_SWEEP_SECONDS
+        evict_idle_agents()
+    finally:
+        _sweep_lock.release()
 
 def get_or_create_agent_for_user(email: str, session_id: str) -> Dict:
-    """Get existing agent or create a new one for the user (Flask + Azure)."""
-    if session_id not in user_agents:
-        config = get_default_config(email)
-        user_agents[session_id] = config
-        logger.info(f"[Azure] Created new agent for session {session_id}: {config}")
+    """Get existing agent or create a new one for the user (Flask + Azure).
+
+    Returns a fresh ``{"configurable": {...}}`` config for this turn.
+    """
+    _maybe_evict()
+    state = user_agents.get(session_id)
+    if state is None:
+        thread_id = _restored_threads.pop(session_id, None) or str(uuid.uuid4())
+        state = SessionState(get_patient_profile(email), thread_id, session_id)
+        state = user_agents.setdefault(session_id, state)
+        logger.info("agent_created", session_id=session_id, thread_id=state.thread_id)
     else:
-        logger.info(f"[Azure] Retrieved existing agent for session {session_id}")
-    return user_agents[session_id]
+        logger.debug("agent_reused", session_id=session_id)
+    state.last_used = time.monotonic()
+    return state.config()
+
+def session_threads() -> Dict[str, str]:
+    """session_id -> graph thread id of every session this process knows, including unclaimed restored ones."""
+    return {**_restored_threads, **{sid: state.thread_id for sid, state in list(user_agents.items())}}
+
+def restore_session_threads(threads: Dict[str, str]) -> None:
+    """Let sessions from before a restart continue on their saved graph threads."""
+    for session_id, thread_id in threads.items():
+        if session_id not in user_agents:
+            _restored_threads.setdefault(session_id, thread_id)
 
 def remove_agent(session_id: str) -> None:
     """Remove agent from memory (Flask session cleanup)."""
-    if session_id in user_agents:
-        del user_agents[session_id]
-        logger.info(f"[Azure] Removed agent for session {session_id}")
+    _restored_threads.pop(session_id, None)
+    if user_agents.pop(session_id, None) is not None:
+        logger.info("agent_removed", session_id=session_id)
     else:
-        logger.warning(f"[Azure] Tried to remove non-existent session {session_id}")
+        logger.warning("agent_remove_missing", session_id=session_id)
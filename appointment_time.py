@@ -0,0 +1,274 @@
+# appointment_time.py
+"""Local resolution of appointment dates and times against the live clock.
+
+Users give dates the way they speak ("tomorrow 5pm", "next Monday", "20th
+Oct at 10:30"), and the assistant used to turn them into calendar dates
+itself from the "Current Date" line of the prompt. When it got one wrong
+(a weekday off by one, a past date let through, a time the booking code
+could not parse) the fix cost another turn, each a full LLM round trip.
+
+``resolve`` finds the date and time in a message and returns them as ISO
+values, deterministically, against ``local_now()``:
+
+    >>> resolve("tomorrow 5pm", now=datetime(2026, 10, 19, 9, 0))
+    {'text': 'tomorrow 5pm', 'date': '2026-10-20', 'weekday': 'Tuesday', 'time': '17:00', 'past': False}
+
+It is used in three places:
+  - ``annotate`` appends the resolved values to the user's message before
+    it reaches the graph, so the assistant confirms, checks availability and
+    rejects past dates from values it does not have to compute,
+  - booking.parse_date / parse_time fall back to it, so the availability
+    tool and the booking extracted from the conversation accept relative
+    and spoken forms as well as YYYY-MM-DD / HH:MM,
+  - agent.get_formatted_date renders the prompt's current date from the same clock.
+
+Rules:
+  - dates: YYYY-MM-DD; day-first numbers (20/10, 20/10/2026, 20-10-2026);
+    "20th October", "Oct 20", with or without year; today, tonight,
+    tomorrow, day after tomorrow; in/after N days or weeks; weekdays.
+  - A weekday alone, or with "this"/"next"/"coming", is its next occurrence
+    after today ("this Monday" on a Monday is today). The assistant states
+    the calendar date when it confirms, so a "next Monday" meant a week later
+    is caught there.
+  - A day and month without a year is this year's, or next year's when this
+    year's is more than ROLLOVER_DAYS ago ("5 Jan" said in December); a date
+    a few days past stays in the past and is reported as such.
+  - times: 17:00, 5:30 pm, 5pm, 5.30pm, noon; "at 5" without am/pm is read
+    within clinic hours (1-7 as pm, 8-11 as am), as is an hour followed by
+    "evening"/"afternoon"/"morning". A bare hour counts only where a time can
+    end (end of text, punctuation, a day or time word), so "I live at 12 MG
+    road" has no time.
+  - ``past`` is true for a date before today, or today at a time already gone.
+
+Environment variables:
+  - APP_TIMEZONE: IANA zone of the clinics, e.g. "Asia/Kolkata" (default: the server's local time)
+  - RESOLVE_DATES: "1" (default) to annotate user messages, "0" to pass them through unchanged
+"""
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from structured_log import get_logger
+
+logger = get_logger(__name__)
+
+APP_TIMEZONE = os.getenv("APP_TIMEZONE", "")
+RESOLVE_DATES = os.getenv("RESOLVE_DATES", "1") == "1"
+ROLLOVER_DAYS = 60
+
+try:
+    from zoneinfo import ZoneInfo
+    _zone = ZoneInfo(APP_TIMEZONE) if APP_TIMEZONE else None
+except Exception:
+    logger.warning("app_timezone_unknown", timezone=APP_TIMEZONE, fallback="server local time")
+    _zone = None
+
+_MONTHS = {name: number for number, names in enumerate((
+    ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"), ("may",), ("june", "jun"),
+    ("july", "jul"), ("august", "aug"), ("september", "sep", "sept"), ("october", "oct"),
+    ("november", "nov"), ("december", "dec")), start=1) for name in names}
+_WEEKDAYS = {name: number for number, names in enumerate((
+    ("monday", "mon"), ("tuesday", "tue", "tues"), ("wednesday", "wed"), ("thursday", "thu", "thur", "thurs"),
+    ("friday", "fri"), ("saturday",), ("sunday",))) for name in names}
+_NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+            "eight": 8, "nine": 9, "ten": 10}
+
+_MONTH = "|".join(sorted(_MONTHS, key=len, reverse=True))
+_WEEKDAY = "|".join(sorted(_WEEKDAYS, key=len, reverse=True))
+_ORDINAL = r"(?:st|nd|rd|th)?"
+_AMPM = r"(a\.?m\.?|p\.?m\.?)"
+
+# Date forms, most specific first; each match consumes its span so a later form cannot reuse it
+_DATE_PATTERNS = (
+    ("iso", re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")),
+    ("dmy", re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})\b")),
+    # "24/7" is opening hours, not the 24th of July
+    ("dm", re.compile(r"\b(?!24/7\b)(\d{1,2})/(\d{1,2})\b")),
+    ("day_month", re.compile(rf"\b(\d{{1,2}}){_ORDINAL}(?:\s+of)?\s+({_MONTH})\b\.?(?:,?\s+(\d{{4}}))?")),
+    ("month_day", re.compile(rf"\b({_MONTH})\.?\s+(\d{{1,2}}){_ORDINAL}\b(?:,?\s+(\d{{4}}))?")),
+    ("day_after_tomorrow", re.compile(r"\bday after tomorrow\b")),
+    ("today", re.compile(r"\b(today|tonight|this (?:morning|afternoon|evening))\b")),
+    ("tomorrow", re.compile(r"\b(tomorrow|tmrw|tmr)\b")),
+    ("offset", re.compile(rf"\b(?:in|after)\s+(\d+|{'|'.join(_NUMBERS)})\s+(day|week)s?\b")),
+    ("weekday", re.compile(rf"\b(?:(this|next|coming)\s+)?({_WEEKDAY})\b")),
+)
+# Stands in for the date's span while times are looked for, so "20-10-2026" is not read as 20:10
+_DATE_MARK = "\0"
+# Where a bare hour can end: "at 5", "at 5, please", "at 10 tomorrow", "at 10 on Friday"; not "at 12 MG road"
+_HOUR_END = (rf"$|[,;!?){_DATE_MARK}]|\.(?!\d)|on (?:the )?(?:\d|{_DATE_MARK})"
+             r"|(?:o'?clock|hrs|hours|sharp|please|pls|if|or|and|in the|morning|afternoon|evening|night"
+             rf"|today|tonight|tomorrow|tmrw|tmr|this|next|coming|{_WEEKDAY}|{_MONTH})\b")
+_TIME_PATTERNS = (
+    ("hm", re.compile(rf"\b(\d{{1,2}})[:.](\d{{2}})\s*{_AMPM}?(?![\w/.-]\d)")),
+    ("h_ampm", re.compile(rf"\b(\d{{1,2}})\s*{_AMPM}(?!\w)")),
+    ("noon", re.compile(r"\b(noon|midday)\b")),
+    ("at_h", re.compile(rf"\b(?:at|by|around)\s+(\d{{1,2}})(?![:./-]?\d)(?=\s*(?:{_HOUR_END}))")),
+)
+_AFTERNOON = re.compile(r"\b(afternoon|evening|tonight)\b")
+_MORNING = re.compile(r"\bmorning\b")
+
+
+def local_now() -> datetime:
+    """Current wall-clock time of the clinics (APP_TIMEZONE), naive like the booking data."""
+    if _zone is None:
+        return datetime.now()
+    return datetime.now(_zone).replace(tzinfo=None)
+
+
+def to_local(moment: datetime) -> datetime:
+    """An aware ``moment`` as the clinics' naive wall-clock time, like local_now()."""
+    return moment.astimezone(_zone).replace(tzinfo=None)
+
+
+def today() -> date:
+    return local_now().date()
+
+
+def _safe_date(year: int, month: int, day: int) -> Optional[date]:
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _year_less(month: int, day: int, current: date) -> Optional[date]:
+    resolved = _safe_date(current.year, month, day)
+    if resolved is not None and (current - resolved).days > ROLLOVER_DAYS:
+        resolved = _safe_date(current.year + 1, month, day)
+    return resolved
+
+
+def _date_from(kind: str, groups: Tuple, current: date) -> Optional[date]:
+    if kind == "iso":
+        return _safe_date(int(groups[0]), int(groups[1]), int(groups[2]))
+    if kind == "dmy":
+        year = int(groups[2])
+        return _safe_date(year + 2000 if year < 100 else year, int(groups[1]), int(groups[0]))
+    if kind == "dm":
+        return _year_less(int(groups[1]), int(groups[0]), current)
+    if kind == "day_month":
+        day, month, year = int(groups[0]), _MONTHS[groups[1]], groups[2]
+        return _safe_date(int(year), month, day) if year else _year_less(month, day, current)
+    if kind == "month_day":
+        month, day, year = _MONTHS[groups[0]], int(groups[1]), groups[2]
+        return _safe_date(int(year), month, day) if year else _year_less(month, day, current)
+    if kind == "today":
+        return current
+    if kind == "tomorrow":
+        return current + timedelta(days=1)
+    if kind == "day_after_tomorrow":
+        return current + timedelta(days=2)
+    if kind == "offset":
+        count = int(groups[0]) if groups[0].isdigit() else _NUMBERS[groups[0]]
+        return current + timedelta(days=count * (7 if groups[1] == "week" else 1))
+    if kind == "weekday":
+        ahead = (_WEEKDAYS[groups[1]] - current.weekday()) % 7
+        if ahead == 0 and groups[0] != "this":
+            ahead = 7
+        return current + timedelta(days=ahead)
+    return None
+
+
+def _minutes_from(kind: str, groups: Tuple, text: str) -> Optional[int]:
+    if kind == "noon":
+        return 12 * 60
+    hour = int(groups[0])
+    minute = int(groups[1]) if kind == "hm" else 0
+    meridiem = (groups[2] if kind == "hm" else groups[1] if kind == "h_ampm" else None) or ""
+    meridiem = meridiem.replace(".", "")
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    elif hour < 12 and _AFTERNOON.search(text):
+        hour += 12
+    elif kind == "at_h" and not _MORNING.search(text) and 1 <= hour <= 7:
+        # "at 5": clinics are closed at 5 in the morning
+        hour += 12
+    if hour > 23 or minute > 59:
+        return None
+    return hour * 60 + minute
+
+
+def _first(patterns, text: str):
+    """The earliest match over all patterns (ties go to the earlier, more specific pattern)."""
+    best = None
+    for kind, pattern in patterns:
+        match = pattern.search(text)
+        if match and (best is None or match.start() < best[1].start()):
+            best = (kind, match)
+    return best
+
+
+def resolve(text: Optional[str], now: Optional[datetime] = None) -> Optional[Dict]:
+    """The date and time mentioned in ``text``, or None when it mentions neither.
+
+    Returns {"text", "date", "weekday", "time", "past"}: "date" is YYYY-MM-DD
+    and "time" HH:MM, either None when not mentioned; "text" is the span they
+    were read from.
+    """
+    now = now or local_now()
+    lowered = (text or "").lower()
+    if not lowered.strip():
+        return None
+    found = _first(_DATE_PATTERNS, lowered)
+    day = _date_from(found[0], found[1].groups(), now.date()) if found else None
+    # The time is looked for outside the date
+    rest = (lowered[:found[1].start()] + _DATE_MARK * len(found[1].group()) + lowered[found[1].end():]
+            if found else lowered)
+    timed = _first(_TIME_PATTERNS, rest)
+    minutes = _minutes_from(timed[0], timed[1].groups(), lowered) if timed else None
+    if day is None and minutes is None:
+        return None
+    spans = [match.span() for match in (found and found[1], timed and timed[1]) if match]
+    start, end = min(s for s, _ in spans), max(e for _, e in spans)
+    if day is not None:
+        past = day < now.date() or (day == now.date() and minutes is not None
+                                    and minutes < now.hour * 60 + now.minute)
+    else:
+        past = False
+    source = text if len(text) == len(lowered) else lowered
+    return {
+        "text": source[start:end].strip(),
+        "date": day.isoformat() if day else None,
+        "weekday": day.strftime("%A") if day else None,
+        "time": f"{minutes // 60:02d}:{minutes % 60:02d}" if minutes is not None else None,
+        "past": past,
+    }
+
+
+def resolve_date(value: Optional[str], now: Optional[datetime] = None) -> Optional[date]:
+    resolved = resolve(value, now)
+    return date.fromisoformat(resolved["date"]) if resolved and resolved["date"] else None
+
+
+def resolve_minutes(value: Optional[str], now: Optional[datetime] = None) -> Optional[int]:
+    resolved = resolve(value, now)
+    if not resolved or not resolved["time"]:
+        return None
+    hours, minutes = resolved["time"].split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def describe(resolved: Dict) -> str:
+    """The note appended to a user message, e.g. '[tomorrow 5pm = 2026-10-20 (Tuesday) 17:00]'."""
+    parts = []
+    if resolved["date"]:
+        parts.append(f"{resolved['date']} ({resolved['weekday']})")
+    if resolved["time"]:
+        parts.append(resolved["time"])
+    note = f'[{resolved["text"]} = {" ".join(parts)}'
+    if resolved["past"]:
+        note += ", in the past"
+    return note + "]"
+
+
+def annotate(text: str, now: Optional[datetime] = None) -> str:
+    """``text`` with the date/time it mentions resolved, for the assistant; unchanged when there is none."""
+    try:
+        resolved = resolve(text, now)
+    except Exception:
+        logger.exception("date_resolution_failed")
+        return text
+    return f"{text}\n{describe(resolved)}" if resolved else text
@@ -1,40 +1,49 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, jsonify
+import os
 import uuid
-import logging
 from datetime import datetime
 
 from db_utils import (
     authenticate_user,
     register_user,
     load_users_df,
-    get_user_contact_info
+    get_user_contact_info,
+    normalize_email
 )
 from logger import setup_logging
 from session import create_session_record, update_session_record  # added session record utilities
+from rate_limiter import SlidingWindowLimiter
+from structured_log import get_logger
 
 # Initialize logger
 setup_logging()
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 # Flask Blueprint (replaces FastAPI APIRouter)
 auth_bp = Blueprint("auth", __name__, template_folder="templates")
 
+# In-memory login throttling: every attempt counts per IP, failures count per account
+LOGIN_WINDOW_SECONDS = float(os.getenv("LOGIN_RATE_WINDOW", "300"))
+login_ip_limiter = SlidingWindowLimiter(int(os.getenv("LOGIN_RATE_PER_IP", "30")), LOGIN_WINDOW_SECONDS)
+login_account_limiter = SlidingWindowLimiter(int(os.getenv("LOGIN_FAILURES_PER_ACCOUNT", "5")), LOGIN_WINDOW_SECONDS)
+
 
 @auth_bp.route("/")
 def home_page():
-    logger.info("Home page accessed")
+    logger.info("page_accessed", page="home")
     return render_template("home.html")
 
 
 @auth_bp.route("/register", methods=["GET", "POST"])
 def register_page():
     if request.method == "GET":
-        logger.info("Register page accessed")
+        logger.info("page_accessed", page="register")
         return render_template("register.html")
 
     # POST logic
     firstname = request.form.get("firstname")
-    email = request.form.get("email")
+    # Stored, logged and keyed on in this form (see db_utils.normalize_email)
+    email = normalize_email(request.form.get("email"))
     phone = request.form.get("phone")
     country = request.form.get("country")
     state = request.form.get("state")
@@ -46,10 +55,8 @@ def register_page():
 
     if error is None:
         # Log and update session record for registration success
-        logger.info(
-            f"Registration successful for {email} from IP {request.remote_addr} "
-            f"User-Agent: {request.headers.get('User-Agent', '')}"
-        )
+        logger.info("registration_success", email=email, ip=request.remote_addr,
+                    user_agent=request.headers.get("User-Agent", ""))
         try:
             update_session_record(None, "registration_success", {
                 'email': email,
@@ -57,15 +64,13 @@ def register_page():
                 'user_agent': request.headers.get('User-Agent', ''),
             })
         except Exception as e:
-            logger.exception(f"Failed to update session record for registration_success: {e}")
+            logger.exception("session_record_failed", event_type="registration_success", error=e)
 
         return redirect(url_for("auth.login_page"))
 
     # Registration failed: update session record and log
-    logger.warning(
-        f"Registration failed for {email}. Reason: {error}. "
-        f"IP: {request.remote_addr}, User-Agent: {request.headers.get('User-Agent', '')}"
-    )
+    logger.warning("registration_failed", email=email, reason=error, ip=request.remote_addr,
+                   user_agent=request.headers.get("User-Agent", ""))
     try:
         update_session_record(None, "registration_failed", {
             'email': email,
@@ -74,7 +79,7 @@ def register_page():
             'user_agent': request.headers.get('User-Agent', ''),
         })
     except Exception as e:
-        logger.exception(f"Failed to update session record for registration_failed: {e}")
+        logger.exception("session_record_failed", event_type="registration_failed", error=e)
 
     return render_template("register.html", message=error)
 
@@ -82,32 +87,46 @@ def register_page():
 @auth_bp.route("/login", methods=["GET", "POST"])
 def login_page():
     if request.method == "GET":
-        logger.info("Login page accessed")
+        logger.info("page_accessed", page="login")
         return render_template("login.html")
 
     # POST logic
-    email = request.form.get("email")
+    email = normalize_email(request.form.get("email"))
     password = request.form.get("password")
 
-    if authenticate_user(email, password):
+    # remote_addr is the client's address once main.py's ProxyFix has read X-Forwarded-For
+    ip_key = f"ip:{request.remote_addr}"
+    account_key = f"acct:{email}"
+    for limiter, key in ((login_ip_limiter, ip_key), (login_account_limiter, account_key)):
+        allowed, retry_after = limiter.check(key)
+        if not allowed:
+            logger.warning("login_rate_limited", scope=key.split(":")[0], email=email, ip=request.remote_addr)
+            response = render_template("login.html", message="Too many login attempts. Please try again later.")
+            return response, 429, {"Retry-After": str(int(retry_after) + 1)}
+    login_ip_limiter.hit(ip_key)
+
+    account_email = authenticate_user(request.form.get("email"), password)
+    if account_email:
+        login_account_limiter.reset(account_key)
+        # The normalized email, or the stored one of an account that could not be renamed to it
+        email = account_email
         session_id = str(uuid.uuid4())
         session["user"] = email
         session["session_id"] = session_id
 
         # Create and update session records (wrapped in try/except to avoid breaking auth flow)
         try:
-            create_session_record(request, email, session_id)
+            create_session_record(email, session_id)
             update_session_record(session_id, "login_success")
         except Exception as e:
-            logger.exception(f"Failed to create/update session record after login: {e}")
+            logger.exception("session_record_failed", event_type="login_success", error=e)
 
-        logger.info(
-            f"User {email} logged in successfully with session ID {session_id} "
-            f"from IP {request.remote_addr}, User-Agent: {request.headers.get('User-Agent', '')}"
-        )
+        logger.info("login_success", email=email, session_id=session_id, ip=request.remote_addr,
+                    user_agent=request.headers.get("User-Agent", ""))
         return redirect(url_for("chat.chat_page", session_id=session_id))
 
     # Login failed: update session record and log
+    login_account_limiter.hit(account_key)
     try:
         update_session_record(None, "login_failed", {
             'email': email,
@@ -115,12 +134,10 @@ def login_page():
             'user_agent': request.headers.get('User-Agent', ''),
         })
     except Exception as e:
-        logger.exception(f"Failed to update session record for login_failed: {e}")
+        logger.exception("session_record_failed", event_type="login_failed", error=e)
 
-    logger.warning(
-        f"Failed login attempt for {email} "
-        f"from IP {request.remote_addr}, User-Agent: {request.headers.get('User-Agent', '')}"
-    )
+    logger.warning("login_failed", email=email, ip=request.remote_addr,
+                   user_agent=request.headers.get("User-Agent", ""))
 
     flash("Invalid email or password", "error")
     return render_template("login.html", message="Invalid email or password")
@@ -133,14 +150,14 @@ def google_login():
     If the user doesn't exist, auto-register them (using parts of their email as firstname).
     Creates a session and returns session_id JSON.
     """
-    email = request.form.get("email")
-    logger.info(f"Google login attempt for {email}")
+    email = normalize_email(request.form.get("email"))
+    logger.info("google_login_attempt", email=email)
 
     # Check if user exists in backend
     existing_user = get_user_contact_info(email)
 
     if not existing_user:
-        logger.info(f"User {email} not found in backend. Registering now...")
+        logger.info("google_login_auto_register", email=email)
         try:
             register_user(
                 firstname=email.split("@")[0],
@@ -153,7 +170,7 @@ def google_login():
                 password="google_oauth",
             )
         except Exception as e:
-            logger.exception(f"Auto-registration during google-login failed for {email}: {e}")
+            logger.exception("google_login_auto_register_failed", email=email, error=e)
             try:
                 update_session_record(None, "google_login_failed", {
                     'email': email,
@@ -171,12 +188,12 @@ def google_login():
     session["session_id"] = session_id
 
     try:
-        create_session_record(request, email, session_id)
+        create_session_record(email, session_id)
         update_session_record(session_id, "google_login_success")
     except Exception as e:
-        logger.exception(f"Failed to create/update session record after google login: {e}")
+        logger.exception("session_record_failed", event_type="google_login_success", error=e)
 
-    logger.info(f"Google login: Created session for {email} with session ID {session_id}")
+    logger.info("google_login_success", email=email, session_id=session_id)
 
     # Return session ID in JSON response
     return jsonify({"session_id": session_id}), 200
@@ -191,10 +208,10 @@ def logout():
         try:
             update_session_record(session_id, "logout")
         except Exception as e:
-            logger.exception(f"Failed to update session record for logout: {e}")
-        logger.info(f"User {user_email} logged out from session {session_id}")
+            logger.exception("session_record_failed", event_type="logout", error=e)
+        logger.info("logout", email=user_email, session_id=session_id)
     else:
-        logger.warning("Logout attempted without active session")
+        logger.warning("logout_without_session")
 
     session.clear()
     return redirect(url_for("auth.home_page"))
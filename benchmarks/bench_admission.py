@@ -0,0 +1,162 @@
+"""Site responsiveness while the LLM is slow: chat admission control off vs on.
+
+Serves the app over real HTTP from a fixed pool of --threads worker threads
+(as a gunicorn gthread worker would), with the stub LLM answering after
+--llm-latency-ms. --chatters users then send a chat message at once, and
+while those turns run the login page and a static file are probed every
+--probe-interval seconds. Runs twice:
+
+  - off: CHAT_MAX_IN_FLIGHT=0, every turn is let in and holds a worker thread
+  - on:  --max-in-flight turns run, --max-waiting wait up to --queue-timeout,
+         the rest get 503 + Retry-After right away
+
+Reports chat outcomes (200 / 503, latency of each, Retry-After values),
+probe latency (p50/p95/max and how many exceeded one second) and the
+admission counters from /metrics/admission.
+
+    python -m benchmarks.bench_admission [--threads 8] [--chatters 32] [--llm-latency-ms 1500]
+                                         [--max-in-flight 4] [--max-waiting 2] [--queue-timeout 2]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import BaseWSGIServer
+
+from benchmarks.bench_chat_flow import percentile, setup_environment
+
+ADMIN_TOKEN = "bench-admin"
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """A WSGI server with a fixed number of request threads; further connections wait in the backlog."""
+
+    request_queue_size = 256
+
+    def __init__(self, app, threads: int):
+        super().__init__("127.0.0.1", 0, app)
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="worker")
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+def login(base: str, index: int):
+    """A logged-in requests session and its chat session id."""
+    client = requests.Session()
+    email = f"admission{index}@example.com"
+    client.post(f"{base}/register", data={
+        "firstname": f"Admission{index}", "email": email, "phone": f"95{index:08d}", "country": "India",
+        "state": "Tamil Nadu", "location": "Centre", "city": "Chennai", "password": "bench-password"},
+        allow_redirects=False)
+    response = client.post(f"{base}/login", data={"email": email, "password": "bench-password"},
+                           allow_redirects=False)
+    session_id = response.headers["Location"].rstrip("/").split("/")[-1]
+    client.get(f"{base}/chat/{session_id}")
+    return client, session_id
+
+
+def chat_once(base: str, client, session_id: str):
+    started = time.perf_counter()
+    response = client.post(f"{base}/chat/{session_id}", json={"user_input": "I want to book a doctor appointment"})
+    return response.status_code, (time.perf_counter() - started) * 1000, response.headers.get("Retry-After")
+
+
+def probe(base: str, stop: threading.Event, interval: float, latencies: dict) -> None:
+    while not stop.is_set():
+        for label, path in (("login_page", "/login"), ("static", "/static/css/chat.css")):
+            started = time.perf_counter()
+            requests.get(f"{base}{path}")
+            latencies[label].append((time.perf_counter() - started) * 1000)
+        stop.wait(interval)
+
+
+def summary(values) -> dict:
+    if not values:
+        return {"count": 0}
+    return {"count": len(values), "p50_ms": round(percentile(values, 50), 1),
+            "p95_ms": round(percentile(values, 95), 1), "max_ms": round(max(values), 1),
+            "over_1s": sum(v > 1000 for v in values)}
+
+
+def run_mode(base: str, sessions, max_in_flight: int, max_waiting: int, queue_timeout: float,
+             probe_interval: float) -> dict:
+    from admission import chat_admission
+
+    chat_admission.max_in_flight = max_in_flight
+    chat_admission.max_waiting = max_waiting
+    chat_admission.queue_timeout = queue_timeout
+    chat_admission.reset()
+    latencies = {"login_page": [], "static": []}
+    stop = threading.Event()
+    prober = threading.Thread(target=probe, args=(base, stop, probe_interval, latencies))
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        futures = [pool.submit(chat_once, base, client, session_id) for client, session_id in sessions]
+        time.sleep(0.2)  # let the chat turns take the worker threads first
+        prober.start()
+        results = [f.result() for f in futures]
+    stop.set()
+    prober.join()
+    statuses = Counter(status for status, _, _ in results)
+    return {
+        "chat": {
+            "statuses": {str(k): v for k, v in sorted(statuses.items())},
+            "ok": summary([ms for status, ms, _ in results if status == 200]),
+            "busy_503": summary([ms for status, ms, _ in results if status == 503]),
+            "retry_after": sorted({r for status, _, r in results if status == 503}),
+        },
+        "probes": {label: summary(values) for label, values in latencies.items()},
+        "admission": requests.get(f"{base}/metrics/admission", headers={"X-Admin-Token": ADMIN_TOKEN}).json(),
+    }
+
+
+def run(threads: int, chatters: int, llm_latency_ms: float, max_in_flight: int, max_waiting: int,
+        queue_timeout: float, probe_interval: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_admission_")
+    os.environ["ADMIN_TOKEN"] = ADMIN_TOKEN
+    app, stub, _ = setup_environment(workdir, llm_latency_ms, 0)
+    server = PooledWSGIServer(app, threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = server.base_url
+
+    report = {"config": {"threads": threads, "chatters": chatters, "llm_latency_ms": llm_latency_ms,
+                         "max_in_flight": max_in_flight, "max_waiting": max_waiting,
+                         "queue_timeout_s": queue_timeout}}
+    for n, (mode, limits) in enumerate((("off", (0, 0)), ("on", (max_in_flight, max_waiting)))):
+        sessions = [login(base, n * chatters + i) for i in range(chatters)]
+        report[mode] = run_mode(base, sessions, *limits, queue_timeout, probe_interval)
+    server.shutdown()
+    stub.stop()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--chatters", type=int, default=32)
+    parser.add_argument("--llm-latency-ms", type=float, default=1500)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--max-waiting", type=int, default=2)
+    parser.add_argument("--queue-timeout", type=float, default=2)
+    parser.add_argument("--probe-interval", type=float, default=0.25)
+    args = parser.parse_args()
+    print(json.dumps(run(args.threads, args.chatters, args.llm_latency_ms, args.max_in_flight, args.max_waiting,
+                         args.queue_timeout, args.probe_interval), indent=2))
@@ -0,0 +1,184 @@
+"""Latency of the check_appointment / cancel_appointment paths at realistic data sizes.
+
+Seeds ``patient_information_details_table`` (mongomock) with --users accounts
+holding --per-user appointments each (past, upcoming and cancelled; a third
+of them older rows whose date is the free text the user typed, which the
+upcoming range scan must leave out), then measures:
+
+  - db: ``find_appointments`` (upcoming) and ``cancel_appointment`` for
+    random users: p50/p95 latency, documents returned, free-text dates
+    returned (should be 0), collection operations per call, and the init_db
+    index leading with account_email, the one owner field. mongomock scans rather than using indexes, so latency here is
+    an upper bound; the index check is what carries over to Cosmos.
+  - chat: "Show my appointments", "Cancel my appointment on <date>",
+    "Yes, cancel it" through the app (stub LLM), with turn latency and LLM
+    calls per turn, checking the appointment ends up cancelled.
+
+    python -m benchmarks.bench_appointments [--users 2000] [--per-user 12] [--queries 200] [--chat-users 10]
+"""
+import re
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+from benchmarks.bench_chat_flow import Recorder, percentile, setup_environment
+from benchmarks.stubs import CITIES, HOSPITALS, SPECIALIZATIONS
+
+
+CANONICAL_DATE = re.compile(r"\d{4}-\d{2}-\d{2}$")
+
+
+def appointment(rng: random.Random, index: int, n: int, free_text: bool = False) -> dict:
+    day = date.today() + timedelta(days=rng.randint(-300, 60))
+    doc = {
+        "username": f"Seed{index}", "phone_number": f"93{index:08d}", "mail": f"seed{index}@example.com",
+        "location": rng.choice(CITIES), "hospital_name": rng.choice(HOSPITALS),
+        "specialization": rng.choice(SPECIALIZATIONS),
+        "appointment_booking_date": day.isoformat(),
+        "appointment_booking_time": f"{rng.randint(9, 17):02d}:{rng.choice((0, 15, 30, 45)):02d}",
+        "appointment_status": "cancelled" if n % 5 == 4 else rng.choice(("Pending", "confirmed")),
+        "date": day.isoformat(), "time": "10:00:00", "account_email": f"seed{index}@example.com",
+    }
+    if free_text:
+        doc["appointment_booking_date"] = rng.choice(("next Friday", "tomorrow", day.strftime("%d %B")))
+    return doc
+
+
+def seed(users: int, per_user: int) -> None:
+    from db_utils import patient_information_details_table_collection as appointments
+
+    rng = random.Random(42)
+    batch = []
+    for index in range(users):
+        for n in range(per_user):
+            batch.append(appointment(rng, index, n, free_text=n % 3 == 0))
+        if len(batch) >= 5000:
+            appointments.insert_many(batch)
+            batch = []
+    if batch:
+        appointments.insert_many(batch)
+
+
+def leading_indexes() -> dict:
+    """Owner field -> init_db index that starts with it (only account_email should have one)."""
+    from db_utils import patient_information_details_table_collection as appointments
+
+    found = {}
+    for name, info in appointments.index_information().items():
+        first = info["key"][0][0]
+        if first in ("account_email", "mail", "phone_number"):
+            found[first] = name
+    return found
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+
+def bench_db(users: int, queries: int, counter) -> dict:
+    import db_utils
+
+    rng = random.Random(7)
+    today = date.today().isoformat()
+    check_ms, cancel_ms, returned = [], [], []
+    free_text = 0
+    counter.ops.clear()
+    for _ in range(queries):
+        index = rng.randrange(users)
+        found, ms = timed(lambda: db_utils.find_appointments(f"seed{index}@example.com", from_date=today))
+        check_ms.append(ms)
+        returned.append(len(found))
+        free_text += sum(not CANONICAL_DATE.match(a["appointment_booking_date"]) for a in found)
+    check_ops = counter.total() / queries
+
+    counter.ops.clear()
+    cancelled = 0
+    for _ in range(queries):
+        index = rng.randrange(users)
+        upcoming = db_utils.find_appointments(f"seed{index}@example.com", from_date=today)
+        if not upcoming:
+            continue
+        counter.ops.clear()
+        (status, _), ms = timed(lambda: db_utils.cancel_appointment(
+            str(upcoming[0]["_id"]), f"seed{index}@example.com"))
+        cancel_ms.append(ms)
+        cancelled += status == "cancelled"
+    cancel_ops = counter.total()
+    return {
+        "check": {"p50_ms": round(percentile(check_ms, 50), 2), "p95_ms": round(percentile(check_ms, 95), 2),
+                  "mean_returned": round(sum(returned) / len(returned), 2), "free_text_returned": free_text,
+                  "ops_per_call": round(check_ops, 2)},
+        "cancel": {"p50_ms": round(percentile(cancel_ms, 50), 2), "p95_ms": round(percentile(cancel_ms, 95), 2),
+                   "calls": len(cancel_ms), "cancelled": cancelled,
+                   # counted for the last call only: one conditional update
+                   "ops_per_call": cancel_ops},
+        "indexes": leading_indexes(),
+    }
+
+
+def bench_chat(app, stub, users: int, per_user: int) -> dict:
+    import db_utils
+
+    recorder = Recorder()
+    calls_by_turn = {}
+    verified = 0
+    rng = random.Random(11)
+    for index in range(users):
+        client = app.test_client()
+        email = f"check{index}@example.com"
+        client.post("/register", data={
+            "firstname": f"Check{index}", "email": email, "phone": f"94{index:08d}", "country": "India",
+            "state": "Tamil Nadu", "location": "Centre", "city": "Chennai", "password": "bench-password"})
+        docs = [appointment(rng, 100_000 + index, n) for n in range(per_user)]
+        target = (date.today() + timedelta(days=3 + index)).isoformat()
+        docs[0].update({"appointment_booking_date": target, "appointment_status": "Pending"})
+        for doc in docs:
+            doc.update({"account_email": email, "mail": email})
+        db_utils.patient_information_details_table_collection.insert_many(docs)
+
+        response = client.post("/login", data={"email": email, "password": "bench-password"})
+        session_id = response.headers["Location"].rstrip("/").split("/")[-1]
+        client.get(f"/chat/{session_id}")
+        for label, text in (("check", "Show my appointments"), ("cancel_ask", f"Cancel my appointment on {target}"),
+                            ("cancel_confirm", "Yes, cancel it")):
+            before = stub.calls["chat"] + stub.calls["chat_tools"]
+            recorder.timed(label, lambda: client.post(f"/chat/{session_id}", json={"user_input": text}))
+            calls_by_turn.setdefault(label, []).append(stub.calls["chat"] + stub.calls["chat_tools"] - before)
+        stored = db_utils.patient_information_details_table_collection.find_one({"_id": docs[0]["_id"]})
+        verified += stored["appointment_status"] == db_utils.CANCELLED_STATUS
+    return {
+        "turns": {label: {"p50_ms": round(percentile(values, 50), 1), "p95_ms": round(percentile(values, 95), 1),
+                          "errors": recorder.errors.get(label, 0),
+                          "llm_calls": round(sum(calls_by_turn[label]) / len(calls_by_turn[label]), 2)}
+                  for label, values in recorder.latencies.items()},
+        "cancelled_in_db": f"{verified}/{users}",
+    }
+
+
+def run(users: int, per_user: int, queries: int, chat_users: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_appointments_")
+    app, stub, counter = setup_environment(workdir, 0, 0)
+    import db_utils
+
+    db_utils.init_db()
+    seed(users, per_user)
+    report = {"users": users, "per_user": per_user, "appointments": users * per_user,
+              "db": bench_db(users, queries, counter),
+              "chat": bench_chat(app, stub, chat_users, per_user)}
+    stub.stop()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--per-user", type=int, default=12)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--chat-users", type=int, default=10)
+    args = parser.parse_args()
+    print(json.dumps(run(args.users, args.per_user, args.queries, args.chat_users), indent=2))
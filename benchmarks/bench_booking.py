@@ -0,0 +1,83 @@
+"""Concurrency stress for the booking engine: no slot may be booked twice.
+
+Many threads race to hold and confirm a small set of slots on the same day;
+the run fails if any slot ends up with more than one successful confirmation.
+Also reports availability-query latency. Uses mongomock by default (pip install
+mongomock); pass ``--mongo-uri`` to run against a real server.
+
+    python -m benchmarks.bench_booking [--threads 32] [--attempts 2000] [--slots 8]
+"""
+import json
+import time
+import random
+import argparse
+import statistics
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import booking
+
+
+def _collection(mongo_uri):
+    if mongo_uri:
+        from pymongo import MongoClient
+        collection = MongoClient(mongo_uri)["bench_booking"]["appointment_slots"]
+        collection.drop()
+        return collection
+    import mongomock
+    return mongomock.MongoClient()["bench_booking"]["appointment_slots"]
+
+
+def run(threads: int, attempts: int, slots: int, mongo_uri=None) -> dict:
+    booking.slots_collection = _collection(mongo_uri)
+    day = date.today() + timedelta(days=1)
+    start = booking.CLINIC_HOURS[0][0]
+    minutes = [start + i * booking.SLOT_MINUTES for i in range(slots)]
+    confirmed = Counter()
+    lock = threading.Lock()
+
+    def attempt(i):
+        minute = random.choice(minutes)
+        reservation = booking.hold("Apollo Hospitals", "Dr. Doctor 0", day, minute, holder=f"user{i}")
+        if reservation and booking.confirm(reservation, appointment_id=i):
+            with lock:
+                confirmed[minute] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(attempt, range(attempts)))
+    elapsed = time.perf_counter() - started
+
+    double_booked = {booking.format_minutes(m): n for m, n in confirmed.items() if n > 1}
+    timings = []
+    for _ in range(200):
+        booking._availability_cache.clear()
+        t0 = time.perf_counter()
+        booking.availability("Apollo Hospitals", "Dr. Doctor 0", day)
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+    return {
+        "threads": threads,
+        "attempts": attempts,
+        "slots": slots,
+        "confirmed": sum(confirmed.values()),
+        "double_booked": double_booked,
+        "elapsed_s": round(elapsed, 3),
+        "availability_uncached_p50_ms": round(statistics.median(timings), 3),
+        "availability_uncached_p99_ms": round(timings[int(len(timings) * 0.99) - 1], 3),
+        "ok": not double_booked and sum(confirmed.values()) == len(confirmed) <= slots,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+    report = run(args.threads, args.attempts, args.slots, args.mongo_uri)
+    print(json.dumps(report, indent=2))
+    raise SystemExit(0 if report["ok"] else 1)
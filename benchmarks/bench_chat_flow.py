@@ -0,0 +1,238 @@
+"""End-to-end load test of the chat flow against local stand-ins.
+
+Boots ``main.create_app`` with:
+  - the Azure OpenAI clients pointed at a local stub (benchmarks/stubs.py)
+    with configurable latency, playing a scripted booking conversation,
+  - mongomock in place of Cosmos (operations counted per collection),
+  - the doctor directory served from a synthetic vector snapshot,
+then drives ``--users`` scripted conversations (register, login, greeting,
+six booking turns, session check, page reload) at ``--concurrency``.
+
+Reports throughput, p50/p95/p99 latency per endpoint, LLM calls per turn,
+DB ops per turn and RSS growth as JSON (stdout or --out) so CI can gate on it.
+
+    pip install -r requirements-dev.txt
+    python -m benchmarks.bench_chat_flow [--users 20] [--concurrency 4] [--llm-latency-ms 50]
+
+With ``--replay record|replay --archive FILE`` the run goes through the
+llm_replay layer: record once (against the stub, or real Azure with --live),
+then replay the same traffic on another code version and compare the two
+reports with ``python -m benchmarks.compare_reports old.json new.json``.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/status", encoding="utf-8") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def booking_script(user_index: int, slots_per_day: int = 28):
+    """Turns for one user; each user asks for a distinct slot so bookings don't collide."""
+    day = date.today() + timedelta(days=1 + user_index // slots_per_day)
+    minute = 9 * 60 + (user_index % slots_per_day) * 15
+    if minute >= 13 * 60:
+        minute += 60  # skip the lunch break in the default clinic hours
+    at = f"{minute // 60:02d}:{minute % 60:02d}"
+    return [
+        "I want to book a doctor appointment",
+        "I am in Chennai",
+        "Apollo Hospitals please",
+        "Cardiologist",
+        f"{day.isoformat()} at {at}",
+        "Yes, please go ahead",
+    ]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def timed(self, endpoint: str, fn, ok=lambda r: r.status_code < 400):
+        started = time.perf_counter()
+        response = fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok(response):
+                self.errors[endpoint] += 1
+        return response
+
+
+def setup_environment(workdir: str, llm_latency_ms: float, token_ms: float,
+                      replay: str = "off", archive: str = None, live: bool = False,
+                      retriever: str = "snapshot"):
+    """Start the stubs and import the app. Must run before any app module is imported."""
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+
+    from benchmarks.stubs import StubOpenAIServer, use_mongomock, write_directory_shards, write_directory_snapshot
+
+    counter = use_mongomock()
+    stub = StubOpenAIServer(latency_ms=llm_latency_ms, token_ms=token_ms).start()
+    snapshot_dir = os.path.join(workdir, "snapshot")
+    # Read by retriever.retriever_model when patient_bot_conversational is imported
+    os.environ["VECTOR_SNAPSHOT_DIR"] = snapshot_dir
+    write_directory_snapshot(snapshot_dir)
+    if retriever == "sharded":
+        os.environ["VECTOR_SHARD_DIR"] = os.path.join(workdir, "shards")
+        write_directory_shards(os.environ["VECTOR_SHARD_DIR"])
+
+    if not live:
+        os.environ.update({
+            "llm_azure_endpoint": stub.endpoint,
+            "llm_api_key": "stub",
+            "embedding_azure_endpoint": stub.endpoint,
+            "embedding_api_key": "stub",
+            # tiktoken would download its vocabulary to tokenize queries
+            "embedding_check_ctx_length": "0",
+        })
+    if replay != "off":
+        os.environ.update({"LLM_REPLAY_MODE": replay, "LLM_REPLAY_ARCHIVE": archive})
+    os.environ.update({
+        "RETRIEVER_BACKEND": retriever,
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    # Measure the app, not the production rate limits, unless asked to
+    os.environ.setdefault("LLM_RPM", "1000000")
+    os.environ.setdefault("LLM_TPM", "1000000000")
+    os.environ.setdefault("LOGIN_RATE_PER_IP", "1000000")
+    os.environ.setdefault("CHAT_MAX_IN_FLIGHT", "0")
+
+    import main
+
+    app = main.create_app()
+    app.config["TESTING"] = True
+    return app, stub, counter
+
+
+def run_user(app, recorder: Recorder, index: int) -> int:
+    client = app.test_client()
+    email = f"bench{index}@example.com"
+    recorder.timed("POST /register", lambda: client.post("/register", data={
+        "firstname": f"Bench{index}", "email": email, "phone": f"90000{index:05d}", "country": "India",
+        "state": "Tamil Nadu", "location": "Velachery", "city": "Chennai", "password": "bench-password",
+    }), ok=lambda r: r.status_code == 302)
+
+    response = recorder.timed("POST /login", lambda: client.post(
+        "/login", data={"email": email, "password": "bench-password"}), ok=lambda r: r.status_code == 302)
+    location = response.headers.get("Location", "")
+    session_id = location.rstrip("/").split("/")[-1]
+    recorder.timed("GET /chat/<id>", lambda: client.get(f"/chat/{session_id}"))
+
+    turns = 0
+    for text in booking_script(index):
+        recorder.timed("POST /chat/<id>", lambda: client.post(f"/chat/{session_id}", json={"user_input": text}))
+        turns += 1
+    recorder.timed("GET /check-session", lambda: client.get("/check-session"))
+    # A browser refresh: the greeting must come from session state, not a new graph turn
+    recorder.timed("GET /chat/<id> (reload)", lambda: client.get(f"/chat/{session_id}"))
+    return turns
+
+
+def run(users: int, concurrency: int, llm_latency_ms: float, token_ms: float,
+        replay: str = "off", archive: str = None, live: bool = False, retriever: str = "snapshot") -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_chat_flow_")
+    app, stub, counter = setup_environment(workdir, llm_latency_ms, token_ms, replay, archive, live, retriever)
+    import llm_replay
+    import chat_routes
+    recorder = Recorder()
+
+    # One warm-up conversation so import-time and first-request costs are excluded
+    run_user(app, Recorder(), users + 1)
+    stub.calls.clear()
+    counter.ops.clear()
+    chat_routes.greeting_stats.reset()
+    if llm_replay.get_archive():
+        llm_replay.get_archive().reset_stats()
+    rss_before = rss_kb()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        turns = sum(pool.map(lambda i: run_user(app, recorder, i), range(users)))
+    elapsed = time.perf_counter() - started
+    rss_after = rss_kb()
+    stub.stop()
+
+    # The greeting on GET /chat/<id> counts as a turn (it runs the graph with GREETING_MODE=llm)
+    graph_turns = turns + users
+    replay_stats = llm_replay.stats()
+    # Replayed completions never reach the stub but are still calls the code made
+    llm_calls = stub.calls["chat"] + stub.calls["chat_tools"] + replay_stats.get("chat_hits", 0)
+    return {
+        "config": {"users": users, "concurrency": concurrency, "llm_latency_ms": llm_latency_ms,
+                   "token_ms": token_ms, "replay": replay, "live": live, "retriever": retriever},
+        "elapsed_s": round(elapsed, 3),
+        "throughput_turns_per_s": round(turns / elapsed, 3),
+        "endpoints": {
+            endpoint: {
+                "count": len(values),
+                "errors": recorder.errors.get(endpoint, 0),
+                "p50_ms": round(percentile(values, 50), 2),
+                "p95_ms": round(percentile(values, 95), 2),
+                "p99_ms": round(percentile(values, 99), 2),
+                "mean_ms": round(statistics.fmean(values), 2),
+            }
+            for endpoint, values in sorted(recorder.latencies.items())
+        },
+        "llm_calls": dict(stub.calls),
+        "llm_calls_per_turn": round(llm_calls / graph_turns, 3),
+        "db_ops": dict(sorted(counter.ops.items())),
+        "db_ops_per_turn": round(counter.total() / graph_turns, 3),
+        "rss_kb": {"before": rss_before, "after": rss_after, "growth": rss_after - rss_before},
+        "replay": replay_stats,
+        "greeting": chat_routes.greeting_stats.snapshot(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=0.0)
+    parser.add_argument("--out", default=None, help="write the JSON report to this file")
+    parser.add_argument("--replay", choices=("off", "record", "replay"), default="off")
+    parser.add_argument("--archive", default="llm_replay.jsonl.gz", help="record/replay archive path")
+    parser.add_argument("--live", action="store_true", help="use the configured Azure endpoints, not the stub")
+    parser.add_argument("--retriever", choices=("snapshot", "sharded"), default="snapshot")
+    args = parser.parse_args()
+    out_path = os.path.abspath(args.out) if args.out else None
+    archive_path = os.path.abspath(args.archive)
+
+    report = run(args.users, args.concurrency, args.llm_latency_ms, args.token_ms,
+                 args.replay, archive_path, args.live, args.retriever)
+    output = json.dumps(report, indent=2)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as fh:
+            fh.write(output)
+    print(output)
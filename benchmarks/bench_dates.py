@@ -0,0 +1,142 @@
+"""Local date/time resolution (appointment_time.py) against a corpus of appointment requests.
+
+The corpus is what patients type when asked "What date and time would you
+prefer?", each with the date and time it means on Monday 2026-10-19 14:05
+(NOW), plus messages that mention no appointment date at all (kept in
+benchmarks/tests/test_appointment_time.py, which asserts each one). Reports:
+
+  - corpus: how many messages resolve to exactly the expected date, time and
+    past flag, with the mismatches listed,
+  - prompt: date-bearing messages whose date the assistant had to work out
+    itself from the "Current Date" line (every one before; after, only those
+    left unresolved), and past dates flagged before the model sees them.
+    Each is a chance for a wrong date and a correction turn; how many of
+    those a given model actually makes needs the real model, so the turns
+    avoided are bounded by this count rather than measured,
+  - slots: booking fields as the extraction prompt returns them (EXTRACTED,
+    often the user's own wording) through booking.hold_for_request, with the
+    fixed formats only (before) and with the appointment_time fallback
+    (after). An "unparsed" booking is recorded without holding a slot, so
+    nothing stops the same slot being booked twice,
+  - cost: resolve() per message.
+
+    python -m benchmarks.bench_dates
+"""
+import json
+import time
+import argparse
+import statistics
+from unittest import mock
+
+from benchmarks.bench_chat_flow import percentile
+# The corpus and its clock; benchmarks/tests/test_appointment_time.py asserts every case
+from benchmarks.tests.test_appointment_time import CORPUS, NOW
+
+# (appointment_booking_date, appointment_booking_time) as extracted, and the slot they mean on NOW
+EXTRACTED = [
+    ("2026-10-20", "10:00", "2026-10-20", "10:00"),
+    ("2026-10-21", "4:30 PM", "2026-10-21", "16:30"),
+    ("October 22, 2026", "11:00 AM", "2026-10-22", "11:00"),
+    ("22/10/2026", "15:00", "2026-10-22", "15:00"),
+    ("23 October 2026", "9:45", "2026-10-23", "09:45"),
+    ("tomorrow", "5pm", "2026-10-20", "17:00"),
+    ("Tomorrow", "10 am", "2026-10-20", "10:00"),
+    ("day after tomorrow", "4 pm", "2026-10-21", "16:00"),
+    ("next Monday", "3 PM", "2026-10-26", "15:00"),
+    ("Friday", "2 p.m.", "2026-10-23", "14:00"),
+    ("Wednesday", "10:15 AM", "2026-10-21", "10:15"),
+    ("20th October", "10:00 AM", "2026-10-20", "10:00"),
+    ("23rd Oct", "3 PM", "2026-10-23", "15:00"),
+    ("Nov 5", "9:30 am", "2026-11-05", "09:30"),
+    ("November 3rd, 2026", "4pm", "2026-11-03", "16:00"),
+    ("25/10", "9:45 AM", "2026-10-25", "09:45"),
+    ("30-10-26", "5 PM", "2026-10-30", "17:00"),
+    ("in 3 days", "10am", "2026-10-22", "10:00"),
+    ("2026-10-27", "noon", "2026-10-27", "12:00"),
+    ("27th of October", "5:15 p.m.", "2026-10-27", "17:15"),
+]
+
+
+def check_corpus() -> dict:
+    import appointment_time
+
+    mismatches = []
+    for text, day, at, past in CORPUS:
+        got = appointment_time.resolve(text, NOW)
+        expected = (day, at, past) if day or at else None
+        actual = (got["date"], got["time"], got["past"]) if got else None
+        if actual != expected:
+            mismatches.append({"message": text, "expected": expected, "got": actual})
+    return {"messages": len(CORPUS), "correct": len(CORPUS) - len(mismatches), "mismatches": mismatches}
+
+
+def prompt_work() -> dict:
+    import appointment_time
+
+    dated = [(text, day, past) for text, day, _, past in CORPUS if day]
+    resolved = [appointment_time.resolve(text, NOW) for text, _, _ in dated]
+    left = sum(not (r and r["date"] == day) for r, (_, day, _) in zip(resolved, dated))
+    return {
+        "date_bearing_messages": len(dated),
+        "dates_the_model_works_out": {"before": len(dated), "after": left},
+        "past_dates": sum(past for _, _, past in dated),
+        "past_dates_flagged_before_the_model": sum(bool(r and r["past"]) for r in resolved),
+        "example": appointment_time.annotate("tomorrow 5pm", NOW),
+    }
+
+
+def slot_path() -> dict:
+    import mongomock
+    import booking
+
+    booking.slots_collection = mongomock.MongoClient()["bench_dates"]["appointment_slots"]
+
+    # One doctor per request, so no two requests compete for a slot
+    records = [{"hospital": "Apollo Hospitals", "location": "Chennai", "specialization": f"Cardiologist {i}",
+                "doctor": f"Dr. Doctor {i}"} for i in range(len(EXTRACTED))]
+
+    def outcomes():
+        counts = {"held": 0, "wrong_slot": 0, "unavailable": 0, "unparsed": 0}
+        for i, (day_text, time_text, day, at) in enumerate(EXTRACTED):
+            data = {"hospital_name": "Apollo Hospitals", "specialization": f"Cardiologist {i}",
+                    "appointment_booking_date": day_text, "appointment_booking_time": time_text}
+            status, reservation = booking.hold_for_request(data, "bench", records)
+            if reservation:
+                booking.release(reservation)
+                if (reservation["date"], reservation["time"]) != (day, at):
+                    status = "wrong_slot"
+            counts[status] += 1
+        return counts
+
+    with mock.patch("appointment_time.local_now", return_value=NOW), \
+            mock.patch("booking.local_now", return_value=NOW):
+        with mock.patch("booking.resolve_date", return_value=None), \
+                mock.patch("booking.resolve_minutes", return_value=None):
+            before = outcomes()
+        after = outcomes()
+    return {"booking_requests": len(EXTRACTED), "before": before, "after": after}
+
+
+def cost() -> dict:
+    import appointment_time
+
+    timings = []
+    for _ in range(20):
+        for text, *_ in CORPUS:
+            started = time.perf_counter()
+            appointment_time.resolve(text, NOW)
+            timings.append((time.perf_counter() - started) * 1000)
+    return {"resolve_p50_ms": round(statistics.median(timings), 4),
+            "resolve_p99_ms": round(percentile(timings, 99), 4)}
+
+
+def run() -> dict:
+    return {"now": NOW.isoformat(), "corpus": check_corpus(), "prompt": prompt_work(), "slots": slot_path(),
+            "cost": cost()}
+
+
+if __name__ == "__main__":
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    report = run()
+    print(json.dumps(report, indent=2))
+    raise SystemExit(0 if not report["corpus"]["mismatches"] else 1)
@@ -0,0 +1,232 @@
+"""Query embedding latency and throughput: Azure OpenAI vs the local ONNX backend.
+
+Measures ``embed_query`` p50/p99 and ``embed_documents`` throughput for:
+
+  - azure: AzureOpenAIEmbeddings against the local stub with
+    --azure-latency-ms per request (a modelled network round trip; the
+    stub's own work is negligible)
+  - onnx-fp32 / onnx-int8: ``local_embeddings.OnnxEmbeddings`` on this CPU
+
+By default the ONNX model is synthetic: a BERT encoder with the shape of
+all-MiniLM-L6-v2 (6 layers, hidden 384, 12 heads, FFN 1536, 30522-token
+vocabulary) and random weights, written with the ``onnx`` helpers and then
+int8 quantized, plus a WordPiece tokenizer trained on the directory text.
+Latency depends on the architecture and sequence length, not the weights,
+so this measures the real CPU cost without downloading a model. Pass
+--model-dir to benchmark a real export instead (``local_embeddings.py download``).
+
+Also reports concurrent query throughput with --callers threads for each
+EMBEDDING_THREADS value in --threads.
+
+Needs the optional packages: pip install -r requirements-dev.txt -r requirements-onnx.txt
+
+    python -m benchmarks.bench_embeddings [--queries 300] [--azure-latency-ms 100] [--threads 1,2] [--callers 4]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.bench_chat_flow import percentile
+from benchmarks.stubs import CITIES, HOSPITALS, SPECIALIZATIONS, StubOpenAIServer, directory_documents
+
+VOCAB, HIDDEN, LAYERS, HEADS, FFN, MAX_POSITIONS = 30522, 384, 6, 12, 1536, 512
+
+
+def queries(n: int):
+    """Queries shaped like the ones hospital_details sends."""
+    templates = ["hospitals in {city}", "specializations at {hospital} in {city}",
+                 "{spec} at {hospital} in {city}", "Which hospitals have a {spec} near {city}?"]
+    return [templates[i % len(templates)].format(city=CITIES[i % len(CITIES)], hospital=HOSPITALS[i % len(HOSPITALS)],
+                                                 spec=SPECIALIZATIONS[i % len(SPECIALIZATIONS)]) for i in range(n)]
+
+
+def build_tokenizer(path: str) -> None:
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors, trainers
+
+    tokenizer = Tokenizer(models.WordPiece(unk_token="[UNK]"))
+    tokenizer.normalizer = normalizers.BertNormalizer(lowercase=True)
+    tokenizer.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    specials = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+    trainer = trainers.WordPieceTrainer(vocab_size=VOCAB, special_tokens=specials)
+    corpus = [text for text, _ in directory_documents(4)] + queries(200)
+    tokenizer.train_from_iterator(corpus, trainer)
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]", special_tokens=[("[CLS]", 2), ("[SEP]", 3)])
+    tokenizer.save(path)
+
+
+def build_encoder(path: str) -> None:
+    """A MiniLM-L6-shaped BERT encoder with random weights: input_ids/attention_mask/token_type_ids -> states."""
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    rng = np.random.default_rng(0)
+    nodes, inits = [], []
+
+    def weight(name, *shape):
+        inits.append(numpy_helper.from_array((rng.standard_normal(shape) * 0.02).astype(np.float32), name))
+        return name
+
+    def const(name, value, dtype=np.float32):
+        inits.append(numpy_helper.from_array(np.asarray(value, dtype=dtype), name))
+        return name
+
+    def node(op, inputs, name, **attrs):
+        nodes.append(helper.make_node(op, inputs, [name], **attrs))
+        return name
+
+    def layer_norm(x, name):
+        return node("LayerNormalization", [x, const(f"{name}.g", np.ones(HIDDEN)), const(f"{name}.b", np.zeros(HIDDEN))],
+                    name, axis=-1, epsilon=1e-12)
+
+    def dense(x, name, n_in, n_out):
+        return node("Add", [node("MatMul", [x, weight(f"{name}.w", n_in, n_out)], f"{name}.mm"),
+                            const(f"{name}.bias", np.zeros(n_out))], name)
+
+    # Embeddings
+    seq_len = node("Gather", [node("Shape", ["input_ids"], "shape"), const("one", 1, np.int64)], "seq_len", axis=0)
+    positions = node("Range", [const("zero_i", 0, np.int64), seq_len, const("one_i", 1, np.int64)], "positions")
+    x = node("Add", [node("Gather", [weight("word_emb", VOCAB, HIDDEN), "input_ids"], "word"),
+                     node("Gather", [weight("pos_emb", MAX_POSITIONS, HIDDEN), positions], "pos")], "emb0")
+    x = node("Add", [x, node("Gather", [weight("type_emb", 2, HIDDEN), "token_type_ids"], "type")], "emb1")
+    x = layer_norm(x, "emb_ln")
+    # Padding mask as an additive bias over the key axis: [B, 1, 1, T]
+    keep = node("Cast", ["attention_mask"], "mask_f", to=TensorProto.FLOAT)
+    bias = node("Mul", [node("Sub", [const("one_f", 1.0), keep], "mask_inv"), const("neg", -10000.0)], "mask_bias")
+    bias = node("Unsqueeze", [bias, const("mask_axes", [1, 2], np.int64)], "mask_bias4")
+
+    heads_shape = const("heads_shape", [0, 0, HEADS, HIDDEN // HEADS], np.int64)
+    merged_shape = const("merged_shape", [0, 0, HIDDEN], np.int64)
+    for i in range(LAYERS):
+        p = f"l{i}"
+
+        def split(name, perm):
+            return node("Transpose", [node("Reshape", [dense(x, f"{p}.{name}", HIDDEN, HIDDEN), heads_shape],
+                                           f"{p}.{name}.r")], f"{p}.{name}.t", perm=perm)
+
+        q, k, v = split("q", [0, 2, 1, 3]), split("k", [0, 2, 3, 1]), split("v", [0, 2, 1, 3])
+        scores = node("Mul", [node("MatMul", [q, k], f"{p}.qk"), const(f"{p}.scale", 1 / np.sqrt(HIDDEN // HEADS))],
+                      f"{p}.scaled")
+        probs = node("Softmax", [node("Add", [scores, bias], f"{p}.masked")], f"{p}.probs", axis=-1)
+        context = node("Transpose", [node("MatMul", [probs, v], f"{p}.ctx")], f"{p}.ctx.t", perm=[0, 2, 1, 3])
+        context = node("Reshape", [context, merged_shape], f"{p}.ctx.r")
+        x = layer_norm(node("Add", [x, dense(context, f"{p}.o", HIDDEN, HIDDEN)], f"{p}.res1"), f"{p}.ln1")
+        hidden = dense(x, f"{p}.ffn1", HIDDEN, FFN)
+        # GELU(x) = 0.5 x (1 + erf(x / sqrt(2)))
+        erf = node("Erf", [node("Mul", [hidden, const(f"{p}.rsqrt2", 1 / np.sqrt(2))], f"{p}.gs")], f"{p}.erf")
+        gelu = node("Mul", [node("Mul", [hidden, const(f"{p}.half", 0.5)], f"{p}.gh"),
+                            node("Add", [erf, const(f"{p}.one", 1.0)], f"{p}.g1")], f"{p}.gelu")
+        x = layer_norm(node("Add", [x, dense(gelu, f"{p}.ffn2", FFN, HIDDEN)], f"{p}.res2"), f"{p}.ln2")
+    nodes.append(helper.make_node("Identity", [x], ["last_hidden_state"]))
+
+    int_input = lambda name: helper.make_tensor_value_info(name, TensorProto.INT64, ["batch", "sequence"])
+    graph = helper.make_graph(
+        nodes, "minilm_shaped_encoder",
+        [int_input("input_ids"), int_input("attention_mask"), int_input("token_type_ids")],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", HIDDEN])],
+        inits)
+    # IR 8 is what opset 17 shipped with; newer onnx packages default past what onnxruntime reads
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)], ir_version=8)
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+
+
+def synthetic_model(workdir: str) -> str:
+    model_dir = os.path.join(workdir, "minilm-shaped")
+    os.makedirs(model_dir, exist_ok=True)
+    build_tokenizer(os.path.join(model_dir, "tokenizer.json"))
+    build_encoder(os.path.join(model_dir, "model.onnx"))
+    return model_dir
+
+
+def single_dir(model_dir: str, model_file: str, workdir: str) -> str:
+    """A directory holding just one of the model files, so OnnxEmbeddings loads that one."""
+    target = os.path.join(workdir, model_file.replace(".onnx", ""))
+    os.makedirs(target, exist_ok=True)
+    for name in (model_file, "tokenizer.json"):
+        if not os.path.exists(os.path.join(target, name)):
+            os.symlink(os.path.abspath(os.path.join(model_dir, name)), os.path.join(target, name))
+    return target
+
+
+def query_latency(embeddings, texts) -> dict:
+    embeddings.embed_query(texts[0])  # warm-up
+    latencies = []
+    for text in texts:
+        started = time.perf_counter()
+        embeddings.embed_query(text)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {"p50_ms": round(percentile(latencies, 50), 2), "p99_ms": round(percentile(latencies, 99), 2),
+            "queries_per_s": round(len(texts) / (sum(latencies) / 1000), 1)}
+
+
+def concurrent_throughput(embeddings, texts, callers: int) -> float:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        list(pool.map(embeddings.embed_query, texts))
+    return round(len(texts) / (time.perf_counter() - started), 1)
+
+
+def document_throughput(embeddings, documents) -> float:
+    started = time.perf_counter()
+    embeddings.embed_documents(documents)
+    return round(len(documents) / (time.perf_counter() - started), 1)
+
+
+def run(n_queries: int, azure_latency_ms: float, threads, callers: int, model_dir: str = None) -> dict:
+    from langchain_openai import AzureOpenAIEmbeddings
+    from local_embeddings import OnnxEmbeddings, quantize
+
+    texts = queries(n_queries)
+    documents = [text for text, _ in directory_documents(2)]
+    report = {"cpus": os.cpu_count(), "queries": n_queries, "documents": len(documents)}
+
+    stub = StubOpenAIServer(latency_ms=azure_latency_ms).start()
+    azure = AzureOpenAIEmbeddings(model="text-embedding-3-small", azure_deployment="stub", api_version="2023-05-15",
+                                  azure_endpoint=stub.endpoint, api_key="stub", check_embedding_ctx_length=False)
+    report["azure"] = {"modelled_rtt_ms": azure_latency_ms, **query_latency(azure, texts[:max(20, n_queries // 5)])}
+    stub.stop()
+
+    workdir = tempfile.mkdtemp(prefix="bench_embeddings_")
+    synthetic = model_dir is None
+    model_dir = model_dir or synthetic_model(workdir)
+    report["model"] = "synthetic MiniLM-L6 shape" if synthetic else model_dir
+    if not os.path.exists(os.path.join(model_dir, "model_quantized.onnx")):
+        quantize(model_dir)
+    for label, model_file in (("onnx-fp32", "model.onnx"), ("onnx-int8", "model_quantized.onnx")):
+        if not os.path.exists(os.path.join(model_dir, model_file)):
+            continue
+        path = single_dir(model_dir, model_file, workdir)
+        result = {"model_mb": round(os.path.getsize(os.path.join(model_dir, model_file)) / 2 ** 20, 1)}
+        for n in threads:
+            embeddings = OnnxEmbeddings(path, threads=n, max_concurrency=max(1, callers))
+            result[f"threads={n}"] = {
+                **query_latency(embeddings, texts),
+                f"concurrent_queries_per_s@{callers}": concurrent_throughput(embeddings, texts, callers),
+                "documents_per_s@batch32": document_throughput(embeddings, documents),
+            }
+        single = OnnxEmbeddings(path, threads=threads[0], batch_size=1)
+        result["documents_per_s@batch1"] = document_throughput(single, documents)
+        report[label] = result
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--azure-latency-ms", type=float, default=100)
+    parser.add_argument("--threads", default="1,2", help="EMBEDDING_THREADS values to compare")
+    parser.add_argument("--callers", type=int, default=4, help="concurrent request threads")
+    parser.add_argument("--model-dir", default=None, help="a real model directory instead of the synthetic one")
+    args = parser.parse_args()
+    print(json.dumps(run(args.queries, args.azure_latency_ms, [int(t) for t in args.threads.split(",")],
+                         args.callers, args.model_dir), indent=2))
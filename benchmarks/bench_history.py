@@ -0,0 +1,70 @@
+"""History-load latency vs. number of stored conversations.
+
+Fills ``patient_each_chat_table`` with N conversations of M messages through
+conversation_store and times ``load_history`` for random sessions. Uses an
+in-process mongomock by default (pip install mongomock); pass ``--mongo-uri``
+to measure against a real server where the (session_id, seq) index is used.
+
+    python -m benchmarks.bench_history [--conversations 100,1000,10000] [--messages 20]
+"""
+import json
+import time
+import random
+import argparse
+import statistics
+
+import db_utils
+import conversation_store
+
+
+def _collections(mongo_uri):
+    if mongo_uri:
+        from pymongo import MongoClient
+        database = MongoClient(mongo_uri)["bench_history"]
+        database.drop_collection("patient_each_chat_table")
+        database.drop_collection("chat_sequences")
+    else:
+        import mongomock
+        database = mongomock.MongoClient()["bench_history"]
+    return database["patient_each_chat_table"], database["chat_sequences"]
+
+
+def run(conversations: int, messages: int, samples: int, mongo_uri=None) -> dict:
+    chats, sequences = _collections(mongo_uri)
+    db_utils.chat_collection = conversation_store.chat_collection = chats
+    conversation_store.sequence_collection = sequences
+    chats.create_index([("session_id", 1), ("seq", 1)])
+
+    docs = []
+    for c in range(conversations):
+        for m in range(1, messages + 1):
+            docs.append({"session_id": f"s{c}", "email": f"user{c}@example.com",
+                         "role": "user" if m % 2 else "assistant", "seq": m,
+                         "message": f"message {m} of conversation {c}"})
+    chats.insert_many(docs)
+
+    timings = []
+    for _ in range(samples):
+        session_id = f"s{random.randrange(conversations)}"
+        started = time.perf_counter()
+        page = conversation_store.load_history(session_id, limit=messages)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert len(page["messages"]) == messages
+    timings.sort()
+    return {
+        "conversations": conversations,
+        "messages_per_conversation": messages,
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--conversations", default="100,1000,10000")
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+    results = [run(int(n), args.messages, args.samples, args.mongo_uri) for n in args.conversations.split(",")]
+    print(json.dumps(results, indent=2))
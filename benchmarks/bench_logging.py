@@ -0,0 +1,108 @@
+"""Per-request logging CPU: eager f-string logging vs structured_log.
+
+Replays the log calls made by one POST /chat/<id> turn (chat_routes, agent,
+db_utils and session records), once as the code used to write them (f-strings
+of whole configs and messages, dicts built for session_logger) and once
+through structured_log, at INFO (records emitted to an in-memory handler) and
+at WARNING (records filtered out).
+
+    python -m benchmarks.bench_logging [--requests 20000] [--format text|json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SESSION_ID = "5c5595f3-7eb5-4f81-8932-7ba52ce63742"
+EMAIL = "patient.name@example.com"
+USER_INPUT = "I would like to book a cardiologist at Apollo Hospitals in Chennai tomorrow at 10:30, my number is 9876543210"
+BOT_RESPONSE = ("Here are some options:\n" + "\n".join(
+    f"{i}. Hospital {i}, Chennai - Cardiologist Dr. Doctor {i}, open 09:00-13:00 and 14:00-18:00" for i in range(1, 8)))
+CONFIG = {"configurable": {"patient_data": f"Name: Patient, Phone Number: 9876543210, Email Id: {EMAIL}",
+                           "current_date": "October 19, 2026", "thread_id": "0d3b5a1c-8f0e-4f55-9b8e-2c8d6f1e7a90"}}
+
+
+def eager_request(logger: logging.Logger, session_logger: logging.Logger) -> None:
+    """The log calls of one chat turn before structured logging."""
+    logger.info(f"[Azure] Retrieved existing agent for session {SESSION_ID}")
+    logger.info(f"Inserted Patient Chat Data ID: 671377c1e4b0a1b2c3d4e5f6")
+    logger.info(f"[{SESSION_ID}] User ({EMAIL}) input: {USER_INPUT}")
+    event = {"timestamp": str(datetime.now()), "session_id": SESSION_ID, "event_type": "user_message",
+             "data": {"message": USER_INPUT, "timestamp": str(datetime.now())}}
+    session_logger.info(f"SESSION UPDATED: {event}")
+    logger.debug(f"user_details: {CONFIG}")
+    logger.info(f"Inserted Patient Chat Data ID: 671377c1e4b0a1b2c3d4e5f7")
+    event = {"timestamp": str(datetime.now()), "session_id": SESSION_ID, "event_type": "bot_response",
+             "data": {"response": BOT_RESPONSE, "timestamp": str(datetime.now())}}
+    session_logger.info(f"SESSION UPDATED: {event}")
+    logger.info(f"[{SESSION_ID}] Bot response: {BOT_RESPONSE}")
+    event = {"timestamp": str(datetime.now()), "session_id": SESSION_ID, "event_type": "session_check",
+             "data": {"valid": True}}
+    session_logger.info(f"SESSION UPDATED: {event}")
+    logger.info(f"Session check performed | session_id={SESSION_ID} | valid={True}")
+
+
+def structured_request(log, session_log) -> None:
+    """The same turn through structured_log."""
+    log.debug("agent_reused", session_id=SESSION_ID)
+    log.debug("chat_message_inserted", id="671377c1e4b0a1b2c3d4e5f6", session_id=SESSION_ID)
+    log.info("chat_user_message", session_id=SESSION_ID, email=EMAIL, text=USER_INPUT)
+    session_log.info("user_message", session_id=SESSION_ID, data={"chars": len(USER_INPUT)})
+    log.debug("user_details", session_id=SESSION_ID, details=lambda: CONFIG["configurable"])
+    log.debug("chat_message_inserted", id="671377c1e4b0a1b2c3d4e5f7", session_id=SESSION_ID)
+    session_log.info("bot_response", session_id=SESSION_ID, data={"chars": len(BOT_RESPONSE)})
+    log.info("chat_bot_response", session_id=SESSION_ID, text=BOT_RESPONSE)
+    session_log.info("session_check", session_id=SESSION_ID, data={"valid": True})
+    log.info("session_check", session_id=SESSION_ID, valid=True)
+
+
+def measure(fn, requests: int) -> float:
+    """CPU microseconds per request."""
+    started = time.process_time()
+    for _ in range(requests):
+        fn()
+    return (time.process_time() - started) / requests * 1e6
+
+
+def run(requests: int, log_format: str) -> dict:
+    sys.path.insert(0, REPO_ROOT)
+    os.environ["LOG_FORMAT"] = log_format
+    from structured_log import get_logger, make_formatter
+
+    sink = io.StringIO()
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(make_formatter())
+    results = {}
+    for level_name in ("INFO", "WARNING"):
+        level = getattr(logging, level_name)
+        for name in ("bench.app", "bench.session"):
+            target = logging.getLogger(name)
+            target.handlers = [handler]
+            target.propagate = False
+            target.setLevel(level)
+        before = measure(lambda: eager_request(logging.getLogger("bench.app"), logging.getLogger("bench.session")),
+                         requests)
+        sink.seek(0)
+        sink.truncate()
+        after = measure(lambda: structured_request(get_logger("bench.app"), get_logger("bench.session")), requests)
+        emitted = sink.getvalue().count("\n") / requests
+        sink.seek(0)
+        sink.truncate()
+        results[level_name] = {"before_us_per_request": round(before, 1), "after_us_per_request": round(after, 1),
+                               "speedup": round(before / after, 2) if after else None,
+                               "after_lines_per_request": round(emitted, 2)}
+    return {"requests": requests, "format": log_format, "levels": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--format", choices=("text", "json"), default="text")
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.format), indent=2))
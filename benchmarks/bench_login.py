@@ -0,0 +1,60 @@
+"""Login throughput benchmark against an in-process Mongo stand-in.
+
+Compares the current scrypt path (cold: Cosmos lookup, warm: credential cache)
+with the legacy unsalted SHA256 compound lookup. Requires ``mongomock``.
+
+    python -m benchmarks.bench_login [--users 1000] [--logins 200] [--threads 4]
+"""
+import json
+import time
+import argparse
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import mongomock
+
+import db_utils
+
+
+def _run(fn, logins: int, threads: int) -> dict:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(fn, range(logins)))
+    elapsed = time.perf_counter() - started
+    return {"logins": logins, "ok": sum(map(bool, results)), "elapsed_s": round(elapsed, 4),
+            "logins_per_s": round(logins / elapsed, 1)}
+
+
+def main(users: int, logins: int, threads: int) -> dict:
+    collection = mongomock.MongoClient().db.patient_credentials
+    collection.create_index("email", unique=True)
+    db_utils.patient_credentials_collection = collection
+
+    stored = db_utils.hash_password("secret")
+    collection.insert_many([{"email": f"user{i}@example.com", "password": stored} for i in range(users)])
+
+    def login(i):
+        return db_utils.authenticate_user(f"user{i % users}@example.com", "secret")
+
+    report = {"scrypt_n": db_utils.SCRYPT_N}
+    db_utils._credential_cache.clear()
+    report["scrypt_cold"] = _run(login, min(logins, users), threads)
+    report["scrypt_warm_cache"] = _run(login, logins, threads)
+
+    legacy = hashlib.sha256(b"secret").hexdigest()
+
+    def legacy_login(i):
+        return collection.find_one({"email": f"user{i % users}@example.com", "password": legacy}) is not None
+
+    collection.update_many({}, {"$set": {"password": legacy}})
+    report["legacy_sha256"] = _run(legacy_login, logins, threads)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    print(json.dumps(main(args.users, args.logins, args.threads), indent=2))
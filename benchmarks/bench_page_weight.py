@@ -0,0 +1,118 @@
+"""Chat page weight and modelled time-to-interactive, before and after static_assets.
+
+Loads GET /chat/<id> and the assets it pulls in through the app's test client
+(stub LLM, mongomock) twice:
+
+  - before: no asset build and no compression, as the page used to be served
+    (its CSS/JS were inline, so they count against every visit, and the
+    avatars are the original JPGs revalidated on each visit)
+  - after: ``static_assets.build`` output, brotli/gzip, AVIF avatars and
+    immutable caching, so a repeat visit only downloads the HTML
+
+Time to interactive is modelled, not measured in a browser:
+    TTI = round trips * RTT + render-blocking bytes / bandwidth
+where the HTML, CSS and JS block (the script sits at the end of the body)
+and images do not. Defaults are Lighthouse's "slow 4G" (150 ms, 1.6 Mbit/s).
+
+    python -m benchmarks.bench_page_weight [--rtt-ms 150] [--mbps 1.6]
+"""
+import os
+import re
+import gzip
+import json
+import argparse
+import tempfile
+
+import brotli
+
+from benchmarks.bench_chat_flow import setup_environment
+
+BROWSER_HEADERS = {"Accept": "text/html,image/avif,image/webp,*/*", "Accept-Encoding": "br, gzip"}
+PLAIN_HEADERS = {"Accept": "text/html,*/*", "Accept-Encoding": "identity"}
+
+
+def login(client) -> str:
+    client.post("/register", data={
+        "firstname": "Page", "email": "page@example.com", "phone": "9000099999", "country": "India",
+        "state": "Tamil Nadu", "location": "Velachery", "city": "Chennai", "password": "bench-password"})
+    response = client.post("/login", data={"email": "page@example.com", "password": "bench-password"})
+    return response.headers["Location"].rstrip("/").split("/")[-1]
+
+
+def fetch(client, url: str, headers: dict) -> int:
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, (url, response.status_code)
+    return len(response.get_data())
+
+
+def page_load(client, session_id: str, headers: dict) -> dict:
+    page = client.get(f"/chat/{session_id}", headers=headers)
+    html = page.get_data()
+    text = page.get_data(as_text=True) if "Content-Encoding" not in page.headers else None
+    if text is None:
+        # Decode the compressed page only to find its asset URLs; the wire size is len(html)
+        text = (brotli.decompress(html) if page.headers["Content-Encoding"] == "br" else gzip.decompress(html)).decode()
+    blocking = re.findall(r'(?:href|src)="(/(?:static|assets)/[^"]+\.(?:css|js))"', text)
+    avatars = re.findall(r'(?:bot|user): "([^"]+)"', text)
+    return {
+        "html": len(html),
+        "blocking": {url: fetch(client, url, headers) for url in blocking},
+        "images": {url: fetch(client, url, headers) for url in avatars},
+    }
+
+
+def tti_ms(round_trips: int, blocking_bytes: int, rtt_ms: float, mbps: float) -> float:
+    return round(round_trips * rtt_ms + blocking_bytes * 8 / (mbps * 1e6) * 1000, 1)
+
+
+def run(rtt_ms: float, mbps: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_page_weight_")
+    # Start without a build, whatever is in ./static/dist
+    os.environ["ASSET_DIST_DIR"] = os.path.join(workdir, "no-build")
+    app, stub, _ = setup_environment(workdir, 0, 0)
+    import static_assets
+
+    client = app.test_client()
+    session_id = login(client)
+
+    # before: no manifest, identity encoding
+    before = page_load(client, session_id, PLAIN_HEADERS)
+    before_blocking = before["html"] + sum(before["blocking"].values())
+    before_images = sum(before["images"].values())
+
+    dist = os.path.join(workdir, "dist")
+    static_assets.build(out_dir=dist)
+    static_assets.use_manifest(app, dist)
+    after = page_load(client, session_id, BROWSER_HEADERS)
+    after_blocking = after["html"] + sum(after["blocking"].values())
+    after_images = sum(after["images"].values())
+    stub.stop()
+
+    return {
+        "network": {"rtt_ms": rtt_ms, "mbps": mbps},
+        "before": {
+            "first_visit_bytes": before_blocking + before_images,
+            "repeat_visit_bytes": before_blocking,
+            "render_blocking_bytes": before_blocking,
+            # HTML with inline CSS/JS: connection + request
+            "tti_first_ms": tti_ms(2, before_blocking, rtt_ms, mbps),
+            "tti_repeat_ms": tti_ms(2, before_blocking, rtt_ms, mbps),
+        },
+        "after": {
+            "first_visit_bytes": after_blocking + after_images,
+            "repeat_visit_bytes": after["html"],
+            "render_blocking_bytes": after_blocking,
+            "assets": {**after["blocking"], **after["images"]},
+            # HTML, then CSS and JS in parallel on the same connection
+            "tti_first_ms": tti_ms(3, after_blocking, rtt_ms, mbps),
+            "tti_repeat_ms": tti_ms(2, after["html"], rtt_ms, mbps),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtt-ms", type=float, default=150)
+    parser.add_argument("--mbps", type=float, default=1.6)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rtt_ms, args.mbps), indent=2))
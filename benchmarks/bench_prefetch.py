@@ -0,0 +1,118 @@
+"""Turn latency of the booking flow with the hospital_details cache and speculative prefetch.
+
+Drives booking conversations (stub LLM with --llm-latency-ms per call,
+mongomock) three times over fresh users:
+
+  - off:      no tool cache, no speculation (TOOL_CACHE_TTL=0), as before
+  - cache:    tool results reused for TOOL_CACHE_TTL, no speculation
+  - prefetch: cache plus speculative lookups started on each message and
+              on chat page load for the profile city
+
+Users are spread over the directory's cities; every fourth one changes
+their mind about the city once, which is what cancellation and the waste
+counter are for. Reports p50/p95 latency of the turns that call
+hospital_details, of all turns, LLM calls per booking (speculative spend
+included) and the prefetcher's metrics.
+
+The synthetic directory has only five cities, so users share most lookups
+through the cache. ``--cold`` runs one user at a time and clears the cache
+before each, as for a directory large enough that users rarely ask for the
+same thing; that isolates what speculation adds.
+
+    python -m benchmarks.bench_prefetch [--users 24] [--concurrency 4] [--llm-latency-ms 50] [--cold]
+"""
+import json
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from benchmarks.bench_chat_flow import Recorder, percentile, setup_environment
+from benchmarks.stubs import CITIES
+
+MODES = {
+    "off": {"enabled": False, "ttl": 0},
+    "cache": {"enabled": False, "ttl": 300},
+    "prefetch": {"enabled": True, "ttl": 300},
+}
+
+
+def script(index: int, city: str):
+    """(label, text) turns; labels name the turns that call hospital_details."""
+    day = date.today() + timedelta(days=1 + index // 16)
+    at = f"{9 + (index % 16) // 4:02d}:{(index % 4) * 15:02d}"
+    turns = [("book", "I want to book a doctor appointment"), ("location", f"I am in {city}")]
+    if index % 4 == 3:
+        other = CITIES[(CITIES.index(city) + 1) % len(CITIES)]
+        turns.append(("location", f"Actually, I am in {other}"))
+    return turns + [("hospital", "Apollo Hospitals please"), ("other", "Cardiologist"),
+                    ("other", f"{day.isoformat()} at {at}"), ("other", "Yes, please go ahead")]
+
+
+def run_user(app, recorder: Recorder, index: int, cold: bool = False) -> int:
+    from patient_bot_conversational import prefetcher
+
+    if cold:
+        prefetcher.clear()
+    client = app.test_client()
+    email = f"prefetch{index}@example.com"
+    city = CITIES[index % len(CITIES)]
+    client.post("/register", data={
+        "firstname": f"Prefetch{index}", "email": email, "phone": f"92000{index:05d}", "country": "India",
+        "state": "Tamil Nadu", "location": "Centre", "city": city, "password": "bench-password"})
+    response = client.post("/login", data={"email": email, "password": "bench-password"})
+    session_id = response.headers["Location"].rstrip("/").split("/")[-1]
+    client.get(f"/chat/{session_id}")
+    turns = script(index, city)
+    for label, text in turns:
+        recorder.timed(label, lambda: client.post(f"/chat/{session_id}", json={"user_input": text}))
+    return len(turns)
+
+
+def run_mode(app, stub, mode: str, users: int, concurrency: int, offset: int, cold: bool = False) -> dict:
+    from patient_bot_conversational import prefetcher
+
+    prefetcher.enabled = MODES[mode]["enabled"]
+    prefetcher.ttl = MODES[mode]["ttl"]
+    prefetcher.reset()
+    stub.calls.clear()
+    recorder = Recorder()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        turns = sum(pool.map(lambda i: run_user(app, recorder, i, cold), range(offset, offset + users)))
+    tool_turns = recorder.latencies["location"] + recorder.latencies["hospital"]
+    every_turn = [ms for values in recorder.latencies.values() for ms in values]
+    return {
+        "turns": turns,
+        "errors": sum(recorder.errors.values()),
+        "tool_turn_ms": {"p50": round(percentile(tool_turns, 50), 1), "p95": round(percentile(tool_turns, 95), 1),
+                         "mean": round(statistics.fmean(tool_turns), 1)},
+        "all_turns_mean_ms": round(statistics.fmean(every_turn), 1),
+        "llm_calls_per_booking": round((stub.calls["chat"] + stub.calls["chat_tools"]) / users, 2),
+        "prefetch": prefetcher.metrics(),
+    }
+
+
+def run(users: int, concurrency: int, llm_latency_ms: float, cold: bool = False) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_prefetch_")
+    app, stub, _ = setup_environment(workdir, llm_latency_ms, 0)
+    # Warm-up so import-time and first-request costs are excluded
+    run_mode(app, stub, "off", 2, 1, 10_000)
+    if cold:
+        concurrency = 1
+    report = {"config": {"users": users, "concurrency": concurrency, "llm_latency_ms": llm_latency_ms,
+                         "cold": cold}}
+    for n, mode in enumerate(MODES):
+        report[mode] = run_mode(app, stub, mode, users, concurrency, n * users, cold)
+    stub.stop()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--cold", action="store_true", help="clear the cache before each user, one at a time")
+    args = parser.parse_args()
+    print(json.dumps(run(args.users, args.concurrency, args.llm_latency_ms, args.cold), indent=2))
@@ -0,0 +1,116 @@
+"""Turns and LLM calls per completed booking, with and without profile prefill.
+
+Each simulated user registers (with a city), books an appointment, logs in
+again and books a second one in the new session. Rather than a fixed
+script, the user answers whatever the assistant asked last:
+
+  - location question        -> "I am in Chennai"
+  - list of hospitals        -> "Apollo Hospitals please"
+  - list of specializations  -> "Cardiologist"
+  - date/time question       -> "<day> at <time>"
+  - "Should I go ahead ..."  -> "Yes, please go ahead"
+  - "Would you like another" -> "Yes, same as last time"
+
+so a turn the assistant skips is a turn the user never types. The run is
+repeated with agent.PROFILE_PREFILL off and on (stub LLM, mongomock) and
+reports user turns and LLM calls per completed booking, for first and
+repeat bookings separately.
+
+    python -m benchmarks.bench_prefill [--users 20] [--llm-latency-ms 0]
+"""
+import json
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+from benchmarks.bench_chat_flow import setup_environment
+
+MAX_TURNS = 12
+
+
+def next_input(reply: str, slot: str, lists_seen: int):
+    lowered = reply.lower()
+    if "processing your doctor appointment" in lowered:
+        return None
+    if "would you like another" in lowered:
+        return "Yes, same as last time"
+    if "should i go ahead" in lowered:
+        return "Yes, please go ahead"
+    if "date and time" in lowered:
+        return slot
+    if "your location" in lowered:
+        return "I am in Chennai"
+    if "options" in lowered:
+        # The first list is hospitals, the next one the hospital's specializations
+        return "Apollo Hospitals please" if lists_seen == 0 else "Cardiologist"
+    return "I want to book a doctor appointment"
+
+
+def book(client, session_id: str, slot: str, stub) -> dict:
+    calls_before = stub.calls["chat"] + stub.calls["chat_tools"]
+    text, turns, lists_seen = "I want to book a doctor appointment", 0, 0
+    while text is not None and turns < MAX_TURNS:
+        reply = client.post(f"/chat/{session_id}", json={"user_input": text}).get_json()["response"]
+        turns += 1
+        text = next_input(reply, slot, lists_seen)
+        lists_seen += "options" in reply.lower()
+    return {"turns": turns, "llm_calls": stub.calls["chat"] + stub.calls["chat_tools"] - calls_before,
+            "completed": text is None}
+
+
+def login(client, email: str) -> str:
+    response = client.post("/login", data={"email": email, "password": "bench-password"})
+    return response.headers["Location"].rstrip("/").split("/")[-1]
+
+
+def run_mode(app, stub, prefill: bool, users: int, offset: int) -> dict:
+    import agent
+
+    agent.PROFILE_PREFILL = prefill
+    totals = {"first": [], "repeat": []}
+    for index in range(offset, offset + users):
+        client = app.test_client()
+        email = f"prefill{index}@example.com"
+        client.post("/register", data={
+            "firstname": f"Prefill{index}", "email": email, "phone": f"91000{index:05d}", "country": "India",
+            "state": "Tamil Nadu", "location": "Velachery", "city": "Chennai", "password": "bench-password"})
+        day = date.today() + timedelta(days=1 + index // 14)
+        for kind, hour in (("first", 9), ("repeat", 14)):
+            session_id = login(client, email)
+            client.get(f"/chat/{session_id}")
+            slot = f"{day.isoformat()} at {hour + (index % 14) // 4:02d}:{(index % 4) * 15:02d}"
+            totals[kind].append(book(client, session_id, slot, stub))
+            client.get("/logout")
+
+    def summary(results):
+        done = [r for r in results if r["completed"]]
+        return {
+            "bookings": len(results),
+            "completed": len(done),
+            "turns_per_booking": round(sum(r["turns"] for r in done) / max(1, len(done)), 2),
+            "llm_calls_per_booking": round(sum(r["llm_calls"] for r in done) / max(1, len(done)), 2),
+        }
+
+    return {kind: summary(results) for kind, results in totals.items()}
+
+
+def run(users: int, llm_latency_ms: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_prefill_")
+    app, stub, _ = setup_environment(workdir, llm_latency_ms, 0)
+    # Warm-up so import-time costs don't land in the first mode
+    run_mode(app, stub, False, 1, 10_000)
+    report = {
+        "users": users,
+        "prefill_off": run_mode(app, stub, False, users, 0),
+        "prefill_on": run_mode(app, stub, True, users, users),
+    }
+    stub.stop()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.users, args.llm_latency_ms), indent=2))
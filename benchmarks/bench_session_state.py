@@ -0,0 +1,102 @@
+"""Memory of the per-session agent store: nested config dicts vs SessionState.
+
+Creates ``--sessions`` sessions spread over ``--users`` users, once as the
+dict-of-dicts agent.py used to keep (a ``{"configurable": {...}}`` per
+session holding its own patient_data and date strings) and once through
+``agent.get_or_create_agent_for_user`` (slotted SessionState records sharing
+one PatientProfile per user). Reports traced bytes per session and the cost
+of producing the per-turn config.
+
+    python -m benchmarks.bench_session_state [--sessions 100000] [--users 20000]
+"""
+import gc
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import tracemalloc
+
+from benchmarks.bench_chat_flow import setup_environment
+
+
+def contact(index: int) -> dict:
+    return {"firstname": f"Patient{index}", "email": f"user{index}@example.com", "phone": f"98{index:08d}"}
+
+
+def legacy_config(email: str, contact_info: dict, current_date: str) -> dict:
+    """What get_default_config stored per session before SessionState."""
+    patient_data = (
+        f"Name: {contact_info.get('firstname', 'Unknown')}, "
+        f"Phone Number: {contact_info.get('phone', 'N/A')}, "
+        f"Email Id: {email}"
+    )
+    return {"configurable": {"patient_data": patient_data, "current_date": current_date,
+                             "thread_id": str(uuid.uuid4())}}
+
+
+def traced(build) -> tuple:
+    """Bytes still allocated by build() once it returns, and the object it built."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def run(sessions: int, users: int) -> dict:
+    setup_environment(tempfile.mkdtemp(prefix="bench_session_state_"), 0, 0)
+    import agent
+
+    contacts = {f"user{i}@example.com": contact(i) for i in range(users)}
+    emails = list(contacts)
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    # The database is not what is measured here
+    agent.get_user_contact_info = lambda email: [contacts[email]]
+    agent.logger = agent.get_logger("bench.silenced")
+
+    def build_legacy():
+        current_date = agent.get_formatted_date()
+        return {sid: legacy_config(emails[i % users], contacts[emails[i % users]], current_date)
+                for i, sid in enumerate(session_ids)}
+
+    def build_slotted():
+        for i, sid in enumerate(session_ids):
+            agent.get_or_create_agent_for_user(emails[i % users], sid)
+        return agent.user_agents
+
+    legacy_bytes, legacy = traced(build_legacy)
+    slotted_bytes, _ = traced(build_slotted)
+
+    started = time.perf_counter()
+    for sid in session_ids[:10000]:
+        legacy[sid]
+    legacy_lookup = (time.perf_counter() - started) / 10000 * 1e6
+    started = time.perf_counter()
+    for i, sid in enumerate(session_ids[:10000]):
+        agent.get_or_create_agent_for_user(emails[i % users], sid)
+    slotted_lookup = (time.perf_counter() - started) / 10000 * 1e6
+
+    return {
+        "sessions": sessions,
+        "users": users,
+        "dict_of_dicts": {"total_mb": round(legacy_bytes / 2 ** 20, 2),
+                          "bytes_per_session": round(legacy_bytes / sessions, 1),
+                          "config_lookup_us": round(legacy_lookup, 3)},
+        "session_state": {"total_mb": round(slotted_bytes / 2 ** 20, 2),
+                          "bytes_per_session": round(slotted_bytes / sessions, 1),
+                          "profiles": len(agent._profiles),
+                          "config_per_turn_us": round(slotted_lookup, 3)},
+        "reduction": round(legacy_bytes / slotted_bytes, 2) if slotted_bytes else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sessions, args.users), indent=2))
@@ -0,0 +1,118 @@
+"""Doctor directory retrieval as the directory grows: one snapshot vs region shards.
+
+For each scale (1x = the 5 cities / 100 rows of the synthetic directory, 10x
+and 100x add cities the way onboarding does), writes the directory once as a
+single vector snapshot and once as region shards, then runs the same queries
+through ``SnapshotRetriever`` and ``ShardedRetriever``:
+
+  - profile: "I need a cardiologist" from a user whose profile city is set
+  - mention: "Neurologist in <city>" naming the city in the query
+  - state:   a user with only a profile state (that state's shards merged)
+  - global:  a query with no region at all (served from the ``_all`` shard)
+
+Reports latency percentiles, the share of returned rows outside the user's
+city (irrelevant context handed to the filtering LLM) and shard opens and
+evictions under VECTOR_SHARDS_MAX_OPEN.
+
+    python -m benchmarks.bench_shards [--scales 1,10,100] [--queries 200] [--max-open 16]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.bench_chat_flow import percentile
+from benchmarks.stubs import CITIES, HOSPITALS, SPECIALIZATIONS, fake_embedding
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return fake_embedding(text)
+
+
+def directory(scale: int):
+    """Rows for 5 * scale cities, ten cities per state."""
+    cities = CITIES + [f"City {i:03d}" for i in range(len(CITIES) * (scale - 1))]
+    rows = []
+    for n, city in enumerate(cities):
+        state = "Tamil Nadu" if city in CITIES else f"State {n // 10:02d}"
+        for hospital in HOSPITALS:
+            for i, specialization in enumerate(SPECIALIZATIONS):
+                text = (f"Hospital Name : {hospital}, Doctor Name : Dr. Doctor {i}, "
+                        f"Specialization : {specialization}, Hospital Location : {city}")
+                rows.append((text, {"summary": text, "state": state}))
+    return cities, rows
+
+
+def off_region(docs, city: str) -> float:
+    if not docs:
+        return 0.0
+    return sum(f"Hospital Location : {city}" not in d.page_content for d in docs) / len(docs)
+
+
+def timed_queries(retriever, queries):
+    latencies, off = [], []
+    for text, city, kwargs in queries:
+        started = time.perf_counter()
+        docs = retriever.invoke(text, **kwargs)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if city:
+            off.append(off_region(docs, city))
+    return {"p50_ms": round(percentile(latencies, 50), 3), "p95_ms": round(percentile(latencies, 95), 3),
+            "off_region_share": round(sum(off) / len(off), 3) if off else None}
+
+
+def run_scale(scale: int, queries: int, max_open: int, workdir: str) -> dict:
+    import numpy as np
+    from vector_snapshot import SnapshotRetriever, write_snapshot
+    from region_shards import ShardedRetriever, write_shards
+
+    cities, rows = directory(scale)
+    vectors = np.array([fake_embedding(text) for text, _ in rows], dtype=np.float32)
+    texts, metas = [t for t, _ in rows], [m for _, m in rows]
+    single_dir = os.path.join(workdir, f"single-{scale}")
+    shard_dir = os.path.join(workdir, f"shards-{scale}")
+    write_snapshot(vectors, texts, metas, single_dir)
+    write_shards(vectors, texts, metas, shard_dir)
+
+    single = SnapshotRetriever(embeddings=FakeEmbeddings(), snapshot_dir=single_dir, k=20)
+    sharded = ShardedRetriever(embeddings=FakeEmbeddings(), shard_dir=shard_dir, k=20, max_open=max_open)
+
+    rng = random.Random(scale)
+    # Users cluster in a few large cities, as real traffic does
+    popular = cities[:max(1, max_open // 2)]
+    users = [rng.choice(popular) if rng.random() < 0.8 else rng.choice(cities) for _ in range(queries)]
+    workloads = {
+        "profile": [("I need a cardiologist", c, {"city": c}) for c in users],
+        "mention": [(f"Neurologist in {c}", c, {}) for c in users],
+        "state": [("I need a cardiologist", None, {"state": "State 00" if scale > 1 else "Tamil Nadu"})
+                  for _ in range(max(1, queries // 10))],
+        "global": [("Which hospitals have a dermatologist?", None, {}) for _ in range(max(1, queries // 10))],
+    }
+    result = {"scale": scale, "cities": len(cities), "rows": len(rows)}
+    for name, workload in workloads.items():
+        # SnapshotRetriever drops the city/state keywords and always searches everything
+        result[name] = {"single": timed_queries(single, workload), "sharded": timed_queries(sharded, workload)}
+    result["shard_stats"] = sharded.stats()
+    return result
+
+
+def run(scales, queries: int, max_open: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_shards_")
+    return {"queries": queries, "max_open": max_open,
+            "scales": [run_scale(scale, queries, max_open, workdir) for scale in scales]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1,10,100")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-open", type=int, default=16)
+    args = parser.parse_args()
+    print(json.dumps(run([int(s) for s in args.scales.split(",")], args.queries, args.max_open), indent=2))
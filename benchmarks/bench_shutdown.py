@@ -0,0 +1,232 @@
+"""SIGTERM during running conversations: drain, persisted writes, and warm start.
+
+Runs the app in a child process (threaded HTTP server, stub LLM at
+--llm-latency-ms, mongomock) and drives --users booking conversations
+against it over HTTP. --sigterm-after seconds in, while turns are running,
+the child gets SIGTERM. Then:
+
+  - every turn running at the signal should complete with its real reply;
+    turns sent during the drain get 503 + Retry-After, and once the server
+    has stopped, connections are not accepted; never a 500, and no turn is
+    cut off mid-run,
+  - every answered turn has its user and assistant message in the chat
+    store, checked in the child just before it exits,
+  - the checkpoints are saved, the child exits within SHUTDOWN_DEADLINE,
+
+and a second child started on the same CHECKPOINT_DIR (and the same
+filesystem Flask sessions, so the users' cookies stay valid) must warm
+start: each user sends one more turn, and the thread it continues on must
+hold the messages from before the restart plus the new ones.
+benchmarks/tests/test_shutdown.py runs it and fails when any of this does not hold.
+
+    python -m benchmarks.bench_shutdown [--users 6] [--llm-latency-ms 600] [--sigterm-after 2.5] [--deadline 15]
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+
+import requests
+
+from benchmarks.bench_chat_flow import REPO_ROOT, booking_script, percentile
+
+
+# ---- child process --------------------------------------------------------
+def child_report() -> dict:
+    import lifecycle
+    from agent import session_threads
+    from conversation_store import chat_collection
+    from patient_bot_conversational import part_1_graph
+
+    threads = session_threads()
+    return {
+        "pid": os.getpid(),
+        "shutdown": lifecycle._shutdown_report,
+        "warm_start": lifecycle.last_warm_start,
+        "graph_messages": {sid: len(part_1_graph.get_state({"configurable": {"thread_id": tid}})
+                                    .values.get("messages", [])) for sid, tid in threads.items()},
+        "stored_messages": {sid: chat_collection.count_documents({"session_id": sid}) for sid in threads},
+        "stored_user_messages": {sid: chat_collection.count_documents({"session_id": sid, "role": "user"})
+                                 for sid in threads},
+    }
+
+
+def serve(workdir: str, llm_latency_ms: float, port_file: str, report_file: str) -> None:
+    server = serving = None
+
+    # Installed before the app, so lifecycle's handler drains first and then chains to this one,
+    # as it would to gunicorn's: stop accepting, finish the requests being answered, exit
+    def on_sigterm(signum, frame):
+        server.shutdown()
+        # serve_forever() ends with server_close(), which waits for the request threads
+        serving.join()
+        with open(report_file, "w") as fh:
+            json.dump(child_report(), fh)
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    from werkzeug.serving import make_server
+    from benchmarks.bench_chat_flow import setup_environment
+
+    app, _, _ = setup_environment(workdir, llm_latency_ms, 0)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    # Non-daemon request threads, so server_close() waits for them
+    server.daemon_threads = False
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+    with open(port_file + ".tmp", "w") as fh:
+        fh.write(str(server.server_port))
+    os.replace(port_file + ".tmp", port_file)
+    threading.Event().wait()
+
+
+# ---- parent ---------------------------------------------------------------
+def start_child(workdir: str, llm_latency_ms: float, deadline: float, name: str):
+    port_file = os.path.join(workdir, f"{name}.port")
+    report_file = os.path.join(workdir, f"{name}.json")
+    env = {**os.environ, "SHUTDOWN_DEADLINE": str(deadline),
+           "CHECKPOINT_DIR": os.path.join(workdir, "checkpoints"), "PYTHONPATH": REPO_ROOT}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_shutdown", "--serve", "--workdir", workdir,
+         "--llm-latency-ms", str(llm_latency_ms), "--port-file", port_file, "--report-file", report_file],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    started = time.monotonic()
+    while not os.path.exists(port_file):
+        if process.poll() is not None or time.monotonic() - started > 180:
+            raise RuntimeError(f"{name} did not start")
+        time.sleep(0.1)
+    with open(port_file) as fh:
+        return process, f"http://127.0.0.1:{fh.read()}", report_file
+
+
+def stop_child(process, report_file: str) -> dict:
+    started = time.monotonic()
+    process.send_signal(signal.SIGTERM)
+    code = process.wait(timeout=120)
+    exit_s = time.monotonic() - started
+    with open(report_file) as fh:
+        return {"exit_code": code, "exit_s": round(exit_s, 2), **json.load(fh)}
+
+
+def login(base: str, index: int):
+    client = requests.Session()
+    # One connection per request: an idle keep-alive connection would hold a request thread the stopping
+    # server waits for
+    client.headers["Connection"] = "close"
+    email = f"shutdown{index}@example.com"
+    client.post(f"{base}/register", data={
+        "firstname": f"Shutdown{index}", "email": email, "phone": f"96{index:08d}", "country": "India",
+        "state": "Tamil Nadu", "location": "Centre", "city": "Chennai", "password": "bench-password"},
+        allow_redirects=False)
+    response = client.post(f"{base}/login", data={"email": email, "password": "bench-password"},
+                           allow_redirects=False)
+    session_id = response.headers["Location"].rstrip("/").split("/")[-1]
+    client.get(f"{base}/chat/{session_id}")
+    return client, session_id
+
+
+def converse(base: str, client, session_id: str, index: int, signalled: threading.Event, turns: list) -> None:
+    """Send the booking script until the server refuses a turn or goes away."""
+    for text in booking_script(index):
+        sent_after_signal = signalled.is_set()
+        started = time.perf_counter()
+        try:
+            response = client.post(f"{base}/chat/{session_id}", json={"user_input": text}, timeout=60)
+            outcome, reply = response.status_code, response.json().get("response", "")
+        except requests.ConnectionError as e:
+            # The server had stopped: refused, or reset in the listen backlog (a request it accepted is
+            # always answered). "unanswered_turns_ran" checks that
+            outcome, reply = "not_accepted", str(e)
+        except ValueError as e:
+            outcome, reply = "bad_response", str(e)
+        turns.append({"session_id": session_id, "outcome": outcome, "ms": (time.perf_counter() - started) * 1000,
+                      "sent_after_signal": sent_after_signal, "running_at_signal": signalled.is_set()
+                      and not sent_after_signal, "reply": reply,
+                      "retry_after": response.headers.get("Retry-After") if outcome == 503 else None})
+        if outcome != 200:
+            return
+
+
+def run(users: int, llm_latency_ms: float, sigterm_after: float, deadline: float) -> dict:
+    workdir = tempfile.mkdtemp(prefix="bench_shutdown_")
+    first, base, first_report = start_child(workdir, llm_latency_ms, deadline, "first")
+    sessions = [login(base, i) for i in range(users)]
+
+    signalled = threading.Event()
+    turns = []
+    workers = [threading.Thread(target=converse, args=(base, client, sid, i, signalled, turns))
+               for i, (client, sid) in enumerate(sessions)]
+    for worker in workers:
+        worker.start()
+    time.sleep(sigterm_after)
+    signalled.set()
+    stopped = stop_child(first, first_report)
+    for worker in workers:
+        worker.join()
+
+    outcomes = Counter(str(t["outcome"]) for t in turns)
+    running = [t for t in turns if t["running_at_signal"]]
+    answered = Counter(t["session_id"] for t in turns if t["outcome"] == 200)
+    stored_ok = all(stopped["stored_messages"].get(sid, 0) >= 2 * n for sid, n in answered.items())
+    # A user message is written only once a turn is admitted, so more than the answered turns means one
+    # was cut off mid-run
+    cut_off = sum(max(0, n - answered[sid]) for sid, n in stopped["stored_user_messages"].items())
+
+    # Restart on the same checkpoints and sessions; each user sends one more turn
+    second, base, second_report = start_child(workdir, llm_latency_ms, deadline, "second")
+    resumed = Counter()
+    for client, session_id in sessions:
+        response = client.post(f"{base}/chat/{session_id}", json={"user_input": "Cardiologist"}, timeout=60)
+        resumed[str(response.status_code)] += 1
+    restarted = stop_child(second, second_report)
+    continued = {sid: (stopped["graph_messages"].get(sid, 0), restarted["graph_messages"].get(sid, 0))
+                 for _, sid in sessions}
+
+    return {
+        "config": {"users": users, "llm_latency_ms": llm_latency_ms, "sigterm_after_s": sigterm_after,
+                   "deadline_s": deadline},
+        "first_run": {
+            "turn_outcomes": dict(outcomes),
+            "running_at_signal": {"count": len(running),
+                                  "completed_200": sum(t["outcome"] == 200 for t in running),
+                                  "p50_ms": round(percentile([t["ms"] for t in running], 50), 1) if running else None},
+            "refused_during_drain": sum(t["outcome"] == 503 for t in turns),
+            "retry_after": sorted({t["retry_after"] for t in turns if t["retry_after"]}),
+            "not_accepted_after_stop": sum(t["outcome"] == "not_accepted" for t in turns),
+            "errors": sum(t["outcome"] not in (200, 503, "not_accepted") for t in turns) + cut_off,
+            "answered_turns_stored": stored_ok,
+            "unanswered_turns_ran": cut_off,
+            "exit_code": stopped["exit_code"], "exit_s": stopped["exit_s"],
+            "shutdown": stopped["shutdown"],
+        },
+        "second_run": {
+            "warm_start": restarted["warm_start"],
+            "resumed_turns": dict(resumed),
+            # (messages before the restart, after one more turn)
+            "graph_messages": continued,
+            "all_continued": all(after > before > 0 for before, after in continued.values()),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=6)
+    parser.add_argument("--llm-latency-ms", type=float, default=600)
+    parser.add_argument("--sigterm-after", type=float, default=2.5)
+    parser.add_argument("--deadline", type=float, default=15)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--port-file", help=argparse.SUPPRESS)
+    parser.add_argument("--report-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.workdir, args.llm_latency_ms, args.port_file, args.report_file)
+    else:
+        print(json.dumps(run(args.users, args.llm_latency_ms, args.sigterm_after, args.deadline), indent=2))
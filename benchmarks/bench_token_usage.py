@@ -0,0 +1,152 @@
+"""Token accounting (token_usage.py): attribution, the admin report, budgets, and the cost of recording.
+
+Runs booking conversations through the app against the stub LLM (which
+returns usage like the real API) and reports:
+
+  - attribution: LLM calls the stub answered vs calls recorded in the
+    ledger (every call should be recorded exactly once), and the share
+    attributed to an unknown session or node,
+  - report: GET /admin/reports/tokens grouped by node, and the top sessions
+    and users, after the ledger is flushed to Mongo,
+  - budget: the same conversations with SESSION_TOKEN_BUDGET set to half of
+    what a booking used above: every turn is still answered (errors), the
+    calls served by the economy deployment, and the hospital_details
+    LLM steps skipped: the booking script's lookups are all matched
+    locally, so those are measured on bench_tool_output's query mix, for a
+    session under and over its budget,
+  - cost: ledger.record() per call, and one flush of the resulting records.
+
+    python -m benchmarks.bench_token_usage [--users 8] [--llm-latency-ms 20]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+from benchmarks.bench_chat_flow import Recorder, booking_script, percentile, setup_environment
+
+ADMIN_TOKEN = "bench-admin"
+
+
+def run_user(app, recorder: Recorder, index: int) -> None:
+    client = app.test_client()
+    email = f"tokens{index}@example.com"
+    client.post("/register", data={
+        "firstname": f"Tokens{index}", "email": email, "phone": f"93000{index:05d}", "country": "India",
+        "state": "Tamil Nadu", "location": "Centre", "city": "Chennai", "password": "bench-password"})
+    response = client.post("/login", data={"email": email, "password": "bench-password"})
+    session_id = response.headers["Location"].rstrip("/").split("/")[-1]
+    client.get(f"/chat/{session_id}")
+    for text in booking_script(index):
+        recorder.timed("POST /chat/<id>", lambda: client.post(f"/chat/{session_id}", json={"user_input": text}))
+
+
+def report(app, group_by: str, limit: int = 100) -> dict:
+    response = app.test_client().get(f"/admin/reports/tokens?group_by={group_by}&limit={limit}",
+                                     headers={"X-Admin-Token": ADMIN_TOKEN})
+    return response.get_json()
+
+
+def run_phase(app, stub, users: int, offset: int) -> dict:
+    from patient_bot_conversational import prefetcher
+    from token_usage import ledger, usage_collection
+
+    # Every lookup runs, so the hospital_details LLM steps are counted
+    prefetcher.clear()
+    usage_collection.delete_many({})
+    stub.calls.clear()
+    before = dict(ledger.counters)
+    recorder = Recorder()
+    for i in range(offset, offset + users):
+        run_user(app, recorder, i)
+    by_node = report(app, "node")
+    by_session = report(app, "session")
+    answered = stub.calls["chat"] + stub.calls["chat_tools"]
+    recorded = ledger.counters["calls"] - before["calls"]
+    rows = {row["node"]: row for row in by_node["rows"]}
+    return {
+        "errors": sum(recorder.errors.values()),
+        "llm_calls": {"answered_by_stub": answered, "recorded": recorded},
+        "unattributed_calls": sum(row["calls"] for row in by_session["rows"] if row["session"] == "anonymous")
+        + rows.get("other", {}).get("calls", 0),
+        "by_node": {node: {"calls": row["calls"], "tokens": row["tokens"], "cost_usd": row["cost_usd"]}
+                    for node, row in rows.items()},
+        "tokens_per_booking": round(by_node["totals"]["tokens"] / users),
+        "llm_calls_per_booking": round(answered / users, 2),
+        "economy_calls": by_node["totals"]["economy_calls"],
+        "degraded_checks": ledger.counters["degraded_calls"] - before["degraded_calls"],
+        "by_session": by_session,
+    }
+
+
+def lookups(stub) -> dict:
+    from benchmarks.bench_tool_output import lookup_queries
+    from patient_bot_conversational import search_hospitals
+    from token_usage import ledger
+
+    queries = lookup_queries()
+    results = {}
+    for name, session_id in (("under_budget", "lookups-under"), ("over_budget", "lookups-over")):
+        if name == "over_budget":
+            ledger.record({"input_tokens": ledger.session_budget, "output_tokens": 0}, session_id, None, "bench")
+        before = stub.calls["chat"]
+        started = time.perf_counter()
+        for query in queries:
+            search_hospitals(query, config={"configurable": {"thread_id": session_id, "session_id": session_id}})
+        results[name] = {"llm_calls": stub.calls["chat"] - before,
+                         "ms_per_lookup": round((time.perf_counter() - started) * 1000 / len(queries), 1)}
+    return {"lookups": len(queries), **results}
+
+
+def cost() -> dict:
+    import mongomock
+    from token_usage import UsageLedger
+
+    ledger = UsageLedger(mongomock.MongoClient()["bench_tokens"]["llm_usage"], 150000, 0, 0)
+    usage = {"input_tokens": 1800, "output_tokens": 60, "input_token_details": {"cache_read": 1024}}
+    nodes = ("assistant", "record_selection", "extraction")
+    timings = []
+    for i in range(20000):
+        started = time.perf_counter()
+        ledger.record(usage, f"session-{i % 200}", f"user{i % 200}@example.com", nodes[i % 3])
+        timings.append((time.perf_counter() - started) * 1e6)
+    started = time.perf_counter()
+    written = ledger.flush()
+    return {"record_p50_us": round(statistics.median(timings), 2), "record_p99_us": round(percentile(timings, 99), 2),
+            "flush": {"records": written, "ms": round((time.perf_counter() - started) * 1000, 1)}}
+
+
+def run(users: int, llm_latency_ms: float) -> dict:
+    os.environ.update({"ADMIN_TOKEN": ADMIN_TOKEN, "USAGE_FLUSH_SECONDS": "0", "SESSION_TOKEN_BUDGET": "0",
+                       "llm_economy_deployment_name": "economy-stub"})
+    app, stub, _ = setup_environment(tempfile.mkdtemp(prefix="bench_tokens_"), llm_latency_ms, 0)
+    from token_usage import ledger
+
+    unlimited = run_phase(app, stub, users, 0)
+    budget = unlimited["tokens_per_booking"] // 2
+    ledger.session_budget = budget
+    limited = run_phase(app, stub, users, users)
+    limited["hospital_details"] = lookups(stub)
+    ledger.session_budget = 0
+
+    top = unlimited.pop("by_session")
+    limited.pop("by_session")
+    return {
+        "config": {"users": users, "llm_latency_ms": llm_latency_ms},
+        "unlimited": {**unlimited,
+                      "top_sessions": [{k: row[k] for k in ("session", "calls", "tokens", "cost_usd")}
+                                       for row in top["rows"][:3]],
+                      "users": report(app, "user")["groups"]},
+        "session_budget": {"budget_tokens": budget, **limited},
+        "cost": cost(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--llm-latency-ms", type=float, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.users, args.llm_latency_ms), indent=2))
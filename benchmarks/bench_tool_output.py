@@ -0,0 +1,106 @@
+"""Size of hospital_details results and turn latency: structured records vs LLM-filtered text.
+
+Runs twice, with STRUCTURED_TOOL_OUTPUT off (the retrieved rows are
+filtered by an LLM call into free text, as before) and on
+(``directory_records``: parsed, deduplicated, matched locally, rendered
+under TOOL_RESULT_MAX_TOKENS, with the LLM only asked to pick record numbers
+when a query word matches no record). The tool cache and prefetch are off
+so every lookup runs.
+
+  - lookups: ``search_hospitals`` over a query mix (city, hospital,
+    specialization, and wording the directory does not contain): estimated
+    tokens per result (mean/max), LLM calls per lookup, p50/p95 latency
+  - chat: booking conversations through the app: p50 of the turns that call
+    the tool, input tokens the main LLM is sent per booking (tool results
+    are re-sent on every later turn), LLM calls per booking
+
+The stub's "filtering" keeps the first five rows verbatim, which is shorter
+than a real model's free-text answer, so the "off" token counts are a lower bound.
+
+    python -m benchmarks.bench_tool_output [--users 12] [--llm-latency-ms 50] [--max-tokens 400]
+"""
+import os
+import json
+import argparse
+import tempfile
+import statistics
+
+from benchmarks.bench_chat_flow import Recorder, percentile, setup_environment
+from benchmarks.bench_prefetch import run_user
+from benchmarks.stubs import CITIES, HOSPITALS, SPECIALIZATIONS
+
+MODES = {"llm-filtered": False, "structured": True}
+
+
+def lookup_queries():
+    queries = []
+    for i, city in enumerate(CITIES):
+        hospital, specialization = HOSPITALS[i % len(HOSPITALS)], SPECIALIZATIONS[i % len(SPECIALIZATIONS)]
+        queries += [f"hospitals in {city}", f"specializations at {hospital} in {city}",
+                    f"{specialization}s at {hospital} in {city}", f"heart specialist near {city}"]
+    return queries
+
+
+def bench_lookups(stub, queries) -> dict:
+    import time
+    from llm_scheduler import estimate_tokens
+    from patient_bot_conversational import search_hospitals
+
+    before = stub.calls["chat"]
+    sizes, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        result = search_hospitals(query, config={"configurable": {"thread_id": "bench"}})
+        latencies.append((time.perf_counter() - started) * 1000)
+        sizes.append(estimate_tokens(result))
+    return {"tokens_mean": round(statistics.fmean(sizes), 1), "tokens_max": max(sizes),
+            "llm_calls_per_lookup": round((stub.calls["chat"] - before) / len(queries), 2),
+            "p50_ms": round(percentile(latencies, 50), 1), "p95_ms": round(percentile(latencies, 95), 1)}
+
+
+def bench_chat(app, stub, users: int, offset: int) -> dict:
+    from llm_scheduler import scheduler
+
+    recorder = Recorder()
+    stub.calls.clear()
+    input_before = scheduler.metrics()["usage"]["input_tokens"]
+    for index in range(offset, offset + users):
+        run_user(app, recorder, index)
+    tool_turns = recorder.latencies["location"] + recorder.latencies["hospital"]
+    every_turn = [ms for values in recorder.latencies.values() for ms in values]
+    return {
+        "errors": sum(recorder.errors.values()),
+        "tool_turn_p50_ms": round(percentile(tool_turns, 50), 1),
+        "tool_turn_p95_ms": round(percentile(tool_turns, 95), 1),
+        "all_turns_mean_ms": round(statistics.fmean(every_turn), 1),
+        "input_tokens_per_booking": round((scheduler.metrics()["usage"]["input_tokens"] - input_before) / users),
+        "llm_calls_per_booking": round((stub.calls["chat"] + stub.calls["chat_tools"]) / users, 2),
+    }
+
+
+def run(users: int, llm_latency_ms: float, max_tokens: int) -> dict:
+    os.environ["TOOL_RESULT_MAX_TOKENS"] = str(max_tokens)
+    workdir = tempfile.mkdtemp(prefix="bench_tool_output_")
+    app, stub, _ = setup_environment(workdir, llm_latency_ms, 0)
+    import patient_bot_conversational
+
+    patient_bot_conversational.prefetcher.enabled = False
+    patient_bot_conversational.prefetcher.ttl = 0
+    queries = lookup_queries()
+    report = {"config": {"users": users, "llm_latency_ms": llm_latency_ms, "max_tokens": max_tokens,
+                         "lookups": len(queries)}}
+    for n, (mode, structured) in enumerate(MODES.items()):
+        patient_bot_conversational.STRUCTURED_TOOL_OUTPUT = structured
+        report[mode] = {"lookups": bench_lookups(stub, queries),
+                        "chat": bench_chat(app, stub, users, 20_000 + n * users)}
+    stub.stop()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=12)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--max-tokens", type=int, default=400)
+    args = parser.parse_args()
+    print(json.dumps(run(args.users, args.llm_latency_ms, args.max_tokens), indent=2))
@@ -0,0 +1,176 @@
+"""Concurrency test of the WebSocket chat channel (ws_chat.py) against HTTP POST.
+
+Serves ``main.create_app`` from a threaded werkzeug server with the same local
+stand-ins as bench_chat_flow (stub OpenAI with streaming, mongomock, vector
+snapshot), logs ``--users`` users in over HTTP, then:
+
+  - holds ``--users`` WebSocket connections open at once, each sending a
+    partial transcript, a ping and ``--turns`` messages, and records time to
+    first token and to the final reply;
+  - sends the same turns over POST /chat/<id> for comparison.
+
+Reports the peak connections the worker held (from /metrics/ws), token
+frames per turn and latency percentiles as JSON.
+
+    python -m benchmarks.bench_ws [--users 50] [--turns 2] [--llm-latency-ms 50] [--token-ms 5]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_chat_flow import percentile, setup_environment
+
+ADMIN_TOKEN = "bench-admin"
+TURNS = ["I want to book a doctor appointment", "I am in Chennai", "Apollo Hospitals please"]
+
+
+def summary(values) -> dict:
+    if not values:
+        return {"count": 0}
+    return {"count": len(values), "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2), "mean_ms": round(statistics.fmean(values), 2)}
+
+
+class BenchUser:
+    """One registered, logged-in user with its own cookie jar."""
+
+    def __init__(self, base_url: str, index: int):
+        self.base_url = base_url
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        email = f"ws{index}@example.com"
+        self._post_form("/register", {
+            "firstname": f"Ws{index}", "email": email, "phone": f"91000{index:05d}", "country": "India",
+            "state": "Tamil Nadu", "location": "Velachery", "city": "Chennai", "password": "bench-password",
+        })
+        response = self._post_form("/login", {"email": email, "password": "bench-password"})
+        self.session_id = response.geturl().rstrip("/").split("/")[-1]
+
+    def _post_form(self, path: str, data: dict):
+        body = urllib.parse.urlencode(data).encode()
+        return self.opener.open(self.base_url + path, data=body, timeout=60)
+
+    def cookie_header(self) -> str:
+        return "; ".join(f"{c.name}={c.value}" for c in self.cookies)
+
+    def post_chat(self, text: str) -> str:
+        request = urllib.request.Request(f"{self.base_url}/chat/{self.session_id}",
+                                         data=json.dumps({"user_input": text}).encode(),
+                                         headers={"Content-Type": "application/json"})
+        with self.opener.open(request, timeout=120) as response:
+            return json.loads(response.read())["response"]
+
+
+def run_socket(user: BenchUser, turns: int, all_open: threading.Barrier, results: dict, lock: threading.Lock):
+    from simple_websocket import Client
+
+    ws_url = user.base_url.replace("http://", "ws://") + f"/ws/chat/{user.session_id}"
+    ws = Client.connect(ws_url, headers={"Cookie": user.cookie_header()})
+    try:
+        all_open.wait(timeout=120)
+        ws.send(json.dumps({"type": "partial", "text": "I want to"}))
+        ws.send(json.dumps({"type": "ping"}))
+        for text in TURNS[:turns]:
+            started = time.perf_counter()
+            first_token, frames = None, 0
+            ws.send(json.dumps({"type": "message", "text": text}))
+            while True:
+                event = json.loads(ws.receive(timeout=120))
+                if event["type"] == "token":
+                    frames += 1
+                    if first_token is None:
+                        first_token = (time.perf_counter() - started) * 1000
+                elif event["type"] == "pong" and not event["valid"]:
+                    raise RuntimeError("session reported invalid")
+                elif event["type"] == "done":
+                    break
+                elif event["type"] == "error":
+                    raise RuntimeError(event["text"])
+            total = (time.perf_counter() - started) * 1000
+            with lock:
+                results["ws_first_token"].append(first_token if first_token is not None else total)
+                results["ws_reply"].append(total)
+                results["token_frames"].append(frames)
+    finally:
+        ws.close()
+
+
+def run(users: int, turns: int, llm_latency_ms: float, token_ms: float) -> dict:
+    from werkzeug.serving import make_server
+
+    workdir = tempfile.mkdtemp(prefix="bench_ws_")
+    os.environ.setdefault("WS_MAX_CONNECTIONS", str(max(500, users)))
+    os.environ["ADMIN_TOKEN"] = ADMIN_TOKEN
+    app, stub, _ = setup_environment(workdir, llm_latency_ms, token_ms)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        bench_users = list(pool.map(lambda i: BenchUser(base_url, i), range(users)))
+    # One warm-up turn so first-request costs land on neither transport
+    BenchUser(base_url, users + 1).post_chat(TURNS[0])
+
+    results = {"ws_first_token": [], "ws_reply": [], "token_frames": [], "http_reply": []}
+    lock = threading.Lock()
+    errors = []
+    all_open = threading.Barrier(users)
+
+    def socket_worker(user):
+        try:
+            run_socket(user, turns, all_open, results, lock)
+        except Exception as e:  # report, don't abort the whole run
+            errors.append(repr(e))
+            all_open.abort()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(socket_worker, bench_users))
+    ws_elapsed = time.perf_counter() - started
+
+    def http_worker(user):
+        for text in TURNS[:turns]:
+            began = time.perf_counter()
+            user.post_chat(text)
+            with lock:
+                results["http_reply"].append((time.perf_counter() - began) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(http_worker, bench_users))
+    http_elapsed = time.perf_counter() - started
+
+    metrics = urllib.request.Request(base_url + "/metrics/ws", headers={"X-Admin-Token": ADMIN_TOKEN})
+    with urllib.request.urlopen(metrics, timeout=10) as response:
+        channel = json.loads(response.read())
+    server.shutdown()
+    stub.stop()
+
+    return {
+        "config": {"users": users, "turns": turns, "llm_latency_ms": llm_latency_ms, "token_ms": token_ms},
+        "channel": channel,
+        "errors": errors[:10],
+        "websocket": {"elapsed_s": round(ws_elapsed, 3), "first_token": summary(results["ws_first_token"]),
+                      "reply": summary(results["ws_reply"]),
+                      "token_frames_per_turn": round(statistics.fmean(results["token_frames"]), 2)
+                      if results["token_frames"] else 0},
+        "http": {"elapsed_s": round(http_elapsed, 3), "reply": summary(results["http_reply"])},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=2, choices=range(1, len(TURNS) + 1))
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.users, args.turns, args.llm_latency_ms, args.token_ms), indent=2))
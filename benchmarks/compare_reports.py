@@ -0,0 +1,71 @@
+"""Compare two bench_chat_flow JSON reports (e.g. a replayed run on two code versions).
+
+Prints per-endpoint latency deltas and the change in LLM calls and DB ops per
+turn; exits non-zero when --max-regression is given and any p95 latency or
+per-turn call count grew by more than that percentage.
+
+    python -m benchmarks.compare_reports baseline.json candidate.json [--max-regression 10]
+"""
+import sys
+import json
+import argparse
+
+
+def _delta(old: float, new: float) -> dict:
+    pct = round((new - old) / old * 100, 1) if old else (0.0 if new == old else None)
+    return {"old": old, "new": new, "delta": round(new - old, 3), "pct": pct}
+
+
+def compare(baseline: dict, candidate: dict) -> dict:
+    endpoints = {}
+    for endpoint in sorted(set(baseline.get("endpoints", {})) | set(candidate.get("endpoints", {}))):
+        old = baseline.get("endpoints", {}).get(endpoint, {})
+        new = candidate.get("endpoints", {}).get(endpoint, {})
+        endpoints[endpoint] = {
+            metric: _delta(old.get(metric, 0.0), new.get(metric, 0.0)) for metric in ("p50_ms", "p95_ms", "mean_ms")
+        }
+        endpoints[endpoint]["errors"] = _delta(old.get("errors", 0), new.get("errors", 0))
+    return {
+        "endpoints": endpoints,
+        "throughput_turns_per_s": _delta(baseline.get("throughput_turns_per_s", 0.0),
+                                         candidate.get("throughput_turns_per_s", 0.0)),
+        "llm_calls_per_turn": _delta(baseline.get("llm_calls_per_turn", 0.0), candidate.get("llm_calls_per_turn", 0.0)),
+        "db_ops_per_turn": _delta(baseline.get("db_ops_per_turn", 0.0), candidate.get("db_ops_per_turn", 0.0)),
+        "replay_misses": _delta(
+            baseline.get("replay", {}).get("chat_misses", 0) + baseline.get("replay", {}).get("embed_misses", 0),
+            candidate.get("replay", {}).get("chat_misses", 0) + candidate.get("replay", {}).get("embed_misses", 0)),
+    }
+
+
+def regressions(result: dict, max_pct: float, min_delta_ms: float = 5.0) -> list:
+    """Metrics that grew by more than ``max_pct``; latencies must also grow by ``min_delta_ms``."""
+    found = []
+    checks = [(f"{endpoint} p95_ms", metrics["p95_ms"], min_delta_ms)
+              for endpoint, metrics in result["endpoints"].items()]
+    checks += [("llm_calls_per_turn", result["llm_calls_per_turn"], 0.0),
+               ("db_ops_per_turn", result["db_ops_per_turn"], 0.0)]
+    for name, delta, floor in checks:
+        if delta["pct"] is not None and delta["pct"] > max_pct and delta["delta"] > floor:
+            found.append(f"{name}: {delta['old']} -> {delta['new']} (+{delta['pct']}%)")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--max-regression", type=float, default=None, help="fail above this percentage")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="ignore latency changes below this")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    with open(args.candidate, encoding="utf-8") as fh:
+        candidate = json.load(fh)
+    result = compare(baseline, candidate)
+    print(json.dumps(result, indent=2))
+    if args.max_regression is not None:
+        found = regressions(result, args.max_regression, args.min_delta_ms)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if found else 0)
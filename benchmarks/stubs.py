@@ -0,0 +1,379 @@
+"""Local stand-ins used by the benchmark suite.
+
+- ``StubOpenAIServer``: an Azure OpenAI compatible HTTP server (chat
+  completions, streaming and embeddings) with configurable latency that plays
+  a scripted booking conversation, so the real langchain clients and the whole
+  graph run unchanged.
+- ``use_mongomock``: swap pymongo.MongoClient for mongomock before the app
+  modules are imported, counting collection operations.
+- ``write_directory_snapshot`` / ``write_directory_shards``: a synthetic
+  doctor directory written as a vector snapshot (see vector_snapshot.py) or
+  as region shards (region_shards.py) so no Chroma/Azure is needed.
+- ``real_directory_documents``: the rows of the shipped doctor_details_db,
+  read straight from its SQLite file (no Chroma client or embeddings).
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBEDDING_DIM = 1536
+CITIES = ["Chennai", "Kanchipuram", "Cuddalore", "Vellore", "Madurai"]
+HOSPITALS = ["Apollo Hospitals", "Fortis Malar Hospital", "Global Health City", "Sri Ramachandra Medical Centre"]
+SPECIALIZATIONS = ["Cardiologist", "Neurologist", "General Physician", "Dermatologist", "Psychiatrist"]
+
+BOOKING_CLOSING = ("Thank you! We are currently processing your doctor appointment request. "
+                   "You will receive a confirmation shortly.")
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> list:
+    """Deterministic pseudo-embedding: same text, same unit vector."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def directory_documents(scale: int = 1):
+    """Synthetic directory rows in the same text layout as doctor_details_db."""
+    docs = []
+    for copy in range(scale):
+        suffix = f" {copy}" if copy else ""
+        for city in CITIES:
+            for hospital in HOSPITALS:
+                for i, specialization in enumerate(SPECIALIZATIONS):
+                    text = (f"Hospital Name : {hospital}{suffix}, Doctor Name : Dr. Doctor {i}, "
+                            f"Specialization : {specialization}, Hospital Location : {city}")
+                    docs.append((text, {"summary": text}))
+    return docs
+
+
+def real_directory_documents():
+    """(text, metadata) of every row of the repository's doctor_details_db."""
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "doctor_details_db", "chroma.sqlite3")
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as connection:
+        rows = connection.execute(
+            "SELECT string_value FROM embedding_metadata WHERE key = 'chroma:document' ORDER BY id").fetchall()
+    return [(text, {}) for text, in rows]
+
+
+def write_directory_snapshot(snapshot_dir: str, scale: int = 1) -> str:
+    from vector_snapshot import write_snapshot
+
+    docs = directory_documents(scale)
+    vectors = np.array([fake_embedding(text) for text, _ in docs], dtype=np.float32)
+    return write_snapshot(vectors, [t for t, _ in docs], [m for _, m in docs], snapshot_dir)
+
+
+def write_directory_shards(shard_dir: str, scale: int = 1) -> str:
+    from region_shards import write_shards
+
+    docs = directory_documents(scale)
+    vectors = np.array([fake_embedding(text) for text, _ in docs], dtype=np.float32)
+    return write_shards(vectors, [t for t, _ in docs], [m for _, m in docs], shard_dir)
+
+
+def _last_turn(messages):
+    """Return (role, content) of the last user/tool message, skipping system messages."""
+    for message in reversed(messages):
+        if message.get("role") in ("user", "tool"):
+            return message["role"], message.get("content") or ""
+    return "user", ""
+
+
+def _listed_appointments(everything: str) -> list:
+    """Appointments from check_appointment results earlier in the conversation."""
+    listed = []
+    for line in everything.splitlines():
+        if line.startswith('{"appointments"'):
+            listed.extend(json.loads(line)["appointments"])
+    return listed
+
+
+def _appointment_id(everything: str, question: str) -> str:
+    for appointment in _listed_appointments(everything):
+        if f"on {appointment['date']} at {appointment['time']}" in question:
+            return appointment["id"]
+    return "000000000000000000000000"
+
+
+def scripted_reply(payload: dict):
+    """Decide the stub's answer: (content, tool_calls) for one chat completion request."""
+    messages = payload.get("messages", [])
+    everything = "\n".join(str(m.get("content") or "") for m in messages)
+
+    if not payload.get("tools"):
+        if "extract structured appointment details" in everything:
+            match = re.findall(r"(\d{4}-\d{2}-\d{2}) at (\d{2}:\d{2})", everything)
+            day, at = match[-1] if match else (None, None)
+            return json.dumps({
+                "username": "Bench User", "phone_number": "9999999999", "mail": "bench@example.com",
+                "location": "Chennai", "hospital_name": "Apollo Hospitals", "specialization": "Cardiologist",
+                "appointment_booking_date": day, "appointment_booking_time": at,
+                "appointment_status": "booking in progress",
+            }), None
+        # record selection (directory_records): pick the first few records
+        if "### Records" in everything:
+            return "1, 2, 3", None
+        # hospital filtering chain: keep the first few documents
+        documents = everything.split("### Documents:")[-1].strip().splitlines()
+        return "\n".join(documents[:5]), None
+
+    role, content = _last_turn(messages)
+    lowered = content.lower()
+    if role == "tool" and content.startswith('{"appointments"'):
+        listed = json.loads(content)["appointments"]
+        if not listed:
+            return "You have no upcoming appointments. Would you like to book one?", None
+        return "Your appointments:\n" + "\n".join(
+            f"{a['specialization']} at {a['hospital']} on {a['date']} at {a['time']} ({a['status']})"
+            for a in listed), None
+    if role == "tool" and content.startswith('{"status"'):
+        result = json.loads(content)
+        if result["status"] != "cancelled":
+            return "I couldn't find that appointment, or it was already cancelled.", None
+        a = result["appointment"]
+        return f"Your appointment at {a['hospital']} on {a['date']} at {a['time']} has been cancelled.", None
+    if role == "tool" and content.startswith('{"slot"'):
+        result = json.loads(content)
+        if result["slot"] != "held":
+            return f"Sorry, that time is not available. Free times: {result.get('free', 'none')}.", None
+        return (f"To confirm, you would like to book {result['doctor']} at {result['hospital']} on {result['date']} "
+                f"at {result['time']}. Should I go ahead and process your appointment?"), None
+    if role == "tool":
+        if lowered.startswith("free times") or lowered.startswith("no free"):
+            said = re.findall(r"(\d{4}-\d{2}-\d{2}) at (\d{2}:\d{2})", everything)
+            day, at = said[-1] if said else (None, None)
+            return None, [("hold_appointment",
+                           {"hospital": "Apollo Hospitals", "doctor": "Cardiologist", "date": day, "time": at})]
+        return "Here are some options:\n1. Apollo Hospitals\n2. Global Health City\nWhich one would you prefer?", None
+    if "hello, user details" in lowered:
+        return "Hello! I'm Azentyk's Doctor AI Assistant. Would you like to book, check, or cancel an appointment?", None
+    if "same as last time" in lowered:
+        return "What date and time would you prefer?", None
+    asked = next((m.get("content") or "" for m in reversed(messages)
+                  if m.get("role") == "assistant" and m.get("content")), "")
+    if lowered.startswith("yes") and asked.startswith("Do you want me to cancel"):
+        return None, [("cancel_appointment", {"appointment_id": _appointment_id(everything, asked)})]
+    if lowered.startswith("yes"):
+        return BOOKING_CLOSING, None
+    if "my appointments" in lowered:
+        return None, [("check_appointment", {})]
+    cancel_date = re.search(r"cancel .*?(\d{4}-\d{2}-\d{2})", lowered)
+    if cancel_date:
+        listed = [a for a in _listed_appointments(everything) if a["date"] == cancel_date.group(1)]
+        if not listed:
+            return None, [("check_appointment", {})]
+        a = listed[0]
+        return (f"Do you want me to cancel your {a['specialization']} appointment at {a['hospital']} "
+                f"on {a['date']} at {a['time']}?"), None
+    date_time = re.search(r"(\d{4}-\d{2}-\d{2}) at (\d{2}:\d{2})", content)
+    if date_time:
+        return None, [("appointment_availability",
+                       {"hospital": "Apollo Hospitals", "doctor": "Cardiologist", "date": date_time.group(1)})]
+    if "cardiologist" in lowered:
+        return "What date and time would you prefer?", None
+    if "apollo" in lowered:
+        said = [m.get("content") or "" for m in messages if m.get("role") == "user"]
+        city = next((c for text in reversed(said) for c in CITIES if c.lower() in text.lower()), "Chennai")
+        return None, [("hospital_details", {"query": f"specializations at Apollo Hospitals in {city}"})]
+    for city in CITIES:
+        if city.lower() in lowered:
+            return None, [("hospital_details", {"query": f"hospitals in {city}"})]
+    if "book" in lowered:
+        # Profile prefill (agent.PROFILE_PREFILL): offer the last booking, else search the known city
+        last = re.search(r"Last booking: ([^,;\n]+) at ([^,;\n]+)", everything)
+        if last:
+            return f"Would you like another {last.group(1)} appointment at {last.group(2)}?", None
+        known = re.search(r"Known details[^\n]*?Location: ([A-Za-z ]+)", everything)
+        if known:
+            return None, [("hospital_details", {"query": f"hospitals in {known.group(1).strip()}"})]
+        return "Please share your location so I can list available hospitals.", None
+    return "Could you tell me a little more about the appointment you need?", None
+
+
+class StubOpenAIServer:
+    """Azure OpenAI compatible stub with configurable latency.
+
+    latency_ms: time to first token; token_ms: extra delay per output token.
+    ``calls`` counts requests by kind (chat, chat_tools, embeddings);
+    ``chat_payloads`` keeps the latest chat request bodies.
+    """
+
+    def __init__(self, latency_ms: float = 50, token_ms: float = 0.0, host: str = "127.0.0.1",
+                 reply=scripted_reply):
+        self.latency = latency_ms / 1000.0
+        self.token_delay = token_ms / 1000.0
+        self.reply = reply
+        self.calls = Counter()
+        self.chat_payloads = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "StubOpenAIServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, kind: str) -> None:
+        with self._lock:
+            self.calls[kind] += 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, body: dict, status: int = 200):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.split("?")[0].endswith("/embeddings"):
+                    stub.count("embeddings")
+                    inputs = payload.get("input")
+                    inputs = inputs if isinstance(inputs, list) else [inputs]
+                    data = [{"object": "embedding", "index": i, "embedding": fake_embedding(json.dumps(item))}
+                            for i, item in enumerate(inputs)]
+                    time.sleep(stub.latency)
+                    return self._send_json({"object": "list", "data": data, "model": "stub",
+                                            "usage": {"prompt_tokens": 1, "total_tokens": 1}})
+
+                stub.count("chat_tools" if payload.get("tools") else "chat")
+                stub.chat_payloads.append(payload)
+                content, tool_calls = stub.reply(payload)
+                prompt_tokens = sum(len(str(m.get("content") or "")) for m in payload.get("messages", [])) // 4
+                completion_tokens = len((content or "").split()) + 10 * len(tool_calls or [])
+                time.sleep(stub.latency + stub.token_delay * completion_tokens)
+                message = {"role": "assistant", "content": content}
+                if tool_calls:
+                    message["tool_calls"] = [
+                        {"id": f"call_{i}_{int(time.time() * 1e6)}", "type": "function",
+                         "function": {"name": name, "arguments": json.dumps(args)}}
+                        for i, (name, args) in enumerate(tool_calls)
+                    ]
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                         "total_tokens": prompt_tokens + completion_tokens,
+                         "prompt_tokens_details": {"cached_tokens": 0}}
+                if payload.get("stream"):
+                    return self._stream(content or "", message.get("tool_calls"), usage)
+                self._send_json({
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                    "model": "gpt-4o-mini",
+                    "choices": [{"index": 0, "message": message,
+                                 "finish_reason": "tool_calls" if tool_calls else "stop"}],
+                    "usage": usage,
+                })
+
+            def _stream(self, content, tool_calls, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def emit(delta, finish=None, extra=None):
+                    chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": "gpt-4o-mini", "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                    chunk.update(extra or {})
+                    data = f"data: {json.dumps(chunk)}\n\n".encode()
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+
+                emit({"role": "assistant", "content": ""})
+                for word in content.split(" ") if content else []:
+                    time.sleep(stub.token_delay)
+                    emit({"content": word + " "})
+                for i, call in enumerate(tool_calls or []):
+                    emit({"tool_calls": [{"index": i, **call}]})
+                emit({}, "tool_calls" if tool_calls else "stop", {"usage": usage})
+                done = b"data: [DONE]\n\n"
+                self.wfile.write(f"{len(done):x}\r\n".encode() + done + b"\r\n0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+class MongoOpCounter:
+    """Counts mongomock collection operations, by collection and method."""
+
+    METHODS = ("insert_one", "insert_many", "find", "find_one", "update_one", "update_many",
+               "find_one_and_update", "aggregate", "bulk_write", "delete_one", "delete_many", "count_documents")
+
+    def __init__(self):
+        self.ops = Counter()
+        self._lock = threading.Lock()
+        self._depth = threading.local()
+
+    def install(self, collection_cls) -> None:
+        for name in self.METHODS:
+            original = getattr(collection_cls, name, None)
+            if original is None:
+                continue
+
+            def wrapper(coll, *args, __original=original, __name=name, **kwargs):
+                # Only the outermost call counts (mongomock's find_one calls find, etc.)
+                depth = getattr(self._depth, "value", 0)
+                if depth == 0:
+                    with self._lock:
+                        self.ops[f"{coll.name}.{__name}"] += 1
+                self._depth.value = depth + 1
+                try:
+                    return __original(coll, *args, **kwargs)
+                finally:
+                    self._depth.value = depth
+
+            setattr(collection_cls, name, wrapper)
+
+    def total(self, exclude=("app_logs",)) -> int:
+        return sum(n for key, n in self.ops.items() if key.split(".")[0] not in exclude)
+
+
+_mongomock_counter = None
+
+
+def use_mongomock() -> MongoOpCounter:
+    """Route every pymongo.MongoClient created afterwards to one shared in-memory mongomock server.
+
+    Later calls return the first call's counter, so modules imported before and after share one server.
+    """
+    global _mongomock_counter
+    import pymongo
+    import mongomock
+
+    if _mongomock_counter is not None:
+        return _mongomock_counter
+    shared = mongomock.MongoClient()
+
+    def _client(*args, **kwargs):
+        return shared
+
+    pymongo.MongoClient = _client
+    _mongomock_counter = MongoOpCounter()
+    _mongomock_counter.install(mongomock.collection.Collection)
+    return _mongomock_counter
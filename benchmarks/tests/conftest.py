@@ -0,0 +1,42 @@
+"""Shared setup for the tests: app modules talk to an in-memory mongomock server,
+and ``app_env`` boots the app against the stub LLM once per test session.
+
+    pip install -r requirements-dev.txt
+    python -m pytest benchmarks/tests
+"""
+import os
+
+import pytest
+
+from benchmarks.stubs import use_mongomock
+
+# Before any app module is imported: db_utils opens its client at import, and
+# llm_scheduler reads its limits
+use_mongomock()
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("LLM_TPM", "1000000000")
+
+
+@pytest.fixture(scope="session")
+def app_env(tmp_path_factory):
+    """(app, stub LLM) from benchmarks.bench_chat_flow.setup_environment."""
+    from benchmarks.bench_chat_flow import setup_environment
+
+    cwd = os.getcwd()
+    app, stub, _ = setup_environment(str(tmp_path_factory.mktemp("app")), 5, 0)
+    yield app, stub
+    stub.stop()
+    os.chdir(cwd)
+
+
+def login(app, index: int, city: str = "Chennai", name: str = None):
+    """A logged-in test client and its chat session id."""
+    client = app.test_client()
+    email = f"test{index}@example.com"
+    client.post("/register", data={
+        "firstname": name or f"Test{index}", "email": email, "phone": f"95000{index:05d}", "country": "India",
+        "state": "Tamil Nadu", "location": "Centre", "city": city, "password": "test-password"})
+    response = client.post("/login", data={"email": email, "password": "test-password"})
+    session_id = response.headers["Location"].rstrip("/").split("/")[-1]
+    client.get(f"/chat/{session_id}")
+    return client, session_id
@@ -0,0 +1,48 @@
+"""Saturated chat turns are refused with 503 + Retry-After while auth pages stay fast (admission.py)."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.bench_admission import PooledWSGIServer, chat_once, login
+
+
+def test_busy_chats_get_503_and_leave_threads_to_auth_routes(app_env):
+    from admission import chat_admission
+
+    app, stub = app_env
+    # Fewer threads than chats: without admission control every thread would be waiting on the LLM
+    server = PooledWSGIServer(app, threads=4)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = server.base_url
+    limits = chat_admission.max_in_flight, chat_admission.max_waiting, chat_admission.queue_timeout
+    latency = stub.latency
+    try:
+        sessions = [login(base, 9100 + i) for i in range(6)]
+        chat_admission.max_in_flight, chat_admission.max_waiting, chat_admission.queue_timeout = 2, 1, 0.2
+        chat_admission.reset()
+        stub.latency = 1.0
+        with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+            turns = [pool.submit(chat_once, base, client, session_id) for client, session_id in sessions]
+            time.sleep(0.3)  # the admitted turns are now waiting on the LLM
+            probes = []
+            for _ in range(5):
+                started = time.perf_counter()
+                assert requests.get(f"{base}/login").status_code == 200
+                probes.append(time.perf_counter() - started)
+            running = chat_admission.metrics()["in_flight"]
+            results = [turn.result() for turn in turns]
+    finally:
+        stub.latency = latency
+        chat_admission.max_in_flight, chat_admission.max_waiting, chat_admission.queue_timeout = limits
+        server.shutdown()
+
+    assert running == 2
+    # Each admitted turn takes over a second of LLM time; the login page does not wait for them
+    assert max(probes) < 0.5
+    statuses = sorted(status for status, _, _ in results)
+    assert statuses == [200, 200, 503, 503, 503, 503]
+    busy = [(ms, retry_after) for status, ms, retry_after in results if status == 503]
+    assert all(int(retry_after) >= 1 for _, retry_after in busy)
+    assert all(ms < 1000 for ms, _ in busy)
@@ -0,0 +1,28 @@
+"""Idle sessions are evicted from agent.user_agents, and come back from the stored conversation."""
+from benchmarks.tests.conftest import login
+
+
+def test_idle_sessions_are_evicted_and_resume_from_history(app_env):
+    import agent
+    from patient_bot_conversational import part_1_graph
+
+    app, _ = app_env
+    client, session_id = login(app, 901)
+    first = "I want to book a doctor appointment"
+    assert client.post(f"/chat/{session_id}", json={"user_input": first}).status_code == 200
+    state = agent.user_agents[session_id]
+    config = {"configurable": {"thread_id": state.thread_id}}
+    assert part_1_graph.get_state(config).values.get("messages")
+
+    active, active_session = login(app, 902)
+    active.post(f"/chat/{active_session}", json={"user_input": first})
+    state.last_used -= agent.AGENT_IDLE_SECONDS + 1
+    assert agent.evict_idle_agents() == 1
+    assert session_id not in agent.user_agents and active_session in agent.user_agents
+    assert not part_1_graph.get_state(config).values.get("messages")
+
+    # The next turn gets a new thread seeded with the earlier conversation
+    assert client.post(f"/chat/{session_id}", json={"user_input": "I am in Chennai"}).status_code == 200
+    resumed = {"configurable": {"thread_id": agent.user_agents[session_id].thread_id}}
+    said = [m.content for m in part_1_graph.get_state(resumed).values["messages"]]
+    assert any(first in text for text in said)
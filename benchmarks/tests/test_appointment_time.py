@@ -0,0 +1,97 @@
+"""Date and time resolution against the corpus of what patients type, on Monday 2026-10-19 14:05 (NOW).
+
+benchmarks.bench_dates reports over the same corpus.
+"""
+from datetime import datetime
+
+import pytest
+
+from appointment_time import annotate, resolve
+
+NOW = datetime(2026, 10, 19, 14, 5)  # a Monday
+
+# (message, date, time, past); date/time None where the message has none
+CORPUS = [
+    ("tomorrow 5pm", "2026-10-20", "17:00", False),
+    ("Tomorrow at 10 am please", "2026-10-20", "10:00", False),
+    ("tmrw 11:30", "2026-10-20", "11:30", False),
+    ("day after tomorrow, 4 pm", "2026-10-21", "16:00", False),
+    ("the day after tomorrow morning at 9", "2026-10-21", "09:00", False),
+    ("today at 4.30 pm", "2026-10-19", "16:30", False),
+    ("today 11am", "2026-10-19", "11:00", True),
+    ("this evening at 6", "2026-10-19", "18:00", False),
+    ("tonight 7pm if possible", "2026-10-19", "19:00", False),
+    ("next Monday", "2026-10-26", None, False),
+    ("next monday at 3", "2026-10-26", "15:00", False),
+    ("this Monday 5pm", "2026-10-19", "17:00", False),
+    ("Wednesday 10:15", "2026-10-21", "10:15", False),
+    ("on friday around 2", "2026-10-23", "14:00", False),
+    ("coming Saturday at noon", "2026-10-24", "12:00", False),
+    ("Sunday 9 a.m.", "2026-10-25", "09:00", False),
+    ("thu 4pm", "2026-10-22", "16:00", False),
+    ("Tues at 11", "2026-10-20", "11:00", False),
+    ("in 3 days at 10am", "2026-10-22", "10:00", False),
+    ("in two days", "2026-10-21", None, False),
+    ("after a week, 5 pm", "2026-10-26", "17:00", False),
+    ("in 2 weeks on the same time 10:30", "2026-11-02", "10:30", False),
+    ("2026-10-25 17:00", "2026-10-25", "17:00", False),
+    ("2026-10-20 at 10:00", "2026-10-20", "10:00", False),
+    ("2026-10-01 at 10:00", "2026-10-01", "10:00", True),
+    ("20/10/2026 at 4.30 pm", "2026-10-20", "16:30", False),
+    ("21-10-2026 10am", "2026-10-21", "10:00", False),
+    ("22.10.2026, 14:00", "2026-10-22", "14:00", False),
+    ("25/10 at 9:45", "2026-10-25", "09:45", False),
+    ("30/10/26 5pm", "2026-10-30", "17:00", False),
+    ("20th October at 10", "2026-10-20", "10:00", False),
+    ("23rd oct 3 PM", "2026-10-23", "15:00", False),
+    ("1st of November, 11:00", "2026-11-01", "11:00", False),
+    ("November 3rd at 4pm", "2026-11-03", "16:00", False),
+    ("Nov 5, 2026 9:30 am", "2026-11-05", "09:30", False),
+    ("Dec 25th, 2026 3 PM", "2026-12-25", "15:00", False),
+    ("5 Jan 10am", "2027-01-05", "10:00", False),
+    ("January 12 at 5", "2027-01-12", "17:00", False),
+    ("Oct 5 at 10", "2026-10-05", "10:00", True),
+    ("12th October 2026 11 am", "2026-10-12", "11:00", True),
+    ("31/11/2026", None, None, False),
+    ("I'd like 24 October at 12:30", "2026-10-24", "12:30", False),
+    ("can I come on 28 oct in the afternoon at 3", "2026-10-28", "15:00", False),
+    ("book me for the 27th of October, 5:15 p.m.", "2026-10-27", "17:15", False),
+    ("any time tomorrow", "2026-10-20", None, False),
+    ("5pm", None, "17:00", False),
+    ("at 10:30", None, "10:30", False),
+    ("noon", None, "12:00", False),
+    ("I need a cardiologist", None, None, False),
+    ("Apollo Hospitals in Chennai", None, None, False),
+    ("Yes, please go ahead", None, None, False),
+    ("My number is 9876543210", None, None, False),
+    ("Is it open 24/7?", None, None, False),
+    ("I am 45 years old", None, None, False),
+    ("Which doctor is rated 4.5?", None, None, False),
+    ("May I book a neurologist?", None, None, False),
+    ("show my appointments", None, None, False),
+    ("I live at 12 MG road", None, None, False),
+    ("at 9 pm", None, "21:00", False),
+]
+
+
+@pytest.mark.parametrize("text, day, at, past", CORPUS)
+def test_resolve(text, day, at, past):
+    got = resolve(text, NOW)
+    if day is None and at is None:
+        assert got is None
+    else:
+        assert (got["date"], got["time"], got["past"]) == (day, at, past)
+        assert got["text"] and got["text"].lower() in text.lower()
+
+
+@pytest.mark.parametrize("text, day, at, past", CORPUS)
+def test_annotate(text, day, at, past):
+    annotated = annotate(text, NOW)
+    if day is None and at is None:
+        assert annotated == text
+        return
+    first, note = annotated.split("\n")
+    assert first == text
+    assert note.startswith("[") and note.endswith("]")
+    assert all(value in note for value in (day, at) if value)
+    assert note.endswith(", in the past]") == past
@@ -0,0 +1,48 @@
+"""Appointment reads in db_utils: the profile's last booking and the check/cancel tools' lookups."""
+import db_utils
+
+
+def book(email: str, hospital: str, **fields):
+    return db_utils.push_patient_information_data_to_db({
+        "account_email": email, "hospital_name": hospital, "specialization": "Cardiology",
+        "location": "Chennai (Velachery)", "appointment_status": "Pending", **fields}).inserted_id
+
+
+def test_last_booking_is_the_latest_live_one():
+    email = "last-booking@example.com"
+    book(email, "First Hospital")
+    second = book(email, "Second Hospital")
+    assert db_utils.get_last_booking(email)["hospital_name"] == "Second Hospital"
+
+    assert db_utils.cancel_appointment(str(second), email)[0] == "cancelled"
+    assert db_utils.get_last_booking(email)["hospital_name"] == "First Hospital"
+
+
+def test_appointments_belong_to_the_account_not_typed_contact_details():
+    email = "owner@example.com"
+    mine = book(email, "Mine Hospital", appointment_booking_date="2099-01-02", appointment_booking_time="10:00")
+    # Someone else's booking that names this address as the patient's email
+    theirs = book("other@example.com", "Their Hospital", mail=email, phone_number="9500011111",
+                  appointment_booking_date="2099-01-01", appointment_booking_time="10:00")
+    assert [a["_id"] for a in db_utils.find_appointments(email)] == [mine]
+    assert db_utils.cancel_appointment(str(theirs), email) == ("not_found", None)
+
+
+def test_upcoming_appointments_leave_free_text_dates_out():
+    from booking import canonical_booking_fields
+
+    email = "dates@example.com"
+    parsed = {"appointment_booking_date": "2099-03-04", "appointment_booking_time": "5pm"}
+    canonical_booking_fields(parsed)
+    assert parsed == {"appointment_booking_date": "2099-03-04", "appointment_booking_time": "17:00"}
+    unparsed = {"appointment_booking_date": "when my son is back", "appointment_booking_time": "17:00"}
+    canonical_booking_fields(unparsed)
+    assert unparsed["appointment_booking_date"] is None
+    assert unparsed["appointment_booking_date_text"] == "when my son is back"
+
+    upcoming = book(email, "Upcoming Hospital", **parsed)
+    book(email, "Unparsed Hospital", **unparsed)
+    # Stored before dates were canonicalized; "the 5th" sorts after any YYYY-MM-DD
+    book(email, "Older Hospital", appointment_booking_date="the 5th", appointment_booking_time="10:00")
+    assert [a["_id"] for a in db_utils.find_appointments(email, from_date="2026-01-01")] == [upcoming]
+    assert len(db_utils.find_appointments(email)) == 3
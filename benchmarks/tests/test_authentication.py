@@ -0,0 +1,68 @@
+"""Login throttling per forwarded client address and per account, and upgrades of legacy accounts."""
+import db_utils
+from db_utils import _legacy_hash_password, authenticate_user, lowercase_stored_emails, patient_credentials_collection
+from rate_limiter import SlidingWindowLimiter
+
+
+def legacy_account(email: str, password: str = "old-password") -> None:
+    """An account as registered before scrypt and email normalization."""
+    patient_credentials_collection.insert_one({"firstname": "Legacy", "email": email, "phone": f"p-{email}",
+                                               "password": _legacy_hash_password(password)})
+
+
+def post_login(client, email: str, password: str, forwarded_for: str):
+    return client.post("/login", data={"email": email, "password": password},
+                       headers={"X-Forwarded-For": forwarded_for}, environ_base={"REMOTE_ADDR": "10.0.0.1"})
+
+
+def test_login_is_limited_per_client_behind_the_proxy_and_per_account(app_env, monkeypatch):
+    import authentication
+    import main
+
+    app, _ = app_env
+    monkeypatch.setattr(authentication, "login_ip_limiter", SlidingWindowLimiter(3, 300))
+    monkeypatch.setattr(authentication, "login_account_limiter", SlidingWindowLimiter(2, 300))
+    monkeypatch.setattr(app, "wsgi_app", app.wsgi_app)
+    main.trust_proxies(app, 1)
+    client = app.test_client()
+
+    # Every client reaches the app from the front end's address; each is limited on its own
+    for attempt in range(3):
+        assert post_login(client, f"nobody{attempt}@example.com", "x", "203.0.113.5").status_code == 200
+    assert post_login(client, "nobody9@example.com", "x", "203.0.113.5").status_code == 429
+    assert post_login(client, "nobody9@example.com", "x", "198.51.100.7").status_code == 200
+
+    # Failures count per account, whatever case or spacing the email is typed in
+    assert post_login(client, "Target@Example.com ", "x", "198.51.100.8").status_code == 200
+    assert post_login(client, "TARGET@example.com", "x", "198.51.100.9").status_code == 200
+    response = post_login(client, "target@example.com", "x", "198.51.100.10")
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) > 0
+
+
+def test_legacy_hash_and_mixed_case_email_are_upgraded_on_login(app_env):
+    app, _ = app_env
+    legacy_account("Legacy.User@Example.com")
+    client = app.test_client()
+    response = client.post("/login", data={"email": " Legacy.User@Example.com", "password": "old-password"})
+    assert response.status_code == 302
+    with client.session_transaction() as flask_session:
+        assert flask_session["user"] == "legacy.user@example.com"
+
+    user = patient_credentials_collection.find_one({"email": "legacy.user@example.com"})
+    assert user["password"].startswith("scrypt$")
+    assert authenticate_user("LEGACY.USER@example.com", "old-password") == "legacy.user@example.com"
+    assert authenticate_user("legacy.user@example.com", "wrong") is None
+
+
+def test_lowercase_migration_reports_collisions():
+    legacy_account("Solo.Case@Example.com")
+    legacy_account("Twice@Example.com")
+    legacy_account("twice@example.com", "other-password")
+    db_utils.patient_information_details_table_collection.insert_one({"account_email": "Solo.Case@Example.com"})
+
+    report = lowercase_stored_emails()
+    assert ["Twice@Example.com", "twice@example.com"] in report["collisions"]
+    assert patient_credentials_collection.find_one({"email": "solo.case@example.com"})
+    assert db_utils.patient_information_details_table_collection.find_one({"account_email": "solo.case@example.com"})
+    # A colliding account still logs in as itself
+    assert authenticate_user("Twice@Example.com", "old-password") == "Twice@Example.com"
@@ -0,0 +1,157 @@
+"""Appointment slots: keyed by the directory's (hospital, doctor), read-only
+availability, and a hold taken when the time is proposed and booked on "yes".
+"""
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import pytest
+
+from benchmarks.tests.conftest import login
+
+
+@pytest.fixture
+def booking(app_env):
+    """The booking module, imported once the app environment (directory snapshot) is set up."""
+    import booking
+
+    return booking
+
+
+RECORDS = [
+    {"hospital": "Apollo Hospitals", "location": "Chennai", "specialization": "Cardiologist",
+     "doctor": "Dr. Anil Rao"},
+    {"hospital": "Apollo Hospitals", "location": "Chennai", "specialization": "Neurosurgeon",
+     "doctor": "Dr. Vikas Bhat"},
+    {"hospital": "Apollo Hospitals", "location": "Madurai", "specialization": "Neurosurgeon",
+     "doctor": "Dr. Priya Das"},
+]
+
+
+def test_doctor_name_and_specialization_resolve_to_the_same_slot(booking):
+    by_name = booking.resolve_provider("Apollo Hospital", "Dr. Anil Rao", RECORDS)
+    by_specialization = booking.resolve_provider("apollo hospitals", "cardiologist", RECORDS)
+    assert by_name == by_specialization == [RECORDS[0]]
+
+    day = date.today() + timedelta(days=30)
+    minute = booking.CLINIC_HOURS[0][0]
+    first = booking.hold_for_session("slots-a", by_name[0], day, minute)
+    assert first is not None
+    assert booking.hold_for_session("slots-b", by_specialization[0], day, minute) is None
+    booking.release(booking.take_session_hold("slots-a"))
+
+
+def test_location_narrows_and_unknown_names_resolve_to_nothing(booking):
+    assert booking.resolve_provider("Apollo Hospitals", "Neurosurgeon", RECORDS) == RECORDS[1:]
+    assert booking.resolve_provider("Apollo Hospitals", "Neurosurgeon", RECORDS, "Madurai") == [RECORDS[2]]
+    assert booking.resolve_provider("Apollo Hospitals", "Dr. Made Up", RECORDS) == []
+    assert booking.resolve_provider("Fortis", "Cardiologist", RECORDS) == []
+
+
+def test_availability_writes_nothing(booking):
+    day = date.today() + timedelta(days=31)
+    before = booking.slots_collection.count_documents({})
+    assert booking.availability("Imaginary Clinic", "Dr. Nobody", day)
+    assert booking.availability("Apollo Hospitals", "Dr. Anil Rao", day)
+    assert booking.slots_collection.count_documents({}) == before
+
+
+def race(sessions: int, turn):
+    """Run ``turn(i)`` for every session at once; the Counter of slot indexes whose turn confirmed."""
+    start = threading.Barrier(sessions)
+    confirmed = Counter()
+    lock = threading.Lock()
+
+    def run(i):
+        start.wait()
+        index = turn(i)
+        if index is not None:
+            with lock:
+                confirmed[index] += 1
+
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(run, range(sessions)))
+    return confirmed
+
+
+def slot_index(reservation) -> int:
+    return int(reservation["field"].split(".")[1])
+
+
+def test_racing_sessions_confirm_each_slot_once(booking):
+    day = date.today() + timedelta(days=33)
+    minutes = [booking.CLINIC_HOURS[0][0] + n * booking.SLOT_MINUTES for n in range(3)]
+
+    def turn(i):
+        reservation = booking.hold("Apollo Hospitals", "Dr. Anil Rao", day, minutes[i % 3], holder=f"race-{i}")
+        if reservation and booking.confirm(reservation, appointment_id=i):
+            return slot_index(reservation)
+
+    confirmed = race(24, turn)
+    assert sorted(confirmed.values()) == [1, 1, 1]
+    reserved = booking.slots_collection.find_one({"_id": booking.day_id("Apollo Hospitals", "Dr. Anil Rao", day)})
+    assert sorted(int(index) for index in reserved["reserved"]) == sorted(confirmed)
+    assert all(entry["status"] == "booked" for entry in reserved["reserved"].values())
+
+
+def test_renewed_holds_race_fresh_holds_and_confirm_once(booking):
+    """The chat "yes" turn: take the session's hold, renew it, confirm, while others hold the same slot."""
+    provider = RECORDS[0]
+    day = date.today() + timedelta(days=34)
+    minutes = [booking.CLINIC_HOURS[0][0] + n * booking.SLOT_MINUTES for n in range(3)]
+    sessions = [f"renew-race-{i}" for i in range(18)]
+
+    def propose(i):
+        held = booking.hold_for_session(sessions[i], provider, day, minutes[i % 3])
+        return slot_index(held) if held else None
+
+    assert sorted(race(len(sessions), propose).values()) == [1, 1, 1]
+
+    # The proposed holds lapse before anyone says yes, so every session competes for its slot again
+    doc_id = booking.day_id(provider["hospital"], provider["doctor"], day)
+    past = booking.local_now() - timedelta(minutes=1)
+    booking.slots_collection.update_one(
+        {"_id": doc_id}, {"$set": {f"reserved.{index}.expires_at": past
+                                   for index in booking.slots_collection.find_one({"_id": doc_id})["reserved"]}})
+
+    def yes_turn(i):
+        reservation = booking.take_session_hold(sessions[i])
+        if reservation is not None:
+            held = booking.renew(reservation, sessions[i])
+        else:
+            held = booking.hold(provider["hospital"], provider["doctor"], day, minutes[i % 3], holder=sessions[i])
+        if held and booking.confirm(held, appointment_id=sessions[i]):
+            return slot_index(held)
+
+    confirmed = race(len(sessions), yes_turn)
+    assert sorted(confirmed.values()) == [1, 1, 1]
+    reserved = booking.slots_collection.find_one({"_id": doc_id})["reserved"]
+    assert [entry["status"] for entry in reserved.values()] == ["booked"] * 3
+    assert len({entry["appointment_id"] for entry in reserved.values()}) == 3
+
+
+def test_time_is_held_when_proposed_and_booked_on_yes(app_env, booking):
+    app, _ = app_env
+    client, session_id = login(app, 801)
+    day = (date.today() + timedelta(days=32)).isoformat()
+    for text in ("I want to book a doctor appointment", "I am in Chennai", "Apollo Hospitals please",
+                 "Cardiologist", f"{day} at 10:00"):
+        assert client.post(f"/chat/{session_id}", json={"user_input": text}).status_code == 200
+
+    hold = booking.holds_collection.find_one({"_id": session_id})
+    assert hold is not None and (hold["reservation"]["date"], hold["reservation"]["time"]) == (day, "10:00")
+    slot = booking.slots_collection.find_one({"_id": hold["reservation"]["slot_doc"]})
+    assert slot["reserved"][hold["reservation"]["field"].split(".")[1]]["status"] == "held"
+
+    # Another user proposing the same time while it is held is refused
+    other, other_session = login(app, 802)
+    for text in ("I want to book a doctor appointment", "I am in Chennai", "Apollo Hospitals please",
+                 "Cardiologist", f"{day} at 10:00"):
+        other.post(f"/chat/{other_session}", json={"user_input": text})
+    assert booking.holds_collection.find_one({"_id": other_session}) is None
+
+    client.post(f"/chat/{session_id}", json={"user_input": "Yes, please go ahead"})
+    assert booking.holds_collection.find_one({"_id": session_id}) is None
+    entry = booking.slots_collection.find_one({"_id": hold["reservation"]["slot_doc"]})["reserved"]
+    assert [e["status"] for e in entry.values()] == ["booked"]
@@ -0,0 +1,54 @@
+"""Conversation sequence numbers, history pages, and the legacy-row backfill's day buckets."""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import appointment_time
+import conversation_store
+from conversation_store import append_message, backfill, chat_collection, load_history
+
+
+def test_concurrent_messages_get_distinct_increasing_sequence_numbers():
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda n: append_message("seq-session", "seq@example.com", "user", f"message {n}"), range(40)))
+    seqs = sorted(row["seq"] for row in chat_collection.find({"session_id": "seq-session"}))
+    assert seqs == list(range(1, 41))
+
+
+def test_history_pages_run_oldest_first_back_to_the_start():
+    for n in range(7):
+        append_message("page-session", "page@example.com", "user" if n % 2 == 0 else "assistant", f"m{n}")
+    page = load_history("page-session", limit=3)
+    assert [m["text"] for m in page["messages"]] == ["m4", "m5", "m6"]
+    assert [m["role"] for m in page["messages"]] == ["user", "assistant", "user"]
+
+    texts = [m["text"] for m in page["messages"]]
+    while page["next_before"] is not None:
+        page = load_history("page-session", before=page["next_before"], limit=3)
+        texts = [m["text"] for m in page["messages"]] + texts
+    assert texts == [f"m{n}" for n in range(7)]
+    assert len(page["messages"]) == 1
+
+
+def test_backfill_buckets_legacy_rows_by_the_clinics_day(monkeypatch):
+    # Rows written by a UTC server for clinics in India (UTC+05:30)
+    monkeypatch.setenv("TZ", "UTC")
+    time.tzset()
+    monkeypatch.setattr(appointment_time, "_zone", ZoneInfo("Asia/Kolkata"))
+    try:
+        rows = [("2001-03-04", "10:00:00", "morning"), ("2001-03-04", "20:00:00", "after local midnight"),
+                ("2001-03-05", "09:00:00", "next morning")]
+        ids = chat_collection.insert_many([{"date": d, "time": t, "message": m} for d, t, m in rows]).inserted_ids
+        assert backfill(batch_size=2) >= 3
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+    migrated = [chat_collection.find_one({"_id": _id}) for _id in ids]
+    assert [(row["session_id"], row["seq"]) for row in migrated] == [
+        ("legacy-2001-03-04", 1), ("legacy-2001-03-05", 1), ("legacy-2001-03-05", 2)]
+    assert migrated[1]["ts"].replace(tzinfo=timezone.utc) == datetime(2001, 3, 4, 20, 0, tzinfo=timezone.utc)
+    assert [m["text"] for m in load_history("legacy-2001-03-05")["messages"]] == [
+        "after local midnight", "next morning"]
+    assert conversation_store.sequence_collection.find_one({"_id": "legacy-2001-03-05"})["seq"] == 2
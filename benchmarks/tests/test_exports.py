@@ -0,0 +1,66 @@
+"""Incremental exports (reports.py): passing the watermark back as ``since`` misses no record."""
+import json
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+ADMIN_TOKEN = "test-admin"
+
+
+@pytest.fixture
+def admin(app_env, monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", ADMIN_TOKEN)
+    import db_utils
+
+    appointments = db_utils.patient_information_details_table_collection
+    appointments.delete_many({})
+    client = app_env[0].test_client()
+
+    def export(since=None):
+        query = "?format=ndjson" + (f"&since={since}" if since else "")
+        response = client.get(f"/admin/export/appointments{query}", headers={"X-Admin-Token": ADMIN_TOKEN})
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        return [row["username"] for row in rows], response.headers["X-Export-Watermark"]
+
+    return appointments, export
+
+
+def stamp(at: datetime) -> dict:
+    return {"date": at.strftime("%Y-%m-%d"), "time": at.strftime("%H:%M:%S")}
+
+
+def frozen(at: datetime):
+    class Frozen(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return at
+    return mock.patch("reports.datetime", Frozen)
+
+
+def test_record_written_in_the_watermark_second_is_exported_next_time(admin):
+    appointments, export = admin
+    now = datetime(2026, 10, 19, 14, 5, 30)
+    appointments.insert_one({"username": "earlier", **stamp(datetime(2026, 10, 19, 14, 5, 10))})
+    with frozen(now):
+        names, watermark = export()
+    assert names == ["earlier"]
+
+    # Written in the same second as the first export ran, after its query
+    appointments.insert_one({"username": "same-second", **stamp(now)})
+    with frozen(datetime(2026, 10, 19, 14, 6, 0)):
+        names, _ = export(since=watermark)
+    assert names == ["same-second"]
+
+
+def test_exports_do_not_overlap(admin):
+    appointments, export = admin
+    for second in range(0, 60, 10):
+        appointments.insert_one({"username": f"row{second}", **stamp(datetime(2026, 10, 19, 14, 5, second))})
+    with frozen(datetime(2026, 10, 19, 14, 5, 25)):
+        first, watermark = export()
+    with frozen(datetime(2026, 10, 19, 14, 7, 0)):
+        second, _ = export(since=watermark)
+    assert first == ["row0", "row10", "row20"]
+    assert second == ["row30", "row40", "row50"]
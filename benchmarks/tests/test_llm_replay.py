@@ -0,0 +1,26 @@
+"""Replay keys ignore the injected current date but not dates the conversation names."""
+import json
+
+from llm_replay import ReplayArchive, ReplayChatCache, chat_key
+
+
+def prompt(today: str, asked: str) -> str:
+    return json.dumps([
+        {"type": "system", "content": f"Current Date:\n<Date>\n{today}\n</Date>"},
+        {"type": "human", "content": f"Book me in on {asked} at 10:00"},
+    ])
+
+
+def test_current_date_is_normalized_and_conversation_dates_are_kept():
+    monday = chat_key(prompt("Monday, October 19, 2026, 09:00", "2026-10-21"), "model")
+    tuesday = chat_key(prompt("Tuesday, October 20, 2026, 17:30", "2026-10-21"), "model")
+    assert monday == tuesday
+    assert chat_key(prompt("Monday, October 19, 2026, 09:00", "2026-10-22"), "model") != monday
+
+
+def test_a_failed_call_leaves_no_start_time_behind(tmp_path):
+    cache = ReplayChatCache(ReplayArchive(str(tmp_path / "archive.jsonl.gz"), "record"))
+    for day in range(1, 20):
+        # lookup() without update(): the model call raised
+        cache.lookup(prompt("Monday, October 19, 2026, 09:00", f"2026-11-{day:02d}"), "model")
+    assert len(cache._started) == 1
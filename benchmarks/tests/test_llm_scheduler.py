@@ -0,0 +1,226 @@
+"""LLMScheduler: fair queuing across sessions, priority classes, and 429 backoff.
+
+The calls are local functions, and one test runs the scheduler against a
+rate-limited stub HTTP deployment that answers 429 + Retry-After.
+"""
+import json
+import time
+import threading
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_scheduler import BACKGROUND, INTERACTIVE, LLMScheduler
+
+
+class RateLimited(Exception):
+    """A 429 as the openai client raises it: ``status_code`` and ``response.headers``."""
+    status_code = 429
+
+    def __init__(self, retry_after: str):
+        super().__init__("429")
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after}, "status_code": 429})()
+
+
+def make_scheduler(**overrides) -> LLMScheduler:
+    settings = dict(rpm=1_000_000, tpm=1_000_000_000, max_concurrency=1, burst_seconds=1,
+                    backoff_base=0.01, queue_timeout=10)
+    settings.update(overrides)
+    return LLMScheduler(**settings)
+
+
+def waiting(sched: LLMScheduler) -> int:
+    return sum(q["waiting"] for q in sched.metrics()["queues"].values())
+
+
+def wait_until(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+class Calls:
+    """Queues calls one at a time behind a held slot and records the order they run in."""
+
+    def __init__(self, sched: LLMScheduler):
+        self.sched = sched
+        self.order = []
+        self.threads = []
+        self.release = threading.Event()
+        self.holder = threading.Thread(target=sched.run, args=(self.release.wait,), kwargs={"session_id": "holder"})
+        self.holder.start()
+        wait_until(lambda: sched.metrics()["in_flight"] == 1)
+
+    def enqueue(self, session_id: str, priority: int = INTERACTIVE, fn=None) -> None:
+        before = waiting(self.sched)
+
+        def call():
+            if fn is not None:
+                fn()
+            self.order.append(session_id)
+
+        thread = threading.Thread(target=self.sched.run, args=(call,),
+                                  kwargs={"session_id": session_id, "priority": priority})
+        thread.start()
+        self.threads.append(thread)
+        # One at a time, so the queue order is the order of these calls
+        wait_until(lambda: waiting(self.sched) == before + 1)
+
+    def finish(self) -> list:
+        self.release.set()
+        for thread in [self.holder] + self.threads:
+            thread.join(timeout=10)
+        return self.order
+
+
+def test_sessions_take_turns_within_a_priority_class():
+    calls = Calls(make_scheduler())
+    for _ in range(4):
+        calls.enqueue("chatty")
+    calls.enqueue("a")
+    calls.enqueue("b")
+    order = calls.finish()
+    # Round-robin: the chatty session's backlog doesn't hold the others back
+    assert order[:3] == ["chatty", "a", "b"]
+    assert order[3:] == ["chatty"] * 3
+
+
+def test_interactive_calls_are_granted_before_background_work():
+    calls = Calls(make_scheduler())
+    calls.enqueue("extraction-1", BACKGROUND)
+    calls.enqueue("extraction-2", BACKGROUND)
+    calls.enqueue("turn-1", INTERACTIVE)
+    calls.enqueue("turn-2", INTERACTIVE)
+    assert calls.finish() == ["turn-1", "turn-2", "extraction-1", "extraction-2"]
+
+
+def test_429_waits_at_least_retry_after_and_pauses_the_queue():
+    sched = make_scheduler(max_concurrency=4)
+    attempts = []
+
+    def call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RateLimited("0.3")
+        return "ok"
+
+    assert sched.run(call, session_id="s") == "ok"
+    assert attempts[1] - attempts[0] >= 0.3
+    metrics = sched.metrics()
+    assert (metrics["rate_limited"], metrics["retries"], metrics["failures"]) == (1, 1, 0)
+
+    # While paused, other sessions wait too
+    started = time.monotonic()
+    sched._pause(0.2)
+    sched.run(lambda: None, session_id="other")
+    assert time.monotonic() - started >= 0.2
+
+
+def test_429_gives_up_after_max_retries():
+    sched = make_scheduler(max_retries=2)
+
+    def call():
+        raise RateLimited("0")
+
+    with pytest.raises(RateLimited):
+        sched.run(call, session_id="s")
+    assert sched.metrics()["rate_limited"] == 3
+    assert sched.metrics()["in_flight"] == 0
+
+
+def test_retried_call_keeps_its_turn():
+    sched = make_scheduler()
+    calls = Calls(sched)
+    throttled = []
+
+    def first_attempt_throttled():
+        if not throttled:
+            throttled.append(True)
+            raise RateLimited("0.1")
+
+    calls.enqueue("a", fn=first_attempt_throttled)
+    calls.enqueue("b")
+    calls.enqueue("c")
+    # a is throttled once and retried before b and c, which were queued behind it
+    assert calls.finish() == ["a", "b", "c"]
+
+
+# ---- against a rate-limited stub deployment -------------------------------
+def stub_deployment(per_second: int):
+    """A local HTTP "deployment" that accepts ``per_second`` requests per second and 429s the rest."""
+    window = deque()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            now = time.monotonic()
+            with lock:
+                while window and now - window[0] > 1.0:
+                    window.popleft()
+                allowed = len(window) < per_second
+                if allowed:
+                    window.append(now)
+            if allowed:
+                time.sleep(0.02)
+                body = json.dumps({"usage": {"total_tokens": 50}}).encode()
+                self.send_response(200)
+            else:
+                body = b"{}"
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/chat"
+
+
+def test_every_session_completes_against_a_throttling_deployment():
+    server, url = stub_deployment(per_second=4)
+    # Allows twice what the deployment accepts, so it answers 429s
+    sched = make_scheduler(rpm=480, max_concurrency=4, backoff_base=0.2, queue_timeout=60)
+
+    def call():
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=b"{}", method="POST")) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                raise RateLimited(e.headers.get("Retry-After", "0"))
+            raise
+
+    finished = {}
+
+    def session(name: str, turns: int, priority: int = INTERACTIVE):
+        for _ in range(turns):
+            sched.run(call, session_id=name, priority=priority, tokens=50)
+        finished[name] = time.monotonic()
+
+    turns = {"chatty": 9, "s1": 3, "s2": 3, "s3": 3}
+    threads = [threading.Thread(target=session, args=(name, n)) for name, n in turns.items()]
+    threads.append(threading.Thread(target=session, args=("extraction", 3, BACKGROUND)))
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=90)
+    finally:
+        server.shutdown()
+
+    metrics = sched.metrics()
+    assert set(finished) == set(turns) | {"extraction"}
+    assert metrics["rate_limited"] > 0 and metrics["failures"] == 0 and metrics["timeouts"] == 0
+    assert metrics["wait"]["interactive"]["granted"] + metrics["wait"]["background"]["granted"] \
+        == sum(turns.values()) + 3 + metrics["retries"]
+    # The chatty session's extra turns don't delay the others to the end
+    assert max(finished[name] for name in ("s1", "s2", "s3")) < finished["chatty"]
@@ -0,0 +1,48 @@
+"""Prefetch keys match the tool's lookups for the real directory, whose locations read "City (Area)"."""
+import time
+
+from benchmarks.stubs import real_directory_documents
+from prefetch import ToolPrefetcher
+from region_shards import _LOCATION_RE
+
+
+def prefetcher():
+    docs = real_directory_documents()
+    fetched = []
+    cache = ToolPrefetcher(lambda query, city, state, session_id: fetched.append(query) or query)
+    cache.learn(text for text, _ in docs)
+    locations = sorted({_LOCATION_RE.search(text).group(1).strip() for text, _ in docs})
+    return cache, fetched, locations
+
+
+def test_profile_locations_key_by_their_city():
+    cache, _, _ = prefetcher()
+    assert cache.key("hospitals in Chennai", "Chennai") == ("location", "chennai")
+    assert cache.key("hospitals in Chennai", "Chennai (Velachery)") == ("location", "chennai")
+    assert cache.predict("I want to book an appointment", "Chennai (Velachery)") == ("location", "chennai")
+    assert cache.predict("Apollo Hospitals please", "Kanchipuram (Uthiramerur)") == (
+        "hospital", "apollo hospitals", "kanchipuram")
+    assert cache.key("specializations at Apollo Hospitals", "Kanchipuram (Uthiramerur)") == (
+        "hospital", "apollo hospitals", "kanchipuram")
+
+
+def test_session_start_prefetch_is_hit_for_every_real_location():
+    cache, fetched, locations = prefetcher()
+    assert len(locations) > 3
+    for index, location in enumerate(locations):
+        cache.on_session_start(f"s{index}", location)
+    # A tool call that finds its lookup still queued runs it inline; let the prefetches finish first
+    deadline = time.monotonic() + 10
+    while cache.metrics()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for location in locations:
+        city = location.split("(")[0].strip()
+        computed = []
+        cache.run(f"hospitals in {city}", location, lambda: computed.append(city))
+        assert not computed, location
+    metrics = cache.metrics()
+    # One lookup per city; the other locations in it find the cached result
+    assert sorted(fetched) == ["hospitals in Chennai", "hospitals in Cuddalore", "hospitals in Kanchipuram"]
+    assert metrics.get("bypassed", 0) == 0 and metrics.get("misses", 0) == 0
+    assert metrics["hits"] + metrics["cache_hits"] == len(locations)
+    cache.shutdown()
@@ -0,0 +1,30 @@
+"""The assistant's requests start with a prefix that is byte-identical across sessions.
+
+The provider caches prompt prefixes; anything per-user or per-day in the
+leading system message (or the tool definitions) would make every request a
+cache miss. The requests are captured by the stub LLM as the app sends them.
+"""
+import json
+
+from benchmarks.tests.conftest import login
+
+
+def test_leading_system_message_and_tools_are_identical_across_sessions(app_env):
+    app, stub = app_env
+    stub.chat_payloads.clear()
+    users = [(701, "Chennai", "Aarav"), (702, "Madurai", "Meera")]
+    for index, city, name in users:
+        client, session_id = login(app, index, city, name)
+        for text in ("I want to book a doctor appointment", f"I am in {city}"):
+            assert client.post(f"/chat/{session_id}", json={"user_input": text}).status_code == 200
+
+    requests = [payload for payload in stub.chat_payloads if payload.get("tools")]
+    assert len(requests) >= 4
+    prefixes = {json.dumps([payload["messages"][0], payload["tools"]], sort_keys=True).encode()
+                for payload in requests}
+    assert len(prefixes) == 1
+    first = requests[0]["messages"][0]
+    assert first["role"] == "system" and not any(name in first["content"] for _, _, name in users)
+    # The per-user data is still sent, after the conversation
+    sent = json.dumps(requests)
+    assert all(name in sent for _, _, name in users)
@@ -0,0 +1,59 @@
+"""Region shards of the real directory, whose locations read "City (Area)"."""
+import json
+import os
+
+import numpy as np
+
+from benchmarks.stubs import fake_embedding, real_directory_documents
+from region_shards import REGIONS_FILE, RegionIndex, ShardedRetriever, split_location, write_shards
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return fake_embedding(text, 64)
+
+
+def shards(tmp_path):
+    docs = real_directory_documents()
+    vectors = np.array([fake_embedding(text, 64) for text, _ in docs], dtype=np.float32)
+    write_shards(vectors, [t for t, _ in docs], [m for _, m in docs], str(tmp_path))
+    return docs, ShardedRetriever(embeddings=FakeEmbeddings(), shard_dir=str(tmp_path))
+
+
+def test_split_location():
+    assert split_location("Kanchipuram (Uthiramerur)") == ("Kanchipuram", "Uthiramerur")
+    assert split_location(" Chennai  ( T. Nagar ) ") == ("Chennai", "T. Nagar")
+    assert split_location("Chennai") == ("Chennai", None)
+    assert split_location(None) == (None, None)
+
+
+def test_real_rows_are_sharded_by_city_with_areas_under_it(tmp_path):
+    docs, _ = shards(tmp_path)
+    with open(os.path.join(tmp_path, REGIONS_FILE)) as fh:
+        regions = json.load(fh)["regions"]
+    assert sorted(regions) == ["chennai", "cuddalore", "kanchipuram"]
+    assert sum(info["count"] for info in regions.values()) == len(docs)
+    assert "Velachery" in regions["chennai"]["areas"]
+    assert sum(regions["kanchipuram"]["areas"].values()) == regions["kanchipuram"]["count"]
+
+
+def test_real_rows_route_by_city_area_and_profile(tmp_path):
+    _, retriever = shards(tmp_path)
+    route = retriever.route
+    assert route("hospitals in Kanchipuram") == ["kanchipuram"]
+    assert route("Chennai hospitals") == ["chennai"]
+    assert route("Kanchipuram (Uthiramerur)") == ["kanchipuram"]
+    assert route("a cardiologist near T. Nagar") == ["chennai"]
+    assert route("Chennai or Cuddalore?") == ["chennai", "cuddalore"]
+    assert route("I need a neurosurgeon", "Kanchipuram", "Tamil Nadu") == ["kanchipuram"]
+    assert route("I need a neurosurgeon", "Chennai (Adyar)") == ["chennai"]
+    assert route("I need a neurosurgeon") == ["_all"]
+
+    found = retriever.invoke("neurosurgeon in Cuddalore")
+    assert found and all("Hospital Location : Cuddalore (" in doc.page_content for doc in found)
+
+
+def test_names_ending_in_punctuation_match_without_a_word_boundary():
+    index = RegionIndex({"regions": {"chennai": {"name": "Chennai", "areas": {"T. Nagar": 1}}}})
+    assert index.mentioned("anything in t. nagar?") == ["chennai"]
+    assert index.mentioned("chennaiXYZ") == []
@@ -0,0 +1,25 @@
+"""SIGTERM mid-conversation: running turns finish, nothing is cut off, and a new process resumes the threads.
+
+Runs benchmarks.bench_shutdown end to end (two app processes over HTTP).
+"""
+from benchmarks.bench_shutdown import run
+
+
+def test_sigterm_drains_turns_and_a_restart_resumes_from_checkpoints():
+    users = 3
+    report = run(users=users, llm_latency_ms=300, sigterm_after=1.5, deadline=15)
+
+    first = report["first_run"]
+    assert first["running_at_signal"]["count"] > 0
+    assert first["running_at_signal"]["completed_200"] == first["running_at_signal"]["count"]
+    assert first["unanswered_turns_ran"] == 0
+    assert first["errors"] == 0
+    assert first["answered_turns_stored"]
+    assert first["exit_code"] == 0
+    assert first["shutdown"]["abandoned_turns"] == 0
+    assert first["shutdown"]["checkpoint_file"]
+
+    second = report["second_run"]
+    assert second["warm_start"]["files"] == 1 and second["warm_start"]["sessions"] >= users
+    assert second["resumed_turns"] == {"200": users}
+    assert second["all_continued"], second["graph_messages"]
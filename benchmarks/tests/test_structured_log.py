@@ -0,0 +1,12 @@
+"""PII is masked in nested log fields, as session events log them."""
+from structured_log import Event
+
+
+def test_nested_fields_are_masked_by_their_own_keys():
+    event = Event("login_success", {"session_id": "s1", "data": {
+        "ip": "10.1.2.3", "user": {"email": "meera@example.com"}, "phones": [{"phone": "9500000123"}]}})
+    text = str(event)
+    assert "10.1.2.3" not in text and "10.1.x.x" in text
+    assert "meera@example.com" not in text and "m***@example.com" in text
+    assert "9500000123" not in text
+    assert event.fields["session_id"] == "s1"
@@ -0,0 +1,31 @@
+"""Session budgets count a session's tokens from every worker, as of each worker's last flush."""
+from db_utils import db
+from token_usage import UsageLedger
+
+
+def usage(input_tokens: int, output_tokens: int = 0) -> dict:
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens}
+
+
+def test_session_budget_adds_up_calls_made_on_other_workers():
+    collection = db["llm_usage_budget_test"]
+    first, second = (UsageLedger(collection, session_budget=1000, daily_budget=0, flush_seconds=0)
+                     for _ in range(2))
+    first.record(usage(500, 100), "s1", "budget@example.com", "assistant")
+    first.flush()
+    second.record(usage(250, 50), "s1", "budget@example.com", "assistant")
+    second.flush()
+    assert second.session_tokens("s1") == 900
+    assert second.over_budget("s1") is None
+
+    first.record(usage(10), "s1", "budget@example.com", "assistant")
+    first.flush()
+    assert first.session_tokens("s1") == 910
+    # Unflushed calls count on top of the flushed totals
+    second.record(usage(100), "s1", "budget@example.com", "assistant")
+    assert second.session_tokens("s1") == 1000
+    assert second.over_budget("s1") == "session"
+    # Sessions are counted apart
+    first.record(usage(10), "s2", "budget@example.com", "assistant")
+    first.flush()
+    assert first.session_tokens("s2") == 10 and first.over_budget("s2") is None
@@ -0,0 +1,74 @@
+"""Snapshot export, the CURRENT swap, worker reload, and pruning that keeps a just-replaced version."""
+import os
+
+import numpy as np
+
+import vector_snapshot
+from benchmarks.stubs import fake_embedding
+from vector_snapshot import CURRENT_FILE, SnapshotRetriever, write_snapshot
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return fake_embedding(text, 64)
+
+
+def export(snapshot_dir: str, texts) -> str:
+    vectors = np.array([fake_embedding(text, 64) for text in texts], dtype=np.float32)
+    return write_snapshot(vectors, list(texts), [{"n": i} for i in range(len(texts))], snapshot_dir)
+
+
+def age(snapshot_dir: str, version: str, seconds: float = 3600) -> None:
+    path = os.path.join(snapshot_dir, version)
+    past = os.path.getmtime(path) - seconds
+    os.utime(path, (past, past))
+
+
+def test_export_swap_and_reload(tmp_path):
+    snapshot_dir = str(tmp_path)
+    first = export(snapshot_dir, ["Apollo Hospitals Chennai", "Kauvery Hospital Cuddalore"])
+    retriever = SnapshotRetriever(embeddings=FakeEmbeddings(), snapshot_dir=snapshot_dir, k=1, reload_interval=0)
+    assert [d.page_content for d in retriever.invoke("Kauvery Hospital Cuddalore")] == ["Kauvery Hospital Cuddalore"]
+
+    second = export(snapshot_dir, ["Global Health City Chennai"])
+    assert second != first
+    with open(os.path.join(snapshot_dir, CURRENT_FILE)) as fh:
+        assert fh.read() == second
+    assert [d.page_content for d in retriever.invoke("anything")] == ["Global Health City Chennai"]
+    # No staging or temporary files are left behind
+    assert sorted(os.listdir(snapshot_dir)) == sorted([CURRENT_FILE, first, second])
+
+
+def test_replaced_versions_are_pruned_only_after_they_retire(tmp_path):
+    snapshot_dir = str(tmp_path)
+    first = export(snapshot_dir, ["one"])
+    second = export(snapshot_dir, ["two"])
+    third = export(snapshot_dir, ["three"])
+    # first was retired by the swap to second moments ago, so it stays
+    assert os.path.isdir(os.path.join(snapshot_dir, first))
+
+    age(snapshot_dir, first)
+    fourth = export(snapshot_dir, ["four"])
+    assert not os.path.isdir(os.path.join(snapshot_dir, first))
+    assert all(os.path.isdir(os.path.join(snapshot_dir, v)) for v in (second, third, fourth))
+
+
+def test_a_version_pruned_before_it_is_opened_falls_through_to_current(tmp_path, monkeypatch):
+    snapshot_dir = str(tmp_path)
+    gone = export(snapshot_dir, ["old"])
+    export(snapshot_dir, ["new"])
+    age(snapshot_dir, gone)
+    vector_snapshot.prune_versions(snapshot_dir, keep=[])
+    assert not os.path.isdir(os.path.join(snapshot_dir, gone))
+
+    # A fresh worker read CURRENT just before the swap and the prune
+    reads = []
+    read_current = vector_snapshot._read_current
+
+    def stale_then_current(directory):
+        reads.append(directory)
+        return gone if len(reads) == 1 else read_current(directory)
+
+    monkeypatch.setattr(vector_snapshot, "_read_current", stale_then_current)
+    retriever = SnapshotRetriever(embeddings=FakeEmbeddings(), snapshot_dir=snapshot_dir, k=1)
+    assert [d.page_content for d in retriever.invoke("anything")] == ["new"]
@@ -0,0 +1,376 @@
+# booking.py
+"""Slot inventory and conflict-free booking.
+
+Inventory is one document per (hospital, doctor, day) in ``appointment_slots``,
+keyed by the hospital and doctor names of a directory record
+(``resolve_provider``), so "Cardiologist", "Dr. Vikas Bhat" and "Dr. Vikas
+Bhat, Cardiologist" all book the same doctor's slots:
+
+    {"_id": "<hospital>|<doctor>|<YYYY-MM-DD>", "hospital", "doctor", "date",
+     "open": [[540, 780], [840, 1080]],        # working intervals, minutes from midnight
+     "slot_minutes": 15,
+     "reserved": {"36": {"hold_id", "status": "held"|"booked", "expires_at", "holder"}}}
+
+Only reserved slots are stored, keyed by slot index, so a day is a few hundred
+bytes. A day is created from BOOKING_CLINIC_HOURS by its first hold;
+availability only reads, so looking up times (or a name that is not in the
+directory) writes nothing.
+
+Reservation is two-phase and relies on single-document atomic conditional
+updates: ``hold`` sets ``reserved.<idx>`` only if it is absent or an expired
+hold, and ``confirm`` flips it to booked only if our unexpired hold is still
+there. Two parallel confirmations for the same slot cannot both succeed.
+``release_booking`` frees a booked slot when its appointment is cancelled.
+
+In a conversation the hold is taken when the time is proposed
+(``hold_for_session``, from the hold_appointment tool) and kept in
+``appointment_holds`` under the chat session, so the slot stays reserved
+while the user confirms; their "yes" confirms it (``take_session_hold``,
+``renew``) on whichever worker answers it. Holding another time releases the
+session's previous hold.
+
+Environment variables:
+  - BOOKING_CLINIC_HOURS (default "09:00-13:00,14:00-18:00")
+  - BOOKING_SLOT_MINUTES (default 15)
+  - BOOKING_HOLD_SECONDS (default 300): how long a proposed time stays held for the user to confirm
+"""
+import os
+import re
+import time
+import uuid
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from db_utils import db
+from appointment_time import local_now, resolve_date, resolve_minutes
+from directory_records import Record, words
+
+logger = logging.getLogger(__name__)
+
+slots_collection = db["appointment_slots"]
+holds_collection = db["appointment_holds"]
+
+SLOT_MINUTES = int(os.getenv("BOOKING_SLOT_MINUTES", "15"))
+HOLD_SECONDS = int(os.getenv("BOOKING_HOLD_SECONDS", "300"))
+AVAILABILITY_CACHE_SECONDS = 2.0
+
+
+def _parse_hours(spec: str) -> List[List[int]]:
+    intervals = []
+    for part in spec.split(","):
+        start, _, end = part.strip().partition("-")
+        intervals.append([to_minutes(start), to_minutes(end)])
+    return sorted(intervals)
+
+
+def to_minutes(hhmm: str) -> int:
+    hours, minutes = hhmm.strip().split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+CLINIC_HOURS = _parse_hours(os.getenv("BOOKING_CLINIC_HOURS", "09:00-13:00,14:00-18:00"))
+
+
+def _normalize(value: str) -> str:
+    return re.sub(r"\s+", " ", (value or "").strip().lower())
+
+
+def day_id(hospital: str, doctor: str, day: date) -> str:
+    return f"{_normalize(hospital)}|{_normalize(doctor)}|{day.isoformat()}"
+
+
+def _template(hospital: str, doctor: str, day: date) -> Dict:
+    return {"hospital": hospital.strip(), "doctor": doctor.strip(), "date": day.isoformat(),
+            "open": CLINIC_HOURS, "slot_minutes": SLOT_MINUTES, "reserved": {}}
+
+
+def ensure_day(hospital: str, doctor: str, day: date) -> Dict:
+    """Return the inventory document for the day, creating it from the clinic template."""
+    return slots_collection.find_one_and_update(
+        {"_id": day_id(hospital, doctor, day)},
+        {"$setOnInsert": _template(hospital, doctor, day)},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def day_document(hospital: str, doctor: str, day: date) -> Dict:
+    """The inventory document for the day, or the clinic template when none exists yet; never writes."""
+    key = day_id(hospital, doctor, day)
+    return slots_collection.find_one({"_id": key}) or {"_id": key, **_template(hospital, doctor, day)}
+
+
+def resolve_provider(hospital: str, doctor: str, records: Iterable[Record],
+                     location: Optional[str] = None) -> List[Record]:
+    """Directory records of the doctors ``hospital`` and ``doctor`` can mean, one per (hospital, doctor).
+
+    ``doctor`` may be a doctor's name, a specialization, or both ("Dr. Vikas
+    Bhat, Neurosurgeon"): a doctor named in it wins, else every doctor of the
+    specialization at the hospital matches. ``location`` narrows the matches
+    when some of them are there.
+    """
+    wanted_hospital, wanted = words(hospital), words(doctor) - {"dr"}
+    if not wanted_hospital or not wanted:
+        return []
+    at_hospital = [r for r in records if r.get("doctor") and wanted_hospital <= words(r["hospital"])]
+    # "Apollo Hospitals" means that hospital, not also "Apollo Hospitals Speciality"
+    at_hospital = [r for r in at_hospital if words(r["hospital"]) == wanted_hospital] or at_hospital
+    named = [r for r in at_hospital if (words(r["doctor"]) - {"dr"}) <= wanted]
+    matches = named or [r for r in at_hospital
+                        if r.get("specialization") and words(r["specialization"]) <= wanted]
+    nearby = [r for r in matches if location and words(location) & words(r.get("location", ""))]
+    distinct, seen = [], set()
+    for record in nearby or matches:
+        key = (_normalize(record["hospital"]), _normalize(record["doctor"]))
+        if key not in seen:
+            seen.add(key)
+            distinct.append(record)
+    return distinct
+
+
+def _taken(doc: Dict, now: datetime) -> set:
+    return {
+        int(index) for index, entry in (doc.get("reserved") or {}).items()
+        if entry.get("status") == "booked" or entry.get("expires_at", now) > now
+    }
+
+
+def free_intervals(doc: Dict, now: Optional[datetime] = None) -> List[Tuple[int, int]]:
+    """Merge the free slots of a day into (start_minute, end_minute) intervals."""
+    now = now or local_now()
+    step = doc.get("slot_minutes", SLOT_MINUTES)
+    taken = _taken(doc, now)
+    earliest = now.hour * 60 + now.minute if doc["date"] == now.date().isoformat() else 0
+    intervals: List[Tuple[int, int]] = []
+    for start, end in doc.get("open", []):
+        minute = start
+        while minute + step <= end:
+            if minute >= earliest and minute // step not in taken:
+                if intervals and intervals[-1][1] == minute:
+                    intervals[-1] = (intervals[-1][0], minute + step)
+                else:
+                    intervals.append((minute, minute + step))
+            minute += step
+    return intervals
+
+
+_availability_cache: Dict[str, Tuple[float, List[Tuple[int, int]]]] = {}
+_cache_lock = threading.Lock()
+
+
+def _invalidate(key: str) -> None:
+    with _cache_lock:
+        _availability_cache.pop(key, None)
+
+
+def availability(hospital: str, doctor: str, day: date) -> List[Tuple[int, int]]:
+    """Free intervals for the day, served from a short-lived per-process cache; read-only."""
+    if day < local_now().date():
+        return []
+    key = day_id(hospital, doctor, day)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _availability_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+    intervals = free_intervals(day_document(hospital, doctor, day))
+    with _cache_lock:
+        _availability_cache[key] = (now + AVAILABILITY_CACHE_SECONDS, intervals)
+    return intervals
+
+
+def format_intervals(intervals: List[Tuple[int, int]]) -> str:
+    return ", ".join(f"{format_minutes(start)}-{format_minutes(end)}" for start, end in intervals)
+
+
+def _slot_is_open(doc: Dict, minute: int) -> bool:
+    step = doc.get("slot_minutes", SLOT_MINUTES)
+    return minute % step == 0 and any(start <= minute and minute + step <= end for start, end in doc["open"])
+
+
+def hold(hospital: str, doctor: str, day: date, minute: int, holder: str,
+         hold_seconds: int = HOLD_SECONDS) -> Optional[Dict]:
+    """Atomically place a short hold on a slot. Returns the reservation or None if unavailable.
+
+    The holder's own hold on the slot is replaced, so holding it again extends it.
+    """
+    now = local_now()
+    if datetime.combine(day, datetime.min.time()) + timedelta(minutes=minute) < now:
+        return None
+    doc = ensure_day(hospital, doctor, day)
+    if not _slot_is_open(doc, minute):
+        return None
+
+    field = f"reserved.{minute // doc.get('slot_minutes', SLOT_MINUTES)}"
+    hold_id = uuid.uuid4().hex
+    expires_at = now + timedelta(seconds=hold_seconds)
+    result = slots_collection.update_one(
+        {"_id": doc["_id"], "$or": [
+            {field: {"$exists": False}},
+            {f"{field}.status": "held", f"{field}.expires_at": {"$lte": now}},
+            {f"{field}.status": "held", f"{field}.holder": holder},
+        ]},
+        {"$set": {field: {
+            "hold_id": hold_id,
+            "status": "held",
+            "expires_at": expires_at,
+            "holder": holder,
+        }}},
+    )
+    _invalidate(doc["_id"])
+    if result.modified_count != 1:
+        return None
+    return {"slot_doc": doc["_id"], "field": field, "hold_id": hold_id, "expires_at": expires_at,
+            "hospital": doc["hospital"], "doctor": doc["doctor"], "date": day.isoformat(),
+            "time": format_minutes(minute)}
+
+
+def confirm(reservation: Dict, appointment_id=None) -> bool:
+    """Turn our unexpired hold into a booking. False if the hold was lost."""
+    field = reservation["field"]
+    result = slots_collection.update_one(
+        {"_id": reservation["slot_doc"], f"{field}.hold_id": reservation["hold_id"],
+         f"{field}.status": "held", f"{field}.expires_at": {"$gt": local_now()}},
+        {"$set": {f"{field}.status": "booked", f"{field}.appointment_id": appointment_id},
+         "$unset": {f"{field}.expires_at": ""}},
+    )
+    _invalidate(reservation["slot_doc"])
+    return result.modified_count == 1
+
+
+def release(reservation: Dict) -> bool:
+    """Drop a hold or booking that we own (e.g. the appointment insert failed or was cancelled)."""
+    field = reservation["field"]
+    result = slots_collection.update_one(
+        {"_id": reservation["slot_doc"], f"{field}.hold_id": reservation["hold_id"]},
+        {"$unset": {field: ""}},
+    )
+    _invalidate(reservation["slot_doc"])
+    return result.modified_count == 1
+
+
+def release_booking(slot_doc: str, slot_time: str, appointment_id) -> bool:
+    """Free the slot of a cancelled appointment, if it is still booked for that appointment."""
+    doc = slots_collection.find_one({"_id": slot_doc}, {"slot_minutes": 1})
+    if doc is None:
+        return False
+    field = f"reserved.{to_minutes(slot_time) // doc.get('slot_minutes', SLOT_MINUTES)}"
+    result = slots_collection.update_one(
+        {"_id": slot_doc, f"{field}.status": "booked", f"{field}.appointment_id": appointment_id},
+        {"$unset": {field: ""}},
+    )
+    _invalidate(slot_doc)
+    return result.modified_count == 1
+
+
+_DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%B %d, %Y", "%B %d %Y", "%d %B %Y", "%b %d, %Y", "%d %b %Y")
+_TIME_FORMATS = ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p", "%I %p", "%I%p")
+
+
+def parse_date(value: Optional[str]) -> Optional[date]:
+    """The date in ``value``: the fixed formats, else relative and spoken forms (appointment_time)."""
+    value = (value or "").strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return resolve_date(value)
+
+
+def parse_time(value: Optional[str]) -> Optional[int]:
+    """Minutes from midnight: the fixed formats, else forms like "5pm" or "noon" (appointment_time)."""
+    value = (value or "").strip()
+    for fmt in _TIME_FORMATS:
+        try:
+            parsed = datetime.strptime(value.upper().replace(".", ""), fmt)
+            return parsed.hour * 60 + parsed.minute
+        except ValueError:
+            continue
+    return resolve_minutes(value)
+
+
+def _with_provider(reservation: Optional[Dict], provider: Record) -> Optional[Dict]:
+    if reservation is not None:
+        reservation.update(specialization=provider.get("specialization"), location=provider.get("location"))
+    return reservation
+
+
+def hold_for_session(session_id: str, provider: Record, day: date, minute: int) -> Optional[Dict]:
+    """Hold a slot of ``provider`` (a directory record) for the session until the user confirms.
+
+    Replaces the session's previous hold, which is released. Returns the reservation or None if unavailable.
+    """
+    # Snap to the slot grid so "10:05" holds the 10:00 slot
+    minute -= minute % SLOT_MINUTES
+    reservation = _with_provider(hold(provider["hospital"], provider["doctor"], day, minute, holder=session_id),
+                                 provider)
+    if reservation is None:
+        return None
+    previous = holds_collection.find_one_and_replace(
+        {"_id": session_id}, {"_id": session_id, "reservation": reservation}, upsert=True)
+    old = previous and previous["reservation"]
+    if old and (old["slot_doc"], old["field"]) != (reservation["slot_doc"], reservation["field"]):
+        release(old)
+    return reservation
+
+
+def take_session_hold(session_id: str) -> Optional[Dict]:
+    """Remove and return the session's hold, if it has one."""
+    doc = holds_collection.find_one_and_delete({"_id": session_id})
+    return doc["reservation"] if doc else None
+
+
+def renew(reservation: Dict, holder: str) -> Optional[Dict]:
+    """Hold the reservation's slot again with a fresh expiry; None if it was lost to someone else meanwhile."""
+    return _with_provider(hold(reservation["hospital"], reservation["doctor"], date.fromisoformat(reservation["date"]),
+                               to_minutes(reservation["time"]), holder), reservation)
+
+
+def hold_for_request(patient_data: Dict, holder: str, records: Iterable[Record]) -> Tuple[str, Optional[Dict]]:
+    """Hold the slot described by extracted booking data, for a booking no hold was taken for.
+
+    The doctor is looked up in ``records`` (the directory). Returns ("held",
+    reservation), ("unavailable", None) when the slot is taken, closed or in
+    the past, or ("unparsed", None) when the request lacks a date/time we can
+    interpret or names no single doctor of the directory.
+    """
+    providers = resolve_provider(patient_data.get("hospital_name") or "", patient_data.get("specialization") or "",
+                                 records, patient_data.get("location"))
+    day = parse_date(patient_data.get("appointment_booking_date"))
+    minute = parse_time(patient_data.get("appointment_booking_time"))
+    if len(providers) != 1 or day is None or minute is None:
+        return "unparsed", None
+    provider = providers[0]
+    # Snap to the slot grid so "10:05" books the 10:00 slot
+    minute -= minute % SLOT_MINUTES
+    reservation = _with_provider(hold(provider["hospital"], provider["doctor"], day, minute, holder), provider)
+    return ("held", reservation) if reservation else ("unavailable", None)
+
+
+def canonical_booking_fields(patient_data: Dict) -> None:
+    """Store the extracted appointment date/time as YYYY-MM-DD / HH:MM, for a booking without a reservation.
+
+    A value neither parse_date nor parse_time understands moves to
+    ``<field>_text``, so db_utils.find_appointments only ever range-scans
+    and sorts canonical values.
+    """
+    for field, parse, render in (("appointment_booking_date", parse_date, date.isoformat),
+                                 ("appointment_booking_time", parse_time, format_minutes)):
+        value = patient_data.get(field)
+        if value is None:
+            continue
+        parsed = parse(str(value))
+        if parsed is None:
+            patient_data[f"{field}_text"] = value
+            patient_data[field] = None
+        else:
+            patient_data[field] = render(parsed)
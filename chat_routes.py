@@ -1,21 +1,39 @@
 # chat_routes.py (Flask version — merged & hardened)
 
 from flask import Blueprint, request, session, render_template, redirect, url_for, jsonify
-from datetime import datetime
-import logging
 
-from agent import get_or_create_agent_for_user, remove_agent
+import os
+import threading
+
+from agent import get_or_create_agent_for_user, get_patient_profile, remember_booking, remove_agent
 from db_utils import (
     patient_each_chat_table_collection,
     push_patient_information_data_to_db,
     push_patient_chat_data_to_db
 )
 from session import update_session_record
+from admin import admin_required
+from booking import (hold_for_request, take_session_hold, renew, confirm, release, availability, format_intervals,
+                     parse_date, canonical_booking_fields)
+from conversation_store import load_history, graph_messages, first_message, DEFAULT_PAGE_SIZE
+from llm_scheduler import scheduled, scheduler, BACKGROUND, QueueTimeout
+from admission import chat_admission, Overloaded
+from appointment_time import RESOLVE_DATES, annotate
 from patient_bot_conversational import *
 from prompt import doctor_appointment_patient_data_extraction_prompt
+from structured_log import get_logger
 
 chat_bp = Blueprint("chat", __name__)
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
+
+# "template" greets new sessions without an LLM call; "llm" runs one graph turn per new session
+GREETING_MODE = os.getenv("GREETING_MODE", "template").lower()
+GREETING_TEMPLATE = os.getenv(
+    "GREETING_TEMPLATE",
+    "Hello {name}! I'm Azentyk's doctor appointment assistant. I can help you find a hospital or "
+    "doctor, check available times and book an appointment. How can I help you today?")
+# Reply to a turn refused by admission control; the message is not stored, so the user can just resend it
+BUSY_MESSAGE = "We're handling a lot of requests right now. Please send your message again in a moment."
 
 
 # --------------------------
@@ -28,45 +46,143 @@ def chat_page(session_id):
         try:
             update_session_record(session_id, "unauthorized_access_attempt")
         except Exception:
-            logger.exception("Failed to record unauthorized access attempt")
-        logger.warning(f"Unauthorized access attempt for session_id={session_id}")
+            logger.exception("session_record_failed", event_type="unauthorized_access_attempt")
+        logger.warning("unauthorized_access", session_id=session_id, route="chat_page")
         return redirect(url_for("auth.login_page"))
 
     try:
         update_session_record(session_id, "chat_page_accessed")
     except Exception:
-        logger.exception("Failed to update session record for chat_page_accessed")
+        logger.exception("session_record_failed", event_type="chat_page_accessed")
+
+    logger.info("chat_page_accessed", session_id=session_id, email=session.get("user"))
+
+    greeting = session_greeting(session_id, session.get("user"))
+    try:
+        profile = get_patient_profile(session.get("user"))
+        prefetcher.on_session_start(session_id, profile.city, profile.state)
+    except Exception:
+        logger.exception("prefetch_failed", session_id=session_id)
+    return render_template("index.html", greeting=greeting, session_id=session_id)
+
+
+class GreetingStats:
+    """Where chat page greetings came from: generated, or served again without running anything."""
 
-    logger.info(f"Chat page accessed: session_id={session_id}, user={session.get('user')}")
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"generated": 0, "session_hits": 0, "store_hits": 0}
 
-    email = session.get("user")
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters = dict.fromkeys(self.counters, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            served = sum(self.counters.values())
+            hits = self.counters["session_hits"] + self.counters["store_hits"]
+            return {**self.counters, "hit_rate": round(hits / served, 3) if served else None}
+
+
+greeting_stats = GreetingStats()
+# Striped locks so two tabs opening the same new session generate one greeting per worker
+_greeting_locks = [threading.Lock() for _ in range(64)]
+
+
+def generate_greeting(session_id, email):
+    """Produce a new session's greeting: from GREETING_TEMPLATE, or with one graph turn if GREETING_MODE=llm."""
     user_details = get_or_create_agent_for_user(email, session_id)
-    logger.debug(f"user_details: {user_details}")
+    if GREETING_MODE != "llm":
+        # The thread is seeded from the stored conversation on the first turn (rehydrate_graph_state),
+        # and the patient details reach the assistant through the config on every turn.
+        profile = get_patient_profile(email)
+        return GREETING_TEMPLATE.format(name=profile.firstname or "there")
 
-    # Compose initial message
     try:
         initial_message = f"Hello, User Details are: {user_details['configurable']['patient_data']}"
     except Exception:
         initial_message = "Hello"
-        logger.exception("Failed to compose initial message from user_details")
-
+        logger.exception("greeting_compose_failed", session_id=session_id)
     try:
-        last_message = part_1_graph.invoke(
-            {"messages": ("user", initial_message)},
-            config=user_details
-        )
-        last_message_text = last_message['messages'][-1].content
+        with chat_admission.slot():
+            last_message = part_1_graph.invoke({"messages": ("user", initial_message)}, config=user_details)
+        return last_message['messages'][-1].content
+    except Overloaded:
+        logger.warning("greeting_overloaded", session_id=session_id)
+        profile = get_patient_profile(email)
+        return GREETING_TEMPLATE.format(name=profile.firstname or "there")
     except Exception:
-        logger.exception("Error invoking part_1_graph for initial message")
-        last_message_text = "Hello! How can I help you today?"
+        logger.exception("greeting_graph_failed", session_id=session_id)
+        return "Hello! How can I help you today?"
 
-    # Persist bot initial message
+
+def session_greeting(session_id, email):
+    """The session's greeting, generated and persisted once; reloads are served from session state."""
+    if session.get("greeting_for") == session_id and session.get("greeting"):
+        greeting_stats.count("session_hits")
+        logger.debug("greeting_served", session_id=session_id, source="session")
+        return session["greeting"]
+
+    with _greeting_locks[hash(session_id) % len(_greeting_locks)]:
+        try:
+            greeting = first_message(session_id, "assistant")
+        except Exception:
+            logger.exception("greeting_lookup_failed", session_id=session_id)
+            greeting = None
+        if greeting is not None:
+            greeting_stats.count("store_hits")
+            source = "store"
+        else:
+            greeting = generate_greeting(session_id, email)
+            greeting_stats.count("generated")
+            source = GREETING_MODE
+            try:
+                patient_each_chat_table_collection(greeting, session_id, email, "assistant")
+            except Exception:
+                logger.exception("chat_persist_failed", session_id=session_id, role="assistant")
+
+    session["greeting_for"] = session_id
+    session["greeting"] = greeting
+    logger.info("greeting_served", session_id=session_id, source=source)
+    return greeting
+
+
+def rehydrate_graph_state(session_id, config, pending_input=None):
+    """Seed an empty graph thread (e.g. after a worker restart) from the stored conversation."""
     try:
-        patient_each_chat_table_collection(last_message_text)
+        if part_1_graph.get_state(config).values.get("messages"):
+            return
+        history = graph_messages(session_id)
+        # The just-persisted user message is sent by the caller; don't seed it twice
+        if history and history[-1] == ("user", pending_input):
+            history = history[:-1]
+        if history:
+            part_1_graph.update_state(config, {"messages": history}, as_node="assistant")
+            logger.info("graph_state_rehydrated", session_id=session_id, messages=len(history))
     except Exception:
-        logger.exception("Failed to persist initial chat message")
+        logger.exception("graph_state_rehydrate_failed", session_id=session_id)
 
-    return render_template("index.html", greeting=last_message_text, session_id=session_id)
+
+# --------------------------
+# GET: Paginated chat history
+# --------------------------
+@chat_bp.route("/chat/<session_id>/history", methods=["GET"])
+def chat_history(session_id):
+    if ("user" not in session or "session_id" not in session or session.get("session_id") != session_id):
+        logger.warning("unauthorized_access", session_id=session_id, route="chat_history")
+        return jsonify({"error": "Invalid session. Please log in again."}), 401
+
+    try:
+        before = request.args.get("before", type=int)
+        limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+        return jsonify(load_history(session_id, before=before, limit=limit))
+    except Exception:
+        logger.exception("chat_history_failed", session_id=session_id)
+        return jsonify({"error": "Could not load history"}), 500
 
 
 # --------------------------
@@ -76,11 +192,11 @@ def chat_page(session_id):
 def chat(session_id):
     # Session validation
     if ("user" not in session or "session_id" not in session or session.get("session_id") != session_id):
-        logger.warning(f"Unauthorized chat attempt | session_id={session_id}")
+        logger.warning("unauthorized_access", session_id=session_id, route="chat")
         try:
             update_session_record(session_id, "unauthorized_chat_attempt")
         except Exception:
-            logger.exception("Failed to update session record for unauthorized_chat_attempt")
+            logger.exception("session_record_failed", event_type="unauthorized_chat_attempt")
         return jsonify({"response": "Invalid session. Please log in again."}), 401
 
     user_email = session.get("user")
@@ -92,44 +208,94 @@ def chat(session_id):
     if not user_input:
         return jsonify({"response": "Empty message"}), 400
 
+    try:
+        reply = handle_user_message(session_id, user_email, user_input)
+    except Overloaded as busy:
+        return jsonify({"response": BUSY_MESSAGE, "busy": True}), 503, {"Retry-After": str(busy.retry_after)}
+    return jsonify({"response": reply})
+
+
+def run_graph(user_input, config, on_token=None):
+    """Run one graph turn; with ``on_token`` the assistant's reply text is streamed as it is generated."""
+    if on_token is None:
+        return part_1_graph.invoke({"messages": ("user", user_input)}, config=config)
+    state = None
+    for mode, payload in part_1_graph.stream({"messages": ("user", user_input)}, config=config,
+                                             stream_mode=["messages", "values"]):
+        if mode == "values":
+            state = payload
+            continue
+        chunk, metadata = payload
+        # Only the assistant's own reply; tool-internal LLM calls (e.g. hospital filtering) stay server side
+        if metadata.get("langgraph_node") == "assistant" and isinstance(chunk.content, str) and chunk.content:
+            on_token(chunk.content)
+    return state
+
+
+def handle_user_message(session_id, user_email, user_input, on_token=None):
+    """Process one user turn for an authenticated session and return the reply text.
+
+    Shared by the HTTP endpoint and the WebSocket channel (ws_chat.py), which
+    passes ``on_token`` to stream the reply. Raises ``Overloaded`` without
+    storing anything when admission control refuses the turn (admission.py).
+    """
+    try:
+        with chat_admission.slot():
+            return _handle_admitted_message(session_id, user_email, user_input, on_token)
+    except Overloaded as busy:
+        logger.warning("chat_turn_rejected", session_id=session_id, reason=busy.reason,
+                       retry_after=busy.retry_after)
+        raise
+
+
+def _handle_admitted_message(session_id, user_email, user_input, on_token=None):
     # Persist user message
     try:
-        patient_each_chat_table_collection(user_input)
+        patient_each_chat_table_collection(user_input, session_id, user_email, "user")
     except Exception:
-        logger.exception("Failed to persist user message")
+        logger.exception("chat_persist_failed", session_id=session_id, role="user")
 
-    now = datetime.now()
-    logger.info(f"[{session_id}] User ({user_email}) input: {user_input}")
+    logger.info("chat_user_message", session_id=session_id, email=user_email, text=user_input)
     try:
-        update_session_record(session_id, "user_message", {"message": user_input, "timestamp": str(now)})
+        update_session_record(session_id, "user_message", {"chars": len(user_input)})
     except Exception:
-        logger.exception("Failed to update session record for user_message")
+        logger.exception("session_record_failed", event_type="user_message")
 
     # Get agent & invoke graph
     user_details = get_or_create_agent_for_user(user_email, session_id)
+    # Start the lookup this message makes likely while the assistant decides on it
+    configurable = user_details["configurable"]
+    try:
+        prefetcher.on_user_message(session_id, user_input, configurable.get("patient_city"),
+                                   configurable.get("patient_state"))
+    except Exception:
+        logger.exception("prefetch_failed", session_id=session_id)
+    rehydrate_graph_state(session_id, user_details, user_input)
 
     try:
-        last_message = part_1_graph.invoke(
-            {"messages": ("user", user_input)},
-            config=user_details
-        )
+        # The assistant gets the dates and times the message mentions already resolved (appointment_time.py)
+        graph_input = annotate(user_input) if RESOLVE_DATES else user_input
+        last_message = run_graph(graph_input, user_details, on_token)
         final_response = last_message['messages'][-1].content
+    except QueueTimeout:
+        logger.warning("llm_queue_timeout", session_id=session_id)
+        final_response = "We're handling a lot of requests right now. Please try again in a moment."
     except Exception as e:
-        logger.exception(f"Error invoking graph for {session_id}: {e}")
+        logger.exception("graph_invoke_failed", session_id=session_id, error=e)
         final_response = "Sorry, something went wrong while processing your message."
 
     # Persist bot response
     try:
-        patient_each_chat_table_collection(final_response)
+        patient_each_chat_table_collection(final_response, session_id, user_email, "assistant")
     except Exception:
-        logger.exception("Failed to persist bot response")
+        logger.exception("chat_persist_failed", session_id=session_id, role="assistant")
 
     try:
-        update_session_record(session_id, "bot_response", {"response": final_response, "timestamp": str(now)})
+        update_session_record(session_id, "bot_response", {"chars": len(final_response)})
     except Exception:
-        logger.exception("Failed to update session record for bot_response")
+        logger.exception("session_record_failed", event_type="bot_response")
 
-    logger.info(f"[{session_id}] Bot response: {final_response}")
+    logger.info("chat_bot_response", session_id=session_id, text=final_response)
 
     # Appointment booking triggers
     appointment_triggers = [
@@ -155,7 +321,10 @@ def chat(session_id):
                 try:
                     # If llm exists in globals(), attempt the old style call
                     if "llm" in globals():
-                        patient_data = doctor_appointment_patient_data_extraction_prompt(llm).invoke(str(last_message['messages']))
+                        # Extraction is background work: it yields to interactive chat turns
+                        patient_data = doctor_appointment_patient_data_extraction_prompt(
+                            scheduled(llm, priority=BACKGROUND, node="extraction")
+                        ).invoke(str(last_message['messages']), config=user_details)
                     else:
                         # If prompt object exposes an `invoke` directly
                         invokable = doctor_appointment_patient_data_extraction_prompt
@@ -180,18 +349,68 @@ def chat(session_id):
 
                 if not isinstance(patient_data, dict):
                     # Ensure patient_data is a dict
-                    logger.warning("Extracted patient_data is not a dict; coercing to empty dict")
+                    logger.warning("patient_data_not_dict", session_id=session_id, type=type(patient_data).__name__)
                     patient_data = {}
             except Exception:
-                logger.exception("Failed to extract patient data from response; using fallback")
+                logger.exception("patient_data_extraction_failed", session_id=session_id)
                 patient_data = {}
 
+            # The slot held when the time was proposed (hold_appointment tool), else hold it now,
+            # before recording the appointment so it cannot be double booked
+            try:
+                reservation = take_session_hold(session_id)
+                if reservation is not None:
+                    held = renew(reservation, session_id)
+                    slot_status, reservation = ("held", held) if held else ("unavailable", reservation)
+                else:
+                    slot_status, reservation = hold_for_request(patient_data, session_id, directory_listing())
+            except Exception:
+                logger.exception("slot_hold_failed", session_id=session_id)
+                slot_status, reservation = "unparsed", None
+
+            if slot_status == "unavailable":
+                slot = reservation or {}
+                hospital = slot.get("hospital") or patient_data.get("hospital_name")
+                doctor = slot.get("doctor") or patient_data.get("specialization")
+                day = parse_date(slot.get("date") or patient_data.get("appointment_booking_date"))
+                logger.info("slot_unavailable", session_id=session_id, hospital=hospital, doctor=doctor,
+                            date=day.isoformat() if day else None)
+                free = format_intervals(availability(hospital, doctor, day)) if day and hospital and doctor else ""
+                message = "Sorry, that time is not available."
+                if free:
+                    message += f" Available times on {day.isoformat()}: {free}. Which time would you prefer?"
+                else:
+                    message += " Please choose another date."
+                return message
+
             # Add status and persist patient info + chat
             try:
                 patient_data.setdefault("appointment_status", "Pending")
-                push_patient_information_data_to_db(patient_data)
+                # The logged-in account, whatever address was extracted from the chat; keys get_last_booking
+                patient_data["account_email"] = user_email
+                if reservation:
+                    patient_data["slot_id"] = reservation["slot_doc"]
+                    patient_data["slot_time"] = reservation["time"]
+                    # Canonical YYYY-MM-DD / HH:MM so check_appointment can range-scan and sort by them
+                    patient_data["appointment_booking_date"] = reservation["date"]
+                    patient_data["appointment_booking_time"] = reservation["time"]
+                    # The directory's names, which the slot is keyed by
+                    patient_data["hospital_name"] = reservation["hospital"]
+                    patient_data["doctor_name"] = reservation["doctor"]
+                    patient_data["specialization"] = reservation.get("specialization") or patient_data.get("specialization")
+                else:
+                    canonical_booking_fields(patient_data)
+                insert_result = push_patient_information_data_to_db(patient_data)
+                if insert_result is not None:
+                    remember_booking(user_email, patient_data)
+                if reservation:
+                    if insert_result is not None:
+                        if not confirm(reservation, insert_result.inserted_id):
+                            logger.warning("slot_hold_expired", session_id=session_id, slot=reservation["slot_doc"])
+                    else:
+                        release(reservation)
             except Exception:
-                logger.exception("Failed to push patient information to DB")
+                logger.exception("appointment_persist_failed", session_id=session_id)
 
             try:
                 chat_df = {
@@ -200,24 +419,24 @@ def chat(session_id):
                 }
                 push_patient_chat_data_to_db(chat_df)
             except Exception:
-                logger.exception("Failed to push patient chat data to DB")
+                logger.exception("appointment_chat_persist_failed", session_id=session_id)
 
             try:
                 update_session_record(session_id, "appointment_booked", {
                     "patient_name": patient_data.get("username") or patient_data.get("firstname") or user_email,
-                    "timestamp": str(now)
                 })
             except Exception:
-                logger.exception("Failed to update session record for appointment_booked")
+                logger.exception("session_record_failed", event_type="appointment_booked")
 
-            logger.info(f"[{session_id}] Appointment booking initiated for patient={patient_data.get('username') or patient_data.get('firstname') or user_email}")
+            logger.info("appointment_booking_initiated", session_id=session_id,
+                        slot=reservation["slot_doc"] if reservation else None)
 
-            return jsonify({"response": "Thank you! We are currently processing your doctor appointment request. The scheduling is in progress. You will receive a confirmation shortly."})
+            return "Thank you! We are currently processing your doctor appointment request. The scheduling is in progress. You will receive a confirmation shortly."
 
     except Exception:
-        logger.exception("Error during appointment detection flow")
+        logger.exception("appointment_flow_failed", session_id=session_id)
 
-    return jsonify({"response": final_response})
+    return final_response
 
 
 # --------------------------
@@ -232,11 +451,47 @@ def check_session():
         if session_id:
             update_session_record(session_id, "session_check", {"valid": valid})
     except Exception:
-        logger.exception("Failed to update session record during session check")
+        logger.exception("session_record_failed", event_type="session_check")
 
     if session_id:
-        logger.info(f"Session check performed | session_id={session_id} | valid={valid}")
+        logger.info("session_check", session_id=session_id, valid=valid)
     else:
-        logger.warning("Session check attempted without session_id")
+        logger.warning("session_check_without_session")
 
     return jsonify({"valid": valid})
+
+
+# --------------------------
+# GET: LLM scheduler metrics
+# --------------------------
+@chat_bp.route("/metrics/llm", methods=["GET"])
+@admin_required
+def llm_metrics():
+    return jsonify(scheduler.metrics())
+
+
+# --------------------------
+# GET: Greeting cache metrics
+# --------------------------
+@chat_bp.route("/metrics/greeting", methods=["GET"])
+@admin_required
+def greeting_metrics():
+    return jsonify(greeting_stats.snapshot())
+
+
+# --------------------------
+# GET: Tool prefetch metrics
+# --------------------------
+@chat_bp.route("/metrics/prefetch", methods=["GET"])
+@admin_required
+def prefetch_metrics():
+    return jsonify(prefetcher.metrics())
+
+
+# --------------------------
+# GET: Admission control metrics
+# --------------------------
+@chat_bp.route("/metrics/admission", methods=["GET"])
+@admin_required
+def admission_metrics():
+    return jsonify(chat_admission.metrics())
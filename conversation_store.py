@@ -0,0 +1,161 @@
+# conversation_store.py
+"""Session-scoped chat messages in ``patient_each_chat_table``.
+
+Every message carries ``session_id``, ``email``, ``role`` ("user" or
+"assistant"), a per-session monotonic ``seq`` and a UTC ``ts``; the legacy
+``date``/``time``/``message`` fields are kept for existing readers. With the
+(session_id, seq) index created by db_utils.init_db, a conversation page is a
+single bounded range read.
+
+Sequence numbers come from an atomic ``$inc`` on ``chat_sequences`` so they
+stay monotonic across gunicorn workers.
+
+Backfill legacy rows (no session_id) with:
+  python conversation_store.py backfill [--batch-size 500]
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+
+from appointment_time import to_local
+from db_utils import db, chat_collection, init_db
+
+logger = logging.getLogger(__name__)
+
+sequence_collection = db["chat_sequences"]
+
+ROLES = ("user", "assistant")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def next_sequence(session_id: str) -> int:
+    counter = sequence_collection.find_one_and_update(
+        {"_id": session_id}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+
+def append_message(session_id: str, email: Optional[str], role: str, text: str):
+    """Insert one message for ``session_id`` with the next sequence number."""
+    now = datetime.now()
+    document = {
+        "session_id": session_id,
+        "email": email,
+        "role": role,
+        "seq": next_sequence(session_id),
+        "ts": datetime.now(timezone.utc),
+        "date": now.strftime("%Y-%m-%d"),
+        "time": now.strftime("%H:%M:%S"),
+        "message": (text or "").strip(),
+    }
+    return chat_collection.insert_one(document)
+
+
+def load_history(session_id: str, before: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE) -> Dict:
+    """Return one page of a conversation, oldest first, ending just before ``before``.
+
+    ``next_before`` is the cursor for the previous (older) page, or None when
+    the start of the conversation has been reached.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query: Dict = {"session_id": session_id}
+    if before is not None:
+        query["seq"] = {"$lt": before}
+    cursor = (chat_collection.find(query, {"_id": 0, "role": 1, "seq": 1, "ts": 1, "message": 1})
+              .sort("seq", DESCENDING)
+              .limit(limit + 1))
+    rows = list(cursor)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    messages = [
+        {
+            "seq": row["seq"],
+            "role": row.get("role"),
+            "text": row.get("message", ""),
+            "ts": row["ts"].isoformat() if isinstance(row.get("ts"), datetime) else row.get("ts"),
+        }
+        for row in rows
+    ]
+    return {"messages": messages, "next_before": messages[0]["seq"] if has_more and messages else None}
+
+
+def first_message(session_id: str, role: str = "assistant") -> Optional[str]:
+    """Text of the earliest ``role`` message of a conversation, or None (one indexed read)."""
+    row = chat_collection.find_one({"session_id": session_id, "role": role}, {"_id": 0, "message": 1},
+                                   sort=[("seq", ASCENDING)])
+    return row.get("message", "") if row else None
+
+
+def graph_messages(session_id: str, limit: int = MAX_PAGE_SIZE) -> List[tuple]:
+    """Most recent turns as (role, text) tuples for seeding a fresh graph thread."""
+    history = load_history(session_id, limit=limit)["messages"]
+    return [("user" if m["role"] == "user" else "ai", m["text"]) for m in history if m["role"] in ROLES]
+
+
+def backfill(batch_size: int = 500) -> int:
+    """Give legacy rows (no session_id) the new schema.
+
+    Legacy rows carry no session or user, so they are grouped into one
+    ``legacy-YYYY-MM-DD`` conversation per clinic day (APP_TIMEZONE, see
+    appointment_time), ordered by (date, time, _id), with role "unknown".
+    Their date/time is the writing server's local time (datetime.now()); it
+    is converted to UTC for ``ts`` and to the clinics' day for the bucket.
+    Returns the number of rows updated.
+    """
+    updated = 0
+    cursor = (chat_collection.find({"session_id": {"$exists": False}}, {"date": 1, "time": 1})
+              .sort([("date", ASCENDING), ("time", ASCENDING), ("_id", ASCENDING)])
+              .batch_size(batch_size))
+    sequences: Dict[str, int] = {}
+    ops: List[UpdateOne] = []
+
+    def _flush():
+        nonlocal ops, updated
+        if ops:
+            chat_collection.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+
+    for row in cursor:
+        date, time_ = row.get("date") or "1970-01-01", row.get("time") or "00:00:00"
+        try:
+            # Naive astimezone() reads the server's local zone, as datetime.now() wrote it
+            written = datetime.strptime(f"{date} {time_}", "%Y-%m-%d %H:%M:%S").astimezone()
+        except ValueError:
+            written = None
+        ts = written.astimezone(timezone.utc) if written else None
+        session_id = f"legacy-{to_local(written).date().isoformat() if written else date}"
+        if session_id not in sequences:
+            # Continue after rows migrated by an earlier run
+            counter = sequence_collection.find_one({"_id": session_id}) or {}
+            sequences[session_id] = counter.get("seq", 0)
+        sequences[session_id] += 1
+        ops.append(UpdateOne({"_id": row["_id"], "session_id": {"$exists": False}}, {"$set": {
+            "session_id": session_id, "email": None, "role": "unknown", "seq": sequences[session_id], "ts": ts,
+        }}))
+        if len(ops) >= batch_size:
+            _flush()
+    _flush()
+
+    for session_id, seq in sequences.items():
+        sequence_collection.update_one({"_id": session_id}, {"$max": {"seq": seq}}, upsert=True)
+    logger.info(f"Backfilled {updated} legacy chat messages into {len(sequences)} conversations")
+    return updated
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Conversation store maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    backfill_cmd = sub.add_parser("backfill", help="Migrate legacy chat rows to the session schema")
+    backfill_cmd.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    print(backfill(args.batch_size))
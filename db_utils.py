@@ -1,13 +1,21 @@
 from typing import Optional, List, Dict
 from datetime import datetime
+import base64
 import hashlib
+import hmac
+import threading
+import time
 import pandas as pd
-from pymongo import MongoClient
-import logging
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 
 from urllib.parse import quote_plus
 
+from structured_log import get_logger
+
 # --- Optional: example of building a connection string with escaped credentials ---
 # username = "doctor-appointment-assistant-server"
 # password = "Azentyk@123"   # your real primary password
@@ -25,7 +33,7 @@ patient_information_details_table_collection = db["patient_information_details_t
 patient_chat_table_collection = db["patient_chat_table"]
 chat_collection = db["patient_each_chat_table"]
 patient_credentials_collection = db["patient_credentials"]
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 
 def init_db():
@@ -38,16 +46,105 @@ def init_db():
         # Example: ensure an index on email for fast lookups and uniqueness
         patient_credentials_collection.create_index("email", unique=True)
         patient_credentials_collection.create_index("phone", unique=True, sparse=True)
-        logger.info("Database indexes ensured (email, phone)")
+        # Watermark order for incremental exports/reports (see reports.py)
+        patient_information_details_table_collection.create_index([("date", 1), ("time", 1)])
+        # A user's latest booking, for profile prefill (see agent.PatientProfile)
+        patient_information_details_table_collection.create_index(
+            [("account_email", 1), ("_id", -1)])
+        # A user's appointments by account (check/cancel tools)
+        patient_information_details_table_collection.create_index(
+            [("account_email", 1), ("appointment_status", 1), ("appointment_booking_date", 1)])
+        patient_chat_table_collection.create_index([("date", 1), ("time", 1)])
+        # Conversation pages and per-user history (see conversation_store.py)
+        chat_collection.create_index([("session_id", 1), ("seq", 1)])
+        chat_collection.create_index([("email", 1), ("ts", -1)])
+        # A day's token usage, for budgets and the top-consumers report (see token_usage.py)
+        db["llm_usage"].create_index([("day", 1)])
+        # A session's total across days and workers, for its budget
+        db["llm_usage"].create_index([("session_id", 1)])
+        logger.info("db_indexes_ensured")
     except Exception as e:
-        logger.exception(f"init_db: failed to ensure indexes: {e}")
+        logger.exception("db_indexes_failed", error=e)
+
+
+# scrypt cost parameters; raise PASSWORD_SCRYPT_N as hardware allows (must be a power of 2)
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
 
 
 def hash_password(password: str) -> str:
-    """Hash password using SHA256"""
+    """Hash password with salted scrypt: ``scrypt$n$r$p$salt$hash`` (base64 fields)."""
+    salt = os.urandom(16)
+    derived = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P,
+                             maxmem=256 * SCRYPT_N * SCRYPT_R, dklen=32)
+    return "$".join([
+        "scrypt", str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P),
+        base64.b64encode(salt).decode(), base64.b64encode(derived).decode(),
+    ])
+
+
+def _legacy_hash_password(password: str) -> str:
+    """Unsalted SHA256 used before scrypt; kept only to verify and upgrade old hashes."""
     return hashlib.sha256(password.encode()).hexdigest()
 
 
+def verify_password(password: str, stored: str) -> bool:
+    """Constant-time check of ``password`` against a scrypt or legacy SHA256 hash."""
+    if not stored:
+        return False
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, expected = stored.split("$")
+            expected = base64.b64decode(expected)
+            derived = hashlib.scrypt(password.encode(), salt=base64.b64decode(salt), n=int(n), r=int(r),
+                                     p=int(p), maxmem=256 * int(n) * int(r), dklen=len(expected))
+        except ValueError:
+            logger.warning("malformed_password_hash")
+            return False
+        return hmac.compare_digest(derived, expected)
+    return hmac.compare_digest(_legacy_hash_password(password), stored)
+
+
+def needs_rehash(stored: str) -> bool:
+    """True for legacy SHA256 hashes or scrypt hashes below the configured cost."""
+    if not stored or not stored.startswith("scrypt$"):
+        return True
+    try:
+        _, n, r, p, _, _ = stored.split("$")
+        return (int(n), int(r), int(p)) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    except ValueError:
+        return True
+
+
+# Hash verified against when the account does not exist, so unknown and
+# known emails take the same time to reject.
+_DUMMY_HASH = hash_password(os.urandom(16).hex())
+
+# Small TTL cache of email -> (_id, password hash) so repeated logins skip the
+# Cosmos read. Entries are replaced whenever the stored hash is rewritten.
+CREDENTIAL_CACHE_TTL = float(os.getenv("CREDENTIAL_CACHE_TTL", "300"))
+CREDENTIAL_CACHE_SIZE = int(os.getenv("CREDENTIAL_CACHE_SIZE", "10000"))
+_credential_cache: Dict[str, tuple] = {}
+_credential_cache_lock = threading.Lock()
+
+
+def _cached_credentials(email: str) -> Optional[tuple]:
+    with _credential_cache_lock:
+        entry = _credential_cache.get(email)
+        if entry and entry[2] > time.monotonic():
+            return entry
+        _credential_cache.pop(email, None)
+    return None
+
+
+def _cache_credentials(email: str, user_id, stored: str) -> None:
+    with _credential_cache_lock:
+        if len(_credential_cache) >= CREDENTIAL_CACHE_SIZE:
+            _credential_cache.pop(next(iter(_credential_cache)))
+        _credential_cache[email] = (user_id, stored, time.monotonic() + CREDENTIAL_CACHE_TTL)
+
+
 def load_users_df() -> pd.DataFrame:
     """Load users from MongoDB and return as DataFrame"""
     try:
@@ -59,7 +156,7 @@ def load_users_df() -> pd.DataFrame:
         if df.empty:
             # Return an empty dataframe with expected columns to keep callers safe
             expected_columns = ["firstname", "email", "phone", "country", "state", "location", "city", "password"]
-            logger.info("No users found in patient_credentials_collection")
+            logger.info("users_loaded", count=0)
             return pd.DataFrame(columns=expected_columns)
 
         if "_id" in df.columns:
@@ -70,42 +167,131 @@ def load_users_df() -> pd.DataFrame:
             if col not in df.columns:
                 df[col] = None
 
-        logger.info(f"Successfully loaded {len(df)} users from MongoDB")
+        logger.info("users_loaded", count=len(df))
         return df
 
     except Exception as e:
-        logger.exception(f"Error loading users from MongoDB: {str(e)}")
+        logger.exception("users_load_failed", error=e)
         return pd.DataFrame(columns=["firstname", "email", "phone", "country", "state", "location", "city", "password"])
 
 
-def authenticate_user(email: str, password: str) -> bool:
-    """Return True if email/password match a document in MongoDB."""
+def normalize_email(email: Optional[str]) -> str:
+    """The form emails are stored and looked up in: trimmed and lowercased."""
+    return (email or "").strip().lower()
+
+
+def _rename_account(old: str, new: str) -> bool:
+    """Move an account and the records keyed by its email from ``old`` to ``new``; False if ``new`` is taken."""
     try:
-        hashed = hash_password(password)
-        user = patient_credentials_collection.find_one({"email": email, "password": hashed})
-        logger.info(f"Authentication attempt for {email}: {'success' if user else 'failed'}")
-        return user is not None
-    except Exception as e:
-        logger.exception(f"Authentication error for {email}: {e}")
+        patient_credentials_collection.update_one({"email": old}, {"$set": {"email": new}})
+    except DuplicateKeyError:
         return False
+    patient_information_details_table_collection.update_many({"account_email": old}, {"$set": {"account_email": new}})
+    chat_collection.update_many({"email": old}, {"$set": {"email": new}})
+    return True
+
+
+def lowercase_stored_emails() -> Dict:
+    """One-off migration of accounts registered before emails were normalized.
+
+    Lowercases every stored email (and the appointments and conversations
+    keyed by it). Emails that would collide with another account are left
+    as they are and reported, for an admin to merge or rename.
+    """
+    by_normalized: Dict[str, List[str]] = {}
+    for user in patient_credentials_collection.find({}, {"email": 1}):
+        email = user.get("email") or ""
+        by_normalized.setdefault(normalize_email(email), []).append(email)
+    renamed, collisions = 0, []
+    for normalized, emails in by_normalized.items():
+        if len(emails) > 1:
+            collisions.append(sorted(emails))
+            continue
+        if emails[0] != normalized and _rename_account(emails[0], normalized):
+            renamed += 1
+    with _credential_cache_lock:
+        _credential_cache.clear()
+    logger.info("emails_lowercased", renamed=renamed, collisions=len(collisions))
+    return {"renamed": renamed, "collisions": collisions}
+
+
+def authenticate_user(email: str, password: str) -> Optional[str]:
+    """Return the account's email if the password matches its stored hash, else None.
+
+    One indexed lookup by the normalized email (or none when cached); the
+    hash comparison happens in the app. Legacy SHA256 hashes are upgraded to
+    scrypt on success. An account registered before emails were normalized
+    is found by the email exactly as typed and renamed to the normalized
+    form on success; if that form is already another account's, the account
+    keeps (and the caller gets) its stored email. See lowercase_stored_emails.
+    """
+    try:
+        typed = (email or "").strip()
+        email = normalize_email(typed)
+        password = password or ""
+        legacy_email = None
+        # The cache holds normalized accounts only; a differently typed email may name a legacy one
+        cached = _cached_credentials(email) if typed == email else None
+        if cached:
+            user_id, stored, _ = cached
+        else:
+            user = None
+            # One indexed read for both forms; an account stored exactly as typed wins
+            for match in patient_credentials_collection.find({"email": {"$in": list({email, typed})}},
+                                                             {"email": 1, "password": 1}).limit(2):
+                if user is None or match["email"] == typed:
+                    user = match
+            if user is not None and user["email"] != email:
+                legacy_email = user["email"]
+            if user is None:
+                verify_password(password, _DUMMY_HASH)
+                logger.info("authentication", email=email, ok=False)
+                return None
+            user_id, stored = user["_id"], user.get("password") or ""
+            if legacy_email is None:
+                _cache_credentials(email, user_id, stored)
+
+        ok = verify_password(password, stored)
+        logger.info("authentication", email=email, ok=ok)
+        if not ok:
+            return None
+
+        if legacy_email is not None:
+            if _rename_account(legacy_email, email):
+                logger.info("account_email_normalized", email=email)
+            else:
+                logger.warning("account_email_collision", email=email, stored=legacy_email)
+                email = legacy_email
+
+        if needs_rehash(stored):
+            upgraded = hash_password(password)
+            try:
+                # Conditional on the old hash so a concurrent upgrade is not clobbered
+                patient_credentials_collection.update_one(
+                    {"_id": user_id, "password": stored}, {"$set": {"password": upgraded}}
+                )
+                _cache_credentials(email, user_id, upgraded)
+                logger.info("password_hash_upgraded", email=email)
+            except Exception as e:
+                logger.exception("password_hash_upgrade_failed", email=email, error=e)
+        return email
+    except Exception as e:
+        logger.exception("authentication_error", email=email, error=e)
+        return None
 
 
 def register_user(firstname: str, email: str, phone: str, country: str,
                  state: str, location: str, city: str, password: str) -> Optional[str]:
-    """Register a new user in the database"""
+    """Register a new user in the database
+
+    Relies on the unique email/phone indexes from init_db: the insert is
+    attempted directly and a duplicate key error is mapped to a message.
+    """
     try:
         # Normalize inputs a bit
-        email = (email or "").strip().lower()
+        email = normalize_email(email)
         phone = (phone or "").strip()
 
-        # Check if email or phone already exists
-        if email and patient_credentials_collection.find_one({"email": email}):
-            logger.warning(f"Registration failed - email already exists: {email}")
-            return "Email already registered."
-        if phone and patient_credentials_collection.find_one({"phone": phone}):
-            logger.warning(f"Registration failed - phone already exists: {phone}")
-            return "Phone number already registered."
-
         # Hash the password
         hashed = hash_password(password)
 
@@ -125,26 +311,108 @@ def register_user(firstname: str, email: str, phone: str, country: str,
 
         # Insert into MongoDB
         insert_result = patient_credentials_collection.insert_one(user_document)
-        logger.info(f"New user registered: {email} (id={insert_result.inserted_id})")
+        logger.info("user_registered", email=email, id=insert_result.inserted_id)
         return None  # Success
+    except DuplicateKeyError as e:
+        # Cosmos does not always say which index was hit; only this (rare) path pays a lookup
+        key_pattern = (e.details or {}).get("keyPattern") or {}
+        if "email" in key_pattern or (not key_pattern and patient_credentials_collection.find_one({"email": email}, {"_id": 1})):
+            logger.warning("registration_duplicate", field="email", email=email)
+            return "Email already registered."
+        logger.warning("registration_duplicate", field="phone", phone=phone)
+        return "Phone number already registered."
     except Exception as e:
-        logger.exception(f"Registration error for {email}: {e}")
+        logger.exception("registration_error", email=email, error=e)
         return "Registration failed. Please try again."
 
 
 def get_user_contact_info(email: str) -> List[Dict[str, str]]:
-    """Get user contact information by email"""
+    """Get user contact information by email (one indexed lookup)"""
+    try:
+        user = patient_credentials_collection.find_one(
+            {"email": email}, {"_id": 0, "firstname": 1, "email": 1, "phone": 1, "location": 1, "city": 1, "state": 1})
+        logger.info("contact_info_loaded", email=email, found=user is not None)
+        return [user] if user else []
+    except Exception as e:
+        logger.exception("contact_info_failed", email=email, error=e)
+        return []
+
+
+CANCELLED_STATUS = "cancelled"
+
+
+def get_last_booking(email: str) -> Optional[Dict]:
+    """Hospital, specialization and location of the user's most recent live booking (one indexed read).
+
+    Bookings are ordered by _id: an ObjectId starts with its insertion time.
+    """
+    return patient_information_details_table_collection.find_one(
+        {"account_email": email, "appointment_status": {"$ne": CANCELLED_STATUS}},
+        {"_id": 0, "hospital_name": 1, "specialization": 1, "location": 1},
+        sort=[("_id", -1)],
+    )
+
+
+APPOINTMENT_FIELDS = {"hospital_name": 1, "specialization": 1, "location": 1, "appointment_booking_date": 1,
+                      "appointment_booking_time": 1, "appointment_booking_date_text": 1,
+                      "appointment_booking_time_text": 1, "appointment_status": 1}
+
+
+# Only canonical dates are compared with from_date; rows with free-text dates (older bookings) are left out
+_CANONICAL_DATE = r"^\d{4}-\d{2}-\d{2}$"
+
+
+def find_appointments(email: Optional[str], from_date: Optional[str] = None,
+                      include_cancelled: bool = False, limit: int = 5) -> List[Dict]:
+    """A user's appointments in date order, from ``from_date`` (YYYY-MM-DD) on if given.
+
+    Appointments belong to the logged-in account (account_email), never to
+    an address or number the user typed into the chat.
+    """
+    if not email:
+        return []
+    query = {"account_email": email}
+    if not include_cancelled:
+        query["appointment_status"] = {"$ne": CANCELLED_STATUS}
+    if from_date:
+        query["appointment_booking_date"] = {"$gte": from_date, "$regex": _CANONICAL_DATE}
     try:
-        df = load_users_df()
-        ele_user_id = df[df['email'] == email]
-        contact_info = ele_user_id[["firstname", "email", "phone"]]
-        logger.info(f"Retrieved contact info for user: {email}")
-        return contact_info.to_dict(orient="records")
+        cursor = patient_information_details_table_collection.find(query, APPOINTMENT_FIELDS).sort(
+            [("appointment_booking_date", 1), ("appointment_booking_time", 1)]).limit(limit)
+        appointments = list(cursor)
+        logger.info("appointments_loaded", email=email, count=len(appointments))
+        return appointments
     except Exception as e:
-        logger.exception(f"Error getting contact info for {email}: {e}")
+        logger.exception("appointments_load_failed", email=email, error=e)
         return []
 
 
+def cancel_appointment(appointment_id: str, email: Optional[str]):
+    """Cancel one of the account's appointments with a single conditional update.
+
+    Returns ("cancelled", appointment), or ("already_cancelled" | "not_found", None).
+    The appointment includes slot_id/slot_time so the caller can free the slot.
+    """
+    try:
+        oid = ObjectId(appointment_id)
+    except (InvalidId, TypeError):
+        return "not_found", None
+    if not email:
+        return "not_found", None
+    appointment = patient_information_details_table_collection.find_one_and_update(
+        {"_id": oid, "account_email": email, "appointment_status": {"$ne": CANCELLED_STATUS}},
+        {"$set": {"appointment_status": CANCELLED_STATUS, "cancelled_at": str(datetime.now())}},
+        projection={**APPOINTMENT_FIELDS, "slot_id": 1, "slot_time": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if appointment is not None:
+        logger.info("appointment_cancelled", id=appointment_id, email=email)
+        return "cancelled", appointment
+    # Only a failed cancellation pays this read, to tell the user why
+    exists = patient_information_details_table_collection.find_one({"_id": oid, "account_email": email}, {"_id": 1})
+    return ("already_cancelled" if exists else "not_found"), None
+
+
 def push_patient_information_data_to_db(patient_data: dict):
     """Insert patient information into database"""
     try:
@@ -156,10 +424,10 @@ def push_patient_information_data_to_db(patient_data: dict):
         patient_data['time'] = str(current_time)
 
         insert_result = patient_information_details_table_collection.insert_one(patient_data)
-        logger.info(f"Inserted Patient Information Data ID: {insert_result.inserted_id}")
+        logger.info("appointment_inserted", id=insert_result.inserted_id)
         return insert_result
     except Exception as e:
-        logger.exception(f"Error inserting patient information: {e}")
+        logger.exception("appointment_insert_failed", error=e)
         return None
 
 
@@ -174,24 +442,36 @@ def push_patient_chat_data_to_db(patient_data: dict):
         patient_data['time'] = str(current_time)
 
         insert_result = patient_chat_table_collection.insert_one(patient_data)
-        logger.info(f"Inserted Patient Chat Data ID: {insert_result.inserted_id}")
+        logger.info("appointment_chat_inserted", id=insert_result.inserted_id)
         return insert_result
     except Exception as e:
-        logger.exception(f"Error inserting patient chat data: {e}")
+        logger.exception("appointment_chat_insert_failed", error=e)
         return None
 
 
-def push_patient_each_chat_message(message_text: str):
+def push_patient_each_chat_message(message_text: str, session_id: Optional[str] = None,
+                                   email: Optional[str] = None, role: Optional[str] = None):
     """Insert individual chat message into database (alias)
 
     This forwards to patient_each_chat_table_collection to keep backwards compatibility.
     """
-    return patient_each_chat_table_collection(message_text)
+    return patient_each_chat_table_collection(message_text, session_id, email, role)
+
 
+def patient_each_chat_table_collection(message_text: str, session_id: Optional[str] = None,
+                                       email: Optional[str] = None, role: Optional[str] = None):
+    """Insert individual chat message into database
 
-def patient_each_chat_table_collection(message_text: str):
-    """Insert individual chat message into database"""
+    When session_id is given the message is stored with the session schema
+    (session, user, role, sequence) from conversation_store.
+    """
     try:
+        if session_id:
+            from conversation_store import append_message
+            insert_result = append_message(session_id, email, role, message_text)
+            logger.debug("chat_message_inserted", id=insert_result.inserted_id, session_id=session_id)
+            return insert_result
+
         now = datetime.now()
         current_date = now.strftime("%Y-%m-%d")
         current_time = now.strftime("%H:%M:%S")
@@ -203,8 +483,20 @@ def patient_each_chat_table_collection(message_text: str):
         }
 
         insert_result = chat_collection.insert_one(patient_data)
-        logger.info(f"Inserted Patient Chat Data ID: {insert_result.inserted_id}")
+        logger.debug("chat_message_inserted", id=insert_result.inserted_id)
         return insert_result
     except Exception as e:
-        logger.exception(f"Error inserting chat message: {e}")
+        logger.exception("chat_message_insert_failed", error=e)
         return None
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Database maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("lowercase-emails", help="Lowercase stored account emails; reports collisions")
+    args = parser.parse_args()
+    if args.command == "lowercase-emails":
+        print(json.dumps(lowercase_stored_emails(), indent=2))
@@ -0,0 +1,179 @@
+# directory_records.py
+"""Compact, structured hospital_details results built from directory rows.
+
+The retriever returns up to 20 rows like
+
+    Hospital Name : Apollo Hospitals, Doctor Name : Dr. Vikas Bhat,
+    Specialization : Neurosurgeon, Hospital Location : Chennai, Hospital Summary : ...
+
+Handing those to an LLM to "filter unique relevant documents" costs a call
+per lookup and returns free text of any length, which then stays in the
+conversation and is re-sent on every later turn. Instead the rows are
+parsed into (hospital, location, specialization, doctor) records,
+deduplicated, matched against the query locally, and rendered as one
+compact JSON object under a token budget:
+
+    {"fields":["hospital","location","specialization","doctor"],
+     "rows":[["Apollo Hospitals","Chennai","Neurosurgeon","Dr. Vikas Bhat"], ...],
+     "omitted":3}
+
+Rows keep retrieval (relevance) order. Every content word of the query
+(``prefetch.GENERIC_WORDS`` and a few more aside) has to match a word of a
+record for the query to be answered locally; the LLM is only asked, to pick
+record numbers, when some word matches none ("heart specialist in Chennai").
+
+Truncation: fields are clipped to FIELD_MAX_CHARS, then rows are added in
+order until the next one would exceed TOOL_RESULT_MAX_TOKENS (estimated as
+in llm_scheduler); "omitted" counts the rows left out.
+
+Environment variables:
+  - TOOL_RESULT_MAX_TOKENS: token budget of one hospital_details result (default 400)
+"""
+import os
+import re
+import json
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from llm_scheduler import estimate_tokens
+from prefetch import GENERIC_WORDS
+from structured_log import get_logger
+
+logger = get_logger(__name__)
+
+FIELDS = ("hospital", "location", "specialization", "doctor")
+MAX_TOKENS = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "400"))
+FIELD_MAX_CHARS = 60
+
+# Row labels per field; the first occurrence wins (the summary repeats them)
+_LABELS = {"hospital name": "hospital", "hospital location": "location",
+           "specialization": "specialization", "doctor name": "doctor"}
+_FIELD_RE = re.compile(r"(Hospital Name|Hospital Location|Specialization|Doctor Name)\s*:\s*([^,\n]+)",
+                       re.IGNORECASE)
+# Metadata keys a directory export may carry instead of the text layout
+_METADATA_KEYS = {"hospital": ("hospital_name", "hospital"), "location": ("hospital_location", "location", "city"),
+                  "specialization": ("specialization",), "doctor": ("doctor_name", "doctor")}
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Query words that say nothing about which records are wanted
+QUERY_STOP_WORDS = GENERIC_WORDS | frozenset("""
+    dr best good top nearby near by with who whose has have can i we do does looking need want
+    specialist specialists
+""".split())
+
+Record = Dict[str, str]
+
+
+def parse_record(text: str, metadata: Optional[dict] = None) -> Optional[Record]:
+    """The (hospital, location, specialization, doctor) of one directory row, or None if it has none."""
+    metadata = metadata or {}
+    record = {}
+    for field, keys in _METADATA_KEYS.items():
+        value = next((metadata[k] for k in keys if metadata.get(k)), None)
+        if value:
+            record[field] = str(value).strip()
+    for label, value in _FIELD_RE.findall(text or ""):
+        record.setdefault(_LABELS[label.lower()], value.strip())
+    if not record:
+        return None
+    return {field: record.get(field, "") for field in FIELDS}
+
+
+def records_from_documents(docs: Iterable) -> List[Record]:
+    """Parsed, deduplicated records of retrieved documents, in retrieval order."""
+    records, seen, skipped = [], set(), 0
+    for doc in docs:
+        record = parse_record(doc.page_content, getattr(doc, "metadata", None))
+        if record is None:
+            skipped += 1
+            continue
+        key = tuple(record[field].lower() for field in FIELDS)
+        if key not in seen:
+            seen.add(key)
+            records.append(record)
+    if skipped:
+        logger.debug("directory_rows_skipped", rows=skipped)
+    return records
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+
+def query_terms(query: str) -> List[str]:
+    return [_stem(w) for w in _WORD_RE.findall(query.lower()) if w not in QUERY_STOP_WORDS]
+
+
+def words(value: str) -> set:
+    """Lowercase, singular words of ``value``, for matching names loosely ("Apollo Hospital" ~ "Apollo Hospitals")."""
+    return {_stem(w) for w in _WORD_RE.findall((value or "").lower())}
+
+
+def _record_words(record: Record) -> set:
+    return set().union(*(words(value) for value in record.values()))
+
+
+def match_locally(query: str, records: Sequence[Record]) -> Optional[List[Record]]:
+    """Records matching every content word of the query, or None if some word matches no record."""
+    terms = query_terms(query)
+    if not terms:
+        return list(records)
+    words = [_record_words(record) for record in records]
+    matching = [record for record, vocabulary in zip(records, words) if all(t in vocabulary for t in terms)]
+    if matching or not records:
+        return matching
+    # Some query word names nothing in these rows: it needs the model's judgement
+    return None
+
+
+def numbered(records: Sequence[Record]) -> str:
+    """Records as numbered lines for the selection prompt."""
+    return "\n".join(f"{i}. " + " | ".join(record[field] for field in FIELDS)
+                     for i, record in enumerate(records, start=1))
+
+
+def parse_selection(reply: str, records: Sequence[Record]) -> List[Record]:
+    """Records picked by number in the model's reply; all of them if the reply names none."""
+    if reply.strip().lower().startswith("none"):
+        return []
+    picked, seen = [], set()
+    for number in re.findall(r"\d+", reply):
+        index = int(number) - 1
+        if 0 <= index < len(records) and index not in seen:
+            seen.add(index)
+            picked.append(records[index])
+    return picked or list(records)
+
+
+def _clip(value: str) -> str:
+    return value if len(value) <= FIELD_MAX_CHARS else value[:FIELD_MAX_CHARS - 1] + "…"
+
+
+def render(records: Sequence[Record], max_tokens: int = MAX_TOKENS) -> str:
+    """Compact JSON of the records, cut to max_tokens (see module docstring)."""
+    result = {"fields": list(FIELDS), "rows": [], "omitted": 0}
+    size = estimate_tokens(json.dumps(result, separators=(",", ":"), ensure_ascii=False))
+    for n, record in enumerate(records):
+        row = [_clip(record[field]) for field in FIELDS]
+        cost = estimate_tokens(json.dumps(row, separators=(",", ":"), ensure_ascii=False))
+        if size + cost > max_tokens:
+            result["omitted"] = len(records) - n
+            break
+        result["rows"].append(row)
+        size += cost
+    return json.dumps(result, separators=(",", ":"), ensure_ascii=False)
+
+
+def select(query: str, docs: Iterable, choose: Optional[Callable[[str, str], str]],
+           max_tokens: int = MAX_TOKENS) -> Tuple[str, bool]:
+    """(rendered result, whether the model was asked) for the documents retrieved for ``query``.
+
+    ``choose(query, numbered_records)`` is called only when local matching
+    cannot answer the query, and returns the model's reply. Without
+    ``choose`` those queries get every record, in retrieval order.
+    """
+    records = records_from_documents(docs)
+    matched = match_locally(query, records)
+    if matched is not None:
+        return render(matched, max_tokens), False
+    if choose is None:
+        return render(records, max_tokens), False
+    return render(parse_selection(choose(query, numbered(records)), records), max_tokens), True
@@ -0,0 +1,53 @@
+# gunicorn.conf.py
+"""gunicorn settings for Azure App Service (startup command: ``gunicorn main:app``).
+
+gunicorn reads this file from the working directory. Workers are ``gthread``:
+every request runs on one of a worker's threads, and a WebSocket
+(/ws/chat/<id>, flask-sock) keeps its thread for as long as it is open,
+idle or not. So each worker gets a thread per WebSocket it accepts
+(WS_MAX_CONNECTIONS) plus room for HTTP traffic. Chat turns over HTTP are
+capped by admission.py (CHAT_MAX_IN_FLIGHT running + CHAT_MAX_WAITING
+queued); the HTTP threads must outnumber them so logins and static files
+always find a free thread, and startup fails otherwise.
+
+Environment variables:
+  - PORT: port to bind (default 8000, App Service's default)
+  - GUNICORN_WORKERS: worker processes (default 2)
+  - WS_MAX_CONNECTIONS: WebSockets per worker; defaults to 64 here (ws_chat.py's own default is 500)
+  - GUNICORN_HTTP_THREADS: threads per worker for HTTP requests (default 24)
+  - GUNICORN_THREADS: total threads per worker (default WS_MAX_CONNECTIONS + GUNICORN_HTTP_THREADS)
+  - GUNICORN_TIMEOUT: seconds before a silent worker is restarted (default 120)
+  - CHAT_MAX_IN_FLIGHT / CHAT_MAX_WAITING: read by admission.py, checked here (defaults 8 / 8)
+  - TRUSTED_PROXIES: read by main.py; proxies whose X-Forwarded-For gives the client address
+    (default 1 on App Service, whose front end every request comes through, else 0)
+"""
+import os
+
+# Set before the workers import ws_chat, which reads it
+os.environ.setdefault("WS_MAX_CONNECTIONS", "64")
+
+WS_CONNECTIONS = int(os.environ["WS_MAX_CONNECTIONS"])
+HTTP_THREADS = int(os.getenv("GUNICORN_HTTP_THREADS", "24"))
+CHAT_MAX_IN_FLIGHT = int(os.getenv("CHAT_MAX_IN_FLIGHT", "8"))
+CHAT_MAX_WAITING = int(os.getenv("CHAT_MAX_WAITING", "8"))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", str(WS_CONNECTIONS + HTTP_THREADS)))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# Longer than lifecycle.SHUTDOWN_DEADLINE, so a draining worker is not killed mid-turn
+graceful_timeout = int(os.getenv("SHUTDOWN_DEADLINE", "20")) + 10
+# Keep-alive connections hold a thread too; close them soon
+keepalive = 5
+# No --preload: lifecycle.py installs its SIGTERM handler when each worker creates the app
+preload_app = False
+
+if threads <= WS_CONNECTIONS:
+    raise ValueError(f"GUNICORN_THREADS={threads} leaves no thread for HTTP requests once "
+                     f"WS_MAX_CONNECTIONS={WS_CONNECTIONS} WebSockets are open")
+# CHAT_MAX_IN_FLIGHT=0 turns admission control off; there is then nothing to size against
+if CHAT_MAX_IN_FLIGHT > 0 and threads - WS_CONNECTIONS <= CHAT_MAX_IN_FLIGHT + CHAT_MAX_WAITING:
+    raise ValueError(f"{threads - WS_CONNECTIONS} HTTP threads per worker can all be taken by chat turns "
+                     f"(CHAT_MAX_IN_FLIGHT={CHAT_MAX_IN_FLIGHT} + CHAT_MAX_WAITING={CHAT_MAX_WAITING}); "
+                     f"raise GUNICORN_HTTP_THREADS or lower the chat limits")
@@ -0,0 +1,258 @@
+# lifecycle.py
+"""Graceful shutdown and warm start of a worker.
+
+On SIGTERM (Azure restarts, scale-in, gunicorn stopping a worker) the
+worker, within SHUTDOWN_DEADLINE seconds:
+
+  1. stops admitting chat turns: new and waiting ones get the admission
+     "busy" reply (503 + Retry-After) and /healthz answers 503 so the load
+     balancer stops routing here,
+  2. waits for the running turns to finish. Their Mongo writes (chat
+     messages, appointments) are acknowledged inside the turn, so a finished
+     turn has nothing left to write,
+  3. drops queued speculative lookups (prefetch.py),
+  4. saves the graph's in-memory checkpoints (MemorySaver) and the
+     session -> thread mapping to CHECKPOINT_DIR,
+  5. writes the token usage not yet flushed (token_usage.py),
+  6. flushes the log handlers,
+
+and then hands the signal to the handler that was installed before (e.g.
+gunicorn's), or terminates as SIGTERM would have. The drain runs on its own
+thread, so the server keeps answering meanwhile.
+
+Only the latest checkpoint of each session's thread is saved, with the
+channel values and pending writes it references, one file per process
+(graph-<host>-<pid>.pkl). On start ``warm_start`` loads every file younger than
+CHECKPOINT_MAX_AGE, so a session that lands on any new worker continues
+with its full graph state (tool results included) rather than the
+rehydrated chat text (chat_routes.rehydrate_graph_state). Where two files
+hold the same thread the newer checkpoint wins.
+
+A new worker only sees the checkpoints if it sees the directory. On Azure
+App Service (WEBSITE_SITE_NAME is set) the default is /home/checkpoints:
+/home is the site's persistent storage, shared by every instance and kept
+across restarts, while the app directory of a new instance starts empty.
+Elsewhere the default is ./checkpoints, which only a worker restarted on
+the same machine finds; point CHECKPOINT_DIR at shared storage when
+instances are replaced.
+
+With gunicorn, the handler is installed when the app is created in the
+worker. With --preload, call ``shutdown()`` from the worker_exit hook instead.
+
+Environment variables:
+  - SHUTDOWN_DEADLINE: seconds to wait for running turns (default 20)
+  - CHECKPOINT_DIR: where checkpoints are saved and loaded (default /home/checkpoints on App Service,
+    else ./checkpoints)
+  - CHECKPOINT_MAX_AGE: seconds after which saved checkpoints are ignored and removed (default 3600)
+  - CHECKPOINT_PERSIST: "1" (default) to save and load checkpoints, "0" to only drain
+"""
+import os
+import glob
+import time
+import pickle
+import signal
+import socket
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from flask import jsonify
+
+from structured_log import get_logger
+
+logger = get_logger(__name__)
+
+SHUTDOWN_DEADLINE = float(os.getenv("SHUTDOWN_DEADLINE", "20"))
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR",
+                           "/home/checkpoints" if os.getenv("WEBSITE_SITE_NAME") else "./checkpoints")
+CHECKPOINT_MAX_AGE = float(os.getenv("CHECKPOINT_MAX_AGE", "3600"))
+CHECKPOINT_PERSIST = os.getenv("CHECKPOINT_PERSIST", "1") == "1"
+CHECKPOINT_FORMAT = 1
+
+_shutdown_lock = threading.Lock()
+_shutdown_report: Optional[Dict] = None
+# What warm_start() loaded, for ops: {"files", "sessions", "threads"}
+last_warm_start: Optional[Dict] = None
+_installed = False
+
+
+# ---- checkpoints ----------------------------------------------------------
+def _latest_records(saver, thread_ids) -> List[Dict]:
+    """The latest checkpoint of each thread with the blobs and writes it references."""
+    records = []
+    for thread_id in thread_ids:
+        for namespace, checkpoints in list(saver.storage.get(thread_id, {}).items()):
+            if not checkpoints:
+                continue
+            checkpoint_id = max(checkpoints)
+            saved = checkpoints[checkpoint_id]
+            versions = saver.serde.loads_typed(saved[0]).get("channel_versions", {})
+            blob_keys = [(thread_id, namespace, channel, version) for channel, version in versions.items()]
+            records.append({
+                "thread_id": thread_id, "checkpoint_ns": namespace, "checkpoint_id": checkpoint_id,
+                "checkpoint": saved,
+                "blobs": {key: saver.blobs[key] for key in blob_keys if key in saver.blobs},
+                "writes": dict(saver.writes.get((thread_id, namespace, checkpoint_id), {})),
+            })
+    return records
+
+
+def save_checkpoints(saver, sessions: Dict[str, str], directory: str = CHECKPOINT_DIR) -> str:
+    """Write this process's latest checkpoints and session -> thread map; returns the file path."""
+    os.makedirs(directory, exist_ok=True)
+    for attempt in range(3):
+        try:
+            records = _latest_records(saver, set(sessions.values()))
+            break
+        except RuntimeError:
+            # A turn still running past the deadline changed the saver mid-copy; try again
+            if attempt == 2:
+                raise
+    # Instances sharing the directory can have workers with the same pid
+    path = os.path.join(directory, f"graph-{socket.gethostname()}-{os.getpid()}.pkl")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        pickle.dump({"format": CHECKPOINT_FORMAT, "saved_at": time.time(), "sessions": sessions,
+                     "records": records}, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    logger.info("checkpoints_saved", path=path, sessions=len(sessions), threads=len(records))
+    return path
+
+
+def load_checkpoints(saver, directory: str = CHECKPOINT_DIR, max_age: float = CHECKPOINT_MAX_AGE) -> Dict:
+    """Load saved checkpoints into ``saver``; returns {"sessions": {...}, "threads": n, "files": n}."""
+    sessions, threads, files = {}, 0, 0
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(directory, "graph-*.pkl")), key=os.path.getmtime):
+        if now - os.path.getmtime(path) > max_age:
+            os.remove(path)
+            logger.info("checkpoints_expired", path=path)
+            continue
+        try:
+            # Written by this app into a local directory, so unpickling is as trusted as the code
+            with open(path, "rb") as fh:
+                saved = pickle.load(fh)
+        except Exception:
+            logger.exception("checkpoints_unreadable", path=path)
+            continue
+        if saved.get("format") != CHECKPOINT_FORMAT:
+            logger.warning("checkpoints_format_unknown", path=path, format=saved.get("format"))
+            continue
+        files += 1
+        sessions.update(saved["sessions"])
+        for record in saved["records"]:
+            thread_id, namespace, checkpoint_id = (record["thread_id"], record["checkpoint_ns"],
+                                                   record["checkpoint_id"])
+            current = saver.storage[thread_id][namespace]
+            if current and max(current) >= checkpoint_id:
+                continue
+            current[checkpoint_id] = record["checkpoint"]
+            saver.blobs.update(record["blobs"])
+            if record["writes"]:
+                saver.writes[(thread_id, namespace, checkpoint_id)] = dict(record["writes"])
+            threads += 1
+    return {"sessions": sessions, "threads": threads, "files": files}
+
+
+# ---- shutdown -------------------------------------------------------------
+def _flush_logs() -> None:
+    loggers = [logging.getLogger()] + [item for item in logging.Logger.manager.loggerDict.values()
+                                       if isinstance(item, logging.Logger)]
+    for handler in {handler for item in loggers for handler in item.handlers}:
+        try:
+            handler.flush()
+        except Exception:
+            pass
+
+
+def shutdown(deadline: float = SHUTDOWN_DEADLINE) -> Dict:
+    """Drain and persist this worker (see module docstring); later calls return the first report."""
+    global _shutdown_report
+    with _shutdown_lock:
+        if _shutdown_report is not None:
+            return _shutdown_report
+        from admission import chat_admission
+        from agent import session_threads
+        from patient_bot_conversational import memory, prefetcher
+        from token_usage import ledger
+
+        started = time.monotonic()
+        logger.info("shutdown_started", deadline_s=deadline, in_flight=chat_admission.metrics()["in_flight"])
+        abandoned = chat_admission.drain(deadline)
+        report = {"abandoned_turns": abandoned, "drain_s": round(time.monotonic() - started, 3),
+                  "prefetches_dropped": prefetcher.shutdown(), "checkpoint_file": None}
+        if abandoned:
+            logger.warning("shutdown_deadline_passed", abandoned_turns=abandoned)
+        if CHECKPOINT_PERSIST:
+            try:
+                report["checkpoint_file"] = save_checkpoints(memory, session_threads())
+            except Exception:
+                logger.exception("checkpoints_save_failed")
+        try:
+            report["usage_records_flushed"] = ledger.flush()
+        except Exception:
+            logger.exception("usage_flush_failed")
+        report["shutdown_s"] = round(time.monotonic() - started, 3)
+        logger.info("shutdown_finished", **report)
+        _flush_logs()
+        _shutdown_report = report
+        return report
+
+
+def _on_sigterm(previous):
+    def handler(signum, frame):
+        if _shutdown_report is not None:
+            # Drained: pass the signal on as if this handler had never been installed
+            signal.signal(signum, previous if previous is not None else signal.SIG_DFL)
+            if callable(previous):
+                previous(signum, frame)
+            elif previous != signal.SIG_IGN:
+                os.kill(os.getpid(), signum)
+            return
+        if any(t.name == "shutdown-drain" for t in threading.enumerate()):
+            return
+        # Drain off the main thread so the server keeps answering (503s, /healthz) meanwhile
+        threading.Thread(target=lambda: (shutdown(), os.kill(os.getpid(), signum)),
+                         name="shutdown-drain", daemon=True).start()
+    return handler
+
+
+# ---- app wiring -----------------------------------------------------------
+def warm_start() -> Dict:
+    """Load saved checkpoints and session threads into the graph's saver."""
+    from agent import restore_session_threads
+    from patient_bot_conversational import memory
+
+    global last_warm_start
+    loaded = load_checkpoints(memory)
+    restore_session_threads(loaded["sessions"])
+    last_warm_start = {"files": loaded["files"], "sessions": len(loaded["sessions"]), "threads": loaded["threads"]}
+    if loaded["files"]:
+        logger.info("warm_start", files=loaded["files"], sessions=len(loaded["sessions"]),
+                    threads=loaded["threads"])
+    return loaded
+
+
+def init_lifecycle(app) -> None:
+    """Warm start, the SIGTERM drain, and /healthz for the load balancer."""
+    global _installed
+
+    @app.route("/healthz")
+    def healthz():
+        from admission import chat_admission
+        if chat_admission.draining:
+            return jsonify({"status": "draining"}), 503
+        return jsonify({"status": "ok"})
+
+    if _installed:
+        return
+    _installed = True
+    if CHECKPOINT_PERSIST:
+        try:
+            warm_start()
+        except Exception:
+            logger.exception("warm_start_failed")
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _on_sigterm(signal.getsignal(signal.SIGTERM)))
+    else:
+        logger.warning("sigterm_handler_not_installed", reason="app created outside the main thread")
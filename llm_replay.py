@@ -0,0 +1,290 @@
+# llm_replay.py
+"""Record/replay layer for the Azure OpenAI chat and embedding clients.
+
+Lets optimizations (caching, prompt changes, retrieval changes) be measured
+against realistic traffic without calling Azure:
+
+  LLM_REPLAY_MODE=record  call Azure as usual and append every
+                          (prompt -> completion) and (text -> vector) pair
+                          to the archive, with the observed latency
+  LLM_REPLAY_MODE=replay  answer from the archive only; a miss raises
+                          ReplayMiss unless LLM_REPLAY_STRICT=0 (then the
+                          call goes to Azure)
+  LLM_REPLAY_MODE=off     (default) no effect
+
+  LLM_REPLAY_ARCHIVE      archive path (default ./llm_replay.jsonl.gz)
+  LLM_REPLAY_LATENCY      "none" (default) or "recorded" to sleep for the
+                          recorded latency on each replayed call
+
+The archive is gzip-compressed JSON lines, one record per call. Chat keys are
+a hash of the model settings plus the prompt with message ids, tool-call ids,
+response metadata and the injected current date normalized away, so a
+recording made on one day replays on another as long as the conversation
+names the same dates. Chat completions are hooked in through langchain's
+BaseCache interface (``llm_model(cache=...)``); embeddings through a wrapper.
+"""
+import os
+import re
+import json
+import gzip
+import time
+import base64
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.caches import BaseCache
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+MODE = os.getenv("LLM_REPLAY_MODE", "off").lower()
+ARCHIVE = os.getenv("LLM_REPLAY_ARCHIVE", "./llm_replay.jsonl.gz")
+STRICT = os.getenv("LLM_REPLAY_STRICT", "1") == "1"
+REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "none").lower()
+
+
+class ReplayMiss(Exception):
+    """A replayed run asked for a call that is not in the archive."""
+
+
+# The current date the assistant's context carries (patient_bot_conversational.PRIMARY_ASSISTANT_CONTEXT);
+# dates inside the conversation are part of what is asked and stay in the key
+_CURRENT_DATE = re.compile(r"<Date>.*?</Date>", re.DOTALL)
+_VOLATILE_KEYS = {"id", "tool_call_id", "response_metadata", "usage_metadata"}
+# Ids that also appear inside message reprs pasted into prompts (e.g. the extraction prompt)
+_ID_PATTERN = re.compile(r"\b(?:run-+)?[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?:-\d+)?\b|\bcall_\w+")
+
+
+def _strip_volatile(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v) for k, v in value.items() if k not in _VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    return value
+
+
+# Where and how the model is reached, not what it is asked: a recording made
+# against one endpoint replays against another
+_TRANSPORT_KEYS = {"azure_endpoint", "openai_api_base", "openai_proxy", "max_retries",
+                   "request_timeout", "validate_base_url"}
+
+
+_REPR_METADATA = re.compile(r"(?:response|usage)_metadata=\{")
+
+
+def _strip_repr_metadata(text: str) -> str:
+    """Drop ``response_metadata={...}``/``usage_metadata={...}`` from message reprs.
+
+    Cache hits add fields (e.g. ``total_cost``) to usage metadata, so a prompt
+    that embeds earlier messages' reprs would otherwise differ on replay.
+    """
+    parts, position = [], 0
+    for match in _REPR_METADATA.finditer(text):
+        if match.start() < position:
+            continue
+        depth, end = 0, match.end() - 1
+        while end < len(text):
+            depth += {"{": 1, "}": -1}.get(text[end], 0)
+            end += 1
+            if depth == 0:
+                break
+        parts.append(text[position:match.start()])
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def _canonical_llm_string(llm_string: str) -> str:
+    model, sep, params = llm_string.partition("---")
+    try:
+        serialized = json.loads(model)
+        kwargs = serialized.get("kwargs", {})
+        serialized["kwargs"] = {k: v for k, v in kwargs.items() if k not in _TRANSPORT_KEYS}
+        model = json.dumps(serialized, sort_keys=True)
+    except (ValueError, AttributeError):
+        pass
+    return model + sep + params
+
+
+def chat_key(prompt: str, llm_string: str) -> str:
+    try:
+        prompt = json.dumps(_strip_volatile(json.loads(prompt)), sort_keys=True)
+    except ValueError:
+        pass
+    llm_string = _canonical_llm_string(llm_string)
+    prompt = _ID_PATTERN.sub("<id>", _strip_repr_metadata(prompt))
+    prompt = _CURRENT_DATE.sub("<Date></Date>", prompt)
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+def text_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class ReplayArchive:
+    """In-memory index over the archive file, appending new records in record mode."""
+
+    def __init__(self, path: str, mode: str):
+        self.path = path
+        self.mode = mode
+        self.records: Dict[str, Dict] = {}
+        self.stats = {"chat_hits": 0, "chat_misses": 0, "chat_recorded": 0,
+                      "embed_hits": 0, "embed_misses": 0, "embed_recorded": 0,
+                      "recorded_latency_ms": 0.0}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        with gzip.open(self.path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                if line.strip():
+                    record = json.loads(line)
+                    self.records[record["k"]] = record
+        logger.info(f"Loaded {len(self.records)} replay records from {self.path}")
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.records.get(key)
+
+    def put(self, record: Dict) -> None:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self.records[record["k"]] = record
+            with gzip.open(self.path, "at", encoding="utf-8") as fh:
+                fh.write(line)
+
+    def count(self, stat: str, amount=1) -> None:
+        with self._lock:
+            self.stats[stat] += amount
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+
+
+class ReplayChatCache(BaseCache):
+    """langchain cache that records or replays chat completions."""
+
+    def __init__(self, archive: ReplayArchive):
+        self.archive = archive
+        # thread -> (key, start) of the call the thread is making; a call that
+        # fails never reaches update(), and the thread's next lookup replaces it
+        self._started: Dict[int, tuple] = {}
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = chat_key(prompt, llm_string)
+        if self.archive.mode == "replay":
+            record = self.archive.get(key)
+            if record is not None:
+                self.archive.count("chat_hits")
+                self.archive.count("recorded_latency_ms", record.get("ms", 0.0))
+                if REPLAY_LATENCY == "recorded":
+                    time.sleep(record.get("ms", 0.0) / 1000.0)
+                return loads(record["v"])
+            self.archive.count("chat_misses")
+            if STRICT:
+                raise ReplayMiss(f"No recorded completion for prompt key {key[:12]}")
+            return None
+        # record mode: always call the model, remember when we started
+        self._started[threading.get_ident()] = (key, time.perf_counter())
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence) -> None:
+        if self.archive.mode != "record":
+            return
+        key = chat_key(prompt, llm_string)
+        started_key, started = self._started.pop(threading.get_ident(), (None, None))
+        elapsed_ms = (time.perf_counter() - started) * 1000 if started_key == key else 0.0
+        self.archive.put({"t": "chat", "k": key, "v": dumps(list(return_val)), "ms": round(elapsed_ms, 1)})
+        self.archive.count("chat_recorded")
+
+    def clear(self, **kwargs: Any) -> None:
+        pass
+
+
+class ReplayEmbeddings(Embeddings):
+    """Embeddings wrapper that records or replays vectors per input text."""
+
+    def __init__(self, inner: Embeddings, archive: ReplayArchive, model: str = "embeddings"):
+        self.inner = inner
+        self.archive = archive
+        self.model = model
+
+    def _replayed(self, text: str) -> Optional[List[float]]:
+        record = self.archive.get(text_key(self.model, text))
+        if record is None:
+            return None
+        self.archive.count("embed_hits")
+        return np.frombuffer(base64.b64decode(record["v"]), dtype=np.float32).tolist()
+
+    def _record(self, text: str, vector: List[float], elapsed_ms: float) -> None:
+        encoded = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+        self.archive.put({"t": "embed", "k": text_key(self.model, text), "v": encoded, "ms": round(elapsed_ms, 1)})
+        self.archive.count("embed_recorded")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.archive.mode == "replay":
+            vectors = [self._replayed(text) for text in texts]
+            missing = [text for text, vector in zip(texts, vectors) if vector is None]
+            if missing:
+                self.archive.count("embed_misses", len(missing))
+                if STRICT:
+                    raise ReplayMiss(f"No recorded embedding for {len(missing)} text(s)")
+                fresh = iter(self.inner.embed_documents(missing))
+                vectors = [vector if vector is not None else next(fresh) for vector in vectors]
+            return vectors
+        started = time.perf_counter()
+        vectors = self.inner.embed_documents(texts)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / max(1, len(texts))
+        for text, vector in zip(texts, vectors):
+            self._record(text, vector, elapsed_ms)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.archive.mode == "replay":
+            vector = self._replayed(text)
+            if vector is not None:
+                return vector
+            self.archive.count("embed_misses")
+            if STRICT:
+                raise ReplayMiss("No recorded embedding for query")
+            return self.inner.embed_query(text)
+        started = time.perf_counter()
+        vector = self.inner.embed_query(text)
+        self._record(text, vector, (time.perf_counter() - started) * 1000)
+        return vector
+
+
+_archive: Optional[ReplayArchive] = None
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> Optional[ReplayArchive]:
+    """The process-wide archive, or None when replay is off."""
+    global _archive
+    if MODE not in ("record", "replay"):
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = ReplayArchive(ARCHIVE, MODE)
+            logger.info(f"LLM replay layer active: mode={MODE} archive={ARCHIVE}")
+    return _archive
+
+
+def chat_replay_cache() -> Optional[ReplayChatCache]:
+    archive = get_archive()
+    return ReplayChatCache(archive) if archive else None
+
+
+def replay_embeddings(embeddings: Embeddings, model: str = "embeddings") -> Embeddings:
+    archive = get_archive()
+    return ReplayEmbeddings(embeddings, archive, model) if archive else embeddings
+
+
+def stats() -> Dict[str, Any]:
+    archive = get_archive()
+    return {"mode": MODE, **archive.stats} if archive else {"mode": MODE}
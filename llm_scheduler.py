@@ -0,0 +1,320 @@
+# llm_scheduler.py
+"""Shared scheduler for every call to the Azure OpenAI chat deployment.
+
+All chat turns, the hospital filtering chain and the appointment extraction
+chain go through one LLMScheduler per process, which:
+  - enforces global requests-per-minute and tokens-per-minute budgets
+    (token buckets refilled continuously, burst limited to BURST_SECONDS),
+  - caps concurrent in-flight calls,
+  - queues fairly: round-robin across sessions within a priority class, and
+    interactive turns are always granted before background work,
+  - retries 429s with jittered exponential backoff, honouring Retry-After,
+    and pauses the whole queue while the deployment is throttling us. A
+    retried call goes back to the head of the queue, so a 429 doesn't cost
+    it its turn.
+
+Environment variables:
+  - LLM_RPM (default 300), LLM_TPM (default 150000)
+  - LLM_BURST_SECONDS (default 10)
+  - LLM_MAX_CONCURRENCY (default 8)
+  - LLM_MAX_RETRIES (default 4)
+  - LLM_QUEUE_TIMEOUT (seconds, default 60)
+"""
+import os
+import time
+import random
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+
+import token_usage
+from structured_log import get_logger
+
+logger = get_logger(__name__)
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+class QueueTimeout(Exception):
+    """Raised when a call waited longer than LLM_QUEUE_TIMEOUT for a slot."""
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class _Ticket:
+    __slots__ = ("session_id", "priority", "tokens", "enqueued_at", "granted")
+
+    def __init__(self, session_id: str, priority: int, tokens: int):
+        self.session_id = session_id
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+def _rate_limit_delay(exc: Exception) -> Optional[float]:
+    """Return the server-requested delay for a 429, 0.0 if none was given, or None if not a 429."""
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status != 429:
+        return None
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return 0.0
+
+
+def estimate_tokens(payload: Any) -> int:
+    """Cheap prompt size estimate (~4 characters per token)."""
+    return max(1, len(str(payload)) // 4)
+
+
+class LLMScheduler:
+    def __init__(self, rpm: float = 300, tpm: float = 150000, max_concurrency: int = 8,
+                 burst_seconds: float = 10, max_retries: int = 4, queue_timeout: float = 60,
+                 backoff_base: float = 1.0, backoff_cap: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._requests = _TokenBucket(rpm, burst_seconds)
+        self._tokens = _TokenBucket(tpm, burst_seconds)
+        self._cond = threading.Condition()
+        self._queues: Dict[int, "OrderedDict[str, deque]"] = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}
+        self._in_flight = 0
+        self._paused_until = 0.0
+
+        self._stats = {
+            name: {"granted": 0, "wait_total": 0.0, "wait_max": 0.0, "recent": deque(maxlen=500)}
+            for name in PRIORITY_NAMES.values()
+        }
+        self._counters = {"rate_limited": 0, "retries": 0, "failures": 0, "timeouts": 0}
+        self._usage = {"calls": 0, "input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0}
+
+    # ---- queueing ---------------------------------------------------------
+    def _head(self) -> Optional[_Ticket]:
+        for priority in (INTERACTIVE, BACKGROUND):
+            sessions = self._queues[priority]
+            if sessions:
+                return sessions[next(iter(sessions))][0]
+        return None
+
+    def _pop_head(self, ticket: _Ticket) -> None:
+        sessions = self._queues[ticket.priority]
+        pending = sessions.pop(ticket.session_id)
+        pending.popleft()
+        if pending:
+            # Round-robin: the session goes to the back of its priority class
+            sessions[ticket.session_id] = pending
+
+    def _remove(self, ticket: _Ticket) -> None:
+        sessions = self._queues[ticket.priority]
+        pending = sessions.get(ticket.session_id)
+        if pending and ticket in pending:
+            pending.remove(ticket)
+            if not pending:
+                del sessions[ticket.session_id]
+
+    def _wait_needed(self, ticket: _Ticket, now: float) -> float:
+        """Seconds until ``ticket`` may be granted (0 = now), or -1 if blocked on another event."""
+        if self._head() is not ticket or self._in_flight >= self.max_concurrency:
+            return -1
+        if now < self._paused_until:
+            return self._paused_until - now
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        return max(self._requests.wait_time(1), self._tokens.wait_time(ticket.tokens))
+
+    def acquire(self, session_id: str, priority: int = INTERACTIVE, tokens: int = 1,
+                retry: bool = False) -> _Ticket:
+        """Wait for a slot; a ``retry`` goes to the head of its session and its session to the front."""
+        ticket = _Ticket(session_id or "anonymous", priority, tokens)
+        deadline = ticket.enqueued_at + self.queue_timeout
+        with self._cond:
+            sessions = self._queues[priority]
+            pending = sessions.setdefault(ticket.session_id, deque())
+            if retry:
+                pending.appendleft(ticket)
+                sessions.move_to_end(ticket.session_id, last=False)
+            else:
+                pending.append(ticket)
+            while True:
+                now = time.monotonic()
+                wait = self._wait_needed(ticket, now)
+                if wait == 0:
+                    break
+                if now >= deadline:
+                    self._remove(ticket)
+                    self._counters["timeouts"] += 1
+                    self._cond.notify_all()
+                    raise QueueTimeout(f"LLM queue wait exceeded {self.queue_timeout}s")
+                remaining = deadline - now
+                self._cond.wait(timeout=min(remaining, wait) if wait > 0 else remaining)
+
+            self._pop_head(ticket)
+            self._requests.level -= 1
+            self._tokens.level -= min(ticket.tokens, self._tokens.capacity)
+            self._in_flight += 1
+            ticket.granted = True
+
+            waited = time.monotonic() - ticket.enqueued_at
+            stats = self._stats[PRIORITY_NAMES[priority]]
+            stats["granted"] += 1
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+            stats["recent"].append(waited)
+            self._cond.notify_all()
+        return ticket
+
+    def release(self, ticket: _Ticket, actual_tokens: Optional[int] = None) -> None:
+        with self._cond:
+            if actual_tokens is not None:
+                # Correct the estimate with what the provider actually billed
+                self._tokens.level -= actual_tokens - min(ticket.tokens, self._tokens.capacity)
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _pause(self, delay: float) -> None:
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._cond.notify_all()
+
+    # ---- execution --------------------------------------------------------
+    def run(self, fn: Callable[[], Any], session_id: str = "anonymous", priority: int = INTERACTIVE,
+            tokens: int = 1) -> Any:
+        """Run ``fn`` once a slot is granted, retrying 429s with backoff."""
+        attempt = 0
+        while True:
+            ticket = self.acquire(session_id, priority, tokens, retry=attempt > 0)
+            actual = None
+            try:
+                result = fn()
+                usage = getattr(result, "usage_metadata", None) or {}
+                actual = usage.get("total_tokens")
+                if usage:
+                    self._record_usage(usage)
+                return result
+            except Exception as e:
+                delay = _rate_limit_delay(e)
+                if delay is None:
+                    with self._cond:
+                        self._counters["failures"] += 1
+                    raise
+                with self._cond:
+                    self._counters["rate_limited"] += 1
+                if attempt >= self.max_retries:
+                    logger.warning("llm_rate_limited_giving_up", session_id=session_id, retries=attempt)
+                    raise
+                backoff = min(self.backoff_cap, self.backoff_base * (2 ** attempt))
+                delay = max(delay, backoff) * random.uniform(1.0, 1.5)
+                logger.info("llm_rate_limited_retry", session_id=session_id, delay_s=round(delay, 2))
+                self._pause(delay)
+                attempt += 1
+                with self._cond:
+                    self._counters["retries"] += 1
+            finally:
+                self.release(ticket, actual)
+
+    def _record_usage(self, usage: Dict[str, Any]) -> None:
+        cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+        with self._cond:
+            self._usage["calls"] += 1
+            self._usage["input_tokens"] += usage.get("input_tokens") or 0
+            self._usage["cached_input_tokens"] += cached
+            self._usage["output_tokens"] += usage.get("output_tokens") or 0
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            queues = {}
+            for priority, sessions in self._queues.items():
+                queues[PRIORITY_NAMES[priority]] = {
+                    "sessions": len(sessions),
+                    "waiting": sum(len(q) for q in sessions.values()),
+                }
+            waits = {}
+            for name, stats in self._stats.items():
+                recent = sorted(stats["recent"])
+                waits[name] = {
+                    "granted": stats["granted"],
+                    "wait_avg_s": stats["wait_total"] / stats["granted"] if stats["granted"] else 0.0,
+                    "wait_max_s": stats["wait_max"],
+                    "wait_p50_s": recent[len(recent) // 2] if recent else 0.0,
+                    "wait_p95_s": recent[int(len(recent) * 0.95)] if recent else 0.0,
+                }
+            return {
+                "in_flight": self._in_flight,
+                "paused_for_s": max(0.0, self._paused_until - time.monotonic()),
+                "queues": queues,
+                "wait": waits,
+                "usage": {
+                    **self._usage,
+                    "cache_hit_ratio": (self._usage["cached_input_tokens"] / self._usage["input_tokens"]
+                                        if self._usage["input_tokens"] else 0.0),
+                },
+                **self._counters,
+            }
+
+
+scheduler = LLMScheduler(
+    rpm=float(os.getenv("LLM_RPM", "300")),
+    tpm=float(os.getenv("LLM_TPM", "150000")),
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    burst_seconds=float(os.getenv("LLM_BURST_SECONDS", "10")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "60")),
+)
+
+
+def scheduled(runnable, priority: int = INTERACTIVE, llm_scheduler: Optional[LLMScheduler] = None,
+              node: Optional[str] = None, economy=None):
+    """Wrap a chat model runnable so each invoke goes through the scheduler.
+
+    The session is taken from ``config["configurable"]["thread_id"]``, which
+    langchain propagates to nested calls (e.g. chains invoked inside tools).
+    Each call's token usage is recorded in token_usage.ledger under ``node``
+    (default: the graph node making the call); sessions over their token
+    budget are served by ``economy`` instead, when given.
+    """
+    def _invoke(payload, config: RunnableConfig):
+        target = llm_scheduler or scheduler
+        session_id = (config or {}).get("configurable", {}).get("thread_id") or "anonymous"
+        usage_session, user, usage_node = token_usage.attribution(config, node)
+        model = runnable
+        if economy is not None and token_usage.ledger.over_budget(usage_session):
+            model = economy
+        prompt_tokens = estimate_tokens(payload)
+        result = target.run(lambda: model.invoke(payload, config), session_id=session_id,
+                            priority=priority, tokens=prompt_tokens)
+        token_usage.ledger.record(getattr(result, "usage_metadata", None), usage_session, user, usage_node,
+                                  estimate=(prompt_tokens, estimate_tokens(getattr(result, "content", ""))),
+                                  economy=model is not runnable)
+        return result
+
+    return RunnableLambda(_invoke, name=f"scheduled_{PRIORITY_NAMES[priority]}")
+
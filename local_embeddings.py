@@ -0,0 +1,207 @@
+# local_embeddings.py
+"""In-process CPU embeddings for the doctor directory, through ONNX Runtime.
+
+By default ``retriever_model`` embeds each query with Azure OpenAI, which
+costs an HTTP round trip (often 100+ ms) before the vector search starts.
+With EMBEDDING_BACKEND=onnx it uses ``OnnxEmbeddings`` instead: a small
+sentence embedding model (e.g. all-MiniLM-L6-v2, int8 quantized, ~23 MB)
+run on the CPU in this process.
+
+A model directory holds ``tokenizer.json`` (Hugging Face tokenizers format)
+and ``model_quantized.onnx`` or ``model.onnx``: a BERT-style encoder taking
+input_ids / attention_mask (/ token_type_ids) and returning token states,
+which are mean-pooled over the attention mask and L2-normalized.
+
+Vectors from different models are not comparable. Switching backend means
+re-embedding the directory with the same model (``reembed``) and pointing
+CHROMA_DIR, VECTOR_SNAPSHOT_DIR or VECTOR_SHARD_DIR at the result.
+
+Threading: each inference uses EMBEDDING_THREADS intra-op threads and at most
+EMBEDDING_MAX_CONCURRENCY inferences run at once (request threads beyond that
+wait), so the two multiplied should not exceed the cores of the box.
+
+The packages are optional and not in requirements.txt, so the default Azure
+backend deploys without them: ``pip install -r requirements-onnx.txt`` where
+this backend is used (and before ``download``, ``quantize`` or ``reembed``).
+
+Environment variables:
+  - EMBEDDING_BACKEND: "azure" (default) or "onnx" (read by retriever.py)
+  - EMBEDDING_MODEL_DIR: model directory (default ./models/all-MiniLM-L6-v2)
+  - EMBEDDING_MAX_CONCURRENCY: inferences run at once (default 2)
+  - EMBEDDING_THREADS: intra-op threads per inference (default CPU count / concurrency)
+  - EMBEDDING_BATCH_SIZE: texts per inference when embedding documents (default 32)
+  - EMBEDDING_MAX_TOKENS: truncation length in tokens (default 256)
+
+Usage:
+  python local_embeddings.py download [--repo Xenova/all-MiniLM-L6-v2] [--out ./models/all-MiniLM-L6-v2]
+  python local_embeddings.py quantize [--model-dir ./models/all-MiniLM-L6-v2]
+  python local_embeddings.py reembed [--source ./doctor_details_db] [--out ./doctor_details_db_onnx]
+                                     [--snapshot DIR] [--shards DIR]
+"""
+import os
+import shutil
+import logging
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from structured_log import get_logger
+
+logger = get_logger(__name__)
+
+MODEL_DIR = os.getenv("EMBEDDING_MODEL_DIR", "./models/all-MiniLM-L6-v2")
+MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "2"))
+THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or max(1, (os.cpu_count() or 1) // MAX_CONCURRENCY)
+BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+MAX_TOKENS = int(os.getenv("EMBEDDING_MAX_TOKENS", "256"))
+# Preferred first: the int8 model is ~4x smaller and faster on CPU
+MODEL_FILES = ("model_quantized.onnx", "model.onnx")
+TOKENIZER_FILE = "tokenizer.json"
+DEFAULT_REPO = "Xenova/all-MiniLM-L6-v2"
+# Chroma rejects very large add() calls
+CHROMA_ADD_BATCH = 1000
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings from an ONNX encoder on the CPU (see module docstring)."""
+
+    def __init__(self, model_dir: str = MODEL_DIR, threads: int = THREADS, max_concurrency: int = MAX_CONCURRENCY,
+                 batch_size: int = BATCH_SIZE, max_tokens: int = MAX_TOKENS):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(f"{e}; the onnx backend needs `pip install -r requirements-onnx.txt`") from e
+
+        model_path = next((os.path.join(model_dir, name) for name in MODEL_FILES
+                           if os.path.isfile(os.path.join(model_dir, name))), None)
+        if model_path is None:
+            raise FileNotFoundError(f"No {' or '.join(MODEL_FILES)} in {model_dir}; "
+                                    f"run `python local_embeddings.py download`")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self._tokenizer.enable_truncation(max_length=max_tokens)
+        # Pad to the longest text of each batch, not to max_tokens
+        self._tokenizer.enable_padding()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.batch_size = batch_size
+        self.model_name = os.path.basename(os.path.normpath(model_dir))
+        logger.info("onnx_embeddings_loaded", model=self.model_name, path=model_path, threads=threads,
+                    concurrency=max_concurrency)
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64), "attention_mask": mask}
+        if "token_type_ids" in self._inputs:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        with self._slots:
+            output = self._session.run(None, feeds)[0]
+        if output.ndim == 3:
+            # Token states: average the real (unpadded) tokens
+            weights = mask[..., None].astype(np.float32)
+            output = (output * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return (output / np.maximum(norms, 1e-12)).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Batching similar lengths together keeps padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            chunk = order[start:start + self.batch_size]
+            for i, vector in zip(chunk, self._embed_batch([texts[i] for i in chunk])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+def download(repo: str = DEFAULT_REPO, out_dir: str = MODEL_DIR) -> str:
+    """Fetch a quantized ONNX export and its tokenizer from the Hugging Face hub."""
+    from huggingface_hub import hf_hub_download
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name in (f"onnx/{MODEL_FILES[0]}", TOKENIZER_FILE):
+        shutil.copyfile(hf_hub_download(repo, name), os.path.join(out_dir, os.path.basename(name)))
+    return out_dir
+
+
+def quantize(model_dir: str = MODEL_DIR) -> str:
+    """Write model_quantized.onnx (int8 weights, dynamic activations) next to model.onnx."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    target = os.path.join(model_dir, MODEL_FILES[0])
+    quantize_dynamic(os.path.join(model_dir, MODEL_FILES[1]), target, weight_type=QuantType.QInt8)
+    return target
+
+
+def reembed(source_dir: str = "./doctor_details_db", out_dir: Optional[str] = "./doctor_details_db_onnx",
+            snapshot_dir: Optional[str] = None, shard_dir: Optional[str] = None,
+            model_dir: str = MODEL_DIR) -> int:
+    """Re-embed the doctor collection with the local model into a new Chroma directory and/or snapshots."""
+    from langchain_chroma import Chroma
+
+    data = Chroma(persist_directory=source_dir).get(include=["documents", "metadatas"])
+    documents, metadatas = data["documents"], data["metadatas"]
+    embeddings = OnnxEmbeddings(model_dir)
+    vectors = embeddings.embed_documents(documents)
+    logger.info("documents_reembedded", documents=len(documents), model=embeddings.model_name)
+
+    if out_dir:
+        if os.path.isdir(out_dir) and os.listdir(out_dir):
+            # Mixing models (or dimensions) in one collection would make search meaningless
+            raise FileExistsError(f"{out_dir} is not empty; re-embed into a new directory")
+        collection = Chroma(persist_directory=out_dir, embedding_function=embeddings)._collection
+        for start in range(0, len(documents), CHROMA_ADD_BATCH):
+            end = start + CHROMA_ADD_BATCH
+            collection.add(ids=data["ids"][start:end], embeddings=vectors[start:end],
+                           documents=documents[start:end], metadatas=metadatas[start:end])
+    if snapshot_dir:
+        from vector_snapshot import write_snapshot
+        write_snapshot(vectors, documents, metadatas, snapshot_dir)
+    if shard_dir:
+        from region_shards import write_shards
+        write_shards(vectors, documents, metadatas, shard_dir)
+    return len(documents)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    # Chroma needs a newer sqlite than some hosts ship (as in retriever.py)
+    import pysqlite3
+    sys.modules["sqlite3"] = pysqlite3
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Local CPU embedding model tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    download_cmd = sub.add_parser("download")
+    download_cmd.add_argument("--repo", default=DEFAULT_REPO)
+    download_cmd.add_argument("--out", default=MODEL_DIR)
+    quantize_cmd = sub.add_parser("quantize")
+    quantize_cmd.add_argument("--model-dir", default=MODEL_DIR)
+    reembed_cmd = sub.add_parser("reembed")
+    reembed_cmd.add_argument("--source", default="./doctor_details_db")
+    reembed_cmd.add_argument("--out", default="./doctor_details_db_onnx", help="new Chroma directory ('' to skip)")
+    reembed_cmd.add_argument("--snapshot", default=None, help="also write a vector snapshot here")
+    reembed_cmd.add_argument("--shards", default=None, help="also write region shards here")
+    reembed_cmd.add_argument("--model-dir", default=MODEL_DIR)
+    args = parser.parse_args()
+
+    if args.command == "download":
+        print(download(args.repo, args.out))
+    elif args.command == "quantize":
+        print(quantize(args.model_dir))
+    else:
+        print(reembed(args.source, args.out or None, args.snapshot, args.shards, args.model_dir))
@@ -4,6 +4,8 @@ from logging.handlers import RotatingFileHandler
 from datetime import datetime
 from pymongo import MongoClient
 
+from structured_log import Event, configure_levels, make_formatter
+
 
 def setup_logging():
     """Configure logging with rotating file, console, and a resilient MongoDB handler.
@@ -14,6 +16,8 @@ def setup_logging():
       - MONGO_URI: MongoDB connection URI (default: mongodb://localhost:27017/)
       - MONGO_DB: MongoDB database name for logs (default: patient_db)
       - MONGO_COLLECTION: MongoDB collection name for logs (default: app_logs)
+      - LOG_FORMAT: "text" (default) or "json" for one compact JSON object per line
+      - LOG_LEVELS: per-module levels, e.g. "chat_routes=WARNING,db_utils=DEBUG"
     """
     # Read configuration from environment with sensible defaults
     log_dir = os.getenv("LOG_DIR", os.path.join(os.getcwd(), "logs"))
@@ -42,10 +46,12 @@ def setup_logging():
         encoding="utf-8",
     )
     file_handler.setLevel(level)
+    file_handler.setFormatter(make_formatter())
 
     # Console output
     console_handler = logging.StreamHandler()
     console_handler.setLevel(level)
+    console_handler.setFormatter(make_formatter())
 
     # Configure root logger
     logging.basicConfig(
@@ -99,6 +105,9 @@ def setup_logging():
                     "funcName": record.funcName,
                     "lineno": record.lineno,
                 }
+                if isinstance(record.msg, Event):
+                    log_entry["event"] = record.msg.name
+                    log_entry["fields"] = record.msg.fields
 
                 # Include exception info if present
                 if record.exc_info:
@@ -127,4 +136,5 @@ def setup_logging():
         # If handler construction fails for any reason, don't block the app
         logging.getLogger().exception("Failed to initialize MongoDB logging handler")
 
+    configure_levels()
     logging.getLogger().info("Logging is set up successfully.")
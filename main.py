@@ -8,15 +8,33 @@ sys.modules["sqlite3"] = pysqlite3
 
 from flask import Flask, render_template, session
 from flask_session import Session
+from werkzeug.middleware.proxy_fix import ProxyFix
 from logger import setup_logging
 from db_utils import init_db
 from chat_routes import chat_bp
 from authentication import auth_bp
+from reports import reports_bp
+from profiling import profiling_bp, init_request_profiling
+from ws_chat import ws_bp
+from static_assets import init_assets
+from lifecycle import init_lifecycle
+
+
+# Proxies in front of the app whose X-Forwarded-For is trusted: App Service's front end sets it;
+# elsewhere it defaults to none, so a client cannot pick its own address
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "1" if os.getenv("WEBSITE_SITE_NAME") else "0"))
+
+
+def trust_proxies(app, count: int = TRUSTED_PROXIES) -> None:
+    """Make request.remote_addr the client's address (login throttling and logs key on it)."""
+    if count > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=count)
 
 
 def create_app():
     # Initialize Flask app
     app = Flask(__name__, template_folder="templates", static_folder="static")
+    trust_proxies(app)
 
     # Secret key (required for session management)
     app.secret_key = os.getenv("SECRET_KEY", "your_secret_key")
@@ -43,6 +61,13 @@ def create_app():
     # Register blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(chat_bp)
+    app.register_blueprint(reports_bp)
+    app.register_blueprint(profiling_bp)
+    app.register_blueprint(ws_bp)
+    init_request_profiling(app)
+    init_assets(app)
+    # Warm start from saved checkpoints; drain and save them again on SIGTERM
+    init_lifecycle(app)
 
     # Default route (renders index.html with session_id injected)
     @app.route("/")
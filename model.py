@@ -2,6 +2,8 @@ from dotenv import load_dotenv
 import os
 from langchain_openai import AzureChatOpenAI
 
+from llm_replay import chat_replay_cache
+
 # Load environment variables
 # load_dotenv()
 
@@ -13,14 +15,26 @@ from langchain_openai import AzureChatOpenAI
 # LLM_MODEL = os.getenv("llm_model")  # keep for info if needed
 # LLM_MODEL_VERSION = os.getenv("llm_model_version")
 
-def llm_model() -> AzureChatOpenAI:
+def llm_model(deployment_name: str = None) -> AzureChatOpenAI:
     """
     Create and return an AzureChatOpenAI LLM instance.
     """
     return AzureChatOpenAI(
-        deployment_name="call-automation-openai-gpt-4o-mini",
+        deployment_name=deployment_name or os.getenv("llm_deployment_name", "call-automation-openai-gpt-4o-mini"),
         temperature=0.1,  # could also load from env if needed
-        api_version="2025-01-01-preview",
-        azure_endpoint="https://call-automation-openai.openai.azure.com/",
-        api_key="FsUF4JAg0SbHFchYIFNjxIEUPOmnt9i5uA6UMcf49TrPk7qFbrphJQQJ99BDACYeBjFXJ3w3AAABACOGX1Nm",
+        api_version=os.getenv("llm_api_version", "2025-01-01-preview"),
+        azure_endpoint=os.getenv("llm_azure_endpoint", "https://call-automation-openai.openai.azure.com/"),
+        api_key=os.getenv("llm_api_key", "FsUF4JAg0SbHFchYIFNjxIEUPOmnt9i5uA6UMcf49TrPk7qFbrphJQQJ99BDACYeBjFXJ3w3AAABACOGX1Nm"),
+        max_retries=0,  # 429 retries are handled by llm_scheduler with fair queuing
+        cache=chat_replay_cache(),  # None unless LLM_REPLAY_MODE is record/replay
     )
+
+
+
+def economy_llm_model():
+    """The cheaper deployment that sessions over their token budget are served by (token_usage.py), or None.
+
+    Set ``llm_economy_deployment_name`` to enable it; it shares the main deployment's endpoint and key.
+    """
+    deployment = os.getenv("llm_economy_deployment_name")
+    return llm_model(deployment) if deployment else None
@@ -1,9 +1,22 @@
-from model import llm_model
+from model import llm_model, economy_llm_model
 from retriever import retriever_model
+from region_shards import ShardedRetriever
+from llm_scheduler import scheduled, INTERACTIVE, BACKGROUND
+from prefetch import ToolPrefetcher
+import directory_records
+import booking
+import appointment_time
+import token_usage
+import db_utils
+from langchain_core.documents import Document
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableLambda
 from langgraph.prebuilt import ToolNode
-from typing import Annotated
+from typing import Annotated, Dict
+import json
+import os
+import time
+import threading
 from typing_extensions import TypedDict
 from langgraph.graph.message import AnyMessage, add_messages
 from langchain_core.prompts import ChatPromptTemplate
@@ -19,7 +32,7 @@ from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema.output_parser import StrOutputParser
 from langchain.tools import tool
 
-def hospital_data_filtering_prompt():
+def hospital_data_filtering_prompt(priority: int = INTERACTIVE):
 
     filtering_template = """
 You are a helpful assistant tasked with filtering and extracting only the unique relevant documents based on the user's query.
@@ -34,13 +47,34 @@ You are a helpful assistant tasked with filtering and extracting only the unique
 """
 
     prompt = ChatPromptTemplate.from_template(filtering_template)
-    rag_chain = prompt | llm | StrOutputParser()
+    rag_chain = prompt | scheduled(llm, priority=priority, node="hospital_filter") | StrOutputParser()
     return rag_chain
 
 
+def record_selection_prompt(priority: int = INTERACTIVE):
+
+    selection_template = """
+You are selecting hospital directory records for a user's query.
+Reply only with the numbers of the relevant records, most relevant first, separated by commas.
+If no record matches exactly, give the closest alternatives. Reply "none" if nothing is related.
+
+### User Query:
+{query}
+
+### Records (hospital | location | specialization | doctor):
+{records}
+
+"""
+
+    prompt = ChatPromptTemplate.from_template(selection_template)
+    return prompt | scheduled(llm, priority=priority, node="record_selection") | StrOutputParser()
+
+
 
 
 llm = llm_model()
+# Serves the assistant for sessions over their token budget, when configured (token_usage.py)
+economy_llm = economy_llm_model()
 retriever = retriever_model()
 
 
@@ -108,11 +142,10 @@ class Assistant:
                 break
         return {"messages": result}
     
-primary_assistant_prompt = ChatPromptTemplate.from_messages(
-    [
-        (
-            "system",
-            """
+# The instructions are a fixed system message with no template variables, so
+# every request from every user starts with a byte-identical prefix and the
+# provider can serve it from its prompt cache. Per-user data goes last.
+PRIMARY_ASSISTANT_INSTRUCTIONS = """
 You are Azentyk’s Doctor AI Assistant — a professional, intelligent virtual assistant that helps users book, check, or cancel doctor appointments using real-time system tools.
 
 ---
@@ -130,11 +163,14 @@ You are Azentyk’s Doctor AI Assistant — a professional, intelligent virtual
    - If the user mentions a **hospital**, ensure you know the **location** first before suggesting specializations.
    - If the user provides a **location**, use that to suggest hospitals.
    - If the user provides a **date/time**, ensure other details (location, hospital, specialization) are gathered before confirming booking.
-3. **Validate Dates**: Accept **only today or future** dates for appointments.
+3. **Validate Dates**: Accept **only today or future** dates for appointments. A user message may end with a note such as
+   [tomorrow 5pm = 2026-10-20 (Tuesday) 17:00] giving the date and time it mentions; use those values as they are rather
+   than working dates out yourself, and treat a note ending in ", in the past" as a past date.
 4. **Confirm Critical Info in Sentence**: Summarize all details in a single confirmation sentence before finalizing.
 5. **Follow Adaptive Flow**: Collect missing details naturally, regardless of input order.
 6. **Reuse Prior Details for Multiple Appointments**: Ask if prior user info can be reused; if yes, skip re-collection.
 7. **Support Graceful Fallback**: If no hospital/specialization is found, suggest polite, nearby or similar alternatives.
+8. **Use Known Details**: If the user data lists "Known details", treat them as already collected. Do not ask for them; propose them for confirmation within your next step and switch only if the user gives different ones.
 
 ---
 
@@ -180,6 +216,10 @@ You are Azentyk’s Doctor AI Assistant — a professional, intelligent virtual
      “Would you like me to use your previous name, phone number, email, and location for this new appointment?”
 
 4. **User Info Collection (Based on Context)**  
+   - If the user data has a known **Location**, do not ask for it: list hospitals there right away and mention it, e.g.  
+     “Here are some hospitals in [Location], where you are registered (tell me if you need another location):”
+   - If the user data has a **Last booking**, first offer it:  
+     “Would you like another [Specialization] appointment at [Hospital], [Location]?” If yes, go straight to date and time.
    - If **location** is missing, ask:  
      “Please share your location so I can list available hospitals.”
    - If **hospital** is mentioned but **location** is not yet known, ask for location **first**, then confirm hospital availability.
@@ -209,12 +249,16 @@ You are Azentyk’s Doctor AI Assistant — a professional, intelligent virtual
 
 7. **Schedule Appointment Timing**  
    - Ask: “What date and time would you prefer?”  
+   - Use tools to check free times for the chosen hospital and specialization on that date, and offer only free times.
+   - Once the user picks a free time, hold it with hold_appointment before confirming. If the slot is "unavailable",
+     offer the free times it lists; if it asks you to choose a doctor, ask the user which one.
    - If date is in the past:  
      “I can only schedule appointments for today or future dates. Please provide a valid date.”
 
 8. **Final Confirmation Before Processing**  
    - Example:  
      “To confirm, you would like to schedule an appointment with a **[Specialization]** at **[Hospital]** in **[Location]** on **[Date] at [Time]**. Should I go ahead and process your appointment?”
+   - Use the doctor, date and time hold_appointment held; the slot stays held for the minutes it reports.
 
 9. **Closing Acknowledgment**  
    - If user confirms, respond: 
@@ -222,6 +266,21 @@ You are Azentyk’s Doctor AI Assistant — a professional, intelligent virtual
 
 ---
 
+### Checking and Cancelling Appointments:
+
+1. **Check**  
+   - Use the check_appointment tool; never guess appointment details. Set include_past only if the user asks about past or cancelled appointments.
+   - Present each appointment in one line: “[Specialization] at [Hospital], [Location] on [Date] at [Time] ([Status])”. Do not show ids.
+   - If none are found, say so and offer to book one.
+
+2. **Cancel**  
+   - Find the appointment with check_appointment (unless it was just listed) and confirm it with the user:  
+     “Do you want me to cancel your [Specialization] appointment at [Hospital] on [Date] at [Time]?”
+   - Only after the user confirms, call cancel_appointment with its id.
+   - Then reply: “Your appointment at [Hospital] on [Date] at [Time] has been cancelled.” If it was already cancelled or not found, say so.
+
+---
+
 ### Response Rules:
 - Maintain a polite and empathetic tone at all times.
 - Use short, structured replies.
@@ -230,38 +289,227 @@ You are Azentyk’s Doctor AI Assistant — a professional, intelligent virtual
 - Never book or confirm appointments until all required data is available and validated.
 
 ---
+"""
 
-=============  
-\n\nCurrent user Data:\n<User>\n{user_info}\n</User>  
-\n\nCurrent Date:\n<Date>\n{current_date}\n</Date>  
-=============  
+PRIMARY_ASSISTANT_CONTEXT = """
+=============
+Current user Data:
+<User>
+{user_info}
+</User>
+
+Current Date:
+<Date>
+{current_date}
+</Date>
+=============
 """
-        ),
+
+# The leading system message carries no variables, so it is a byte-identical cacheable prefix
+# (benchmarks/tests/test_prompt_prefix.py)
+primary_assistant_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", PRIMARY_ASSISTANT_INSTRUCTIONS),
         ("placeholder", "{messages}"),
+        ("system", PRIMARY_ASSISTANT_CONTEXT),
     ]
 )
 
 
-@tool
-def hospital_details(query: str) -> str:
-    """Search for hospital information including:
-    - Hospital names
-    - Hospital locations
-    - Available specialties
-    - Doctor Name
-    
-    Use this when users ask about hospital options, specialties, etc."""
-    docs = retriever.invoke(query)
+# Compact records deduplicated locally (directory_records.py); "0" returns the LLM-filtered free text as before
+STRUCTURED_TOOL_OUTPUT = os.getenv("STRUCTURED_TOOL_OUTPUT", "1") == "1"
+
+
+def search_hospitals(query: str, city=None, state=None, priority: int = INTERACTIVE, config=None) -> str:
+    """Retrieve directory rows for ``query`` and reduce them to what the query asks for."""
+    if isinstance(retriever, ShardedRetriever):
+        # Searches the user's region unless the query names another one
+        docs = retriever.invoke(query, city=city, state=state)
+    else:
+        docs = retriever.invoke(query)
+    prefetcher.learn(doc.page_content for doc in docs)
+
+    # Over its token budget a session gets the rows in relevance order, without the LLM step
+    session_id, _, _ = token_usage.attribution(config)
+    if token_usage.ledger.over_budget(session_id):
+        result, _ = directory_records.select(query, docs, None)
+        return result
+
+    if STRUCTURED_TOOL_OUTPUT:
+        chooser = record_selection_prompt(priority)
+        result, _ = directory_records.select(
+            query, docs, lambda q, records: chooser.invoke({"query": q, "records": records}, config))
+        return result
 
     # Prepare context as a string
     context_string = "\n".join([doc.page_content for doc in docs])
     
-    ele_hospital_data_filtering_prompt = hospital_data_filtering_prompt()
-    result = ele_hospital_data_filtering_prompt.invoke({'query':query,'context':context_string})
+    ele_hospital_data_filtering_prompt = hospital_data_filtering_prompt(priority)
+    result = ele_hospital_data_filtering_prompt.invoke({'query':query,'context':context_string}, config)
     return result
 
-part_1_tools = [hospital_details]
-part_1_assistant_runnable = primary_assistant_prompt | llm.bind_tools(part_1_tools)
+
+def _prefetch_hospitals(query: str, city, state, session_id: str) -> str:
+    # Pool threads don't inherit the turn's context; pass the session for the scheduler's fairness
+    return search_hospitals(query, city, state, BACKGROUND,
+                            {"configurable": {"thread_id": session_id, "session_id": session_id}})
+
+
+# Speculative hospital_details lookups and the cache they fill (prefetch.py)
+prefetcher = ToolPrefetcher(_prefetch_hospitals)
+
+
+@tool
+def hospital_details(query: str, config: RunnableConfig) -> str:
+    """Search the hospital directory: hospital names, locations, specializations and doctor names.
+
+    Returns JSON {"fields": [...], "rows": [[hospital, location, specialization, doctor], ...], "omitted": n},
+    most relevant rows first; "omitted" counts rows left out for length, so ask a narrower query
+    (a hospital or specialization) if the one you need is missing.
+
+    Use this when users ask about hospital options, specialties, etc."""
+    configuration = config.get("configurable", {})
+    city, state = configuration.get("patient_city"), configuration.get("patient_state")
+    return prefetcher.run(query, city, lambda: search_hospitals(query, city, state, config=config))
+
+def _appointment_summary(appointment: Dict) -> Dict:
+    return {
+        "id": str(appointment["_id"]),
+        "hospital": appointment.get("hospital_name"),
+        "specialization": appointment.get("specialization"),
+        "location": appointment.get("location"),
+        "date": appointment.get("appointment_booking_date") or appointment.get("appointment_booking_date_text"),
+        "time": appointment.get("appointment_booking_time") or appointment.get("appointment_booking_time_text"),
+        "status": appointment.get("appointment_status"),
+    }
+
+
+def _compact(result: Dict) -> str:
+    return json.dumps(result, separators=(",", ":"), default=str)
+
+
+_directory_lock = threading.Lock()
+_directory = {"records": [], "loaded_at": None}
+DIRECTORY_REFRESH_SECONDS = 300
+
+
+def directory_listing() -> list:
+    """Every doctor of the directory as directory_records records, reloaded every few minutes.
+
+    Appointment slots are keyed by these names (booking.resolve_provider).
+    """
+    with _directory_lock:
+        loaded_at = _directory["loaded_at"]
+        if loaded_at is not None and time.monotonic() - loaded_at < DIRECTORY_REFRESH_SECONDS:
+            return _directory["records"]
+        if hasattr(retriever, "all_documents"):
+            docs = retriever.all_documents()
+        else:
+            data = retriever.vectorstore.get(include=["documents", "metadatas"])
+            docs = [Document(page_content=text or "", metadata=meta or {})
+                    for text, meta in zip(data["documents"], data["metadatas"])]
+        _directory["records"] = directory_records.records_from_documents(docs)
+        _directory["loaded_at"] = time.monotonic()
+        return _directory["records"]
+
+
+def _providers_text(hospital: str, doctor: str) -> str:
+    return (f"{doctor} at {hospital} is not in the directory. "
+            "Look the hospital up with hospital_details and use a doctor or specialization listed there.")
+
+
+@tool
+def appointment_availability(hospital: str, doctor: str, date: str, location: str = "") -> str:
+    """Check free appointment times at a hospital for a doctor or specialization on a date.
+
+    - hospital: hospital name
+    - doctor: doctor name or specialization
+    - date: appointment date as YYYY-MM-DD
+    - location: the hospital's location, if known
+
+    Use this before proposing an appointment time."""
+    day = booking.parse_date(date)
+    if day is None:
+        return "Error: date must be in YYYY-MM-DD format."
+    providers = booking.resolve_provider(hospital, doctor, directory_listing(), location)
+    if not providers:
+        return _providers_text(hospital, doctor)
+    lines = []
+    for provider in providers:
+        intervals = booking.availability(provider["hospital"], provider["doctor"], day)
+        free = booking.format_intervals(intervals) if intervals else "none"
+        lines.append(f"{provider['doctor']} ({provider['specialization']}): {free}")
+    return f"Free times at {providers[0]['hospital']} on {day.isoformat()}:\n" + "\n".join(lines)
+
+
+@tool
+def hold_appointment(hospital: str, doctor: str, date: str, time: str, config: RunnableConfig,
+                     location: str = "") -> str:
+    """Hold an appointment slot for the user while they confirm it.
+
+    - hospital: hospital name
+    - doctor: doctor name or specialization
+    - date: appointment date as YYYY-MM-DD
+    - time: appointment time as HH:MM
+    - location: the hospital's location, if known
+
+    Call this once the user has picked a free time, before asking them to confirm.
+    Returns JSON with slot "held" (and the doctor, date and time held), "unavailable"
+    (with the free times), "choose_doctor" (with the doctors to choose from) or "unknown"."""
+    day, minute = booking.parse_date(date), booking.parse_time(time)
+    if day is None or minute is None:
+        return "Error: date must be YYYY-MM-DD and time HH:MM."
+    providers = booking.resolve_provider(hospital, doctor, directory_listing(), location)
+    if not providers:
+        return _compact({"slot": "unknown", "message": _providers_text(hospital, doctor)})
+    if len(providers) > 1:
+        return _compact({"slot": "choose_doctor",
+                         "doctors": [f"{p['doctor']} ({p['specialization']})" for p in providers]})
+    provider = providers[0]
+    session_id, _, _ = token_usage.attribution(config)
+    reservation = booking.hold_for_session(session_id, provider, day, minute)
+    if reservation is None:
+        free = booking.format_intervals(booking.availability(provider["hospital"], provider["doctor"], day))
+        return _compact({"slot": "unavailable", "date": day.isoformat(), "free": free or "none"})
+    return _compact({"slot": "held", "hospital": reservation["hospital"], "doctor": reservation["doctor"],
+                     "specialization": reservation["specialization"], "date": reservation["date"],
+                     "time": reservation["time"], "held_minutes": booking.HOLD_SECONDS // 60})
+
+
+@tool
+def check_appointment(config: RunnableConfig, include_past: bool = False) -> str:
+    """List the user's appointments as JSON: id, hospital, specialization, location, date, time, status.
+
+    Upcoming appointments that are not cancelled by default; set include_past
+    to true to also list past and cancelled ones.
+
+    Use this when the user asks about their appointments, and to find the id
+    of the appointment they want to cancel."""
+    configuration = config.get("configurable", {})
+    appointments = db_utils.find_appointments(
+        configuration.get("patient_email"),
+        from_date=None if include_past else appointment_time.today().isoformat(), include_cancelled=include_past)
+    return _compact({"appointments": [_appointment_summary(a) for a in appointments]})
+
+
+@tool
+def cancel_appointment(appointment_id: str, config: RunnableConfig) -> str:
+    """Cancel one of the user's appointments by the id from check_appointment.
+
+    Only call this after the user has confirmed which appointment to cancel.
+    Returns JSON with status "cancelled", "already_cancelled" or "not_found"."""
+    configuration = config.get("configurable", {})
+    status, appointment = db_utils.cancel_appointment(appointment_id, configuration.get("patient_email"))
+    if appointment is None:
+        return _compact({"status": status, "id": appointment_id})
+    if appointment.get("slot_id") and appointment.get("slot_time"):
+        # The slot opens up again for other patients
+        booking.release_booking(appointment["slot_id"], appointment["slot_time"], appointment["_id"])
+    return _compact({"status": status, "appointment": _appointment_summary(appointment)})
+
+part_1_tools = [hospital_details, appointment_availability, hold_appointment, check_appointment, cancel_appointment]
+part_1_assistant_runnable = primary_assistant_prompt | scheduled(
+    llm.bind_tools(part_1_tools), economy=economy_llm.bind_tools(part_1_tools) if economy_llm else None)
 
 
 builder = StateGraph(State)
@@ -0,0 +1,362 @@
+# prefetch.py
+"""Speculative prefetch of hospital_details results, and the tool cache they land in.
+
+The booking flow is predictable: once the user names a location the
+assistant lists that city's hospitals, and once they name a hospital it
+lists the hospital's specializations. ``ToolPrefetcher`` starts that lookup
+(vector search plus the filtering LLM call) in a small background pool as
+soon as the user's message arrives, or when the chat page opens for a user
+whose profile has a city, so it runs while the assistant is still deciding
+to call the tool. hospital_details then finds the result in the cache.
+
+Lookups are keyed by what they are about, not their wording:
+("location", city) or ("hospital", hospital, city), with the city as the
+directory shards it ("Chennai (Velachery)" -> "chennai", see
+region_shards.normalize_city). Hospital and city names are learned from the
+directory rows the tool retrieves. A query with any
+other content word ("cardiologists in Chennai") is not cacheable and runs
+as before.
+
+Speculation is bounded:
+  - at most TOOL_PREFETCH_MAX_PENDING lookups queued or running, on
+    TOOL_PREFETCH_WORKERS threads, and TOOL_PREFETCH_SESSION_BUDGET per
+    session; past either cap a prediction is skipped,
+  - a session's queued lookups are cancelled when its next message points
+    somewhere else, and a tool call that finds its lookup still queued
+    cancels it and runs inline rather than wait behind background work,
+  - the filtering LLM call runs at the scheduler's BACKGROUND priority.
+
+Environment variables:
+  - TOOL_PREFETCH: "1" (default) to speculate, "0" to only cache tool results
+  - TOOL_PREFETCH_WORKERS (default 2), TOOL_PREFETCH_MAX_PENDING (default 8)
+  - TOOL_PREFETCH_SESSION_BUDGET (default 4)
+  - TOOL_CACHE_TTL: seconds a result is reused, 0 disables the cache (default 300)
+  - TOOL_CACHE_SIZE: cached results kept (default 256)
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from region_shards import document_region, normalize_city
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("TOOL_PREFETCH", "1") == "1"
+PREFETCH_WORKERS = int(os.getenv("TOOL_PREFETCH_WORKERS", "2"))
+PREFETCH_MAX_PENDING = int(os.getenv("TOOL_PREFETCH_MAX_PENDING", "8"))
+PREFETCH_SESSION_BUDGET = int(os.getenv("TOOL_PREFETCH_SESSION_BUDGET", "4"))
+CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "300"))
+CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "256"))
+# Sessions whose budget and pending lookups are tracked; the oldest are forgotten first
+MAX_TRACKED_SESSIONS = 4096
+
+_HOSPITAL_RE = re.compile(r"Hospital Name\s*:\s*([^,\n]+)", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z]+")
+_BOOKING_RE = re.compile(r"\b(book|appointment|hospital|doctor)", re.IGNORECASE)
+# Words a query can contain besides hospital/city names and still just mean "list them"
+GENERIC_WORDS = frozenset("""
+    a an the in at near around of for to and me my show list find get give please which what are is
+    there available all any some options hospitals hospital clinics clinic specializations specialization
+    specialities speciality specialties specialty departments department doctors doctor
+""".split())
+
+Key = Tuple[Optional[str], ...]
+
+
+class _Entry:
+    __slots__ = ("future", "expires", "speculative", "used")
+
+    def __init__(self, future: Future, expires: float, speculative: bool):
+        self.future = future
+        self.expires = expires
+        self.speculative = speculative
+        self.used = False
+
+
+class ToolPrefetcher:
+    """Result cache for hospital_details with speculative background fills.
+
+    ``fetch(query, city, state, session_id)`` performs a lookup at background
+    priority; tool calls go through ``run(query, city, compute)``.
+    """
+
+    def __init__(self, fetch: Callable[[str, Optional[str], Optional[str], str], Any],
+                 enabled: bool = PREFETCH_ENABLED, workers: int = PREFETCH_WORKERS,
+                 max_pending: int = PREFETCH_MAX_PENDING, session_budget: int = PREFETCH_SESSION_BUDGET,
+                 ttl: float = CACHE_TTL, size: int = CACHE_SIZE):
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self.session_budget = session_budget
+        self.ttl = ttl
+        self.size = size
+        self._fetch = fetch
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        # Re-entrant: a cancelled future runs its done callback in the cancelling thread
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[Key, _Entry]" = OrderedDict()
+        # session -> [prefetches spent, keys still speculative]
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()
+        self._pending = 0
+        self._cities: Dict[str, str] = {}
+        self._hospitals: Dict[str, str] = {}
+        self._hospital_city: Dict[str, str] = {}
+        self._matcher: Optional[re.Pattern] = None
+        self._counters = defaultdict(int)
+
+    # ---- vocabulary -------------------------------------------------------
+    def learn(self, texts: Iterable[str]) -> None:
+        """Pick up hospital and city names from retrieved directory rows."""
+        changed = False
+        with self._lock:
+            for text in texts:
+                match = _HOSPITAL_RE.search(text or "")
+                city, _ = document_region(text, None)
+                if city and city.lower() not in self._cities:
+                    self._cities[city.lower()] = city
+                    changed = True
+                if match:
+                    hospital = match.group(1).strip()
+                    if hospital.lower() not in self._hospitals:
+                        self._hospitals[hospital.lower()] = hospital
+                        changed = True
+                    if city:
+                        self._hospital_city.setdefault(hospital.lower(), city.lower())
+            if changed:
+                self._matcher = None
+
+    @staticmethod
+    def _city(city: Optional[str]) -> Optional[str]:
+        """Key form of a profile or row city: "Chennai (Velachery)" -> "chennai"."""
+        city = normalize_city(city)
+        return city.lower() if city else None
+
+    def _mentions(self, text: str) -> Tuple[list, list, str]:
+        """(hospitals, cities) named in ``text``, and the text with the names removed."""
+        with self._lock:
+            if self._matcher is None and (self._hospitals or self._cities):
+                # Longest names first so "Apollo Hospitals Chennai" wins over "Chennai"
+                names = sorted({*self._hospitals, *self._cities}, key=len, reverse=True)
+                self._matcher = re.compile(r"\b(?:" + "|".join(re.escape(n) for n in names) + r")\b")
+            matcher = self._matcher
+        lowered = text.lower()
+        if matcher is None:
+            return [], [], lowered
+        found = matcher.findall(lowered)
+        hospitals = [name for name in found if name in self._hospitals]
+        cities = [name for name in found if name in self._cities and name not in self._hospitals]
+        return hospitals, cities, matcher.sub(" ", lowered)
+
+    def key(self, query: str, city: Optional[str] = None) -> Optional[Key]:
+        """Cache key of a tool query, or None when it asks for more than a plain listing."""
+        hospitals, cities, rest = self._mentions(query)
+        if set(_WORD_RE.findall(rest)) - GENERIC_WORDS or len(hospitals) > 1 or len(cities) > 1:
+            return None
+        city = cities[0] if cities else self._city(city)
+        if hospitals:
+            return ("hospital", hospitals[0], city or self._hospital_city.get(hospitals[0]))
+        if cities:
+            return ("location", city)
+        return None
+
+    def predict(self, message: str, city: Optional[str] = None) -> Optional[Key]:
+        """The lookup the assistant is likely to make after ``message``."""
+        hospitals, cities, _ = self._mentions(message)
+        city = self._city(city)
+        if hospitals:
+            hospital = hospitals[-1]
+            return ("hospital", hospital, cities[-1] if cities else (city or self._hospital_city.get(hospital)))
+        if cities:
+            return ("location", cities[-1])
+        if city and _BOOKING_RE.search(message):
+            return ("location", city)
+        return None
+
+    def _query(self, key: Key) -> str:
+        city = self._cities.get(key[-1], key[-1]) if key[-1] else None
+        if key[0] == "location":
+            return f"hospitals in {city}"
+        hospital = self._hospitals.get(key[1], key[1])
+        return f"specializations at {hospital} in {city}" if city else f"specializations at {hospital}"
+
+    # ---- cache ------------------------------------------------------------
+    def _live(self, key: Key, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires <= now:
+            self._drop(key, entry)
+            entry = None
+        return entry
+
+    def _drop(self, key: Key, entry: _Entry) -> None:
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+        if entry.speculative and not entry.used and entry.future.done() and not entry.future.cancelled():
+            self._counters["wasted"] += 1
+
+    def _put(self, key: Key, entry: _Entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            old_key, old = next(iter(self._entries.items()))
+            self._drop(old_key, old)
+
+    def run(self, query: str, city: Optional[str], compute: Callable[[], Any]) -> Any:
+        """Answer a tool call from the cache (waiting for a running prefetch) or ``compute()``."""
+        key = self.key(query, city) if self.ttl > 0 else None
+        if key is None:
+            with self._lock:
+                self._counters["bypassed"] += 1
+            return compute()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None and entry.future.cancel():
+                # Still queued behind other background work: answer inline instead
+                self._counters["cancelled"] += 1
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                owned = Future()
+                # Running from the start, so no other caller can cancel() it
+                owned.set_running_or_notify_cancel()
+                self._put(key, _Entry(owned, now + self.ttl, speculative=False))
+            else:
+                owned = None
+                self._counters["hits" if entry.speculative and not entry.used else "cache_hits"] += 1
+                entry.used = True
+        if owned is None:
+            try:
+                return entry.future.result()
+            except Exception:
+                # A failed lookup is retried by this call rather than failing the turn
+                logger.warning("Cached hospital lookup failed; running it again", exc_info=True)
+                return compute()
+        try:
+            result = compute()
+        except Exception as e:
+            owned.set_exception(e)
+            with self._lock:
+                if key in self._entries and self._entries[key].future is owned:
+                    del self._entries[key]
+            raise
+        owned.set_result(result)
+        return result
+
+    # ---- speculation ------------------------------------------------------
+    def _session(self, session_id: str) -> list:
+        state = self._sessions.get(session_id)
+        if state is None:
+            state = self._sessions[session_id] = [0, []]
+            while len(self._sessions) > MAX_TRACKED_SESSIONS:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return state
+
+    def _finished(self, key: Key, entry: _Entry, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            if not future.cancelled() and future.exception() is not None:
+                self._counters["failed"] += 1
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+
+    def _speculate(self, session_id: str, key: Key, city: Optional[str], state: Optional[str]) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            session_state = self._session(session_id)
+            if self._live(key, now) is not None:
+                return False
+            if self._pending >= self.max_pending or session_state[0] >= self.session_budget:
+                self._counters["skipped"] += 1
+                return False
+            session_state[0] += 1
+            self._pending += 1
+            self._counters["started"] += 1
+            future = self._pool.submit(self._fetch, self._query(key), city, state, session_id)
+            entry = _Entry(future, now + self.ttl, speculative=True)
+            self._put(key, entry)
+            session_state[1].append(key)
+            future.add_done_callback(lambda f: self._finished(key, entry, f))
+        return True
+
+    def cancel(self, session_id: str, keep: Optional[Key] = None) -> int:
+        """Cancel the session's queued prefetches other than ``keep``; returns how many."""
+        cancelled = 0
+        with self._lock:
+            session_state = self._sessions.get(session_id)
+            if session_state is None:
+                return 0
+            remaining = []
+            for key in session_state[1]:
+                entry = self._entries.get(key)
+                if entry is None or not entry.speculative or entry.used:
+                    continue
+                if key != keep and entry.future.cancel():
+                    del self._entries[key]
+                    cancelled += 1
+                else:
+                    remaining.append(key)
+            session_state[1] = remaining
+            self._counters["cancelled"] += cancelled
+        return cancelled
+
+    def on_user_message(self, session_id: str, message: str, city: Optional[str] = None,
+                        state: Optional[str] = None) -> Optional[Key]:
+        """Start the lookup ``message`` makes likely; drop queued ones it makes unlikely."""
+        if not self.enabled or self.ttl <= 0:
+            return None
+        key = self.predict(message, city)
+        self.cancel(session_id, keep=key)
+        if key is not None:
+            self._speculate(session_id, key, city, state)
+        return key
+
+    def on_session_start(self, session_id: str, city: Optional[str], state: Optional[str] = None) -> None:
+        """Prefetch the hospital list of the user's profile city when the chat opens."""
+        key_city = self._city(city)
+        if self.enabled and self.ttl > 0 and key_city:
+            self._speculate(session_id, ("location", key_city), city, state)
+
+    def shutdown(self) -> int:
+        """Stop speculating and drop the queued prefetches (worker shutdown); returns how many."""
+        with self._lock:
+            self.enabled = False
+            dropped = [key for key, entry in self._entries.items()
+                       if entry.speculative and entry.future.cancel()]
+            for key in dropped:
+                del self._entries[key]
+            self._counters["cancelled"] += len(dropped)
+        # Running lookups finish on their own; nothing waits for their results
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        return len(dropped)
+
+    # ---- reporting --------------------------------------------------------
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            started = counters.get("started", 0)
+            return {
+                **counters,
+                "enabled": self.enabled,
+                "pending": self._pending,
+                "entries": len(self._entries),
+                "hit_rate": round(counters.get("hits", 0) / started, 3) if started else 0.0,
+                "waste_rate": round(counters.get("wasted", 0) / started, 3) if started else 0.0,
+            }
+
+    def clear(self) -> None:
+        """Forget cached results, e.g. after the directory is re-exported."""
+        with self._lock:
+            self._entries.clear()
+            self._sessions.clear()
+
+    def reset(self) -> None:
+        """Forget cached results and counters."""
+        with self._lock:
+            self.clear()
+            self._counters.clear()
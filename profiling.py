@@ -0,0 +1,280 @@
+# profiling.py
+"""Admin-only profiling hooks for live workers.
+
+Everything is off until asked for, so the module can stay compiled in:
+
+  POST /admin/profile/cpu?seconds=10&interval_ms=5
+      Sample every thread's stack for N seconds (capped by PROFILE_MAX_SECONDS)
+      and return folded stacks ("frame;frame;frame count" per line), the input
+      format of flamegraph.pl, speedscope and inferno. One profile at a time.
+
+  POST /admin/profile/memory/start
+      Start tracemalloc (tracing costs CPU and memory, so nothing starts it
+      implicitly).
+  POST /admin/profile/memory/snapshot?label=before
+      Keep a snapshot (at most PROFILE_MAX_SNAPSHOTS, oldest dropped); 409
+      unless tracing was started.
+  GET  /admin/profile/memory/diff?from=before&to=after&limit=25&group_by=lineno
+      Top allocators that grew between two snapshots ("to" defaults to now,
+      which needs tracing to still be on).
+  POST /admin/profile/memory/stop
+      Stop tracemalloc and drop the snapshots.
+
+  POST /admin/profile/requests?enabled=1&sample=0.1
+      Toggle per-request profiling: logs wall time and CPU time for a sample
+      of requests. Also enabled at start with PROFILE_REQUESTS=1 /
+      PROFILE_REQUEST_SAMPLE. While tracemalloc is on it also logs
+      net_alloc_bytes: the change in traced memory over the request, which is
+      allocations minus frees of the whole process, so it is attributable to
+      the request only with one request in flight per worker.
+
+The sampler is a daemon thread reading ``sys._current_frames``; it needs no
+extra package and stops by itself after the requested duration.
+"""
+import os
+import sys
+import time
+import random
+import logging
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+
+from flask import Blueprint, Response, g, jsonify, request
+
+from admin import admin_required
+
+profiling_bp = Blueprint("profiling", __name__, url_prefix="/admin/profile")
+logger = logging.getLogger(__name__)
+
+MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+MAX_SNAPSHOTS = int(os.getenv("PROFILE_MAX_SNAPSHOTS", "4"))
+TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+MAX_STACK_DEPTH = 64
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler over all threads except its own."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+    def _fold(self, frame, thread_name: str) -> str:
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            stack.append(self._frame_label(frame))
+            frame = frame.f_back
+        stack.append(thread_name)
+        return ";".join(reversed(stack))
+
+    def profile(self, seconds: float, interval: float) -> Optional[Counter]:
+        """Sample for ``seconds``; returns folded-stack counts, or None if a profile is already running."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            samples: Counter = Counter()
+            own = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident != own:
+                        samples[self._fold(frame, names.get(ident, str(ident)))] += 1
+                time.sleep(interval)
+            return samples
+        finally:
+            self._lock.release()
+
+
+sampler = SamplingProfiler()
+
+
+class MemorySnapshots:
+    """Bounded, labelled tracemalloc snapshots."""
+
+    def __init__(self, limit: int = MAX_SNAPSHOTS):
+        self.limit = limit
+        self._snapshots: "OrderedDict[str, tracemalloc.Snapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _filtered(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+        return snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ])
+
+    @staticmethod
+    def start() -> bool:
+        """Start tracing; False if it was already on."""
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        return True
+
+    def take(self, label: Optional[str] = None) -> Optional[str]:
+        """Keep a snapshot under ``label``; None if tracing is off."""
+        if not tracemalloc.is_tracing():
+            return None
+        snapshot = self._filtered(tracemalloc.take_snapshot())
+        with self._lock:
+            label = label or f"s{int(time.time())}"
+            self._snapshots.pop(label, None)
+            self._snapshots[label] = snapshot
+            while len(self._snapshots) > self.limit:
+                self._snapshots.popitem(last=False)
+        return label
+
+    def get(self, label: str) -> Optional[tracemalloc.Snapshot]:
+        with self._lock:
+            return self._snapshots.get(label)
+
+    def labels(self):
+        with self._lock:
+            return list(self._snapshots)
+
+    def diff(self, older: tracemalloc.Snapshot, newer: tracemalloc.Snapshot, group_by: str, limit: int):
+        stats = newer.compare_to(older, group_by)
+        return [
+            {
+                "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                "size_diff_kb": round(stat.size_diff / 1024, 1),
+                "size_kb": round(stat.size / 1024, 1),
+                "count_diff": stat.count_diff,
+                "count": stat.count,
+            }
+            for stat in stats[:limit]
+        ]
+
+    def stop(self) -> None:
+        with self._lock:
+            self._snapshots.clear()
+        tracemalloc.stop()
+
+
+snapshots = MemorySnapshots()
+
+# Per-request profiling settings, shared by all threads of the worker
+request_profiling = {
+    "enabled": os.getenv("PROFILE_REQUESTS", "0") == "1",
+    "sample": float(os.getenv("PROFILE_REQUEST_SAMPLE", "1.0")),
+}
+
+
+def _start_request_profile():
+    if not request_profiling["enabled"] or random.random() >= request_profiling["sample"]:
+        return
+    g.profile_started = (time.perf_counter(), time.thread_time(),
+                         tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None)
+
+
+def _finish_request_profile(response):
+    started = g.pop("profile_started", None)
+    if started is None:
+        return response
+    wall_start, cpu_start, mem_start = started
+    wall_ms = (time.perf_counter() - wall_start) * 1000
+    cpu_ms = (time.thread_time() - cpu_start) * 1000
+    path = request.url_rule.rule if request.url_rule else request.path
+    if mem_start is not None and tracemalloc.is_tracing():
+        logger.info("request_profile method=%s path=%s status=%s wall_ms=%.1f cpu_ms=%.1f net_alloc_bytes=%d",
+                    request.method, path, response.status_code, wall_ms, cpu_ms,
+                    tracemalloc.get_traced_memory()[0] - mem_start)
+    else:
+        logger.info("request_profile method=%s path=%s status=%s wall_ms=%.1f cpu_ms=%.1f",
+                    request.method, path, response.status_code, wall_ms, cpu_ms)
+    return response
+
+
+def init_request_profiling(app) -> None:
+    """Install the per-request hooks; they cost one dict lookup while disabled."""
+    app.before_request(_start_request_profile)
+    app.after_request(_finish_request_profile)
+
+
+def _float_arg(name: str, default: float) -> float:
+    try:
+        return float(request.args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@profiling_bp.route("/cpu", methods=["POST"])
+@admin_required
+def cpu_profile():
+    seconds = min(max(_float_arg("seconds", 10.0), 0.1), MAX_SECONDS)
+    interval = min(max(_float_arg("interval_ms", 5.0), 1.0), 1000.0) / 1000.0
+    logger.info(f"CPU profile requested for {seconds}s every {interval * 1000:.0f}ms")
+    samples = sampler.profile(seconds, interval)
+    if samples is None:
+        return jsonify({"error": "A CPU profile is already running"}), 409
+    body = "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+    return Response(body, mimetype="text/plain",
+                    headers={"Content-Disposition": f"attachment; filename=cpu-{os.getpid()}.folded"})
+
+
+def _not_tracing():
+    return jsonify({"error": "tracemalloc is not running; POST /admin/profile/memory/start first",
+                    "tracing": False}), 409
+
+
+@profiling_bp.route("/memory/start", methods=["POST"])
+@admin_required
+def memory_start():
+    started = snapshots.start()
+    return jsonify({"tracing": True, "started": started, "frames": tracemalloc.get_traceback_limit()})
+
+
+@profiling_bp.route("/memory/snapshot", methods=["POST"])
+@admin_required
+def memory_snapshot():
+    label = snapshots.take(request.args.get("label"))
+    if label is None:
+        return _not_tracing()
+    current, peak = tracemalloc.get_traced_memory()
+    return jsonify({"label": label, "snapshots": snapshots.labels(),
+                    "traced_kb": round(current / 1024, 1), "peak_kb": round(peak / 1024, 1)})
+
+
+@profiling_bp.route("/memory/diff", methods=["GET"])
+@admin_required
+def memory_diff():
+    group_by = request.args.get("group_by", "lineno")
+    if group_by not in ("lineno", "filename", "traceback"):
+        return jsonify({"error": "group_by must be lineno, filename or traceback"}), 400
+    older = snapshots.get(request.args.get("from", ""))
+    if older is None:
+        return jsonify({"error": "Unknown 'from' snapshot", "snapshots": snapshots.labels()}), 404
+    to_label = request.args.get("to")
+    if not to_label and not tracemalloc.is_tracing():
+        return _not_tracing()
+    newer = snapshots.get(to_label) if to_label else snapshots._filtered(tracemalloc.take_snapshot())
+    if newer is None:
+        return jsonify({"error": "Unknown 'to' snapshot", "snapshots": snapshots.labels()}), 404
+    limit = min(max(int(_float_arg("limit", 25)), 1), 200)
+    return jsonify({"from": request.args.get("from"), "to": to_label or "now",
+                    "top": snapshots.diff(older, newer, group_by, limit)})
+
+
+@profiling_bp.route("/memory/stop", methods=["POST"])
+@admin_required
+def memory_stop():
+    snapshots.stop()
+    return jsonify({"tracing": False})
+
+
+@profiling_bp.route("/requests", methods=["POST"])
+@admin_required
+def toggle_request_profiling():
+    if "enabled" in request.args:
+        request_profiling["enabled"] = request.args["enabled"] in ("1", "true", "yes")
+    if "sample" in request.args:
+        request_profiling["sample"] = min(max(_float_arg("sample", 1.0), 0.0), 1.0)
+    return jsonify({**request_profiling, "tracemalloc": tracemalloc.is_tracing()})
@@ -0,0 +1,57 @@
+# rate_limiter.py
+"""In-memory sliding-window rate limiting (per process).
+
+Used on the login path so credential stuffing is rejected before it reaches
+Cosmos. Keys are free-form strings such as "ip:1.2.3.4" or "acct:a@b.com".
+"""
+import time
+import threading
+from collections import deque
+from typing import Dict, Tuple
+
+
+class SlidingWindowLimiter:
+    def __init__(self, limit: int, window_seconds: float, max_keys: int = 100000):
+        self.limit = limit
+        self.window = window_seconds
+        self.max_keys = max_keys
+        self._hits: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, hits: deque, now: float) -> None:
+        while hits and now - hits[0] >= self.window:
+            hits.popleft()
+
+    def check(self, key: str) -> Tuple[bool, float]:
+        """Return (allowed, retry_after_seconds) without recording a hit."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return True, 0.0
+            self._prune(hits, now)
+            if len(hits) < self.limit:
+                return True, 0.0
+            return False, self.window - (now - hits[0])
+
+    def hit(self, key: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                if len(self._hits) >= self.max_keys:
+                    self._evict(now)
+                hits = self._hits[key] = deque()
+            self._prune(hits, now)
+            hits.append(now)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def _evict(self, now: float) -> None:
+        # Drop expired keys first; if still full, drop the oldest inserted ones
+        for key in [k for k, h in self._hits.items() if not h or now - h[-1] >= self.window]:
+            del self._hits[key]
+        while len(self._hits) >= self.max_keys:
+            del self._hits[next(iter(self._hits))]
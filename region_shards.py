@@ -0,0 +1,330 @@
+# region_shards.py
+"""Doctor directory sharded by region, one vector snapshot per city.
+
+A single collection makes every query score every hospital in every city, so
+latency and off-region context grow with each city onboarded. Here the
+directory is split by the hospital's city at export time. Directory
+locations read "City (Area)", e.g. "Chennai (Velachery)": the shard is the
+city's, and the area is kept under it so a query naming only the area is
+routed to its city:
+
+  SHARD_DIR/
+    regions.json       {"version", "regions": {slug: {"name", "state", "count", "areas": {area: count}}}}
+    <slug>/            a vector_snapshot directory (versions + CURRENT)
+    _other/            documents without a recognisable location
+    _all/              the whole directory, for queries with no region at all
+
+Each query is routed to the fewest shards that can answer it:
+  1. cities, areas (or states) named in the query text,
+  2. else the user's profile city, then profile state,
+  3. else ``_all``.
+When 1 or 2 yield several regions (a state, or two cities named) the shards
+are searched in turn and the results merged by score; ``_other`` is always
+searched with them. Region-less queries use ``_all`` rather than opening
+every shard, which would cost one map per region and churn the LRU.
+
+Shards are opened on first use and kept in an LRU of at most MAX_OPEN_SHARDS;
+the least recently used one is dropped (its memory map released) when a new
+one is needed. regions.json is re-read when it changes, so a re-export is
+picked up without a restart.
+
+Environment variables:
+  - VECTOR_SHARD_DIR: shard directory (default ./doctor_details_shards)
+  - VECTOR_SHARDS_MAX_OPEN: shards kept open per worker (default 16)
+
+Usage:
+  python region_shards.py export [--source ./doctor_details_db] [--out ./doctor_details_shards]
+  python region_shards.py export --from-snapshot ./doctor_details_snapshot
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from vector_snapshot import CURRENT_FILE, VectorSnapshot, write_snapshot
+from structured_log import get_logger
+
+logger = get_logger(__name__)
+
+SHARD_DIR = os.getenv("VECTOR_SHARD_DIR", "./doctor_details_shards")
+MAX_OPEN_SHARDS = int(os.getenv("VECTOR_SHARDS_MAX_OPEN", "16"))
+REGIONS_FILE = "regions.json"
+OTHER_SHARD = "_other"
+ALL_SHARD = "_all"
+
+_LOCATION_RE = re.compile(r"Hospital Location\s*:\s*([^,\n]+)", re.IGNORECASE)
+# "Kanchipuram (Uthiramerur)" -> city, area
+_AREA_RE = re.compile(r"^([^()]*?)\s*\(\s*([^()]*?)\s*\)\s*$")
+
+
+def region_slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.strip().lower()).strip("-")
+
+
+def split_location(location: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(city, area) of a location such as "Chennai (Velachery)"; area is None when it names none."""
+    location = re.sub(r"\s+", " ", location or "").strip()
+    match = _AREA_RE.match(location)
+    city, area = (match.group(1), match.group(2)) if match else (location, None)
+    return (city or area or None), (area if city and area else None)
+
+
+def normalize_city(location: Optional[str]) -> Optional[str]:
+    """The city of a location or a user's profile city ("Chennai (Velachery)" -> "Chennai")."""
+    return split_location(location)[0]
+
+
+def document_place(text: str, metadata: Optional[dict]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """(city, area, state) of a directory row, from metadata when present, else the row text."""
+    metadata = metadata or {}
+    location = metadata.get("city") or metadata.get("location") or metadata.get("hospital_location")
+    if not location:
+        match = _LOCATION_RE.search(text or "")
+        location = match.group(1) if match else None
+    city, area = split_location(location)
+    state = metadata.get("state")
+    return city, area, (state.strip() if state else None)
+
+
+def document_region(text: str, metadata: Optional[dict]) -> Tuple[Optional[str], Optional[str]]:
+    """(city, state) of a directory row."""
+    city, _, state = document_place(text, metadata)
+    return city, state
+
+
+def write_shards(embeddings, documents: List[str], metadatas: List[Optional[dict]],
+                 shard_dir: str = SHARD_DIR) -> str:
+    """Split rows by region into one snapshot each and publish regions.json. Returns its version."""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    groups: Dict[str, List[int]] = defaultdict(list)
+    names: Dict[str, Tuple[str, Optional[str]]] = {}
+    areas: Dict[str, Dict[str, int]] = defaultdict(dict)
+    for i, (text, meta) in enumerate(zip(documents, metadatas)):
+        city, area, state = document_place(text, meta)
+        slug = (region_slug(city) if city else OTHER_SHARD) or OTHER_SHARD
+        groups[slug].append(i)
+        if city and slug not in names:
+            names[slug] = (city, state)
+        if city and area:
+            areas[slug][area] = areas[slug].get(area, 0) + 1
+
+    os.makedirs(shard_dir, exist_ok=True)
+    regions, versions = {}, {}
+    versions[ALL_SHARD] = write_snapshot(vectors, documents, metadatas, os.path.join(shard_dir, ALL_SHARD))
+    for slug, rows in sorted(groups.items()):
+        versions[slug] = write_snapshot(vectors[rows], [documents[i] for i in rows],
+                                        [metadatas[i] for i in rows], os.path.join(shard_dir, slug))
+        if slug != OTHER_SHARD:
+            name, state = names[slug]
+            regions[slug] = {"name": name, "state": state, "count": len(rows),
+                             "areas": dict(sorted(areas[slug].items()))}
+
+    version = hashlib.sha256(json.dumps(versions, sort_keys=True).encode()).hexdigest()[:16]
+    index = {"version": version, "regions": regions, "other": OTHER_SHARD in groups}
+    tmp_path = os.path.join(shard_dir, f".{REGIONS_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(index, fh, indent=2)
+    os.replace(tmp_path, os.path.join(shard_dir, REGIONS_FILE))
+    logger.info("region_shards_written", version=version, regions=len(regions), documents=len(documents))
+    return version
+
+
+def export_shards(source_dir: str = "./doctor_details_db", shard_dir: str = SHARD_DIR,
+                  from_snapshot: Optional[str] = None) -> str:
+    """Shard the persisted Chroma collection (or an existing vector snapshot)."""
+    if from_snapshot:
+        with open(os.path.join(from_snapshot, CURRENT_FILE), encoding="utf-8") as fh:
+            snapshot = VectorSnapshot(os.path.join(from_snapshot, fh.read().strip()))
+        docs = snapshot.documents()
+        return write_shards(np.asarray(snapshot.vectors), [d.page_content for d in docs],
+                            [d.metadata for d in docs], shard_dir)
+
+    from langchain_chroma import Chroma
+
+    db = Chroma(persist_directory=source_dir)
+    data = db.get(include=["embeddings", "documents", "metadatas"])
+    return write_shards(data["embeddings"], data["documents"], data["metadatas"], shard_dir)
+
+
+class RegionIndex:
+    """regions.json plus a matcher for region (city, area or state) names mentioned in free text."""
+
+    def __init__(self, data: dict):
+        self.version = data.get("version")
+        self.regions: Dict[str, dict] = data.get("regions", {})
+        self.has_other = bool(data.get("other"))
+        self._by_state: Dict[str, List[str]] = defaultdict(list)
+        for slug, info in self.regions.items():
+            if info.get("state"):
+                self._by_state[info["state"].lower()].append(slug)
+        names = {info["name"].lower(): [slug] for slug, info in self.regions.items()}
+        names.update({state: slugs for state, slugs in self._by_state.items() if state not in names})
+        # An area routes to its city unless it is also a city or state name
+        for slug, info in self.regions.items():
+            for area in info.get("areas", {}):
+                names.setdefault(area.lower(), [slug])
+        self._names = names
+        # Longest names first so "New Delhi" wins over "Delhi". Names may end in
+        # punctuation ("T. Nagar"), where \b would need a word character after
+        # them, so they are delimited by "no letter or digit" on either side.
+        pattern = "|".join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+        self._mention_re = (re.compile(rf"(?<![a-z0-9])(?:{pattern})(?![a-z0-9])", re.IGNORECASE)
+                            if pattern else None)
+
+    def mentioned(self, text: str) -> List[str]:
+        if not self._mention_re or not text:
+            return []
+        slugs: List[str] = []
+        for match in self._mention_re.finditer(text):
+            for slug in self._names[match.group(0).lower()]:
+                if slug not in slugs:
+                    slugs.append(slug)
+        return slugs
+
+    def for_profile(self, city: Optional[str], state: Optional[str]) -> List[str]:
+        city, area = split_location(city)
+        for name in (city, area):
+            if name and region_slug(name) in self.regions:
+                return [region_slug(name)]
+            if name and name.lower() in self._names:
+                return list(self._names[name.lower()])
+        if state:
+            return list(self._by_state.get(state.strip().lower(), []))
+        return []
+
+
+class ShardedRetriever(BaseRetriever):
+    """Retriever over region shards; pass ``city``/``state`` to invoke() for the user's profile.
+
+    ``retriever.invoke(query, city="Chennai", state="Tamil Nadu")``
+    """
+
+    embeddings: Any
+    shard_dir: str = SHARD_DIR
+    k: int = 20
+    max_open: int = MAX_OPEN_SHARDS
+    reload_interval: float = 5.0
+
+    _index: Optional[RegionIndex] = None
+    _index_mtime: float = 0.0
+    _checked_at: float = 0.0
+    _open: Any = None
+    _lock: Any = None
+    _stats: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._open = OrderedDict()
+        self._stats = defaultdict(int)
+        self._maybe_reload(force=True)
+
+    def _maybe_reload(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return
+        path = os.path.join(self.shard_dir, REGIONS_FILE)
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(path)
+                if self._index is not None and mtime == self._index_mtime:
+                    return
+                with open(path, encoding="utf-8") as fh:
+                    index = RegionIndex(json.load(fh))
+            except FileNotFoundError:
+                return
+            except (OSError, ValueError):
+                logger.exception("region_index_read_failed", path=path)
+                return
+            if self._index is None or index.version != self._index.version:
+                # Shards are re-opened lazily at the new version
+                self._open.clear()
+                logger.info("region_shards_serving", version=index.version, regions=len(index.regions))
+            self._index, self._index_mtime = index, mtime
+
+    def _shard(self, slug: str) -> Optional[VectorSnapshot]:
+        with self._lock:
+            snapshot = self._open.get(slug)
+            if snapshot is not None:
+                self._open.move_to_end(slug)
+                return snapshot
+        path = os.path.join(self.shard_dir, slug)
+        try:
+            with open(os.path.join(path, CURRENT_FILE), encoding="utf-8") as fh:
+                snapshot = VectorSnapshot(os.path.join(path, fh.read().strip()))
+        except (OSError, ValueError) as e:
+            logger.warning("region_shard_unavailable", shard=slug, error=str(e))
+            return None
+        with self._lock:
+            self._stats["shard_opens"] += 1
+            self._open[slug] = snapshot
+            self._open.move_to_end(slug)
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+                self._stats["shard_evictions"] += 1
+        return snapshot
+
+    def route(self, query: str, city: Optional[str] = None, state: Optional[str] = None) -> List[str]:
+        """Shards to search for ``query``; the whole directory when nothing narrows it down."""
+        self._maybe_reload()
+        index = self._index
+        if index is None:
+            raise RuntimeError(f"No region shards found in {self.shard_dir}; run `python region_shards.py export`")
+        slugs = index.mentioned(query) or index.for_profile(city, state)
+        if not slugs:
+            self._stats["global"] += 1
+            return [ALL_SHARD]
+        self._stats["routed" if len(slugs) == 1 else "merged"] += 1
+        if index.has_other:
+            slugs.append(OTHER_SHARD)
+        return slugs
+
+    def search(self, query_vector: List[float], slugs: Iterable[str]) -> List[Document]:
+        results: List[Tuple[float, Document]] = []
+        for slug in slugs:
+            shard = self._shard(slug)
+            if shard is not None:
+                results.extend(shard.search_with_scores(query_vector, self.k))
+        results.sort(key=lambda pair: pair[0], reverse=True)
+        return [doc for _, doc in results[:self.k]]
+
+    def all_documents(self) -> List[Document]:
+        """Every document of the directory (the ``_all`` shard)."""
+        self._maybe_reload()
+        shard = self._shard(ALL_SHARD)
+        return shard.documents() if shard is not None else []
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "open_shards": len(self._open)}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                city: Optional[str] = None, state: Optional[str] = None) -> List[Document]:
+        slugs = self.route(query, city, state)
+        return self.search(self.embeddings.embed_query(query), slugs)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Region-sharded doctor directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export")
+    export_cmd.add_argument("--source", default="./doctor_details_db")
+    export_cmd.add_argument("--from-snapshot", default=None, help="shard a vector_snapshot directory instead")
+    export_cmd.add_argument("--out", default=SHARD_DIR)
+    args = parser.parse_args()
+
+    print(export_shards(args.source, args.out, args.from_snapshot))
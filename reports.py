@@ -0,0 +1,263 @@
+# reports.py
+"""Streaming exports and aggregate reports for the ops team.
+
+Nothing here materializes a collection: exports iterate a projected, sorted
+cursor in fixed-size batches and stream NDJSON/CSV rows as they arrive, and
+reports are computed server-side with aggregation pipelines.
+
+Incremental exports use a ``date``/``time`` watermark (the fields written by
+db_utils). Each export response carries ``X-Export-Watermark``; pass it back
+as ``since`` to fetch only records written after it. Those fields have
+one-second resolution, so an export without ``until`` ends at the last
+complete second: a record written later in the current second is left for
+the next export instead of falling between the two.
+"""
+import csv
+import io
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+from admin import admin_required
+import db_utils
+import token_usage
+
+reports_bp = Blueprint("reports", __name__, url_prefix="/admin")
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 500
+
+# Exportable collections and their default column sets
+EXPORTS = {
+    "appointments": (
+        "patient_information_details_table_collection",
+        ["username", "phone_number", "mail", "location", "hospital_name", "specialization",
+         "appointment_booking_date", "appointment_booking_time", "appointment_status", "date", "time"],
+    ),
+    "chats": (
+        "patient_chat_table_collection",
+        ["patient_name", "chat_history", "date", "time"],
+    ),
+}
+
+# Fields an appointments report may be grouped by
+APPOINTMENT_GROUPS = {
+    "status": "$appointment_status",
+    "hospital": "$hospital_name",
+    "location": "$location",
+    "specialization": "$specialization",
+    "date": "$date",
+    "booking_date": "$appointment_booking_date",
+}
+
+# Fields a token report may be grouped by (token_usage.py)
+TOKEN_GROUPS = {
+    "session": "$session_id",
+    "user": "$user",
+    "node": "$node",
+    "day": "$day",
+}
+
+
+def parse_watermark(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Parse ``YYYY-MM-DD[ HH:MM:SS]`` / ISO input into the (date, time) strings stored in Mongo."""
+    if not value:
+        return None
+    value = value.strip().replace("T", " ")
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            parsed = datetime.strptime(value[:19], fmt)
+            return parsed.strftime("%Y-%m-%d"), parsed.strftime("%H:%M:%S")
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid watermark: {value!r}")
+
+
+def watermark_filter(since: Optional[Tuple[str, str]], until: Optional[Tuple[str, str]]) -> Dict:
+    """Mongo filter for records with since < (date, time) <= until."""
+    clauses: List[Dict] = []
+    if since:
+        clauses.append({"$or": [{"date": {"$gt": since[0]}},
+                                {"date": since[0], "time": {"$gt": since[1]}}]})
+    if until:
+        clauses.append({"$or": [{"date": {"$lt": until[0]}},
+                                {"date": until[0], "time": {"$lte": until[1]}}]})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def iter_export(collection, fields: List[str], since=None, until=None,
+                batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Dict]:
+    """Yield projected documents in watermark order, fetching ``batch_size`` at a time."""
+    projection = {field: 1 for field in fields}
+    cursor = (collection.find(watermark_filter(since, until), projection)
+              .sort([("date", 1), ("time", 1), ("_id", 1)])
+              .batch_size(batch_size))
+    try:
+        for doc in cursor:
+            doc["_id"] = str(doc["_id"])
+            yield doc
+    finally:
+        cursor.close()
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str, ensure_ascii=False)
+    return str(value)
+
+
+def ndjson_lines(docs: Iterator[Dict]) -> Iterator[str]:
+    for doc in docs:
+        yield json.dumps(doc, default=str, ensure_ascii=False) + "\n"
+
+
+def csv_lines(docs: Iterator[Dict], fields: List[str]) -> Iterator[str]:
+    columns = ["_id"] + fields
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for doc in docs:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([_cell(doc.get(column)) for column in columns])
+        yield buffer.getvalue()
+
+
+def appointment_report(group_by: str, since=None, until=None, limit: int = 100) -> List[Dict]:
+    """Count appointments per ``group_by`` value, largest groups first."""
+    pipeline = [
+        {"$match": watermark_filter(since, until)},
+        {"$group": {"_id": APPOINTMENT_GROUPS[group_by], "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ]
+    rows = db_utils.patient_information_details_table_collection.aggregate(pipeline)
+    return [{group_by: row["_id"], "count": row["count"]} for row in rows]
+
+
+def funnel_report(since=None, until=None) -> Dict:
+    """Booking funnel: conversations that reached booking, then appointments by status."""
+    match = {"$match": watermark_filter(since, until)}
+    count_stage = {"$group": {"_id": None, "count": {"$sum": 1}}}
+    chats = list(db_utils.patient_chat_table_collection.aggregate([match, count_stage]))
+    statuses = db_utils.patient_information_details_table_collection.aggregate([
+        match,
+        {"$group": {"_id": {"$toLower": {"$ifNull": ["$appointment_status", "unknown"]}}, "count": {"$sum": 1}}},
+    ])
+    by_status = {row["_id"]: row["count"] for row in statuses}
+    return {
+        "booking_conversations": chats[0]["count"] if chats else 0,
+        "appointments": sum(by_status.values()),
+        "appointments_by_status": by_status,
+    }
+
+
+def token_report(group_by: str, since_day: Optional[str] = None, until_day: Optional[str] = None,
+                 limit: int = 100) -> Dict:
+    """LLM calls, tokens and estimated cost per ``group_by`` value over UTC days, largest first."""
+    days = {}
+    if since_day:
+        days["$gte"] = since_day
+    if until_day:
+        days["$lte"] = until_day
+    pipeline = [
+        {"$match": {"day": days} if days else {}},
+        {"$group": {"_id": {"$ifNull": [TOKEN_GROUPS[group_by], "unknown"]},
+                    **{name: {"$sum": f"${name}"} for name in token_usage.COUNTERS}}},
+        {"$addFields": {"tokens": {"$add": ["$input_tokens", "$output_tokens"]}}},
+        {"$sort": {"tokens": -1}},
+    ]
+    rows = []
+    for row in token_usage.usage_collection.aggregate(pipeline):
+        key = row.pop("_id")
+        rows.append({group_by: key, **row, "cost_usd": round(token_usage.cost(row), 6)})
+    totals = {name: sum(row[name] for row in rows) for name in token_usage.COUNTERS + ("tokens",)}
+    totals["cost_usd"] = round(token_usage.cost(totals), 6)
+    return {"rows": rows[:limit], "groups": len(rows), "totals": totals}
+
+
+def _window_args() -> Tuple[Optional[Tuple[str, str]], Tuple[str, str]]:
+    since = parse_watermark(request.args.get("since"))
+    # Pin the upper bound up front so the watermark we hand back is exact; the current second is
+    # still being written to, so it belongs to the next export
+    until = parse_watermark(request.args.get("until")) or parse_watermark(
+        (datetime.now() - timedelta(seconds=1)).strftime("%Y-%m-%d %H:%M:%S"))
+    return since, until
+
+
+@reports_bp.route("/export/<name>", methods=["GET"])
+@admin_required
+def export(name):
+    if name not in EXPORTS:
+        return jsonify({"error": f"Unknown export {name!r}", "available": sorted(EXPORTS)}), 404
+    try:
+        since, until = _window_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    attr, default_fields = EXPORTS[name]
+    fields = [f for f in request.args.get("fields", "").split(",") if f] or default_fields
+    fmt = request.args.get("format", "ndjson").lower()
+    docs = iter_export(getattr(db_utils, attr), fields, since, until)
+
+    if fmt == "csv":
+        body, mimetype = csv_lines(docs, fields), "text/csv"
+    elif fmt == "ndjson":
+        body, mimetype = ndjson_lines(docs), "application/x-ndjson"
+    else:
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+
+    logger.info(f"Streaming {name} export ({fmt}) since={since} until={until}")
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers["X-Export-Watermark"] = f"{until[0]} {until[1]}"
+    response.headers["Content-Disposition"] = f"attachment; filename={name}.{'csv' if fmt == 'csv' else 'ndjson'}"
+    return response
+
+
+@reports_bp.route("/reports/appointments", methods=["GET"])
+@admin_required
+def appointments_report():
+    group_by = request.args.get("group_by", "status")
+    if group_by not in APPOINTMENT_GROUPS:
+        return jsonify({"error": f"group_by must be one of {sorted(APPOINTMENT_GROUPS)}"}), 400
+    try:
+        since, until = _window_args()
+        limit = min(int(request.args.get("limit", 100)), 1000)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"group_by": group_by, "rows": appointment_report(group_by, since, until, limit)})
+
+
+@reports_bp.route("/reports/funnel", methods=["GET"])
+@admin_required
+def booking_funnel_report():
+    try:
+        since, until = _window_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(funnel_report(since, until))
+
+
+@reports_bp.route("/reports/tokens", methods=["GET"])
+@admin_required
+def tokens_report():
+    group_by = request.args.get("group_by", "session")
+    if group_by not in TOKEN_GROUPS:
+        return jsonify({"error": f"group_by must be one of {sorted(TOKEN_GROUPS)}"}), 400
+    try:
+        since, until = parse_watermark(request.args.get("since")), parse_watermark(request.args.get("until"))
+        limit = min(int(request.args.get("limit", 100)), 1000)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # This worker's unflushed calls; other workers' appear after their next flush
+    token_usage.ledger.flush()
+    report = token_report(group_by, since and since[0], until and until[0], limit)
+    return jsonify({"group_by": group_by, "prices_per_million": token_usage.PRICES, **report})
@@ -9,6 +9,7 @@ from langchain.retrievers.document_compressors import LLMChainFilter
 from langchain_community.retrievers import BM25Retriever
 from langchain_openai import AzureOpenAIEmbeddings
 from model import llm_model
+from llm_replay import replay_embeddings
 import os
 
 llm = llm_model()
@@ -19,20 +20,62 @@ llm = llm_model()
 # embedding_azure_endpoint = os.environ["embedding_azure_endpoint"]
 # embedding_api_key = os.environ["embedding_api_key"]
 
-def retriever_model():
+def embedding_model():
+    """
+    Query embeddings for the doctor directory.
+
+    EMBEDDING_BACKEND selects them per deployment:
+      - "azure" (default): text-embedding-3-small through Azure OpenAI
+      - "onnx": a local CPU model (local_embeddings.py); the directory must be
+        re-embedded with it by `python local_embeddings.py reembed`
+    """
+    if os.getenv("EMBEDDING_BACKEND", "azure").lower() == "onnx":
+        from local_embeddings import OnnxEmbeddings
+        # Local and deterministic, so nothing to record or replay
+        return OnnxEmbeddings()
 
-    # Initialize embeddings
     embeddings = AzureOpenAIEmbeddings(
         model="text-embedding-3-small",
-        azure_deployment="call-automation-openai-text-embedding-3-small",
-        api_version="2023-05-15",
-        azure_endpoint="https://call-automation-openai.openai.azure.com/",
-        api_key="FsUF4JAg0SbHFchYIFNjxIEUPOmnt9i5uA6UMcf49TrPk7qFbrphJQQJ99BDACYeBjFXJ3w3AAABACOGX1Nm",
+        azure_deployment=os.getenv("embedding_deployment_name", "call-automation-openai-text-embedding-3-small"),
+        api_version=os.getenv("embedding_api_version", "2023-05-15"),
+        azure_endpoint=os.getenv("embedding_azure_endpoint", "https://call-automation-openai.openai.azure.com/"),
+        api_key=os.getenv("embedding_api_key", "FsUF4JAg0SbHFchYIFNjxIEUPOmnt9i5uA6UMcf49TrPk7qFbrphJQQJ99BDACYeBjFXJ3w3AAABACOGX1Nm"),
+        # "0" sends raw text instead of tiktoken ids; queries are far below the context limit
+        check_embedding_ctx_length=os.getenv("embedding_check_ctx_length", "1") == "1",
     )
+    return replay_embeddings(embeddings, model="text-embedding-3-small")
+
+
+def retriever_model():
+    """
+    Build the doctor details retriever.
+
+    RETRIEVER_BACKEND selects the store:
+      - "chroma" (default): open the persisted Chroma collection in this process
+      - "snapshot": serve from the memory-mapped snapshot written by
+        `python vector_snapshot.py export`, shared across gunicorn workers
+      - "sharded": one snapshot per city written by `python region_shards.py export`,
+        queries routed to the user's or the mentioned region
+    The query embeddings come from embedding_model() and must match the ones
+    the store was built with.
+    """
+
+    # Initialize embeddings
+    embeddings = embedding_model()
+
+    backend = os.getenv("RETRIEVER_BACKEND", "chroma").lower()
+    # The directories are read here, not when the modules were first imported
+    if backend == "snapshot":
+        from vector_snapshot import SNAPSHOT_DIR, SnapshotRetriever
+        return SnapshotRetriever(embeddings=embeddings, k=20,
+                                 snapshot_dir=os.getenv("VECTOR_SNAPSHOT_DIR", SNAPSHOT_DIR))
+    if backend == "sharded":
+        from region_shards import SHARD_DIR, ShardedRetriever
+        return ShardedRetriever(embeddings=embeddings, k=20, shard_dir=os.getenv("VECTOR_SHARD_DIR", SHARD_DIR))
 
     # Load vector DB retriever
     db = Chroma(
-        persist_directory="./doctor_details_db",
+        persist_directory=os.getenv("CHROMA_DIR", "./doctor_details_db"),
         embedding_function=embeddings
     )
 
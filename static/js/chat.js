@@ -0,0 +1,483 @@
+// DOM Elements
+const userInput = document.getElementById("user-input");
+const chatBox = document.getElementById("chat-box");
+const micButton = document.getElementById("micButton");
+const voiceToggle = document.getElementById("toggle-voice");
+
+// App State
+let voiceEnabled = true;
+let recognizing = false;
+const SpeechRecognition = window.SpeechRecognition || window.webkitSpeechRecognition;
+if (!SpeechRecognition) {
+    console.warn("Speech recognition not supported in this browser.");
+    micButton.style.display = "none";
+}
+const recognition = SpeechRecognition ? new SpeechRecognition() : null;
+
+// Initialize Speech Recognition
+if (recognition) {
+    recognition.lang = "en-US";
+    recognition.interimResults = true;
+    recognition.maxAlternatives = 1;
+
+    recognition.onstart = () => {
+        recognizing = true;
+        micButton.innerHTML = `
+            <svg xmlns="http://www.w3.org/2000/svg" width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="#dc2626" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
+                <circle cx="12" cy="12" r="10"></circle>
+                <circle cx="12" cy="12" r="4"></circle>
+                <line x1="12" y1="8" x2="12" y2="12"></line>
+                <line x1="12" y1="16" x2="12" y2="16"></line>
+            </svg>
+        `;
+        micButton.title = "Listening... Click to stop";
+        micButton.classList.add("active");
+    };
+
+    recognition.onend = () => {
+        recognizing = false;
+        micButton.innerHTML = `
+            <svg xmlns="http://www.w3.org/2000/svg" width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
+                <path d="M12 1a3 3 0 0 0-3 3v8a3 3 0 0 0 6 0V4a3 3 0 0 0-3-3z"></path>
+                <path d="M19 10v2a7 7 0 0 1-14 0v-2"></path>
+                <line x1="12" y1="19" x2="12" y2="23"></line>
+                <line x1="8" y1="23" x2="16" y2="23"></line>
+            </svg>
+        `;
+        micButton.title = "Voice input";
+        micButton.classList.remove("active");
+    };
+
+    recognition.onresult = (event) => {
+        const result = event.results[event.results.length - 1];
+        const transcript = result[0].transcript.trim();
+        if (!transcript) return;
+        if (!result.isFinal) {
+            // Interim transcript: show it while the user speaks
+            userInput.value = transcript;
+            chatSocket.send({ type: "partial", text: transcript });
+            return;
+        }
+        userInput.value = "";
+        // Stop any ongoing speech before processing new input
+        stopSpeaking();
+        appendMessage("user", transcript);
+        fetchBotResponse(transcript);
+    };
+
+    recognition.onerror = (event) => {
+        console.error("Speech recognition error", event.error);
+        appendMessage("bot", "Sorry, I couldn't understand your voice input. Please try typing instead.");
+    };
+} else {
+    console.warn("Speech recognition not supported in this browser");
+    micButton.style.display = "none";
+}
+
+// Message Functions
+async function sendMessage() {
+    const message = userInput.value.trim();
+    if (!message) return;
+
+    // Stop any ongoing speech before sending new message
+    stopSpeaking();
+
+    appendMessage("user", message);
+    userInput.value = "";
+    await fetchBotResponse(message);
+}
+
+
+// Persistent chat channel (ws_chat.py): streamed replies and session pings on one
+// connection; falls back to HTTP POST while it is not connected.
+const chatSocket = {
+    ws: null,
+    retryDelay: 1000,
+    pending: null,  // {resolve, bubble, text} for the turn in flight
+
+    isOpen() {
+        return this.ws && this.ws.readyState === WebSocket.OPEN;
+    },
+
+    connect() {
+        if (!("WebSocket" in window)) return;
+        const scheme = window.location.protocol === "https:" ? "wss" : "ws";
+        this.ws = new WebSocket(`${scheme}://${window.location.host}/ws/chat/${sessionId}`);
+        this.ws.onopen = () => { this.retryDelay = 1000; };
+        this.ws.onmessage = (event) => this.onEvent(JSON.parse(event.data));
+        this.ws.onclose = (event) => {
+            if (this.pending) {
+                this.pending.resolve(null);
+                this.pending = null;
+            }
+            if (event.code === 4401) {
+                sessionExpired();
+                return;
+            }
+            setTimeout(() => this.connect(), this.retryDelay);
+            this.retryDelay = Math.min(this.retryDelay * 2, 30000);
+        };
+    },
+
+    send(payload) {
+        if (this.isOpen()) this.ws.send(JSON.stringify(payload));
+    },
+
+    ask(message) {
+        return new Promise((resolve) => {
+            this.pending = { resolve, bubble: null, text: "" };
+            this.send({ type: "message", text: message });
+        });
+    },
+
+    onEvent(event) {
+        const turn = this.pending;
+        if (event.type === "token" && turn) {
+            if (!turn.bubble) {
+                removeTypingIndicator();
+                turn.bubble = startBotMessage();
+            }
+            turn.text += event.text;
+            turn.bubble.textContent = turn.text;
+            scrollToBottom();
+        } else if (event.type === "done" && turn) {
+            this.pending = null;
+            turn.resolve({ bubble: turn.bubble, text: event.text });
+        } else if (event.type === "pong" && !event.valid) {
+            sessionExpired();
+        } else if (event.type === "error") {
+            console.error("Chat channel error:", event.text);
+        }
+    }
+};
+
+function startBotMessage() {
+    const messageContainer = document.createElement("div");
+    messageContainer.className = "message-container bot-message";
+    const avatar = document.createElement("img");
+    avatar.className = "message-avatar";
+    avatar.src = AVATARS.bot;
+    avatar.alt = "Azentyk avatar";
+    avatar.loading = "lazy";
+    const content = document.createElement("div");
+    content.className = "message-content";
+    messageContainer.appendChild(avatar);
+    messageContainer.appendChild(content);
+    chatBox.appendChild(messageContainer);
+    return content;
+}
+
+async function fetchBotResponse(message) {
+    if (chatSocket.isOpen()) {
+        showTypingIndicator();
+        const reply = await chatSocket.ask(message);
+        if (reply) {
+            removeTypingIndicator();
+            if (reply.bubble) {
+                reply.bubble.innerHTML = formatBotResponse(reply.text);
+                if (voiceEnabled) speakBotResponse(stripHtml(reply.bubble.innerHTML));
+                scrollToBottom();
+            } else {
+                appendMessage("bot", formatBotResponse(reply.text));
+            }
+            return;
+        }
+        // The connection dropped mid-turn: fall through to HTTP
+    }
+    try {
+        showTypingIndicator();
+        const response = await fetch(`/chat/${sessionId}`, {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ user_input: message })
+            });
+
+        // 503: the server is busy and did not take the message; its reply asks to resend it
+        if (!response.ok && response.status !== 503) throw new Error("Network response was not ok");
+
+        const data = await response.json();
+        removeTypingIndicator();
+        appendMessage("bot", formatBotResponse(data.response));
+    } catch (error) {
+        console.error("Error:", error);
+        removeTypingIndicator();
+        appendMessage("bot", "Sorry, I'm having trouble responding. Please try again later.");
+    }
+}
+
+
+function formatBotResponse(text) {
+    let formattedText = text;
+
+    // Handle bold first
+    formattedText = formattedText.replace(/\*\*(.*?)\*\*/g, "<strong>$1</strong>");
+    // Handle italic
+    formattedText = formattedText.replace(/\*(.*?)\*/g, "<em>$1</em>");
+
+    // Ordered lists: convert "1. item" into <li>
+    formattedText = formattedText.replace(/^\s*\d+\.\s(.+)$/gm, "<li>$1</li>");
+    // Unordered lists: convert "- item" or "* item" into <li>
+    formattedText = formattedText.replace(/^\s*[-*]\s(.+)$/gm, "<li>$1</li>");
+
+    // Wrap consecutive <li> items into <ol> or <ul>
+    // First handle ordered lists
+    formattedText = formattedText.replace(/(<li>.*<\/li>)+/g, match => {
+        // If the list started with a number, wrap in <ol>
+        return /^\s*\d+\./.test(text) ? `<ol>${match}</ol>` : `<ul>${match}</ul>`;
+    });
+
+    // Convert double line breaks to paragraphs (but don’t wrap list blocks)
+    formattedText = formattedText.split(/\n\s*\n/).map(paragraph => {
+        if (!paragraph.match(/^<ul>|^<ol>|^<li>/)) {
+            return `<p>${paragraph}</p>`;
+        }
+        return paragraph;
+    }).join('');
+
+    return formattedText;
+}
+
+
+function appendMessage(sender, text, speak = true) {
+    const messageContainer = document.createElement("div");
+    messageContainer.className = `message-container ${sender}-message`;
+
+    const avatar = document.createElement("img");
+    avatar.className = "message-avatar";
+    avatar.src = sender === "user" ? AVATARS.user : AVATARS.bot;
+    avatar.alt = sender === "user" ? "User avatar" : "Azentyk avatar";
+    avatar.loading = "lazy";
+
+    const content = document.createElement("div");
+    content.className = "message-content";
+    content.innerHTML = sender === "bot" ? text : escapeHtml(text);
+
+    if (sender === "user") {
+        messageContainer.appendChild(content);
+        messageContainer.appendChild(avatar);
+    } else {
+        messageContainer.appendChild(avatar);
+        messageContainer.appendChild(content);
+
+        if (voiceEnabled && speak) {
+            speakBotResponse(stripHtml(text));
+        }
+    }
+
+    chatBox.appendChild(messageContainer);
+    scrollToBottom();
+}
+
+function showTypingIndicator() {
+    const typingIndicator = document.createElement("div");
+    typingIndicator.id = "typing-indicator";
+    typingIndicator.className = "message-container ai-message";
+
+    const avatar = document.createElement("img");
+    avatar.className = "message-avatar";
+    avatar.src = AVATARS.bot;
+    avatar.alt = "Azentyk avatar";
+    avatar.loading = "lazy";
+
+    const content = document.createElement("div");
+    content.className = "message-content";
+    content.innerHTML = '<div class="typing-dots"><div class="typing-dot"></div><div class="typing-dot"></div><div class="typing-dot"></div></div>';
+
+    typingIndicator.appendChild(avatar);
+    typingIndicator.appendChild(content);
+    chatBox.appendChild(typingIndicator);
+    scrollToBottom();
+}
+
+function removeTypingIndicator() {
+    const indicator = document.getElementById("typing-indicator");
+    if (indicator) indicator.remove();
+}
+
+function scrollToBottom() {
+    chatBox.scrollTop = chatBox.scrollHeight;
+}
+
+// Voice Functions
+function toggleVoice() {
+    voiceEnabled = !voiceEnabled;
+    voiceToggle.classList.toggle("active", voiceEnabled);
+    voiceToggle.innerHTML = `
+        <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
+            <path d="M12 1a3 3 0 0 0-3 3v8a3 3 0 0 0 6 0V4a3 3 0 0 0-3-3z"></path>
+            <path d="M19 10v2a7 7 0 0 1-14 0v-2"></path>
+            <line x1="12" y1="19" x2="12" y2="23"></line>
+            <line x1="8" y1="23" x2="16" y2="23"></line>
+        </svg>
+        ${voiceEnabled ? "Voice On" : "Voice Off"}
+    `;
+
+    if (!voiceEnabled) {
+        stopSpeaking();
+    }
+}
+
+function speakBotResponse(text) {
+    if (!voiceEnabled || !text) return;
+
+    if ('speechSynthesis' in window) {
+        // Clean up text for speech (remove HTML tags, etc.)
+        const cleanText = stripHtml(text)
+            .replace(/\*/g, '') // Remove markdown asterisks
+            .replace(/#/g, '') // Remove markdown headers
+            .replace(/\[(.*?)\]\(.*?\)/g, '$1'); // Remove markdown links
+
+        const utterance = new SpeechSynthesisUtterance(cleanText);
+        utterance.lang = 'en-US';
+        utterance.pitch = 1;
+        utterance.rate = 0.9;
+        utterance.volume = 1;
+
+        // Cancel any ongoing speech before starting new one
+        window.speechSynthesis.cancel();
+        window.speechSynthesis.speak(utterance);
+    }
+}
+
+function stopSpeaking() {
+    if ('speechSynthesis' in window) {
+        window.speechSynthesis.cancel();
+    }
+}
+
+function toggleMic() {
+    if (!recognition) {
+        appendMessage("bot", "Voice input is not supported in your browser. Please use the text input.");
+        return;
+    }
+
+    if (recognizing) {
+        recognition.stop();
+    } else {
+        recognition.start();
+    }
+}
+
+// Logout handler
+function handleLogout() {
+    // Stop any ongoing speech when logging out
+    stopSpeaking();
+
+    // If you need to perform any other cleanup before logout, do it here
+    // The page will then proceed with the logout action
+}
+
+// Utility Functions
+function stripHtml(html) {
+    const div = document.createElement("div");
+    div.innerHTML = html;
+    return div.textContent || div.innerText || "";
+}
+
+function escapeHtml(text) {
+    const div = document.createElement("div");
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function handleKeyPress(event) {
+    if (event.key === "Enter" && !event.shiftKey) {
+        event.preventDefault();
+        sendMessage();
+    }
+
+    // Auto-resize textarea
+    if (event.key === "Enter" || event.key === "Backspace") {
+        userInput.style.height = "auto";
+        userInput.style.height = (userInput.scrollHeight) + "px";
+    }
+}
+
+// Initialize the app
+window.onload = function() {
+    // Auto-focus input
+    userInput.focus();
+
+    // Auto-resize textarea
+    userInput.addEventListener("input", function() {
+        this.style.height = "auto";
+        this.style.height = (this.scrollHeight) + "px";
+    });
+
+    restoreConversation();
+    chatSocket.connect();
+};
+
+// Show the conversation so far (a reload or reconnect keeps earlier turns); the
+// server-rendered greeting is the fallback when the history cannot be loaded.
+async function restoreConversation() {
+    const greetingText = document.getElementById("initial-greeting").textContent.trim();
+    let messages = [];
+    try {
+        const response = await fetch(`/chat/${sessionId}/history`, { credentials: "same-origin" });
+        if (response.ok) {
+            messages = (await response.json()).messages || [];
+        }
+    } catch (error) {
+        console.error("Could not load chat history:", error);
+    }
+
+    if (messages.length === 0) {
+        if (greetingText) {
+            appendMessage("bot", formatBotResponse(greetingText));
+        }
+        return;
+    }
+    // Only a brand-new conversation (just the greeting) is read aloud
+    const isNew = messages.length === 1;
+    for (const message of messages) {
+        if (message.role === "user") {
+            appendMessage("user", message.text, false);
+        } else if (message.role === "assistant") {
+            appendMessage("bot", formatBotResponse(message.text), isNew);
+        }
+    }
+}
+
+function sessionExpired() {
+    alert("Your session has expired. Please log in again.");
+    window.location.href = "/login";
+}
+
+// Stop speaking when page is unloaded (including logout)
+window.addEventListener('beforeunload', function() {
+    stopSpeaking();
+});
+
+// ✅ Check if session is still valid (a ping on the chat channel when connected)
+async function checkSession() {
+    if (chatSocket.isOpen()) {
+        chatSocket.send({ type: "ping" });
+        return;
+    }
+    try {
+        const response = await fetch("/check-session", {
+            method: "GET",
+            headers: { "Content-Type": "application/json" },
+            credentials: "include"  // ensure cookies/session are sent
+        });
+
+        if (!response.ok) {
+            throw new Error("Session validation request failed");
+        }
+
+        const data = await response.json();
+
+        if (!data.valid) {
+            sessionExpired();
+        }
+    } catch (error) {
+        console.error("Session check failed:", error);
+    }
+}
+
+// ✅ Check immediately when the page loads
+window.addEventListener("load", checkSession);
+
+// ✅ Check periodically (every minute; also keeps the chat channel alive through proxies)
+setInterval(checkSession, 60000);
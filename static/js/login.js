@@ -0,0 +1,47 @@
+// Client-side validation for email format
+document.querySelector('form').addEventListener('submit', function(e) {
+    const emailInput = document.getElementById('email');
+    const emailRegex = /^[^\s@]+@[^\s@]+\.[^\s@]+$/;
+
+    if (!emailRegex.test(emailInput.value)) {
+        e.preventDefault();
+        const errorDiv = document.createElement('div');
+        errorDiv.className = 'error-message';
+        errorDiv.innerHTML = '<i class="fas fa-exclamation-circle"></i> Please enter a valid email address';
+
+        // Remove any existing error message
+        const existingError = document.querySelector('.error-message');
+        if (existingError) {
+            existingError.remove();
+        }
+
+        // Insert the error message
+        const firstFormGroup = document.querySelector('.form-group');
+        firstFormGroup.insertAdjacentElement('beforebegin', errorDiv);
+
+        // Add focus to the email field with a slight animation
+        emailInput.focus();
+        emailInput.parentElement.style.borderColor = 'var(--error-color)';
+
+        // Remove the error styling when user starts typing
+        emailInput.addEventListener('input', function() {
+            if (emailRegex.test(emailInput.value)) {
+                emailInput.parentElement.style.borderColor = '';
+            }
+        }, { once: true });
+    }
+});
+
+// Password visibility toggle
+const passwordToggle = document.getElementById('passwordToggle');
+const passwordInput = document.getElementById('password');
+
+passwordToggle.addEventListener('click', function() {
+    const type = passwordInput.getAttribute('type') === 'password' ? 'text' : 'password';
+    passwordInput.setAttribute('type', type);
+
+    // Toggle eye icon
+    const eyeIcon = this.querySelector('i');
+    eyeIcon.classList.toggle('fa-eye');
+    eyeIcon.classList.toggle('fa-eye-slash');
+});
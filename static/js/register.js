@@ -0,0 +1,52 @@
+// Password visibility toggles
+const togglePassword = document.getElementById('togglePassword');
+const passwordInput = document.getElementById('password');
+
+const toggleConfirmPassword = document.getElementById('toggleConfirmPassword');
+const confirmPasswordInput = document.getElementById('confirmPassword');
+
+togglePassword.addEventListener('click', function() {
+  const type = passwordInput.getAttribute('type') === 'password' ? 'text' : 'password';
+  passwordInput.setAttribute('type', type);
+
+  // Toggle eye icon
+  const eyeIcon = this.querySelector('i');
+  eyeIcon.classList.toggle('fa-eye');
+  eyeIcon.classList.toggle('fa-eye-slash');
+});
+
+toggleConfirmPassword.addEventListener('click', function() {
+  const type = confirmPasswordInput.getAttribute('type') === 'password' ? 'text' : 'password';
+  confirmPasswordInput.setAttribute('type', type);
+
+  // Toggle eye icon
+  const eyeIcon = this.querySelector('i');
+  eyeIcon.classList.toggle('fa-eye');
+  eyeIcon.classList.toggle('fa-eye-slash');
+});
+
+// Form validation
+document.querySelector('form').addEventListener('submit', function(e) {
+  const password = document.getElementById('password').value;
+  const confirmPassword = document.getElementById('confirmPassword').value;
+
+  if (password !== confirmPassword) {
+    e.preventDefault();
+    const errorDiv = document.createElement('div');
+    errorDiv.className = 'message';
+    errorDiv.innerHTML = '<i class="fas fa-exclamation-circle"></i> Passwords do not match';
+
+    // Remove any existing error message
+    const existingError = document.querySelector('.message');
+    if (existingError) {
+      existingError.remove();
+    }
+
+    // Insert the error message
+    const form = document.querySelector('form');
+    form.insertBefore(errorDiv, form.firstChild);
+
+    // Add focus to the password field
+    document.getElementById('password').focus();
+  }
+});
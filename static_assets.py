@@ -0,0 +1,259 @@
+# static_assets.py
+"""Build step and serving support for fingerprinted static assets.
+
+``build`` turns ``static/`` into ``static/dist/``:
+  - JPG/PNG images: resized WebP and AVIF variants (IMAGE_WIDTHS, never
+    upscaled) plus the original, all named ``<stem>[-<w>w].<hash>.<ext>``
+  - CSS/JS/SVG/ICO: copied as ``<stem>.<hash>.<ext>`` with precompressed
+    ``.gz`` and (if the ``brotli`` package is installed) ``.br`` siblings
+  - manifest.json: logical name -> fingerprinted file and image variants,
+    swapped in with ``os.replace`` so a running app never reads half of it
+
+Files from earlier builds are kept, so pages already cached by browsers keep
+resolving. ``init_assets(app)`` serves ``/assets/<file>`` with immutable
+cache headers (choosing ``.br``/``.gz`` by Accept-Encoding) and exposes
+``asset_url(name)`` and ``image_url(name, width)`` to templates. Without a
+build they fall back to the plain ``/static`` files, so development needs no
+extra step.
+
+Rendered HTML pages are compressed on the fly (brotli when available and
+accepted, else gzip).
+
+Environment variables:
+  - ASSET_DIST_DIR: build output and serving directory (default ./static/dist)
+  - ASSET_STATIC_MAX_AGE: Cache-Control max-age for unfingerprinted /static files (default 3600)
+
+Usage:
+  python static_assets.py build [--source ./static] [--out ./static/dist]
+"""
+import os
+import io
+import gzip
+import json
+import hashlib
+import logging
+import mimetypes
+from typing import Dict, Optional
+
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = os.getenv("ASSET_DIST_DIR", os.path.join(STATIC_DIR, "dist"))
+STATIC_MAX_AGE = int(os.getenv("ASSET_STATIC_MAX_AGE", "3600"))
+MANIFEST_FILE = "manifest.json"
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+TEXT_EXTENSIONS = {".css", ".js", ".svg", ".ico"}
+IMAGE_WIDTHS = (96, 480, 1280)
+# Encoder settings tuned for photos; AVIF quality runs lower than WebP for the same look
+IMAGE_FORMATS = {"avif": {"quality": 50}, "webp": {"quality": 80, "method": 6}}
+IMMUTABLE = "public, max-age=31536000, immutable"
+MIN_COMPRESS_BYTES = 1024
+
+
+def _fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def _write_hashed(out_dir: str, rel_dir: str, stem: str, ext: str, data: bytes) -> str:
+    name = f"{stem}.{_fingerprint(data)}{ext}"
+    rel = os.path.join(rel_dir, name) if rel_dir else name
+    path = os.path.join(out_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not os.path.exists(path):
+        with open(path, "wb") as fh:
+            fh.write(data)
+    return rel.replace(os.sep, "/")
+
+
+def _precompress(path: str, data: bytes) -> None:
+    with open(path + ".gz", "wb") as fh:
+        # mtime=0 keeps the output byte-identical across builds
+        with gzip.GzipFile(fileobj=fh, mode="wb", compresslevel=9, mtime=0) as gz:
+            gz.write(data)
+    if brotli is not None:
+        with open(path + ".br", "wb") as fh:
+            fh.write(brotli.compress(data, quality=11))
+
+
+def _build_image(out_dir: str, rel_dir: str, stem: str, ext: str, data: bytes) -> Dict:
+    from PIL import Image
+
+    original = _write_hashed(out_dir, rel_dir, stem, ext, data)
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        width = image.width
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        variants = []
+        for target in sorted({w for w in IMAGE_WIDTHS if w < width} | {min(width, IMAGE_WIDTHS[-1])}):
+            resized = image if target == width else image.resize(
+                (target, max(1, round(image.height * target / width))), Image.LANCZOS)
+            for fmt, options in IMAGE_FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, format=fmt.upper(), **options)
+                variants.append({"width": target, "format": fmt,
+                                 "file": _write_hashed(out_dir, rel_dir, f"{stem}-{target}w", f".{fmt}",
+                                                       buffer.getvalue())})
+    return {"file": original, "width": width, "variants": variants}
+
+
+def build(source: str = STATIC_DIR, out_dir: str = DIST_DIR) -> Dict:
+    """Build every asset under ``source`` into ``out_dir`` and publish the manifest."""
+    source = os.path.abspath(source)
+    out_dir = os.path.abspath(out_dir)
+    files: Dict[str, str] = {}
+    images: Dict[str, Dict] = {}
+    for root, dirs, names in os.walk(source):
+        # Never build the output into itself
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != out_dir]
+        for name in sorted(names):
+            stem, ext = os.path.splitext(name)
+            ext = ext.lower()
+            if ext not in IMAGE_EXTENSIONS and ext not in TEXT_EXTENSIONS:
+                continue
+            rel_dir = os.path.relpath(root, source)
+            rel_dir = "" if rel_dir == "." else rel_dir
+            logical = os.path.join(rel_dir, name).replace(os.sep, "/")
+            with open(os.path.join(root, name), "rb") as fh:
+                data = fh.read()
+            if ext in IMAGE_EXTENSIONS:
+                images[logical] = _build_image(out_dir, rel_dir, stem, ext, data)
+                files[logical] = images[logical]["file"]
+            else:
+                files[logical] = _write_hashed(out_dir, rel_dir, stem, ext, data)
+                if len(data) >= MIN_COMPRESS_BYTES:
+                    _precompress(os.path.join(out_dir, files[logical]), data)
+
+    manifest = {"files": files, "images": images}
+    tmp = os.path.join(out_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST_FILE))
+    logger.info("Built %d assets (%d images) into %s", len(files), len(images), out_dir)
+    return manifest
+
+
+class AssetManifest:
+    """Read-only view of a build's manifest; empty when there is no build."""
+
+    def __init__(self, dist_dir: str = DIST_DIR):
+        self.dist_dir = dist_dir
+        self.files: Dict[str, str] = {}
+        self.images: Dict[str, Dict] = {}
+        path = os.path.join(dist_dir, MANIFEST_FILE)
+        try:
+            with open(path, encoding="utf-8") as fh:
+                data = json.load(fh)
+            self.files = data.get("files", {})
+            self.images = data.get("images", {})
+        except FileNotFoundError:
+            logger.info("No asset manifest at %s; serving unfingerprinted /static files", path)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read asset manifest %s: %s", path, e)
+
+    def url(self, name: str) -> str:
+        built = self.files.get(name)
+        if built is None:
+            return url_for("static", filename=name)
+        return url_for("assets.built_asset", filename=built)
+
+    def image_url(self, name: str, width: int, accept: Optional[str] = None) -> str:
+        """Smallest variant at least ``width`` wide in the best format the browser accepts."""
+        image = self.images.get(name)
+        if image is None:
+            return self.url(name)
+        accept = accept or ""
+        for fmt in IMAGE_FORMATS:
+            if f"image/{fmt}" not in accept:
+                continue
+            candidates = sorted((v for v in image["variants"] if v["format"] == fmt), key=lambda v: v["width"])
+            if candidates:
+                chosen = next((v for v in candidates if v["width"] >= width), candidates[-1])
+                return url_for("assets.built_asset", filename=chosen["file"])
+        return self.url(name)
+
+
+assets_bp = Blueprint("assets", __name__)
+
+
+@assets_bp.route("/assets/<path:filename>", methods=["GET"])
+def built_asset(filename):
+    dist_dir = os.path.abspath(current_app.config.get("ASSET_DIST_DIR", DIST_DIR))
+    if not os.path.isfile(os.path.join(dist_dir, filename)):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    encodings = request.accept_encodings
+    served, encoding = filename, None
+    if os.path.splitext(filename)[1].lower() in TEXT_EXTENSIONS:
+        for suffix, name in ((".br", "br"), (".gz", "gzip")):
+            if encodings[name] and os.path.isfile(os.path.join(dist_dir, filename + suffix)):
+                served, encoding = filename + suffix, name
+                break
+    response = send_from_directory(dist_dir, served, mimetype=mimetype, max_age=31536000)
+    response.headers["Cache-Control"] = IMMUTABLE
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def _compress_html(response):
+    """Compress rendered pages; assets are precompressed at build time instead."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != "text/html" or "Content-Encoding" in response.headers):
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+    encodings = request.accept_encodings
+    if brotli is not None and encodings["br"]:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers["Content-Encoding"] = "br"
+    elif encodings["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        return response
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def use_manifest(app, dist_dir: str = DIST_DIR) -> AssetManifest:
+    """Point the template helpers and /assets at a build (also used after a rebuild)."""
+    manifest = AssetManifest(dist_dir)
+    app.config["ASSET_DIST_DIR"] = dist_dir
+    app.jinja_env.globals["asset_url"] = manifest.url
+    app.jinja_env.globals["image_url"] = lambda name, width: manifest.image_url(
+        name, width, request.headers.get("Accept"))
+    return manifest
+
+
+def init_assets(app, dist_dir: str = DIST_DIR) -> AssetManifest:
+    """Register /assets, the template helpers and the caching/compression hooks."""
+    app.register_blueprint(assets_bp)
+    app.config["SEND_FILE_MAX_AGE_DEFAULT"] = STATIC_MAX_AGE
+    app.after_request(_compress_html)
+    return use_manifest(app, dist_dir)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Build fingerprinted static assets")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build")
+    build_cmd.add_argument("--source", default=STATIC_DIR)
+    build_cmd.add_argument("--out", default=DIST_DIR)
+    args = parser.parse_args()
+
+    result = build(args.source, args.out)
+    print(f"{len(result['files'])} assets, {len(result['images'])} images -> {args.out}")
@@ -0,0 +1,208 @@
+# structured_log.py
+"""Structured, lazily formatted logging with PII redaction.
+
+    from structured_log import get_logger
+    log = get_logger(__name__)
+    log.info("chat_user_message", session_id=sid, email=email, text=user_input)
+    log.debug("user_details", details=lambda: expensive_repr())
+
+Nothing is formatted unless the record will be emitted: the level check comes
+first, callables passed as fields are only called then, and the message text
+("event key=value ...") is rendered by the handler's formatter.
+
+Environment variables (read once at import):
+  - LOG_SAMPLE: per-event sampling, e.g. "session_check=0.05,chat_user_message=0.5"
+    (defaults to "session_check=0.05"; warnings and errors are never sampled)
+  - LOG_MAX_FIELD_CHARS: truncate long field values (default 300)
+  - LOG_FORMAT / LOG_LEVELS: used by logger.setup_logging to pick the JSON
+    formatter and per-module levels, see configure_levels()
+"""
+import os
+import re
+import json
+import random
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "300"))
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for part in spec.split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() and rate.strip():
+            try:
+                rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+            except ValueError:
+                continue
+    return rates
+
+
+SAMPLE_RATES = _parse_rates(os.getenv("LOG_SAMPLE", "session_check=0.05"))
+
+# Field names whose values are always masked
+PII_FIELDS = {"email", "user_email", "mail", "phone", "phone_number", "ip", "ip_address", "password"}
+_EMAIL_RE = re.compile(r"([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+\.[A-Za-z]{2,})")
+_PHONE_RE = re.compile(r"(?<!\d)(?:\+?\d[\d -]{7,}\d)(?!\d)")
+
+
+def mask_email(value: str) -> str:
+    return _EMAIL_RE.sub(r"\1***@\2", value)
+
+
+def mask_phone(value: str) -> str:
+    digits = re.sub(r"\D", "", value)
+    return f"***{digits[-2:]}" if len(digits) >= 4 else "***"
+
+
+def mask_ip(value: str) -> str:
+    """Keep the network part: 10.1.x.x, or the first two groups of an IPv6 address."""
+    if "." in value:
+        return ".".join(value.split(".")[:2]) + ".x.x"
+    return ":".join(value.split(":")[:2]) + ":x"
+
+
+def _mask_phone_match(match) -> str:
+    return mask_phone(match.group(0))
+
+
+def redact(key: str, value: Any) -> Any:
+    """Mask PII in one field value (known PII keys fully, free text by pattern; ids are left alone)."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    # Nested fields (e.g. a session event's data={"ip": ...}) are masked by their own keys
+    if isinstance(value, dict):
+        return {k: redact(str(k), v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(key, v) for v in value]
+    text = value if isinstance(value, str) else str(value)
+    if key == "id" or key.endswith("_id"):
+        return text
+    if key in PII_FIELDS:
+        if key == "password":
+            return "***"
+        if key in ("ip", "ip_address"):
+            return mask_ip(text)
+        return mask_email(text) if "@" in text else mask_phone(text)
+    # Only the part that will be kept is scanned; the margin covers a number cut at the limit
+    overflow = len(text) - MAX_FIELD_CHARS
+    if overflow > 0:
+        text = text[:MAX_FIELD_CHARS + 24]
+    if "@" in text:
+        text = mask_email(text)
+    text = _PHONE_RE.sub(_mask_phone_match, text)
+    if overflow > 0:
+        text = f"{text[:MAX_FIELD_CHARS]}...(+{overflow})"
+    return text
+
+
+class Event:
+    """Log message payload; rendered to text only when a formatter asks for it."""
+
+    __slots__ = ("name", "_fields", "_resolved")
+
+    def __init__(self, name: str, fields: Dict[str, Any]):
+        self.name = name
+        self._fields = fields
+        self._resolved: Optional[Dict[str, Any]] = None
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        if self._resolved is None:
+            resolved = {}
+            for key, value in self._fields.items():
+                if callable(value):
+                    try:
+                        value = value()
+                    except Exception as e:  # a broken field must not break logging
+                        value = f"<error: {e}>"
+                resolved[key] = redact(key, value)
+            self._resolved = resolved
+        return self._resolved
+
+    def __str__(self) -> str:
+        if not self._fields:
+            return self.name
+        return self.name + " " + " ".join(f"{key}={value}" for key, value in self.fields.items())
+
+
+class StructuredLogger:
+    """Thin wrapper over a stdlib logger taking an event name plus keyword fields."""
+
+    __slots__ = ("_logger",)
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+
+    @property
+    def name(self) -> str:
+        return self._logger.name
+
+    def _log(self, level: int, event: str, fields: Dict[str, Any], exc_info=None, sample: Optional[float] = None):
+        if not self._logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING:
+            rate = SAMPLE_RATES.get(event, 1.0) if sample is None else sample
+            if rate < 1.0 and random.random() >= rate:
+                return
+        self._logger.log(level, Event(event, fields), exc_info=exc_info, stacklevel=3)
+
+    def debug(self, event: str, sample: Optional[float] = None, **fields) -> None:
+        self._log(logging.DEBUG, event, fields, sample=sample)
+
+    def info(self, event: str, sample: Optional[float] = None, **fields) -> None:
+        self._log(logging.INFO, event, fields, sample=sample)
+
+    def warning(self, event: str, **fields) -> None:
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields) -> None:
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields) -> None:
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+    def is_enabled(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(logging.getLogger(name))
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per line; structured fields are top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        if isinstance(record.msg, Event):
+            entry["event"] = record.msg.name
+            entry.update(record.msg.fields)
+        else:
+            entry["msg"] = record.getMessage()
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(",", ":"), default=str, ensure_ascii=False)
+
+
+def configure_levels(spec: Optional[str] = None) -> None:
+    """Apply per-module levels, e.g. LOG_LEVELS="chat_routes=WARNING,db_utils=DEBUG"."""
+    spec = os.getenv("LOG_LEVELS", "") if spec is None else spec
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip():
+            logging.getLogger(name.strip()).setLevel(getattr(logging, level.strip().upper(), logging.INFO))
+
+
+def make_formatter(text_format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s") -> logging.Formatter:
+    """The formatter selected by LOG_FORMAT ("text" by default, or "json")."""
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        return JsonFormatter()
+    return logging.Formatter(text_format)
+
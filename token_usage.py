@@ -0,0 +1,275 @@
+# token_usage.py
+"""Token accounting per session, user and graph node, with budgets.
+
+Every chat-model call goes through llm_scheduler.scheduled(), which hands
+the response's usage (prompt, completion and cached prompt tokens) to
+``ledger.record`` together with who it was for:
+
+  - session: the chat session (``configurable.session_id``; the graph
+    thread id for calls made outside one),
+  - user: ``configurable.patient_email``,
+  - node: what the call was for: "assistant" (the graph's assistant node),
+    "record_selection" / "hospital_filter" (hospital_details lookups),
+    "extraction" (the booking extraction in chat_routes).
+
+When a response carries no usage (some streaming setups) the tokens are
+estimated as in llm_scheduler and the call is counted as "estimated_calls".
+
+Counts are summed in memory per (day, session, node) and flushed every
+USAGE_FLUSH_SECONDS, and on shutdown (lifecycle.py), as ``$inc`` upserts
+into ``llm_usage``, one document per (day, session, node), so any number of
+workers can add to the same document. ``day`` is the UTC date, as billed.
+reports.token_report ranks sessions, users or nodes from that collection.
+
+Budgets count prompt + completion tokens across all workers: the totals in
+``llm_usage`` as of this worker's last flush plus its unflushed calls. Each
+flush re-reads the totals of the sessions that made calls here since the
+previous one, so a session whose turns land on several workers is counted
+once, whichever serves it. A session over SESSION_TOKEN_BUDGET, or every
+session once the day's total is over DAILY_TOKEN_BUDGET, is served more
+cheaply instead of being refused:
+
+  - hospital_details lookups skip their LLM step and return the directory
+    rows in relevance order (patient_bot_conversational.search_hospitals),
+  - the assistant runs on the economy deployment when one is configured
+    (model.economy_llm_model),
+  - a warning is logged once per session and once per day.
+
+The booking extraction always runs on the main deployment.
+
+Environment variables:
+  - SESSION_TOKEN_BUDGET: tokens per chat session, 0 for no limit (default 150000)
+  - DAILY_TOKEN_BUDGET: tokens per UTC day across all workers, 0 for no limit (default 0)
+  - USAGE_FLUSH_SECONDS: how often usage is written to Mongo (default 30)
+  - LLM_PRICE_INPUT / LLM_PRICE_CACHED_INPUT / LLM_PRICE_OUTPUT: USD per million
+    tokens, for the report's cost column (defaults: gpt-4o-mini, 0.15 / 0.075 / 0.60)
+"""
+import os
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from db_utils import db
+from structured_log import get_logger
+
+logger = get_logger(__name__)
+
+usage_collection = db["llm_usage"]
+
+SESSION_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "150000"))
+DAILY_TOKEN_BUDGET = int(os.getenv("DAILY_TOKEN_BUDGET", "0"))
+FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "30"))
+PRICES = {
+    "input": float(os.getenv("LLM_PRICE_INPUT", "0.15")),
+    "cached_input": float(os.getenv("LLM_PRICE_CACHED_INPUT", "0.075")),
+    "output": float(os.getenv("LLM_PRICE_OUTPUT", "0.60")),
+}
+# Sessions not seen for this long are dropped from the in-memory totals
+SESSION_IDLE_SECONDS = 6 * 3600
+
+COUNTERS = ("calls", "input_tokens", "cached_input_tokens", "output_tokens", "estimated_calls", "economy_calls")
+
+
+def utc_day() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def cost(totals: Dict[str, Any]) -> float:
+    """USD for the token counts in ``totals`` at PRICES."""
+    cached = totals.get("cached_input_tokens") or 0
+    return ((totals.get("input_tokens", 0) - cached) * PRICES["input"] + cached * PRICES["cached_input"]
+            + totals.get("output_tokens", 0) * PRICES["output"]) / 1_000_000
+
+
+def attribution(config: Optional[Dict], node: Optional[str] = None) -> Tuple[str, Optional[str], str]:
+    """(session, user, node) for a call made with ``config``."""
+    configurable = (config or {}).get("configurable", {})
+    session_id = configurable.get("session_id") or configurable.get("thread_id") or "anonymous"
+    node = node or (config or {}).get("metadata", {}).get("langgraph_node") or "other"
+    return session_id, configurable.get("patient_email"), node
+
+
+class UsageLedger:
+    def __init__(self, collection, session_budget: int, daily_budget: int, flush_seconds: float):
+        self.collection = collection
+        self.session_budget = session_budget
+        self.daily_budget = daily_budget
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        # (day, session, node) -> {"user", counters...}, not yet written
+        self._pending: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        # session -> {"flushed": all workers' tokens as of the last flush, "unflushed": this process's since, "seen"}
+        self._sessions: Dict[str, Dict[str, float]] = {}
+        self._day = utc_day()
+        self._day_flushed = 0
+        self._day_unflushed = 0
+        self._warned_sessions = set()
+        self._warned_day = False
+        self._flusher: Optional[threading.Thread] = None
+        self.counters = {"calls": 0, "tokens": 0, "flushes": 0, "flush_failures": 0, "degraded_calls": 0}
+
+    def record(self, usage: Optional[Dict[str, Any]], session_id: str, user: Optional[str], node: str,
+               estimate: Tuple[int, int] = (0, 0), economy: bool = False) -> None:
+        """Add one call's usage (langchain ``usage_metadata``); ``estimate`` is used when there is none."""
+        if usage:
+            input_tokens = usage.get("input_tokens") or 0
+            output_tokens = usage.get("output_tokens") or 0
+            cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+        else:
+            (input_tokens, output_tokens), cached = estimate, 0
+        day = utc_day()
+        with self._lock:
+            if day != self._day:
+                self._day, self._day_flushed, self._day_unflushed, self._warned_day = day, 0, 0, False
+            entry = self._pending.get((day, session_id, node))
+            if entry is None:
+                entry = self._pending[(day, session_id, node)] = dict.fromkeys(COUNTERS, 0)
+            if user:
+                entry["user"] = user
+            entry["calls"] += 1
+            entry["input_tokens"] += input_tokens
+            entry["cached_input_tokens"] += cached
+            entry["output_tokens"] += output_tokens
+            entry["estimated_calls"] += 0 if usage else 1
+            entry["economy_calls"] += 1 if economy else 0
+            tokens = input_tokens + output_tokens
+            session = self._sessions.setdefault(session_id, {"flushed": 0, "unflushed": 0, "seen": 0.0})
+            session["unflushed"] += tokens
+            session["seen"] = time.monotonic()
+            self._day_unflushed += tokens
+            self.counters["calls"] += 1
+            self.counters["tokens"] += tokens
+            start_flusher = self._flusher is None and self.flush_seconds > 0
+            if start_flusher:
+                self._flusher = threading.Thread(target=self._flush_loop, name="usage-flush", daemon=True)
+        if start_flusher:
+            self._flusher.start()
+
+    # ---- budgets ----------------------------------------------------------
+    @staticmethod
+    def _session_total(totals: Dict[str, float]) -> float:
+        return totals["flushed"] + totals["unflushed"]
+
+    def session_tokens(self, session_id: str) -> int:
+        with self._lock:
+            totals = self._sessions.get(session_id)
+            return int(self._session_total(totals)) if totals else 0
+
+    def over_budget(self, session_id: str) -> Optional[str]:
+        """The budget this session has used up, "session" or "day" (warned once), or None."""
+        with self._lock:
+            totals = self._sessions.get(session_id)
+            used = self._session_total(totals) if totals else 0
+            if self.session_budget and used >= self.session_budget:
+                if session_id not in self._warned_sessions:
+                    self._warned_sessions.add(session_id)
+                    logger.warning("session_token_budget_exceeded", session_id=session_id, used=int(used),
+                                   budget=self.session_budget, path="economy")
+                exceeded = "session"
+            elif self.daily_budget and self._day_flushed + self._day_unflushed >= self.daily_budget:
+                if not self._warned_day:
+                    self._warned_day = True
+                    logger.warning("daily_token_budget_exceeded", budget=self.daily_budget, path="economy")
+                exceeded = "day"
+            else:
+                return None
+            self.counters["degraded_calls"] += 1
+            return exceeded
+
+    # ---- persistence ------------------------------------------------------
+    def flush(self) -> int:
+        """Write pending usage to Mongo and re-read the budgets' totals; returns the documents written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            unflushed = self._day_unflushed
+            sessions_unflushed = {session_id: totals["unflushed"] for session_id, totals in self._sessions.items()
+                                  if totals["unflushed"]}
+        if pending:
+            now = datetime.now(timezone.utc)
+            ops = [UpdateOne(
+                {"_id": f"{day}|{session_id}|{node}"},
+                {"$inc": {name: entry[name] for name in COUNTERS},
+                 "$set": {"updated_at": now, **({"user": entry["user"]} if entry.get("user") else {})},
+                 "$setOnInsert": {"day": day, "session_id": session_id, "node": node}},
+                upsert=True) for (day, session_id, node), entry in pending.items()]
+            try:
+                self.collection.bulk_write(ops, ordered=False)
+            except Exception:
+                logger.exception("usage_flush_write_failed", records=len(ops), kept_for_next_flush=True)
+                with self._lock:
+                    for key, entry in pending.items():
+                        current = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                        for name in COUNTERS:
+                            current[name] += entry[name]
+                        if entry.get("user"):
+                            current.setdefault("user", entry["user"])
+                    self.counters["flush_failures"] += 1
+                return 0
+        day_total = None
+        if self.daily_budget:
+            try:
+                rows = list(self.collection.aggregate([
+                    {"$match": {"day": self._day}},
+                    {"$group": {"_id": None, "tokens": {"$sum": {"$add": ["$input_tokens", "$output_tokens"]}}}},
+                ]))
+                day_total = rows[0]["tokens"] if rows else 0
+            except Exception:
+                logger.exception("usage_day_total_failed")
+        session_totals = None
+        active = sorted({session_id for _, session_id, _ in pending})
+        if self.session_budget and active:
+            try:
+                session_totals = {row["_id"]: row["tokens"] for row in self.collection.aggregate([
+                    {"$match": {"session_id": {"$in": active}}},
+                    {"$group": {"_id": "$session_id",
+                                "tokens": {"$sum": {"$add": ["$input_tokens", "$output_tokens"]}}}},
+                ])}
+            except Exception:
+                logger.exception("usage_session_totals_failed", sessions=len(active))
+        with self._lock:
+            if day_total is not None:
+                # What was recorded while writing stays unflushed
+                self._day_flushed = day_total
+                self._day_unflushed = max(0, self._day_unflushed - unflushed)
+            elif pending:
+                self._day_flushed += unflushed
+                self._day_unflushed = max(0, self._day_unflushed - unflushed)
+            for session_id, written in sessions_unflushed.items():
+                totals = self._sessions.get(session_id)
+                if totals is None:
+                    continue
+                totals["unflushed"] = max(0, totals["unflushed"] - written)
+                if session_totals is not None and session_id in session_totals:
+                    totals["flushed"] = session_totals[session_id]
+                else:
+                    totals["flushed"] += written
+            idle = time.monotonic() - SESSION_IDLE_SECONDS
+            for session_id in [s for s, totals in self._sessions.items() if totals["seen"] < idle]:
+                del self._sessions[session_id]
+                self._warned_sessions.discard(session_id)
+            self.counters["flushes"] += 1
+        return len(pending)
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("usage_flush_failed")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"pid": os.getpid(), "day": self._day, "sessions": len(self._sessions),
+                    "pending_records": len(self._pending), "day_tokens": self._day_flushed + self._day_unflushed,
+                    "session_budget": self.session_budget, "daily_budget": self.daily_budget,
+                    "sessions_over_budget": sum(self._session_total(t) >= self.session_budget
+                                                for t in self._sessions.values())
+                    if self.session_budget else 0,
+                    **self.counters}
+
+
+ledger = UsageLedger(usage_collection, SESSION_TOKEN_BUDGET, DAILY_TOKEN_BUDGET, FLUSH_SECONDS)
@@ -0,0 +1,350 @@
+# vector_snapshot.py
+"""Read-only, memory-mapped snapshot of the doctor details vector collection.
+
+Every gunicorn worker that imports ``patient_bot_conversational`` used to open
+its own Chroma client over ``./doctor_details_db``. A snapshot is exported once
+and then mapped read-only by every worker, so the vectors and documents live in
+a single page-cache copy shared by all of them.
+
+Snapshot layout (one directory per version under SNAPSHOT_DIR):
+  - vectors.f32   : float32 row-major matrix (count x dim), L2-normalized
+  - docs.bin      : concatenated UTF-8 JSON records {"page_content", "metadata"}
+  - offsets.u64   : uint64 offsets into docs.bin (count + 1 entries)
+  - manifest.json : {"version", "count", "dim", "files": {name: sha256}}
+and a ``CURRENT`` file at the top level naming the active version. CURRENT is
+swapped with ``os.replace`` so readers always see a complete snapshot. After
+the swap every version but the current and the previous one is deleted, and
+only once it has been out of CURRENT for SNAPSHOT_RETIRE_SECONDS (the
+swap touches the version it retires): a worker that read CURRENT just before
+a swap can still open the version it named. A worker that finds its version
+gone anyway re-reads CURRENT and opens the newer one.
+
+Environment variables:
+  - VECTOR_SNAPSHOT_DIR: snapshot directory (default ./doctor_details_snapshot)
+  - SNAPSHOT_RETIRE_SECONDS: how long a replaced version is kept (default 300)
+
+Usage:
+  python vector_snapshot.py export [--source ./doctor_details_db] [--out ./doctor_details_snapshot]
+  python vector_snapshot.py rss [--workers 4] [--queries 200]
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.getenv("VECTOR_SNAPSHOT_DIR", "./doctor_details_snapshot")
+CURRENT_FILE = "CURRENT"
+VECTORS_FILE = "vectors.f32"
+DOCS_FILE = "docs.bin"
+OFFSETS_FILE = "offsets.u64"
+MANIFEST_FILE = "manifest.json"
+RETIRE_SECONDS = float(os.getenv("SNAPSHOT_RETIRE_SECONDS", "300"))
+# Times a reader re-reads CURRENT when the version it named was deleted before it could open it
+OPEN_ATTEMPTS = 3
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_current(snapshot_dir: str, version: str) -> None:
+    """Atomically point CURRENT at ``version``."""
+    tmp_path = os.path.join(snapshot_dir, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        fh.write(version)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, os.path.join(snapshot_dir, CURRENT_FILE))
+
+
+def _read_current(snapshot_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE), encoding="utf-8") as fh:
+            return fh.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def prune_versions(snapshot_dir: str, keep: List[Optional[str]], retire_seconds: float = RETIRE_SECONDS) -> List[str]:
+    """Delete snapshot versions not in ``keep`` and untouched for ``retire_seconds``; returns those deleted."""
+    removed = []
+    now = time.time()
+    for name in os.listdir(snapshot_dir):
+        path = os.path.join(snapshot_dir, name)
+        if name in keep or not os.path.isfile(os.path.join(path, MANIFEST_FILE)):
+            continue
+        if now - os.path.getmtime(path) < retire_seconds:
+            # Recently replaced: a worker may have just read its name from CURRENT
+            continue
+        try:
+            # Workers still mapping these files keep their pages until they unmap them
+            shutil.rmtree(path)
+            removed.append(name)
+        except OSError as e:
+            logger.warning(f"Could not delete old vector snapshot {name}: {e}")
+    return removed
+
+
+def write_snapshot(embeddings: np.ndarray, documents: List[str], metadatas: List[Optional[dict]],
+                   snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    """Write a snapshot from raw arrays and make it the current version. Returns the version."""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if vectors.ndim != 2 or vectors.shape[0] != len(documents):
+        raise ValueError("embeddings must be a (count x dim) matrix matching documents")
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = np.ascontiguousarray(vectors / norms)
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    previous = _read_current(snapshot_dir)
+    staging = os.path.join(snapshot_dir, f".staging-{os.getpid()}")
+    os.makedirs(staging, exist_ok=True)
+
+    vectors.tofile(os.path.join(staging, VECTORS_FILE))
+
+    offsets = np.zeros(len(documents) + 1, dtype=np.uint64)
+    with open(os.path.join(staging, DOCS_FILE), "wb") as fh:
+        position = 0
+        for i, (text, meta) in enumerate(zip(documents, metadatas)):
+            record = json.dumps({"page_content": text or "", "metadata": meta or {}},
+                                ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            fh.write(record)
+            position += len(record)
+            offsets[i + 1] = position
+    offsets.tofile(os.path.join(staging, OFFSETS_FILE))
+
+    files = {name: _sha256_file(os.path.join(staging, name))
+             for name in (VECTORS_FILE, DOCS_FILE, OFFSETS_FILE)}
+    version = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()[:16]
+    manifest = {
+        "version": version,
+        "count": int(vectors.shape[0]),
+        "dim": int(vectors.shape[1]) if vectors.shape[0] else 0,
+        "files": files,
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2)
+
+    final_dir = os.path.join(snapshot_dir, version)
+    if os.path.isdir(final_dir):
+        # Identical content already exported; drop the staging copy
+        for name in os.listdir(staging):
+            os.remove(os.path.join(staging, name))
+        os.rmdir(staging)
+    else:
+        os.rename(staging, final_dir)
+
+    _write_current(snapshot_dir, version)
+    if previous and previous != version and os.path.isdir(os.path.join(snapshot_dir, previous)):
+        # Its retirement time, which prune_versions counts from
+        os.utime(os.path.join(snapshot_dir, previous))
+    removed = prune_versions(snapshot_dir, keep=[version, previous])
+    logger.info(f"Vector snapshot {version} written ({manifest['count']} docs, dim={manifest['dim']}); "
+                f"{len(removed)} old version(s) deleted")
+    return version
+
+
+def export_snapshot(source_dir: str = "./doctor_details_db", snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    """Export the persisted Chroma collection into a memory-mapped snapshot."""
+    from langchain_chroma import Chroma
+
+    db = Chroma(persist_directory=source_dir)
+    data = db.get(include=["embeddings", "documents", "metadatas"])
+    return write_snapshot(data["embeddings"], data["documents"], data["metadatas"], snapshot_dir)
+
+
+class VectorSnapshot:
+    """A single mapped snapshot version. Immutable once opened."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as fh:
+            self.manifest = json.load(fh)
+        self.version = self.manifest["version"]
+        count, dim = self.manifest["count"], self.manifest["dim"]
+        self.vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype=np.float32,
+                                 mode="r", shape=(count, dim)) if count else np.zeros((0, dim), np.float32)
+        self.offsets = np.memmap(os.path.join(path, OFFSETS_FILE), dtype=np.uint64,
+                                 mode="r", shape=(count + 1,))
+        self.docs = np.memmap(os.path.join(path, DOCS_FILE), dtype=np.uint8, mode="r") \
+            if self.offsets[-1] else np.zeros(0, np.uint8)
+
+    def document(self, index: int) -> Document:
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        record = json.loads(self.docs[start:end].tobytes().decode("utf-8"))
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def documents(self) -> List[Document]:
+        """Every document, in stored order."""
+        return [self.document(i) for i in range(self.manifest["count"])]
+
+    def search(self, query_vector: List[float], k: int) -> List[Document]:
+        return [doc for _, doc in self.search_with_scores(query_vector, k)]
+
+    def search_with_scores(self, query_vector: List[float], k: int) -> List[Tuple[float, Document]]:
+        """Top ``k`` documents by cosine similarity, best first, with their scores."""
+        if not len(self.vectors):
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        if query.shape[0] != self.vectors.shape[1]:
+            raise ValueError(f"Query embedding has {query.shape[0]} dimensions but snapshot {self.version} "
+                             f"has {self.vectors.shape[1]}; EMBEDDING_BACKEND must match the exported vectors")
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.document(int(i))) for i in top]
+
+
+class SnapshotRetriever(BaseRetriever):
+    """Retriever serving from the current memory-mapped snapshot.
+
+    CURRENT is re-read at most every ``reload_interval`` seconds; a new version
+    is opened fully before the reference is swapped, so queries never see a
+    partially loaded snapshot.
+    """
+
+    embeddings: Any
+    snapshot_dir: str = SNAPSHOT_DIR
+    k: int = 20
+    reload_interval: float = 5.0
+
+    _snapshot: Optional[VectorSnapshot] = None
+    _checked_at: float = 0.0
+    _lock: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._maybe_reload(force=True)
+
+    def _current_version(self) -> Optional[str]:
+        return _read_current(self.snapshot_dir)
+
+    def _maybe_reload(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            for attempt in range(OPEN_ATTEMPTS):
+                version = self._current_version()
+                if version is None or (self._snapshot is not None and self._snapshot.version == version):
+                    return
+                try:
+                    snapshot = VectorSnapshot(os.path.join(self.snapshot_dir, version))
+                except Exception as e:
+                    if attempt + 1 < OPEN_ATTEMPTS and self._current_version() != version:
+                        # Replaced and pruned between reading CURRENT and opening it; take the newer one
+                        logger.warning(f"Vector snapshot {version} was replaced before it could be opened: {e}")
+                        continue
+                    logger.exception(f"Failed to open vector snapshot {version}: {e}")
+                    return
+                self._snapshot = snapshot
+                logger.info(f"Serving vector snapshot {version}")
+                return
+
+    def all_documents(self) -> List[Document]:
+        """Every document of the current snapshot."""
+        self._maybe_reload()
+        return self._snapshot.documents() if self._snapshot is not None else []
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        self._maybe_reload()
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise RuntimeError(f"No vector snapshot found in {self.snapshot_dir}; run `python vector_snapshot.py export`")
+        return snapshot.search(self.embeddings.embed_query(query), self.k)
+
+
+def process_memory() -> dict:
+    """Return RSS/PSS/shared memory (kB) of the current process from /proc."""
+    stats = {}
+    try:
+        with open("/proc/self/smaps_rollup", encoding="utf-8") as fh:
+            for line in fh:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Private_Clean", "Private_Dirty"):
+                    stats[key.lower()] = int(value.split()[0])
+    except OSError:
+        import resource
+        stats["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return stats
+
+
+def measure_worker_rss(workers: int = 4, queries: int = 200, snapshot_dir: str = SNAPSHOT_DIR) -> List[dict]:
+    """Fork ``workers`` processes that each query the snapshot and report their memory.
+
+    Random query vectors are used so the measurement needs no embedding service.
+    With the snapshot, Pss per worker should stay roughly flat as workers grow,
+    because the mapped pages are counted once across processes.
+    """
+    import multiprocessing as mp
+
+    ctx = mp.get_context("fork")
+    queue = ctx.Queue()
+    barrier = ctx.Barrier(workers)
+    done = ctx.Event()
+
+    def _worker():
+        with open(os.path.join(snapshot_dir, CURRENT_FILE), encoding="utf-8") as fh:
+            version = fh.read().strip()
+        snapshot = VectorSnapshot(os.path.join(snapshot_dir, version))
+        rng = np.random.default_rng(os.getpid())
+        for _ in range(queries):
+            snapshot.search(rng.standard_normal(snapshot.manifest["dim"]), 20)
+        # Measure only once every worker has the snapshot mapped, so Pss is split fairly
+        barrier.wait()
+        queue.put({"pid": os.getpid(), "workers": workers, **process_memory()})
+        done.wait()
+
+    procs = [ctx.Process(target=_worker) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    done.set()
+    for p in procs:
+        p.join()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Doctor details vector snapshot tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="Export the Chroma collection to a snapshot")
+    export_cmd.add_argument("--source", default="./doctor_details_db")
+    export_cmd.add_argument("--out", default=SNAPSHOT_DIR)
+    rss_cmd = sub.add_parser("rss", help="Report RSS/PSS per worker serving the snapshot")
+    rss_cmd.add_argument("--workers", type=int, default=4)
+    rss_cmd.add_argument("--queries", type=int, default=200)
+    rss_cmd.add_argument("--dir", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "export":
+        print(export_snapshot(args.source, args.out))
+    else:
+        for row in measure_worker_rss(args.workers, args.queries, args.dir):
+            print(json.dumps(row))
+    sys.exit(0)
@@ -0,0 +1,241 @@
+# ws_chat.py
+"""Persistent WebSocket chat channel: one connection per chat page.
+
+    GET /ws/chat/<session_id>   (WebSocket upgrade, authenticated by the Flask session cookie)
+
+Messages are JSON objects with a ``type``:
+
+  client -> server
+    {"type": "message", "text": "..."}   a user turn (typed or final voice transcript)
+    {"type": "partial", "text": "..."}   interim voice transcript, shown while the user speaks
+    {"type": "ping"}                     liveness; replaces polling /check-session
+
+  server -> client
+    {"type": "token", "text": "..."}     part of the assistant's reply as it is generated
+    {"type": "done", "text": "..."}      the final reply (authoritative, replaces the tokens); with
+                                         "busy": true and "retry_after" when the turn was refused
+                                         by admission control and should be resent
+    {"type": "partial_ack", "text": ...} echo of the latest partial transcript
+    {"type": "pong", "valid": true}      answer to ping; "valid": false means log in again
+    {"type": "error", "text": "..."}
+
+The Flask session is loaded once at the handshake and only re-read on ping.
+Turns on a connection run one at a time, so a client sending faster than
+replies are produced is held back by TCP. Outgoing frames go through a
+bounded queue drained by a writer thread: when a slow client lets it fill,
+pending tokens are coalesced into one frame, and a connection that cannot
+take the final reply within WS_SEND_TIMEOUT is closed.
+
+Environment variables:
+  - WS_MAX_CONNECTIONS: per-worker connection limit (default 500)
+  - WS_SEND_QUEUE: outgoing frames buffered per connection (default 64)
+  - WS_SEND_TIMEOUT: seconds to wait for room for a non-token frame (default 10)
+  - WS_IDLE_TIMEOUT: close connections silent for this long (default 180)
+"""
+import os
+import json
+import queue
+import threading
+from typing import Dict, Optional
+
+from flask import Blueprint, current_app, jsonify, request, session
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
+
+from admin import admin_required
+from admission import Overloaded
+from chat_routes import BUSY_MESSAGE, handle_user_message
+from session import update_session_record
+from structured_log import get_logger
+
+ws_bp = Blueprint("ws_chat", __name__)
+sock = Sock()
+logger = get_logger(__name__)
+
+MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "500"))
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE", "64"))
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "180"))
+MAX_MESSAGE_CHARS = 4000
+
+# Close codes (4000-4999 are application defined)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_TRY_AGAIN_LATER = 1013
+CLOSE_SLOW_CONSUMER = 4408
+
+
+class SlowConsumer(Exception):
+    """The client is not reading fast enough to take a non-droppable frame."""
+
+
+class ChatConnection:
+    """Outgoing side of one WebSocket: bounded queue plus writer thread."""
+
+    def __init__(self, ws, session_id: str, queue_size: int = SEND_QUEUE_SIZE):
+        self.ws = ws
+        self.session_id = session_id
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=queue_size)
+        self._pending_tokens = []
+        self._pending_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._drain, name=f"ws-writer-{session_id[:8]}", daemon=True)
+        self.closed = threading.Event()
+        self._writer.start()
+
+    def _drain(self) -> None:
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                return
+            try:
+                self.ws.send(frame)
+            except ConnectionClosed:
+                self.closed.set()
+                return
+
+    def send(self, event: Dict) -> None:
+        """Queue a frame that must be delivered; raises SlowConsumer if there is no room in time."""
+        self._flush_tokens()
+        try:
+            self._queue.put(json.dumps(event), timeout=SEND_TIMEOUT)
+        except queue.Full:
+            raise SlowConsumer()
+
+    def send_token(self, text: str) -> None:
+        """Queue a token without ever blocking the turn; coalesces while the queue is full."""
+        with self._pending_lock:
+            self._pending_tokens.append(text)
+        self._flush_tokens()
+
+    def _flush_tokens(self) -> None:
+        with self._pending_lock:
+            if not self._pending_tokens:
+                return
+            frame = json.dumps({"type": "token", "text": "".join(self._pending_tokens)})
+            try:
+                self._queue.put_nowait(frame)
+            except queue.Full:
+                stats.count("tokens_coalesced")
+                return
+            self._pending_tokens = []
+        stats.count("token_frames")
+
+    def close(self) -> None:
+        """Stop the writer after it has sent what is already queued."""
+        try:
+            self._queue.put(None, timeout=SEND_TIMEOUT)
+        except queue.Full:
+            pass
+        self._writer.join(timeout=SEND_TIMEOUT)
+        self.closed.set()
+
+
+class ChannelStats:
+    """Per-worker connection and frame counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.peak_connections = 0
+        self.counters: Dict[str, int] = {}
+
+    def opened(self) -> bool:
+        with self._lock:
+            if self.connections >= MAX_CONNECTIONS:
+                self.counters["rejected"] = self.counters.get("rejected", 0) + 1
+                return False
+            self.connections += 1
+            self.peak_connections = max(self.peak_connections, self.connections)
+            return True
+
+    def closed(self) -> None:
+        with self._lock:
+            self.connections -= 1
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"pid": os.getpid(), "connections": self.connections, "peak_connections": self.peak_connections,
+                    "max_connections": MAX_CONNECTIONS, **self.counters}
+
+
+stats = ChannelStats()
+
+
+def _session_valid(session_id: str) -> bool:
+    """Re-read the server-side session so a logout elsewhere is noticed."""
+    fresh = current_app.session_interface.open_session(current_app, request)
+    return bool(fresh) and "user" in fresh and fresh.get("session_id") == session_id
+
+
+@sock.route("/ws/chat/<session_id>", bp=ws_bp)
+def chat_socket(ws, session_id):
+    if "user" not in session or session.get("session_id") != session_id:
+        logger.warning("unauthorized_access", session_id=session_id, route="ws_chat")
+        ws.close(reason=CLOSE_UNAUTHORIZED, message="Invalid session")
+        return
+    if not stats.opened():
+        logger.warning("ws_connection_rejected", session_id=session_id, connections=stats.connections)
+        ws.close(reason=CLOSE_TRY_AGAIN_LATER, message="Server busy")
+        return
+
+    user_email = session.get("user")
+    connection = ChatConnection(ws, session_id)
+    logger.info("ws_connected", session_id=session_id)
+    try:
+        while not connection.closed.is_set():
+            raw = ws.receive(timeout=IDLE_TIMEOUT)
+            if raw is None:
+                logger.info("ws_idle_timeout", session_id=session_id)
+                break
+            try:
+                event = json.loads(raw)
+                kind = event.get("type")
+            except (ValueError, AttributeError):
+                connection.send({"type": "error", "text": "Malformed message"})
+                continue
+
+            if kind == "ping":
+                valid = _session_valid(session_id)
+                connection.send({"type": "pong", "valid": valid})
+                if not valid:
+                    break
+            elif kind == "partial":
+                stats.count("partials")
+                connection.send({"type": "partial_ack", "text": str(event.get("text", ""))[:MAX_MESSAGE_CHARS]})
+            elif kind == "message":
+                text = str(event.get("text") or "").strip()[:MAX_MESSAGE_CHARS]
+                if not text:
+                    connection.send({"type": "error", "text": "Empty message"})
+                    continue
+                stats.count("messages")
+                try:
+                    reply = handle_user_message(session_id, user_email, text, on_token=connection.send_token)
+                except Overloaded as busy:
+                    stats.count("turns_rejected")
+                    connection.send({"type": "done", "text": BUSY_MESSAGE, "busy": True,
+                                     "retry_after": busy.retry_after})
+                    continue
+                connection.send({"type": "done", "text": reply})
+            else:
+                connection.send({"type": "error", "text": f"Unknown message type: {kind}"})
+    except SlowConsumer:
+        stats.count("slow_consumers_closed")
+        logger.warning("ws_slow_consumer", session_id=session_id)
+        ws.close(reason=CLOSE_SLOW_CONSUMER, message="Client too slow")
+    finally:
+        connection.close()
+        stats.closed()
+        logger.info("ws_disconnected", session_id=session_id)
+        try:
+            update_session_record(session_id, "ws_disconnected")
+        except Exception:
+            logger.exception("session_record_failed", event_type="ws_disconnected")
+
+
+@ws_bp.route("/metrics/ws", methods=["GET"])
+@admin_required
+def ws_metrics():
+    return jsonify(stats.snapshot())